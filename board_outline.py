@@ -0,0 +1,224 @@
+#! /usr/bin/env python3
+"""
+The real shape of the board, read from the draws and arcs of its profile layer
+The profile is read with gerber_stream.canonical_statements(), so the units and coordinate format are already dealt
+with, and arcs are flattened into short lines, multi quadrant unless the file sets G74. The lines are then chained end
+to end into closed contours and the biggest is the outline of the board, any inside it are cut outs. If the profile
+doesn't close, the convex hull of everything in it is used instead so the shape is never smaller than the board. All
+coordinates are integer nm
+"""
+
+import hashlib
+import math
+import re
+
+from geometry import NM2_PER_DM2, format_decimal, arc_points, convex_hull
+from gerber_stream import canonical_statements
+
+# Ends of lines closer than this are joined, EDA tools don't always round both ends of a profile line the same way
+join_tolerance = 10000
+
+# Furthest a flattened arc is allowed to be from the real arc
+arc_tolerance = 5000
+
+_operation_re = re.compile(r"(D0[123])\*\n$")
+_offset_re = re.compile(r"([IJ])(-?\d+)")
+_interpolation_re = re.compile(r"G0?([123]|7[45])\*")
+
+
+def _arc_lines(start, end, offset, clockwise, multi_quadrant):
+    """
+    Flattens an arc into lines no further than arc_tolerance from it
+    :return: list of the (x, y) points after the start, finishing exactly on the end
+    """
+    _radius = math.hypot(offset[0], offset[1])
+    # Chord of an arc this small is already within the tolerance
+    _max_angle = 2 * math.acos(1 - arc_tolerance / _radius) if _radius > arc_tolerance else math.pi
+    return [(int(round(_x)), int(round(_y)))
+            for _x, _y in arc_points(start, end, offset, clockwise, multi_quadrant, _max_angle)[1:-1]] + [end]
+
+
+def profile_paths(lines):
+    """
+    Reads the lines drawn in a profile layer
+    :param lines: Iterable of lines of gerber source
+    :return: list of paths, each a list of two or more (x, y) points drawn one after the other
+    """
+    _paths = list()
+    _path = None
+    _interpolation = "1"
+    _multi_quadrant = True
+    _current = (0, 0)
+
+    for _kind, _value, _point in canonical_statements(lines):
+        if _kind != "body":
+            continue
+
+        for _code in _interpolation_re.findall(_value):
+            if _code == "74":
+                _multi_quadrant = False
+            elif _code == "75":
+                _multi_quadrant = True
+            else:
+                _interpolation = _code
+
+        if _point is None:
+            continue
+
+        _operation = _operation_re.search(_value)
+        _operation = _operation.group(1) if _operation else "D01"
+        if _operation != "D01":
+            # A move or a flash ends the path
+            _path = None
+        else:
+            if _path is None:
+                _path = [_current]
+                _paths.append(_path)
+
+            if _interpolation == "1":
+                _path.append(_point)
+            else:
+                _offsets = dict((_axis, int(_number)) for _axis, _number in _offset_re.findall(_value))
+                _offset = (_offsets.get("I", 0), _offsets.get("J", 0))
+                _path.extend(_arc_lines(_current, _point, _offset, _interpolation == "2", _multi_quadrant))
+
+        _current = _point
+
+    return [_path for _path in _paths if len(_path) > 1]
+
+
+def chain_paths(paths, tolerance=join_tolerance):
+    """
+    Joins paths whose ends meet into contours
+    :param paths: list of paths from profile_paths()
+    :param tolerance: Ends this close are the same point
+    :return: (closed contours, open chains), each a list of (x, y) points, closed contours don't repeat the first point
+    """
+    # {grid cell: [index of each path with an end in it]}, cells are the size of the tolerance
+    _ends = dict()
+    for _index, _path in enumerate(paths):
+        for _point in (_path[0], _path[-1]):
+            _ends.setdefault((_point[0] // tolerance, _point[1] // tolerance), []).append(_index)
+
+    def _near(point):
+        _cell = (point[0] // tolerance, point[1] // tolerance)
+        for _x in (-1, 0, 1):
+            for _y in (-1, 0, 1):
+                for _index in _ends.get((_cell[0] + _x, _cell[1] + _y), ()):
+                    yield _index
+
+    def _close(a, b):
+        return abs(a[0] - b[0]) <= tolerance and abs(a[1] - b[1]) <= tolerance
+
+    _used = [False] * len(paths)
+    _closed = list()
+    _open = list()
+    for _first, _path in enumerate(paths):
+        if _used[_first]:
+            continue
+        _used[_first] = True
+        _chain = list(_path)
+
+        while not (len(_chain) > 2 and _close(_chain[0], _chain[-1])):
+            for _index in _near(_chain[-1]):
+                if _used[_index]:
+                    continue
+                if _close(paths[_index][0], _chain[-1]):
+                    _chain.extend(paths[_index][1:])
+                elif _close(paths[_index][-1], _chain[-1]):
+                    _chain.extend(paths[_index][-2::-1])
+                else:
+                    continue
+                _used[_index] = True
+                break
+            else:
+                break
+
+        if len(_chain) > 3 and _close(_chain[0], _chain[-1]):
+            _closed.append(_chain[:-1])
+        else:
+            _open.append(_chain)
+
+    return _closed, _open
+
+
+def polygon_area(points):
+    """
+    :param points: list of (x, y) vertices
+    :return: Signed area, positive if the vertices go anticlockwise
+    """
+    _twice = 0
+    for (_x0, _y0), (_x1, _y1) in zip(points, points[1:] + points[:1]):
+        _twice += _x0 * _y1 - _x1 * _y0
+    return _twice / 2
+
+
+class BoardOutline:
+    """
+    Outline polygon of the board, anticlockwise, and any cut outs inside it
+    """
+
+    __slots__ = ("points", "cutouts", "closed")
+
+    def __init__(self, points, cutouts=(), closed=True):
+        """
+        :param points: list of (x, y) vertices of the outline
+        :param cutouts: list of lists of (x, y) vertices of the cut outs
+        :param closed: False if the profile didn't close and the outline is its convex hull
+        """
+        self.points = points if polygon_area(points) >= 0 else points[::-1]
+        self.cutouts = list(cutouts)
+        self.closed = closed
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        :param lines: Iterable of lines of the profile layer
+        :return: BoardOutline, None if nothing is drawn in the profile
+        """
+        _paths = profile_paths(lines)
+        if not _paths:
+            return None
+
+        _closed, _open = chain_paths(_paths)
+        if not _closed:
+            return cls(convex_hull([_point for _path in _paths for _point in _path]), closed=False)
+
+        _closed.sort(key=lambda contour: abs(polygon_area(contour)), reverse=True)
+        return cls(_closed[0], _closed[1:], not _open)
+
+    @property
+    def area(self):
+        """
+        :return: Area inside the outline less the cut outs, in nm2
+        """
+        return abs(polygon_area(self.points)) - sum(abs(polygon_area(_cutout)) for _cutout in self.cutouts)
+
+    @property
+    def surface_area(self):
+        """
+        :return: Area in dm2
+        """
+        return self.area / NM2_PER_DM2
+
+    @property
+    def bounds(self):
+        """
+        :return: (min x, min y, max x, max y)
+        """
+        _xs = [_x for _x, _y in self.points]
+        _ys = [_y for _x, _y in self.points]
+        return min(_xs), min(_ys), max(_xs), max(_ys)
+
+    @property
+    def key(self):
+        """
+        :return: Hex digest of the outline, for caching anything worked out from it
+        """
+        return hashlib.sha1(repr(self.points).encode("ascii")).hexdigest()
+
+    def __repr__(self):
+        _bounds = self.bounds
+        return "BoardOutline({} vertices, {}mm x {}mm, {}dm2{})".format(
+            len(self.points), format_decimal(_bounds[2] - _bounds[0], 4), format_decimal(_bounds[3] - _bounds[1], 4),
+            round(self.surface_area, 4), "" if self.closed else ", not closed")
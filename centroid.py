@@ -0,0 +1,305 @@
+#! /usr/bin/env python3
+"""
+Panelised pick and place centroid files
+Reads the board centroid file from the zip in any of the common dialects (Altium, KiCad, JLCPCB style csv, Eagle
+mountsmd), with the units taken from the header, the values or a preamble line. The part locations are held as one
+numpy array and moved to every board instance at once, and the panel file is written in the same dialect as the
+board file with a suffix on each designator, e.g. R1 on the third board becomes R1_3
+"""
+
+import csv
+import io
+import re
+
+import numpy
+
+from geometry import NM_PER_MM
+from placements import round_mm_array
+
+# Normalised column headings for each column that matters, a heading is normalised by lower casing it and removing
+# the units, spaces, dashes and underscores
+column_names = {
+    "designator": ("designator", "ref", "refdes", "reference", "partdesignator", "component", "part"),
+    "x": ("midx", "posx", "centerx", "centrex", "centroidx", "locationx", "x"),
+    "y": ("midy", "posy", "centery", "centrey", "centroidy", "locationy", "y"),
+    "ref_x": ("refx",),
+    "ref_y": ("refy",),
+    "pad_x": ("padx",),
+    "pad_y": ("pady",),
+}
+
+# Pairs of columns that hold a location, the first pair is the part centroid
+coordinate_columns = (("x", "y"), ("ref_x", "ref_y"), ("pad_x", "pad_y"))
+
+# Eagle mountsmd.ulp files have no header, the columns are always designator, x, y, rotation, value, package
+eagle_extensions = (".mnt", ".mnb")
+
+# nm per unit of each way the units are written
+units_nm = {
+    "mm": NM_PER_MM,
+    "mil": 25400,
+    "mils": 25400,
+    "in": 25400000,
+    "inch": 25400000,
+}
+
+# How many lines are searched for the header row, Altium puts a preamble before it
+_header_search_lines = 30
+
+_heading_units_re = re.compile(r"[\(\[]\s*(mm|mils?|in|inch)\s*[\)\]]", re.IGNORECASE)
+_heading_strip_re = re.compile(r"[\(\[][^\)\]]*[\)\]]|[\s\-_\"']")
+_value_units_re = re.compile(r"^\s*[+-]?[\d.]+\s*(mm|mils?|in|inch)\s*$", re.IGNORECASE)
+_preamble_units_re = re.compile(r"\bunits?(?:\s+used)?\s*[:=]\s*(mm|mils?|in|inch)\b", re.IGNORECASE)
+
+
+class CentroidError(Exception):
+    pass
+
+
+def _heading_key(heading):
+    """
+    :param heading: Column heading as written in the file
+    :return: Key of column_names the heading is, or None
+    """
+    _normalised = _heading_strip_re.sub("", heading).lower()
+    for _key, _names in column_names.items():
+        if _normalised in _names:
+            return _key
+
+    return None
+
+
+def _sniff_delimiter(line):
+    """
+    :param line: Header line
+    :return: Delimiter of the file, None for runs of whitespace
+    """
+    for _delimiter in (",", "\t", ";"):
+        if _delimiter in line:
+            return _delimiter
+
+    return None
+
+
+def _to_mm(units_re, text):
+    """
+    :param units_re: Regex with the units as group 1
+    :param text: str that may say what units the file is in
+    :return: text with the units changed to mm
+    """
+    return units_re.sub(lambda _match: _match.group(0).replace(_match.group(1), "mm"), text)
+
+
+def _split(line, delimiter):
+    if delimiter is None:
+        return line.split()
+    return next(csv.reader([line], delimiter=delimiter))
+
+
+class CentroidFile:
+    """
+    Parts from a board centroid file, with every location as an int64 nm array
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # Lines before the header row, written out again unchanged
+        self.preamble = list()
+        # Column headings, None for files without a header
+        self.header = None
+        # True if the header row starts with a # comment
+        self.header_comment = False
+        # True if every cell of the file is quoted, as Altium does
+        self.quote_all = False
+        # Delimiter between columns, None for runs of whitespace
+        self.delimiter = ","
+        # {column_names key: column index}
+        self.columns = dict()
+        # Index of the x and y column of each location in the file, the centroid first
+        self.location_columns = list()
+        # "mm", "mil" or "inch" the file is in
+        self.units = "mm"
+        # Unit written after each value e.g. "mm" for "5.00mm", or "" if the values are plain numbers
+        self.value_suffix = ""
+        # Every row of the file as a list of str
+        self.rows = list()
+        # Index of the first line after the header
+        self._data_start = 0
+        # Location of each part, (parts, locations, 2)
+        self.locations = numpy.zeros((0, 0, 2), dtype=numpy.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def from_lines(cls, name, lines):
+        """
+        :param name: File name, used for the Eagle top/bottom extensions and error messages
+        :param lines: list of lines of the file
+        :return: CentroidFile
+        """
+        _centroid = cls(name)
+        _centroid._read_header(lines)
+        _centroid._read_rows(lines)
+        _centroid._read_locations()
+        return _centroid
+
+    def _read_header(self, lines):
+        """
+        Finds the header row, the preamble before it, the delimiter and the units
+        :param lines: list of lines of the file
+        :return:
+        """
+        for _index, _line in enumerate(lines[:_header_search_lines]):
+            if not _line.strip():
+                continue
+
+            _delimiter = _sniff_delimiter(_line)
+            _cells = _split(_line, _delimiter)
+            _comment = bool(_cells) and _cells[0] == "#"
+            if _comment:
+                # KiCad ascii files comment out the header
+                _cells = _cells[1:]
+            _keys = [_heading_key(_cell) for _cell in _cells]
+            if "designator" in _keys and "x" in _keys and "y" in _keys:
+                self.preamble = lines[:_index]
+                self.header = _cells
+                self.header_comment = _comment
+                self.quote_all = _line.lstrip().startswith('"')
+                self.delimiter = _delimiter
+                self._data_start = _index + 1
+                for _column, _key in enumerate(_keys):
+                    if _key is not None and _key not in self.columns:
+                        self.columns[_key] = _column
+
+                for _cell in _cells:
+                    _units = _heading_units_re.search(_cell)
+                    if _units:
+                        self.units = _units.group(1).lower()
+                        break
+                else:
+                    for _preamble_line in self.preamble:
+                        _units = _preamble_units_re.search(_preamble_line)
+                        if _units:
+                            self.units = _units.group(1).lower()
+                            break
+                break
+        else:
+            if not self.name.lower().endswith(eagle_extensions):
+                raise CentroidError("No designator, X and Y header found in {}".format(self.name))
+            self.delimiter = None
+            self._data_start = 0
+            self.columns = {"designator": 0, "x": 1, "y": 2}
+
+        self.location_columns = [(self.columns[_x], self.columns[_y]) for _x, _y in coordinate_columns
+                                 if _x in self.columns and _y in self.columns]
+
+    def _read_rows(self, lines):
+        """
+        Reads every part row, blank lines and rows missing a location are left out
+        :param lines: list of lines of the file
+        :return:
+        """
+        _data = [_line for _line in lines[self._data_start:] if _line.strip()]
+        if self.delimiter is None:
+            _rows = [_line.split() for _line in _data]
+        else:
+            _rows = list(csv.reader(_data, delimiter=self.delimiter))
+
+        _width = max(max(_pair) for _pair in self.location_columns) + 1
+        self.rows = [_row for _row in _rows if len(_row) >= _width and _row[self.location_columns[0][0]].strip()]
+
+    def _read_locations(self):
+        """
+        Turns the location columns into nm, the unit suffix is stripped from every value at once
+        :return:
+        """
+        _columns = [_column for _pair in self.location_columns for _column in _pair]
+        if not self.rows:
+            self.locations = numpy.zeros((0, len(self.location_columns), 2), dtype=numpy.int64)
+            return
+
+        _values = numpy.array([[_row[_column] for _column in _columns] for _row in self.rows], dtype=str)
+
+        _units = _value_units_re.match(_values[0, 0])
+        if _units:
+            self.value_suffix = _units.group(1)
+            self.units = _units.group(1).lower()
+
+        _numbers = numpy.char.rstrip(numpy.char.strip(_values), "mMiIlLnNcChHsS ")
+        try:
+            _numbers = _numbers.astype(numpy.float64)
+        except ValueError as e:
+            raise CentroidError("Bad location in {}: {}".format(self.name, e))
+
+        _scale = units_nm.get(self.units, NM_PER_MM)
+        self.locations = numpy.rint(_numbers * _scale).astype(numpy.int64).reshape(len(self.rows), -1, 2)
+
+    def write_panel(self, out_file, board_coords, designator_suffix="_{}", decimals=4):
+        """
+        Writes the parts of every board on the panel, one board at a time
+        Each part row is laid out once as a format template with the static columns filled in, so each board is a
+        single format call with the locations from the array, and the values are only turned into text by that call
+        :param out_file: Text stream to write to
+        :param board_coords: list of (x, y) offset of each board instance in nm
+        :param designator_suffix: Format of the suffix added to each designator, given the board number from 1
+        :param decimals: Decimal places of the values
+        :return: Number of parts written
+        """
+        _boards = numpy.array(board_coords, dtype=numpy.int64).reshape(-1, 2)
+
+        # Everything is written in mm, the preamble and headings that said otherwise are changed to match
+        for _line in self.preamble:
+            out_file.write(_to_mm(_preamble_units_re, _line) + "\n")
+        if self.header is not None:
+            _header = [_to_mm(_heading_units_re, _cell) for _cell in self.header]
+            if self.header_comment:
+                _header = ["#"] + _header
+            self._write_row(out_file, _header)
+
+        _value_suffix = "mm" if self.value_suffix else ""
+        _template = io.StringIO()
+        _designator_column = self.columns["designator"]
+        _placeholder = 1
+        for _row in self.rows:
+            _cells = [_cell.replace("{", "{{").replace("}", "}}") for _cell in _row]
+            _cells[_designator_column] += "{0}"
+            for _x, _y in self.location_columns:
+                _cells[_x] = "{{{}:.{}f}}{}".format(_placeholder, decimals, _value_suffix)
+                _cells[_y] = "{{{}:.{}f}}{}".format(_placeholder + 1, decimals, _value_suffix)
+                _placeholder += 2
+            self._write_row(_template, _cells)
+        _template = _template.getvalue()
+
+        # (boards, parts, locations, 2)
+        _panel = self.locations[None, :, :, :] + _boards[:, None, None, :]
+        _values = round_mm_array(_panel.reshape(len(_boards), -1), decimals).tolist()
+        for _index, _board_values in enumerate(_values):
+            out_file.write(_template.format(designator_suffix.format(_index + 1), *_board_values))
+
+        return len(self.rows) * len(_boards)
+
+    def _write_row(self, out_file, cells):
+        """
+        Writes one row in the delimiter of the file
+        :param out_file: Text stream to write to
+        :param cells: list of str
+        :return:
+        """
+        if self.delimiter is None:
+            out_file.write(" ".join(cells) + "\n")
+        else:
+            csv.writer(out_file, delimiter=self.delimiter, lineterminator="\n",
+                       quoting=csv.QUOTE_ALL if self.quote_all else csv.QUOTE_MINIMAL).writerow(cells)
+
+
+def load_centroid(zip_file, entry):
+    """
+    :param zip_file: Open ZipFile of the board
+    :param entry: layer_manifest.LayerEntry of the centroid file
+    :return: CentroidFile
+    """
+    with zip_file.open(entry.name) as _file:
+        _text = _file.read().decode("utf-8-sig", errors="replace")
+
+    return CentroidFile.from_lines(entry.name, _text.splitlines())
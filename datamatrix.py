@@ -0,0 +1,284 @@
+#! /usr/bin/env python3
+"""
+Data Matrix (ECC 200) symbols for marking boards, square symbols from 10 x 10 up to 48 x 48 modules
+The text is encoded in ASCII mode, with digit pairs packed into a single codeword, then padded and followed by its
+Reed-Solomon error correction codewords. Where each bit of each codeword goes in the symbol only depends on the symbol
+size, so the placement is worked out once per size and every symbol after that is a single numpy index
+"""
+
+import numpy
+
+# Square symbol sizes, (modules along each side, data regions along each side, data codewords, error codewords)
+# Up to 48 x 48 every symbol is a single Reed-Solomon block
+symbol_sizes = (
+    (10, 1, 3, 5),
+    (12, 1, 5, 7),
+    (14, 1, 8, 10),
+    (16, 1, 12, 12),
+    (18, 1, 18, 14),
+    (20, 1, 22, 18),
+    (22, 1, 30, 20),
+    (24, 1, 36, 24),
+    (26, 1, 44, 28),
+    (32, 2, 62, 36),
+    (36, 2, 86, 42),
+    (40, 2, 114, 48),
+    (44, 2, 144, 56),
+    (48, 2, 174, 68),
+)
+
+# Pad codeword straight after the data
+_pad = 129
+# Upper shift, the next codeword is a character from 128 to 255
+_upper_shift = 235
+
+# GF(256) with the Data Matrix prime polynomial x^8 + x^5 + x^3 + x^2 + 1
+_exp = [0] * 510
+_log = [0] * 256
+_value = 1
+for _power in range(255):
+    _exp[_power] = _exp[_power + 255] = _value
+    _log[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x12D
+
+# {error codewords: generator polynomial coefficients, highest power first without the leading 1}
+_generators = dict()
+# {symbol size: numpy intp array of shape (size, size) into the bits of the codewords}
+_placements = dict()
+
+
+def encode_text(text):
+    """
+    :param text: Text to encode, characters 0 to 255
+    :return: list of data codewords, without padding
+    """
+    _codewords = list()
+    _data = text.encode("latin-1")
+    _index = 0
+    while _index < len(_data):
+        _char = _data[_index]
+        _next = _data[_index + 1] if _index + 1 < len(_data) else None
+        if 48 <= _char <= 57 and _next is not None and 48 <= _next <= 57:
+            _codewords.append(130 + (_char - 48) * 10 + _next - 48)
+            _index += 2
+            continue
+
+        if _char > 127:
+            _codewords.append(_upper_shift)
+            _char -= 128
+        _codewords.append(_char + 1)
+        _index += 1
+
+    return _codewords
+
+
+def pick_size(data_count):
+    """
+    :param data_count: Number of data codewords
+    :return: Smallest entry of symbol_sizes that holds them
+    """
+    for _size in symbol_sizes:
+        if _size[2] >= data_count:
+            return _size
+
+    raise ValueError("{} codewords is too long for a Data Matrix symbol, {} at most".format(data_count,
+                                                                                          symbol_sizes[-1][2]))
+
+
+def pad(codewords, data_count):
+    """
+    :param codewords: Data codewords
+    :param data_count: Data codewords the symbol holds
+    :return: list of the codewords padded out to data_count
+    """
+    _codewords = list(codewords)
+    if len(_codewords) < data_count:
+        _codewords.append(_pad)
+    while len(_codewords) < data_count:
+        # Pads after the first are scrambled with their position, counted from 1
+        _value = _pad + ((149 * (len(_codewords) + 1)) % 253) + 1
+        _codewords.append(_value - 254 if _value > 254 else _value)
+
+    return _codewords
+
+
+def _generator(count):
+    """
+    :param count: Number of error codewords
+    :return: Coefficients of (x + 2^1)(x + 2^2)...(x + 2^count), highest power first without the leading 1
+    """
+    try:
+        return _generators[count]
+    except KeyError:
+        pass
+
+    _poly = [1]
+    for _root in range(1, count + 1):
+        _next = _poly + [0]
+        for _index, _coefficient in enumerate(_poly):
+            if _coefficient:
+                _next[_index + 1] ^= _exp[_log[_coefficient] + _root]
+        _poly = _next
+
+    _generators[count] = _poly[1:]
+    return _generators[count]
+
+
+def error_codewords(data, count):
+    """
+    Reed-Solomon error correction codewords, the remainder of the data divided by the generator polynomial
+    :param data: Data codewords, padded
+    :param count: Number of error codewords
+    :return: list of count codewords
+    """
+    _generator_logs = [_log[_coefficient] for _coefficient in _generator(count)]
+    _remainder = [0] * count
+    for _codeword in data:
+        _feedback = _codeword ^ _remainder[0]
+        _remainder = _remainder[1:] + [0]
+        if _feedback:
+            _feedback_log = _log[_feedback]
+            for _index, _generator_log in enumerate(_generator_logs):
+                _remainder[_index] ^= _exp[_feedback_log + _generator_log]
+
+    return _remainder
+
+
+def _mapping(rows, columns):
+    """
+    Where each bit of each codeword goes in the mapping matrix, the data regions without their finder patterns
+    Follows the placement algorithm of ISO/IEC 16022 annex F
+    :param rows: Rows of the mapping matrix
+    :param columns: Columns of the mapping matrix
+    :return: numpy intp array of shape (rows, columns) of codeword * 8 + bit, bit 0 is the most significant. Modules
+    no codeword reaches are -1 for dark and -2 for light
+    """
+    _matrix = numpy.full((rows, columns), -3, dtype=numpy.intp)
+
+    def _module(row, column, codeword, bit):
+        if row < 0:
+            row += rows
+            column += 4 - ((rows + 4) % 8)
+        if column < 0:
+            column += columns
+            row += 4 - ((columns + 4) % 8)
+        _matrix[row, column] = codeword * 8 + bit
+
+    def _place(modules, codeword):
+        for _bit, (_row, _column) in enumerate(modules):
+            _module(_row, _column, codeword, _bit)
+
+    def _utah(row, column, codeword):
+        _place(((row - 2, column - 2), (row - 2, column - 1), (row - 1, column - 2), (row - 1, column - 1),
+                (row - 1, column), (row, column - 2), (row, column - 1), (row, column)), codeword)
+
+    _corners = (
+        lambda: ((rows - 1, 0), (rows - 1, 1), (rows - 1, 2), (0, columns - 2), (0, columns - 1), (1, columns - 1),
+                 (2, columns - 1), (3, columns - 1)),
+        lambda: ((rows - 3, 0), (rows - 2, 0), (rows - 1, 0), (0, columns - 4), (0, columns - 3), (0, columns - 2),
+                 (0, columns - 1), (1, columns - 1)),
+        lambda: ((rows - 3, 0), (rows - 2, 0), (rows - 1, 0), (0, columns - 2), (0, columns - 1), (1, columns - 1),
+                 (2, columns - 1), (3, columns - 1)),
+        lambda: ((rows - 1, 0), (rows - 1, columns - 1), (0, columns - 3), (0, columns - 2), (0, columns - 1),
+                 (1, columns - 3), (1, columns - 2), (1, columns - 1)),
+    )
+
+    _codeword = 0
+    _row = 4
+    _column = 0
+    while _row < rows or _column < columns:
+        # The four corner cases, then a diagonal sweep up and to the right and one back down and to the left
+        for _corner, _at in ((0, _row == rows and _column == 0),
+                             (1, _row == rows - 2 and _column == 0 and columns % 4 != 0),
+                             (2, _row == rows - 2 and _column == 0 and columns % 8 == 4),
+                             (3, _row == rows + 4 and _column == 2 and columns % 8 == 0)):
+            if _at:
+                _place(_corners[_corner](), _codeword)
+                _codeword += 1
+
+        while True:
+            if _row < rows and _column >= 0 and _matrix[_row, _column] == -3:
+                _utah(_row, _column, _codeword)
+                _codeword += 1
+            _row -= 2
+            _column += 2
+            if not (_row >= 0 and _column < columns):
+                break
+        _row += 1
+        _column += 3
+
+        while True:
+            if _row >= 0 and _column < columns and _matrix[_row, _column] == -3:
+                _utah(_row, _column, _codeword)
+                _codeword += 1
+            _row += 2
+            _column -= 2
+            if not (_row < rows and _column >= 0):
+                break
+        _row += 3
+        _column += 1
+
+    # Sizes that leave the bottom right corner unfilled have a fixed pattern there
+    if _matrix[rows - 1, columns - 1] == -3:
+        _matrix[rows - 1, columns - 1] = _matrix[rows - 2, columns - 2] = -1
+        _matrix[rows - 1, columns - 2] = _matrix[rows - 2, columns - 1] = -2
+
+    return _matrix
+
+
+def placement(size):
+    """
+    :param size: Entry of symbol_sizes
+    :return: numpy intp array of shape (modules, modules) of the whole symbol, top row first. Each module is an index
+    into the bits of the codewords followed by a dark bit and a light bit for the fixed modules and finder patterns
+    """
+    _modules, _regions, _data_count, _error_count = size
+    try:
+        return _placements[_modules]
+    except KeyError:
+        pass
+
+    _bits = (_data_count + _error_count) * 8
+    _dark = _bits
+    _light = _bits + 1
+
+    _region = _modules // _regions - 2
+    _mapping_matrix = _mapping(_region * _regions, _region * _regions)
+    _mapping_matrix[_mapping_matrix == -1] = _dark
+    _mapping_matrix[_mapping_matrix == -2] = _light
+
+    _symbol = numpy.full((_modules, _modules), _light, dtype=numpy.intp)
+    _pitch = _region + 2
+    for _region_row in range(_regions):
+        for _region_column in range(_regions):
+            _top = _region_row * _pitch
+            _left = _region_column * _pitch
+            # Finder pattern, solid on the left and bottom, alternating along the top and right
+            _symbol[_top:_top + _pitch, _left] = _dark
+            _symbol[_top + _pitch - 1, _left:_left + _pitch] = _dark
+            _symbol[_top, _left:_left + _pitch:2] = _dark
+            _symbol[_top + 1:_top + _pitch - 1:2, _left + _pitch - 1] = _dark
+
+            _symbol[_top + 1:_top + _pitch - 1, _left + 1:_left + _pitch - 1] = _mapping_matrix[
+                _region_row * _region:(_region_row + 1) * _region,
+                _region_column * _region:(_region_column + 1) * _region]
+
+    _placements[_modules] = _symbol
+    return _symbol
+
+
+def encode(text):
+    """
+    :param text: Text to encode, characters 0 to 255
+    :return: numpy bool array of shape (modules, modules), True for a dark module, top row first
+    """
+    _data = encode_text(text)
+    _size = pick_size(len(_data))
+    _data = pad(_data, _size[2])
+    _codewords = numpy.array(_data + error_codewords(_data, _size[3]), dtype=numpy.uint8)
+
+    # The dark and light bits of the fixed modules go on the end
+    _bits = numpy.concatenate([numpy.unpackbits(_codewords), numpy.array([1, 0], dtype=numpy.uint8)])
+    return _bits[placement(_size)].astype(bool)
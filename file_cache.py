@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+"""
+Bounded cache of values kept in memory and as files in a folder, least recently used first out
+The folder is shared by separate runs and the watch daemon workers, so files are written under a temporary name and
+moved into place, and reading one marks it as used so it is the last to be pruned. The cache is only ever an
+optimisation, any file that can't be read or written is treated as not cached
+"""
+
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+
+class FileCache:
+    """
+    {key: value} cache, each value is also a file named <key><suffix> in the folder
+    """
+
+    def __init__(self, folder, suffix, dump, load, max_entries=32, max_files=256):
+        """
+        :param folder: Folder the entries are also written to, None to only keep them in memory
+        :param suffix: File name suffix of the entries, e.g. ".json"
+        :param dump: Function (value, binary file) that writes a value
+        :param load: Function (path) that reads a value back, raises OSError or ValueError if it can't
+        :param max_entries: Number of entries kept in memory, 0 to only keep them in the folder
+        :param max_files: Number of entries kept in the folder
+        """
+        self.folder = None if folder is None else Path(folder)
+        self.suffix = suffix
+        self.dump = dump
+        self.load = load
+        self.max_entries = max_entries
+        self.max_files = max_files
+        # {key: value}, most recently used last
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return self.folder / "{}{}".format(key, self.suffix)
+
+    def get(self, key):
+        """
+        :param key: Hex digest of everything the value depends on
+        :return: The value, or None if it isn't cached. Shared, don't modify it
+        """
+        _value = self._entries.get(key)
+        if _value is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _value
+
+        if self.folder is not None:
+            _path = self.path(key)
+            try:
+                _value = self.load(_path)
+                # Mark it as used so it is the last to be pruned
+                os.utime(str(_path))
+            except (OSError, ValueError, KeyError):
+                _value = None
+
+            if _value is not None:
+                self._remember(key, _value)
+                self.hits += 1
+                return _value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        :param key: Hex digest of everything the value depends on
+        :param value: Value to keep
+        :return:
+        """
+        self._remember(key, value)
+        if self.folder is None:
+            return
+
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            # Written under a name of its own first, the daemon workers may be writing the same entry at the same time
+            _temp_path = self.folder / "{}.{}.tmp".format(key, os.getpid())
+            with open(str(_temp_path), 'wb') as _file:
+                self.dump(value, _file)
+            os.replace(str(_temp_path), str(self.path(key)))
+            self._prune()
+        except OSError:
+            # The cache is only an optimisation, the value has already been made
+            pass
+
+    def _remember(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _prune(self):
+        """
+        Removes the least recently used files over max_files
+        :return:
+        """
+        _files = list()
+        for _path in self.folder.glob("*" + self.suffix):
+            try:
+                _files.append((_path.stat().st_mtime_ns, _path))
+            except OSError:
+                pass
+
+        _files.sort()
+        for _mtime, _path in _files[:max(0, len(_files) - self.max_files)]:
+            try:
+                _path.unlink()
+            except OSError:
+                pass
+
+    def clear(self):
+        """
+        Empties the memory and the folder
+        :return:
+        """
+        self._entries.clear()
+        if self.folder is not None and self.folder.is_dir():
+            for _path in self.folder.glob("*" + self.suffix):
+                _path.unlink()
+
+
+# {(kind, resolved folder or None, settings...): FileCache}
+_shared = dict()
+
+
+def shared_cache(make, kind, folder, *settings):
+    """
+    :param make: Function (folder) that makes the FileCache the first time
+    :param kind: Name of what is cached, caches of different kinds are never shared
+    :param folder: Folder the entries are also written to, None to only keep them in memory
+    :param settings: Anything else the cache was made with, e.g. its sizes
+    :return: The FileCache for these settings, the same one every time in a process
+    """
+    _key = (kind, None if folder is None else Path(folder).resolve()) + settings
+    if _key not in _shared:
+        _shared[_key] = make(folder)
+
+    return _shared[_key]
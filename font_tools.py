@@ -2,13 +2,199 @@
 """
 Parses the vector font file and does various processing operations
 A copy of the font def dict is made when it is read from the file, this is what is written back to the font file
+The stroke optimiser tidies up the glyphs as they were captured by gerb_to_json, so the silkscreen text has fewer
+points and pen up moves. Glyph coords are worked on as integers with geometry.to_nm, a glyph is 1 unit high
 """
 
+import argparse
 import logzero
 import logging
+import math
 from pathlib import Path
 import json
 
+from geometry import to_mm, to_nm
+
+
+def glyph_strokes(coords):
+    """
+    Splits the coords of a glyph into strokes, each one drawn without lifting the pen
+    Zero length draws are removed, as are moves that are not followed by a draw, a stroke of a single point is a dot
+    :param coords: list of {"x", "y", "command"} dicts from the font definition
+    :return: list of strokes, each a list of (x, y) in glyph units from to_nm()
+    """
+    _strokes = list()
+    _stroke = None
+    for _coord in coords:
+        _point = (to_nm(_coord["x"]), to_nm(_coord["y"]))
+        if _coord["command"] == "D02":
+            _stroke = [_point]
+            _strokes.append(_stroke)
+        elif _stroke is None:
+            # A draw before any move starts wherever the pen was, the best that can be done is to start it here
+            _stroke = [_point]
+            _strokes.append(_stroke)
+        elif _point != _stroke[-1] or len(_stroke) == 1:
+            _stroke.append(_point)
+
+    return [_stroke for _stroke in _strokes if len(_stroke) > 1]
+
+
+def pen_up_travel(strokes, start=(0, 0)):
+    """
+    :param strokes: list of strokes from glyph_strokes()
+    :param start: Where the pen is before the first stroke, the glyph origin by default
+    :return: Total length of the moves between the strokes
+    """
+    _travel = 0
+    _position = start
+    for _stroke in strokes:
+        _travel += math.hypot(_stroke[0][0] - _position[0], _stroke[0][1] - _position[1])
+        _position = _stroke[-1]
+
+    return _travel
+
+
+def chain_strokes(strokes, start=(0, 0)):
+    """
+    Orders and reverses the strokes to cut down the pen up travel between them
+    Nearest neighbour first, always going to the closest end of the strokes left, then 2-opt to untangle the order
+    :param strokes: list of strokes from glyph_strokes()
+    :param start: Where the pen is before the first stroke
+    :return: New list of the strokes, some of them reversed
+    """
+    _remaining = list(strokes)
+    _chain = list()
+    _position = start
+    while _remaining:
+        _best = None
+        for _index, _stroke in enumerate(_remaining):
+            for _reverse in (False, True):
+                _end = _stroke[-1] if _reverse else _stroke[0]
+                _distance = math.hypot(_end[0] - _position[0], _end[1] - _position[1])
+                if _best is None or _distance < _best[0]:
+                    _best = (_distance, _index, _reverse)
+
+        _stroke = _remaining.pop(_best[1])
+        if _best[2]:
+            _stroke = _stroke[::-1]
+        _chain.append(_stroke)
+        _position = _stroke[-1]
+
+    # 2-opt, reversing a run of the chain reverses the order of the strokes and the direction of each of them
+    def _gap(a, b):
+        return math.hypot(b[0] - a[0], b[1] - a[1])
+
+    _improved = True
+    while _improved:
+        _improved = False
+        for _first in range(len(_chain)):
+            _before = _chain[_first - 1][-1] if _first > 0 else start
+            for _last in range(_first, len(_chain)):
+                _after = _chain[_last + 1][0] if _last + 1 < len(_chain) else None
+                _old = _gap(_before, _chain[_first][0])
+                _new = _gap(_before, _chain[_last][-1])
+                if _after is not None:
+                    _old += _gap(_chain[_last][-1], _after)
+                    _new += _gap(_chain[_first][0], _after)
+
+                # Small margin so rounding can't swap two equal orders back and forth forever
+                if _new < _old - 1e-6:
+                    _chain[_first:_last + 1] = [_stroke[::-1] for _stroke in reversed(_chain[_first:_last + 1])]
+                    _improved = True
+
+    return _chain
+
+
+def join_strokes(strokes, join_distance=0):
+    """
+    Draws straight on to the next stroke rather than lifting the pen when it starts where the last one finished
+    :param strokes: Ordered strokes from chain_strokes()
+    :param join_distance: Largest gap that is drawn over rather than moved over, in glyph units
+    :return: New list of strokes
+    """
+    _joined = list()
+    for _stroke in strokes:
+        if _joined and math.hypot(_stroke[0][0] - _joined[-1][-1][0],
+                                  _stroke[0][1] - _joined[-1][-1][1]) <= join_distance:
+            _start = 1 if _stroke[0] == _joined[-1][-1] else 0
+            _joined[-1] = _joined[-1] + _stroke[_start:]
+        else:
+            _joined.append(list(_stroke))
+
+    return _joined
+
+
+def merge_collinear(stroke, tolerance=0):
+    """
+    Removes the points in the middle of straight runs of a stroke, so each straight line is a single draw
+    A point is only removed if it is between the ends of the run, going back on itself is kept as it is
+    :param stroke: list of (x, y)
+    :param tolerance: Furthest a removed point can be from the line that replaces it, in glyph units
+    :return: New list of (x, y)
+    """
+    if len(stroke) < 3:
+        return list(stroke)
+
+    _merged = [stroke[0]]
+    _run = list()
+    for _point in stroke[1:]:
+        if _point == (_run[-1] if _run else _merged[-1]):
+            continue
+        _anchor = _merged[-1]
+        _dx = _point[0] - _anchor[0]
+        _dy = _point[1] - _anchor[1]
+        _length_sq = _dx * _dx + _dy * _dy
+
+        _straight = _length_sq > 0
+        for _middle in _run:
+            if not _straight:
+                break
+            _mx = _middle[0] - _anchor[0]
+            _my = _middle[1] - _anchor[1]
+            _cross = _dx * _my - _dy * _mx
+            _dot = _dx * _mx + _dy * _my
+            _straight = _cross * _cross <= tolerance * tolerance * _length_sq and 0 < _dot < _length_sq
+
+        if _straight:
+            _run.append(_point)
+        else:
+            # The run ends at the last point, which is where the next one starts from
+            _merged.append(_run[-1])
+            _run = [_point]
+
+    _merged.append(_run[-1])
+    return _merged
+
+
+def optimise_glyph(coords, collinear_tolerance=0, join_distance=0):
+    """
+    :param coords: list of {"x", "y", "command"} dicts from the font definition
+    :param collinear_tolerance: See merge_collinear(), in glyph units
+    :param join_distance: See join_strokes(), in glyph units
+    :return: New list of {"x", "y", "command"} dicts
+    """
+    _strokes = chain_strokes(glyph_strokes(coords))
+    _strokes = join_strokes(_strokes, to_nm(join_distance))
+
+    _coords = list()
+    for _stroke in _strokes:
+        for _index, (_x, _y) in enumerate(merge_collinear(_stroke, to_nm(collinear_tolerance))):
+            _coords.append({"x": round(to_mm(_x), 4), "y": round(to_mm(_y), 4),
+                            "command": "D02" if _index == 0 else "D01"})
+
+    return _coords
+
+
+def stroke_stats(coords):
+    """
+    :param coords: list of {"x", "y", "command"} dicts from the font definition
+    :return: (points, moves, pen up travel in glyph units)
+    """
+    _moves = sum(1 for _coord in coords if _coord["command"] == "D02")
+    _travel = to_mm(pen_up_travel(glyph_strokes(coords)))
+    return len(coords), _moves, _travel
+
 
 class FontTools:
     logger = None
@@ -46,7 +232,9 @@ class FontTools:
         for letter, coords in self.font_def["letters"].items():
             self.logger.debug("Reading letter: {}".format(letter))
 
-            # coords = letter[0]
+            # Letters that already have a width are measured again from their coords
+            if isinstance(coords, dict):
+                coords = coords["coords"]
 
             xmin = float('inf')
             xmax = float('-inf')
@@ -65,12 +253,56 @@ class FontTools:
 
         self.logger.debug("Updated font def: {}".format(self.font_def_copy))
 
-    def on_execute(self):
+    def optimise_strokes(self, collinear_tolerance=0, join_distance=0):
+        """
+        Rewrites the coords of every letter with fewer points and moves, the drawn shape is not changed
+        Logs how many points, moves and how much pen up travel were saved
+        :param collinear_tolerance: Furthest a point can be from a straight line and still be merged into it
+        :param join_distance: Largest gap between two strokes that is drawn over rather than moved over
+        :return:
+        """
+        _before_total = [0, 0, 0]
+        _after_total = [0, 0, 0]
+        for letter, glyph in self.font_def["letters"].items():
+            _coords = optimise_glyph(glyph["coords"], collinear_tolerance, join_distance)
+            _before = stroke_stats(glyph["coords"])
+            _after = stroke_stats(_coords)
+            self.logger.debug("Letter '{}': {} -> {} points, {} -> {} moves, {:.4f} -> {:.4f} travel".format(
+                letter, _before[0], _after[0], _before[1], _after[1], _before[2], _after[2]))
+
+            for _index in range(3):
+                _before_total[_index] += _before[_index]
+                _after_total[_index] += _after[_index]
+
+            self.font_def_copy["letters"][letter] = dict(glyph, coords=_coords)
+
+        self.logger.info("Points: {} -> {}, {} saved".format(_before_total[0], _after_total[0],
+                                                             _before_total[0] - _after_total[0]))
+        self.logger.info("Moves: {} -> {}, {} saved".format(_before_total[1], _after_total[1],
+                                                            _before_total[1] - _after_total[1]))
+        self.logger.info("Pen up travel: {:.4f} -> {:.4f}".format(_before_total[2], _after_total[2]))
+
+    def on_execute(self, optimise=False, collinear_tolerance=0, join_distance=0):
         self.load_vector_font()
         self.add_width_to_letters()
+        if optimise:
+            self.optimise_strokes(collinear_tolerance, join_distance)
         self.write_vector_font_file()
 
 
-if __name__ == '__main__':
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("--optimise", action="store_true",
+                         help="Merge straight runs and reorder the strokes of every letter")
+    _parser.add_argument("--collinear-tolerance", type=float, default=0,
+                         help="Furthest a merged point can be from the straight line, in glyph units (0)")
+    _parser.add_argument("--join-distance", type=float, default=0.0001,
+                         help="Largest gap between strokes that is drawn over rather than moved over (0.0001)")
+    _args = _parser.parse_args()
+
     app = FontTools()
-    app.on_execute()
+    app.on_execute(_args.optimise, _args.collinear_tolerance, _args.join_distance)
+
+
+if __name__ == '__main__':
+    main()
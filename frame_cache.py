@@ -0,0 +1,46 @@
+#! /usr/bin/env python3
+"""
+Cache of the frame overlay layers that only depend on the panel size and the config
+The copper, paste and soldermask layers and the drills of the frame are the same for every panel of the same size, only
+the silkscreen text changes from job to job. Their aperture definitions and bodies are kept in memory, least recently
+used first out, and in a folder so separate runs and the watch daemon workers share them
+"""
+
+import hashlib
+import json
+
+import file_cache
+
+# Changed whenever the content of the frame layers changes, so older entries on disk aren't used
+cache_version = 1
+
+
+def template_key(*values):
+    """
+    :param values: Everything the cached layers depend on, must be json serialisable
+    :return: Hex digest identifying the layers
+    """
+    _text = json.dumps([cache_version] + list(values), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(_text.encode("utf-8")).hexdigest()
+
+
+def _dump(layers, file):
+    file.write(json.dumps(layers).encode("utf-8"))
+
+
+def _load(path):
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def shared_cache(folder=None, max_entries=32, max_files=256):
+    """
+    :param folder: Folder the entries are also written to, None to only keep them in memory
+    :param max_entries: Number of panel sizes kept in memory
+    :param max_files: Number of panel sizes kept in the folder
+    :return: file_cache.FileCache of {layer name: text} dicts, each dict is one panel size, the same one every time in
+    a process
+    """
+    def _make(_folder):
+        return file_cache.FileCache(_folder, ".json", _dump, _load, max_entries, max_files)
+
+    return file_cache.shared_cache(_make, "frame", folder, max_entries, max_files)
@@ -0,0 +1,206 @@
+#! /usr/bin/env python3
+"""
+Fixed point geometry shared by the paneliser, the frame gerber generator and the font renderer
+All panel coordinates and dimensions are held as integer nanometres, floats in mm are only converted on the way in
+(config values, gerber bounds, user input) and integers are only converted back on the way out, once per output format
+"""
+
+import math
+
+# Number of fixed point units (nanometres) in a mm
+NM_PER_MM = 1000000
+# Number of nm^2 in a dm^2, used for surface area calculations
+NM2_PER_DM2 = 10 ** 16
+
+
+def to_nm(mm):
+    """
+    Converts a dimension in mm to integer nanometres, rounding to the nearest nm
+    :param mm: Real number in mm, may also be a numeric string from the config file
+    :return: int nanometres
+    """
+    return int(round(float(mm) * NM_PER_MM))
+
+
+def to_mm(nm):
+    """
+    Converts integer nanometres back to a float in mm, only used for display and non coordinate maths
+    :param nm: int nanometres
+    :return: float mm
+    """
+    return nm / NM_PER_MM
+
+
+def point_to_nm(point):
+    """
+    Converts an (x, y) tuple in mm to an (x, y) tuple of integer nanometres
+    :param point: (x, y) tuple in mm
+    :return: (x, y) tuple in nm
+    """
+    return to_nm(point[0]), to_nm(point[1])
+
+
+def scale_nm(nm, factor):
+    """
+    Scales a fixed point value by a real factor, rounding back to the nearest nm
+    :param nm: int nanometres
+    :param factor: Real number to scale by
+    :return: int nanometres
+    """
+    return int(round(nm * factor))
+
+
+def half_nm(nm):
+    """
+    Halves a fixed point value, rounding half away from zero so that +/- values mirror exactly
+    :param nm: int nanometres
+    :return: int nanometres
+    """
+    return div_round(nm, 2)
+
+
+def area_dm2(width_nm, height_nm):
+    """
+    Surface area of a width x height rectangle
+    :param width_nm: Width in nm
+    :param height_nm: Height in nm
+    :return: float area in dm^2
+    """
+    return (width_nm * height_nm) / NM2_PER_DM2
+
+
+def div_round(value, divisor):
+    """
+    Integer division that rounds half away from zero, python's // floors towards -inf and round() is bankers rounding
+    :param value: int numerator
+    :param divisor: positive int denominator
+    :return: int
+    """
+    _quotient, _remainder = divmod(abs(value), divisor)
+    if _remainder * 2 >= divisor:
+        _quotient += 1
+
+    return _quotient if value >= 0 else -_quotient
+
+
+def to_fixed_units(nm, decimals):
+    """
+    Converts nm to an integer count of output units with the given number of decimal places in mm
+    e.g. gerber 3.4 format uses 4 decimals so 1 unit = 0.0001mm = 100nm
+    :param nm: int nanometres
+    :param decimals: Number of decimal places of mm held by the output format, max 6
+    :return: int output units
+    """
+    return div_round(nm, 10 ** (6 - decimals))
+
+
+def format_gerber(nm, decimals=4):
+    """
+    Formats a coordinate for a gerber file with leading zeros omitted, default is for %FSLAX34Y34*%
+    :param nm: int nanometres
+    :param decimals: Decimal places from the format specification
+    :return: str coordinate
+    """
+    return str(to_fixed_units(nm, decimals))
+
+
+def format_excellon(nm, decimals=3):
+    """
+    Formats a coordinate for an excellon file in METRIC,TZ,000.000 format
+    :param nm: int nanometres
+    :param decimals: Decimal places from the format specification
+    :return: str coordinate
+    """
+    return str(to_fixed_units(nm, decimals))
+
+
+def format_decimal(nm, decimals):
+    """
+    Formats a value as a decimal mm string rounded to the given precision, trailing zeros are removed
+    Used for the gerberset xml and the report, replaces str(round(x, decimal_precision))
+    :param nm: int nanometres
+    :param decimals: Number of decimal places to round to
+    :return: str e.g. "12.34"
+    """
+    _units = to_fixed_units(nm, decimals)
+    _sign = "-" if _units < 0 else ""
+    _whole, _fraction = divmod(abs(_units), 10 ** decimals)
+
+    if decimals == 0:
+        return "{}{}".format(_sign, _whole)
+
+    _fraction = "{:0{}d}".format(_fraction, decimals).rstrip("0") or "0"
+    return "{}{}.{}".format(_sign, _whole, _fraction)
+
+
+def format_point(point, decimals=4):
+    """
+    Formats an (x, y) nm tuple for display in logs and reports
+    :param point: (x, y) tuple in nm
+    :param decimals: Number of decimal places to round to
+    :return: str e.g. "(12.34, 5.0)"
+    """
+    return "({}, {})".format(format_decimal(point[0], decimals), format_decimal(point[1], decimals))
+
+
+def arc_points(start, end, offset, clockwise, multi_quadrant=True, max_angle=0.1):
+    """
+    Splits a gerber circular arc into straight segments
+    Files that never set G74 or G75 are read as multi quadrant (G75), the only mode left in the current gerber spec
+    :param start: (x, y) start of the arc
+    :param end: (x, y) end of the arc, the same as start for a full circle in multi quadrant mode
+    :param offset: (i, j) offset of the center from the start, unsigned in single quadrant mode
+    :param clockwise: True for G02
+    :param multi_quadrant: False for G74, where the arc is at most 90 degrees
+    :param max_angle: Largest angle in radians of each segment
+    :return: list of (x, y) from start to end, the points between them are floats
+    """
+    if multi_quadrant:
+        _center = (start[0] + offset[0], start[1] + offset[1])
+    else:
+        # Single quadrant offsets are unsigned, the center is the one that is the same distance from both ends
+        _centers = [(start[0] + _sign_i * abs(offset[0]), start[1] + _sign_j * abs(offset[1]))
+                    for _sign_i in (1, -1) for _sign_j in (1, -1)]
+        _center = min(_centers, key=lambda _c: abs(math.hypot(start[0] - _c[0], start[1] - _c[1]) -
+                                                   math.hypot(end[0] - _c[0], end[1] - _c[1])))
+
+    _radius = math.hypot(start[0] - _center[0], start[1] - _center[1])
+    _start_angle = math.atan2(start[1] - _center[1], start[0] - _center[0])
+    _end_angle = math.atan2(end[1] - _center[1], end[0] - _center[0])
+    _sweep = _end_angle - _start_angle
+    if clockwise:
+        if _sweep >= 0:
+            _sweep -= 2 * math.pi
+    elif _sweep <= 0:
+        _sweep += 2 * math.pi
+    if not multi_quadrant:
+        _sweep = math.copysign(min(abs(_sweep), math.pi / 2), _sweep)
+
+    _steps = max(2, int(math.ceil(abs(_sweep) / max_angle)))
+    _points = [start]
+    for _step in range(1, _steps):
+        _angle = _start_angle + _sweep * _step / _steps
+        _points.append((_center[0] + _radius * math.cos(_angle), _center[1] + _radius * math.sin(_angle)))
+    _points.append(end)
+    return _points
+
+
+def convex_hull(points):
+    """
+    :param points: Iterable of (x, y)
+    :return: list of the (x, y) of the hull, anticlockwise
+    """
+    _points = sorted(set(points))
+    if len(_points) < 3:
+        return _points
+
+    def _half(points):
+        _hull = list()
+        for _point in points:
+            while len(_hull) >= 2 and ((_hull[-1][0] - _hull[-2][0]) * (_point[1] - _hull[-2][1]) -
+                                       (_hull[-1][1] - _hull[-2][1]) * (_point[0] - _hull[-2][0])) <= 0:
+                _hull.pop()
+            _hull.append(_point)
+        return _hull
+
+    return _half(_points)[:-1] + _half(reversed(_points))[:-1]
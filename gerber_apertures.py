@@ -0,0 +1,121 @@
+#! /usr/bin/env python3
+"""
+Aperture library for the frame gerbers
+Hands out D codes for the apertures a layer uses, each definition only once, along with aperture macros (%AM) for
+rounded rectangles and block apertures (%AB) for features drawn more than once, such as the letters of the frame text.
+A repeated feature is then a single flash instead of all of its strokes. Definitions are collected while the layer
+body is written and the header is written in front of it afterwards
+"""
+
+from geometry import to_mm
+
+# Name of the rounded rectangle macro, $1 width, $2 height, $3 corner radius
+rounded_rectangle_macro = "ROUNDRECT"
+# Two overlapping rectangles for the straight edges and a circle in each corner
+_rounded_rectangle_body = "*".join((
+    "0 Rounded rectangle, $1 width, $2 height, $3 corner radius",
+    "21,1,$1,$2-$3-$3,0,0,0",
+    "21,1,$1-$3-$3,$2,0,0,0",
+    "1,1,$3+$3,$1/2-$3,$2/2-$3",
+    "1,1,$3+$3,$3-$1/2,$2/2-$3",
+    "1,1,$3+$3,$3-$1/2,$3-$2/2",
+    "1,1,$3+$3,$1/2-$3,$3-$2/2",
+))
+
+
+class ApertureLibrary:
+    """
+    D codes and definitions for one gerber layer
+    """
+
+    def __init__(self, first_code=10):
+        self._next_code = first_code
+        # {definition: code}, [(code, definition)] in the order they were added
+        self._codes = dict()
+        self._apertures = list()
+        # [(name, body)]
+        self._macros = list()
+        # {key: code}, [(code, lines)]
+        self._block_codes = dict()
+        self._blocks = list()
+
+    def _take_code(self):
+        _code = self._next_code
+        self._next_code += 1
+        return _code
+
+    def aperture(self, definition):
+        """
+        :param definition: Standard or macro aperture definition without the D code, e.g. "C,0.100000"
+        :return: D code of the aperture, the same code every time for the same definition
+        """
+        if definition not in self._codes:
+            self._codes[definition] = self._take_code()
+            self._apertures.append((self._codes[definition], definition))
+
+        return self._codes[definition]
+
+    def circle(self, diameter):
+        """
+        :param diameter: Diameter in nm
+        :return: D code
+        """
+        return self.aperture("C,{:.6f}".format(to_mm(diameter)))
+
+    def rectangle(self, width, height):
+        """
+        :param width: Width in nm
+        :param height: Height in nm
+        :return: D code
+        """
+        return self.aperture("R,{:.6f}X{:.6f}".format(to_mm(width), to_mm(height)))
+
+    def rounded_rectangle(self, width, height, radius):
+        """
+        Rectangle with rounded corners as a single aperture, from the rounded rectangle macro
+        :param width: Overall width in nm
+        :param height: Overall height in nm
+        :param radius: Corner radius in nm
+        :return: D code
+        """
+        if not self._macros:
+            self._macros.append((rounded_rectangle_macro, _rounded_rectangle_body))
+
+        return self.aperture("{},{:.6f}X{:.6f}X{:.6f}".format(rounded_rectangle_macro, to_mm(width), to_mm(height),
+                                                              to_mm(radius)))
+
+    def block(self, key, make_lines):
+        """
+        Block aperture, the content is only made the first time a key is used
+        :param key: Anything hashable that identifies the content, e.g. (letter, mirrored)
+        :param make_lines: Function that returns the list of gerber lines in the block, relative to the block origin
+                           The lines must select their own apertures, which have to come from this library
+        :return: D code
+        """
+        try:
+            return self._block_codes[key]
+        except KeyError:
+            pass
+
+        _lines = make_lines()
+        _code = self._take_code()
+        self._block_codes[key] = _code
+        self._blocks.append((_code, _lines))
+
+        return _code
+
+    def header(self):
+        """
+        :return: str of every definition, macros then apertures then the blocks that use them
+        """
+        _lines = list()
+        for _name, _body in self._macros:
+            _lines.append("%AM{}*\n{}*%\n".format(_name, _body.replace("*", "*\n")))
+        for _code, _definition in self._apertures:
+            _lines.append("%ADD{}{}*%\n".format(_code, _definition))
+        for _code, _block_lines in self._blocks:
+            _lines.append("%ABD{}*%\n".format(_code))
+            _lines.extend(_block_lines)
+            _lines.append("%AB*%\n")
+
+        return "".join(_lines)
@@ -1,15 +1,21 @@
 #! /usr/bin/env python3
 
 import datetime
-import json
+import io
 import logging
 import shutil
-from configparser import ConfigParser
 from pathlib import Path
 from zipfile import ZipFile
 
 import logzero
 
+from frame_cache import shared_cache, template_key
+from gerber_apertures import ApertureLibrary
+from panel_model import PanelSpec
+from snapshot import load_config, load_font
+from text_layout import FrameTextLayout, WidthTable
+from geometry import to_nm, to_mm, point_to_nm, half_nm, format_gerber, format_excellon, format_decimal
+
 # Partial header for gerber file generation
 gerber_header = """G04 Paneliser Gerber RS-274X export*
 G75*
@@ -29,18 +35,23 @@ ICI,OFF
 METRIC,TZ,000.000
 """.format(datetime.datetime.now().strftime("%Y-%M-%dT%H:%M:%SZ"))
 
+# Frame layers that only depend on the panel size and the config, these are cached, see frame_cache.py
+# [GerberFilenames] config keys, the drills are cached without their header
+template_layers = ("top_copper", "bottom_copper", "top_paste", "bottom_paste", "top_soldermask", "bottom_soldermask",
+                   "drills")
+
 
 class GerberGenerator:
-    # {width, height, step, repeat, title}
-    panel_info = dict()
+    # panel_model.PanelSpec of the panel the frame is for, dimensions are in nm
+    panel = None
     config = None
     out_path = None
     # zip_out_path = None
 
-    # Relative points from the corners of the panel, y coord is always the middle of the frame edge
+    # Relative points from the corners of the panel in nm, y coord is always the middle of the frame edge
     # order is bl, br, tl, tr
-    fid_points = [15, -10, 10, -10]
-    # Actual coords of the placed fids, used for reporting
+    fid_points = [to_nm(15), to_nm(-10), to_nm(10), to_nm(-10)]
+    # Actual coords of the placed fids in nm, used for reporting
     fid_coords = list()
     # Diameter of the copper fiducial dot, diameter
     fid_dia = 1
@@ -51,17 +62,44 @@ class GerberGenerator:
     drill_dia = 3.0
     drill_coords = list()
 
+    # Width in nm of the stroke used to round the corners of the stencil apertures
+    stencil_roundness = to_nm(0.24)
+    # Draw rounded apertures as a single flash of an aperture macro, rather than a flash and a stroke around it
+    aperture_macros = True
+    # Define each letter of the frame text once as a block aperture and flash it, rather than drawing every stroke
+    glyph_blocks = False
+
+    # panel_outline.PanelOutline with the native profile and route paths, None leaves the profile blank
+    panel_outline = None
+    # (diameter, numpy array of shape (tabs, holes per tab, 2)) of the native mousebite holes in nm, None if
+    # GerberPanelizer makes them
+    tab_holes = None
+    # Width in mm of the line used to draw the profile
+    profile_line_width = 0.1
+    # List of (x0, y0, x1, y1) bounding boxes of each board in board order, for the serial marks
+    board_boxes = None
+
     # List of file paths to compress into a single zip archive
     file_list = list()
     font_definition = None
+    # text_layout.WidthTable of the font, for fitting the frame text
+    width_table = None
+    # Glyph coords converted to nm, {(letter, text size): [(x, y, command), ...]}
+    glyph_cache = dict()
     # How high to make the text
     text_size = 1.2
+    # Smallest the frame text can be shrunk to in nm to fit between the fiducials, from the config
+    min_text_size = to_nm(0.8)
     # How thick to make the text as a percentage of the height
     # i.e for 1.2mm text, a ratio of 10% will result in 0.12mm thick text
     text_ratio = 10
 
     # Optionally don't zip the output when running for debug purposes
     zip_output = True
+    # Name of the zip the frame gerbers are written to, next to the gerberset
+    overlay_zip_name = "panel_frame_overlay.zip"
+    # file_cache.FileCache of the template layers from frame_cache.shared_cache(), None makes them every time
+    template_cache = None
 
     logger = None
 
@@ -72,6 +110,12 @@ class GerberGenerator:
             self.logger = logzero.logger
             logzero.loglevel(logging.DEBUG)
 
+        # Per panel state, so more than one panel can be made in the same process
+        self.panel = None
+        self.fid_coords = list()
+        self.drill_coords = list()
+        self.file_list = list()
+
     def _make_output_dir(self):
         """
         Make the output directory to put the individual gerber files
@@ -95,7 +139,7 @@ class GerberGenerator:
         :return:
         """
         self.logger.debug("== Writing Zip File ==")
-        _out_zip_path = self.out_path.parent / "panel_frame_overlay.zip"
+        _out_zip_path = self.out_path.parent / self.overlay_zip_name
 
         with ZipFile(str(_out_zip_path), 'w') as out_zip:
             for _file in self.file_list:
@@ -115,67 +159,117 @@ class GerberGenerator:
             self.logger.error("Font file cannot be found at: {}".format(str(_font_path)))
             exit(1)
 
-        self.font_definition = json.loads(_font_path.read_text())
+        _font_definition = load_font(_font_path)
+        if _font_definition is not self.font_definition:
+            # Glyphs are only converted again if the font file has changed
+            self.font_definition = _font_definition
+            self.width_table = WidthTable(_font_definition)
+            self.glyph_cache = dict()
 
-    def _text_to_silk_mm(self, text):
+    def _glyph_coords(self, letter, size):
         """
-        Returns the approximate length of a string of text in mm when applied to the silkscreen layer of the PCB
-        :param text: A string of text to get the mm length of
-        :return: The length of the string in mm when on the PCB
+        Returns the drawing coords of a letter scaled to a text size, each letter is only converted to nm once per size
+        :param letter: Single character from the font definition
+        :param size: Text size in nm
+        :return: list of (x, y, command) tuples with x and y in nm
         """
-        _string_len = 0
+        try:
+            return self.glyph_cache[(letter, size)]
+        except KeyError:
+            pass
 
-        for letter in text:
-            if letter == " ":
-                # Space char width
-                _string_len += self.font_definition['space_char_width']
-            else:
-                _string_len += (self.font_definition['letters'][letter]['width'] * self.text_size) + \
-                               (self.font_definition['text_letter_gap'] * self.text_size)
+        _size = to_mm(size)
+        _coords = [(to_nm(coords["x"] * _size), to_nm(coords["y"] * _size), coords["command"])
+                   for coords in self.font_definition["letters"][letter]["coords"]]
+        self.glyph_cache[(letter, size)] = _coords
 
-        return _string_len
+        return _coords
 
-    def _add_text_to_silk_file(self, text, file, x_start, y_start, mirror=False):
+    @staticmethod
+    def _glyph_end(coords, x_start, mirror=False):
+        """
+        Where a letter drawn at x_start finishes, the next letter starts one letter gap after this
+        :param coords: Glyph coords from _glyph_coords()
+        :param x_start: X coord in nm the letter is drawn at
+        :param mirror: True if the letter is mirrored, the text then runs right to left
+        :return: X coord in nm
+        """
+        if mirror:
+            return x_start + min([0] + [-_x for _x, _y, _command in coords])
+        return x_start + max([0] + [_x for _x, _y, _command in coords])
+
+    @staticmethod
+    def _glyph_block_lines(coords, mirror, stroke_code):
+        """
+        Strokes of a letter relative to its origin, the content of its block aperture
+        :param coords: Glyph coords from _glyph_coords()
+        :param mirror: True for the mirrored letter
+        :param stroke_code: D code of the aperture the letter is drawn with
+        :return: list of gerber lines
+        """
+        _mirror_scalar = -1 if mirror else 1
+        _lines = ["D{}*\n".format(stroke_code)]
+        for _glyph_x, _glyph_y, _command in coords:
+            _lines.append("X{}Y{}{}*\n".format(format_gerber(_glyph_x * _mirror_scalar), format_gerber(_glyph_y),
+                                                _command))
+
+        return _lines
+
+    def _add_text_to_silk_file(self, text, out_file, x_start, y_start, mirror=False, library=None, stroke_code=None,
+                               size=None):
         """
         Adds a sting of text to the given silkscreen file
         :param text: String of text to write to the silkscreen file
-        :param file: File to write the silkscreen information to
+        :param out_file: Text stream of the silkscreen layer body, the stroke aperture must already be selected
+        :param x_start: X coord in nm of the start of the text
+        :param y_start: Y coord in nm of the baseline of the text
+        :param mirror: Mirror the text, for the bottom silkscreen
+        :param library: ApertureLibrary of the layer, letters are flashed as block apertures if given
+        :param stroke_code: D code of the stroke aperture, needed with a library
+        :param size: Text size in nm, text_size if None
         :return:
         """
         # Remove leading and trailing whitespace in the text
         _text = text.strip()
+        if size is None:
+            size = to_nm(self.text_size)
 
         mirror_scalar = 1
         if mirror:
             mirror_scalar = -1
 
+        _space_advance = to_nm(self.font_definition["space_char_width"] - self.font_definition["text_letter_gap"]) * mirror_scalar
+        _letter_gap = to_nm(self.font_definition["text_letter_gap"]) * mirror_scalar
+
         self.logger.debug("Writing string: {}".format(_text))
 
-        with open(file, 'a') as out_file:
-            for index, letter in enumerate(_text):
-                if letter == " ":
-                    x_start += ((self.font_definition["space_char_width"] - self.font_definition["text_letter_gap"]) * mirror_scalar)
-                else:
-                    try:
-                        _xmax = x_start
-                        for coords in self.font_definition["letters"][str(letter)]['coords']:
-                            # print(coords)
-                            _x = (((coords["x"] * mirror_scalar) * self.text_size) + x_start)
-
-                            if (_x > _xmax) and not mirror:
-                                # Store the maximum X coord when drawing the letter
-                                _xmax = _x
-                            elif _x < _xmax and mirror:
-                                _xmax = _x
-
-                            _y = ((coords["y"] * self.text_size) + y_start)
-                            out_file.write("X{}Y{}{}*\n".format(int(_x * 10000), int(_y * 10000), coords["command"]))
-
-                        x_start = _xmax + (self.font_definition["text_letter_gap"] * mirror_scalar)
-                    except KeyError:
-                        self.logger.error("Letter '{}' not found in font definition file".format(letter))
-                        self.logger.error("Please try again with a different frame title")
-                        exit(1)
+        _selected = None
+        for index, letter in enumerate(_text):
+            if letter == " ":
+                x_start += _space_advance
+                continue
+
+            try:
+                _coords = self._glyph_coords(str(letter), size)
+            except KeyError:
+                self.logger.error("Letter '{}' not found in font definition file".format(letter))
+                self.logger.error("Please try again with a different frame title")
+                exit(1)
+
+            if library is None:
+                for _glyph_x, _glyph_y, _command in _coords:
+                    out_file.write("X{}Y{}{}*\n".format(format_gerber((_glyph_x * mirror_scalar) + x_start),
+                                                        format_gerber(_glyph_y + y_start), _command))
+            else:
+                # Each letter is only defined once per layer, every use of it after that is a single flash
+                _code = library.block((letter, mirror, size),
+                                      lambda: self._glyph_block_lines(_coords, mirror, stroke_code))
+                if _code != _selected:
+                    out_file.write("D{}*\n".format(_code))
+                    _selected = _code
+                out_file.write("X{}Y{}D03*\n".format(format_gerber(x_start), format_gerber(y_start)))
+
+            x_start = self._glyph_end(_coords, x_start, mirror) + _letter_gap
 
     def _add_fiducial_apertures_to_file(self, text, file, x_start, y_start, mirror=False):
         """
@@ -188,317 +282,445 @@ class GerberGenerator:
         :return:
         """
 
-    def _write_gerbers(self):
+    def _write_stencil_apertures(self, out_file, library, layer, aperture_size):
         """
-        Write gerber files, fiducial locations and drills
+        Writes the stencil alignment apertures, square with rounded corners
+        Either a single flash of the rounded rectangle macro, or a square flash with a stroke around the edge
+        :param out_file: Text stream of the layer body
+        :param library: ApertureLibrary of the layer
+        :param layer: [GerberFilenames] key of the layer, bottom layers use the mirrored aperture locations
+        :param aperture_size: Overall size of the square aperture in nm
         :return:
         """
-        self.logger.info("== Generating frame gerbers ==")
+        if not self.config["Fabrication"]["add_frame_stencil_apertures"]:
+            return
+
+        _aperture_locations = self.config["Fabrication"]["frame_stencil_aperture_locations"]
+        if layer.startswith("bottom"):
+            _aperture_locations = [self.aperture_coords[x][2] for x in _aperture_locations]
+
+        if self.aperture_macros:
+            out_file.write("D{}*\n".format(library.rounded_rectangle(aperture_size, aperture_size,
+                                                                     half_nm(self.stencil_roundness))))
+            for _location in _aperture_locations:
+                _aperture_coords = self.aperture_coords[_location]
+                out_file.write("X{}Y{}D03*\n".format(format_gerber(_aperture_coords[0]),
+                                                     format_gerber(_aperture_coords[1])))
+            return
+
+        _square_code = library.rectangle(aperture_size - self.stencil_roundness, aperture_size - self.stencil_roundness)
+        _stroke_code = library.circle(self.stencil_roundness)
+
+        # Distance from the center of the aperture to the center line of the rounding stroke
+        _inset = half_nm(aperture_size - self.stencil_roundness)
+
+        for _location in _aperture_locations:
+            out_file.write("D{}*\n".format(_square_code))
+            _aperture_coords = self.aperture_coords[_location]
+            out_file.write("X{}Y{}D03*\n".format(format_gerber(_aperture_coords[0]), format_gerber(_aperture_coords[1])))
+            out_file.write("D{}*\n".format(_stroke_code))
+
+            # Stroke around the square, starting and finishing at the bottom left corner
+            for _x_dir, _y_dir, _command in ((-1, -1, "D02"), (-1, 1, "D01"), (1, 1, "D01"), (1, -1, "D01"), (-1, -1, "D01")):
+                out_file.write("X{}Y{}{}*\n".format(format_gerber(_aperture_coords[0] + (_x_dir * _inset)),
+                                                    format_gerber(_aperture_coords[1] + (_y_dir * _inset)),
+                                                    _command))
+
+    def _write_gerber_file(self, file, library, body):
+        """
+        Writes a frame gerber layer, the aperture definitions are only known once the body has been made
+        :param file: Path of the gerber file
+        :param library: ApertureLibrary the body used
+        :param body: str of the layer body
+        :return:
+        """
+        self._write_layer_text(file, self._layer_text(library, body))
 
-        _y_offset = (float(self.config["PanelOptions"]["panel_width"]) / 2)
-        # Absolute coords for fiducial marks
-        self.fid_coords = [
-            (round(self.fid_points[0], 6), round(_y_offset, 6)),
-            (round(self.panel_info["width"] + self.fid_points[1], 6), round(_y_offset, 6)),
-            (round(self.fid_points[2], 6), round(self.panel_info["height"] - _y_offset, 6)),
-            (round(self.panel_info["width"] + self.fid_points[3], 6), round(self.panel_info["height"] - _y_offset, 6))
-        ]
-        self.logger.debug("Fiducial coords: {}".format(self.fid_coords))
+    @staticmethod
+    def _layer_text(library, body):
+        """
+        :param library: ApertureLibrary the body used
+        :param body: str of the layer body
+        :return: str of the aperture definitions and the body, everything that goes between the header and the end
+        """
+        return library.header() + "\n" + body
 
-        # Absolute coords for corner drills
-        self.drill_coords = [
-            (round(_y_offset, 6), round(_y_offset, 6)),
-            (round(self.panel_info["width"] - _y_offset, 6), round(_y_offset, 6)),
-            (round(_y_offset, 6), round(self.panel_info["height"] - _y_offset, 6)),
-            (round(self.panel_info["width"] - _y_offset, 6), round(self.panel_info["height"] - _y_offset, 6))
-        ]
-        self.logger.debug("Drill coords: {}".format(self.drill_coords))
+    def _write_layer_text(self, file, text):
+        """
+        Writes a frame gerber layer
+        :param file: Path of the gerber file
+        :param text: str from _layer_text()
+        :return:
+        """
+        self.file_list.append(file)
+        self.logger.debug("Writing gerber file: {}".format(file.name))
+        with open(file, 'w') as out_file:
+            out_file.write(gerber_header.format(file.stem) + "G01*\n" + text + "M02*\n")
 
-        # Absolute coords for stencil apertures
-        # Aperture locations - tl: 0, tr: 1, bl: 2, br: 3
-        # (X, Y, bottom_mirror_index)
-        _panel_width = float(self.config["PanelOptions"]["panel_width"])
-        self.aperture_coords = [
-            (_panel_width / 2, round(self.panel_info["height"] - _panel_width - 5, 6), 1),
-            (round(self.panel_info["width"] - (_panel_width / 2), 6), round(self.panel_info["height"] - _panel_width - 5, 6), 0),
-            (_panel_width / 2, _panel_width + 5, 3),
-            (round(self.panel_info["width"] - (_panel_width / 2), 6), _panel_width + 5, 2),
-        ]
+    def _template_key(self):
+        """
+        :return: Key of the template layers of this panel, from everything they depend on
+        """
+        _fabrication = self.config["Fabrication"]
+        return template_key(self.panel.width, self.panel.height,
+                            self.config["PanelOptions"]["panel_width"],
+                            [_fabrication[_option] for _option in ("add_frame_stencil_apertures",
+                                                                   "frame_stencil_aperture_locations",
+                                                                   "frame_stencil_aperture_size",
+                                                                   "frame_stencil_aperture_border")],
+                            self.aperture_macros, self.fid_points, self.fid_dia, self.fid_soldermask_dia,
+                            self.drill_dia, self.stencil_roundness)
+
+    def _template_layers(self):
+        """
+        The template layers of this panel, from the cache if a panel of the same size has been made before
+        :return: dict of {layer: text}
+        """
+        if self.template_cache is None:
+            return self._make_template_layers()
+
+        _key = self._template_key()
+        _layers = self.template_cache.get(_key)
+        if _layers is None:
+            _layers = self._make_template_layers()
+            self.template_cache.put(_key, _layers)
+        else:
+            self.logger.debug("Using cached frame layers {}".format(_key[:12]))
 
-        # Get file names from config file
-        _file_names = self.config["GerberFilenames"]
+        return _layers
 
-        _aperture_size = float(self.config["Fabrication"]["frame_stencil_aperture_size"])
-        _roundness = 0.24
+    def _make_template_layers(self):
+        """
+        Makes the frame layers that don't change between panels of the same size, fiducials, stencil apertures and drills
+        :return: dict of {layer: text}, gerber layers from _layer_text(), the drills without the excellon header
+        """
+        _layers = dict()
+        _aperture_size = self.config["Fabrication"]["frame_stencil_aperture_size"]
 
         # Top and bottom copper have the same content, top and bottom fiducials
-        _files = [self.out_path / _file_names["top_copper"], self.out_path / _file_names["bottom_copper"]]
-        for _file in _files:
-            self.file_list.append(_file)
-            self.logger.debug("Writing gerber file: {}".format(_file.name))
-            with open(_file, 'w') as out_file:
-                out_file.writelines(gerber_header.format(_file.stem))
-
-                out_file.write("G01*\n")
-                out_file.write("%ADD10C,{:.6f}*%\n".format(float(self.fid_dia)))
-
-                out_file.write("%ADD11R,{:.6f}X{:.6f}*%\n".format(_aperture_size - _roundness, _aperture_size - _roundness))
-                out_file.write("%ADD12C,{:.6f}*%\n".format(_roundness))
-                out_file.write("\n")
-
-                out_file.write("D10*\n")
-                for loc in self.fid_coords:
-                    out_file.write("X{:.0f}Y{:.0f}D03*\n".format(loc[0] * 10000, loc[1] * 10000))
-
-                if self.config["Fabrication"]["add_frame_stencil_apertures"].lower() == "true":
-                    _aperture_locations = self.config["Fabrication"]["frame_stencil_aperture_locations"].replace(' ', '').split(',')
-                    _aperture_locations = [int(x) for x in _aperture_locations]
-                    if "bottom" in str(_file):
-                        _aperture_locations = [self.aperture_coords[x][2] for x in _aperture_locations]
-
-                    for _location in _aperture_locations:
-                        out_file.write("D11*\n")
-                        _aperture_coords = self.aperture_coords[_location]
-                        out_file.write("X{:.0f}Y{:.0f}D03*\n".format(_aperture_coords[0] * 10000, _aperture_coords[1] * 10000))
-                        out_file.write("D12*\n")
+        for _layer in ("top_copper", "bottom_copper"):
+            _library = ApertureLibrary()
+            _body = io.StringIO()
 
-                        out_file.write("X{:.0f}Y{:.0f}D02*\n".format((_aperture_coords[0] - _aperture_size / 2 + _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] - _aperture_size / 2 + _roundness / 2) * 10000))
+            _body.write("D{}*\n".format(_library.circle(to_nm(self.fid_dia))))
+            for loc in self.fid_coords:
+                _body.write("X{}Y{}D03*\n".format(format_gerber(loc[0]), format_gerber(loc[1])))
 
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] - _aperture_size / 2 + _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] + _aperture_size / 2 - _roundness / 2) * 10000))
-
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] + _aperture_size / 2 - _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] + _aperture_size / 2 - _roundness / 2) * 10000))
-
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] + _aperture_size / 2 - _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] - _aperture_size / 2 + _roundness / 2) * 10000))
-
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] - _aperture_size / 2 + _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] - _aperture_size / 2 + _roundness / 2) * 10000))
-
-                out_file.write("M02*\n")
+            self._write_stencil_apertures(_body, _library, _layer, _aperture_size)
+            _layers[_layer] = self._layer_text(_library, _body.getvalue())
 
         # Top and bottom paste have the same content, top and bottom fiducials
-        _files = [self.out_path / _file_names["top_paste"], self.out_path / _file_names["bottom_paste"]]
-        for _file in _files:
-            self.file_list.append(_file)
-            self.logger.debug("Writing gerber file: {}".format(_file.name))
-            with open(_file, 'w') as out_file:
-                out_file.writelines(gerber_header.format(_file.stem))
-
-                out_file.write("G01*\n")
-                out_file.write("%ADD11R,{:.6f}X{:.6f}*%\n".format(_aperture_size - _roundness, _aperture_size - _roundness))
-                out_file.write("%ADD12C,{:.6f}*%\n".format(_roundness))
-                out_file.write("\n")
-
-                # out_file.write("D10*\n")
-                # for loc in self.fid_coords:
-                #     out_file.write("X{:.0f}Y{:.0f}D03*\n".format(loc[0] * 10000, loc[1] * 10000))
+        for _layer in ("top_paste", "bottom_paste"):
+            _library = ApertureLibrary()
+            _body = io.StringIO()
 
-                if self.config["Fabrication"]["add_frame_stencil_apertures"].lower() == "true":
-                    _aperture_locations = self.config["Fabrication"]["frame_stencil_aperture_locations"].replace(' ', '').split(',')
-                    _aperture_locations = [int(x) for x in _aperture_locations]
-                    if "bottom" in str(_file):
-                        _aperture_locations = [self.aperture_coords[x][2] for x in _aperture_locations]
+            self._write_stencil_apertures(_body, _library, _layer, _aperture_size)
+            _layers[_layer] = self._layer_text(_library, _body.getvalue())
 
-                    for _location in _aperture_locations:
-                        out_file.write("D11*\n")
-                        _aperture_coords = self.aperture_coords[_location]
-                        out_file.write("X{:.0f}Y{:.0f}D03*\n".format(_aperture_coords[0] * 10000, _aperture_coords[1] * 10000))
-                        out_file.write("D12*\n")
+        _aperture_size = self.config["Fabrication"]["frame_stencil_aperture_size"] + \
+            (self.config["Fabrication"]["frame_stencil_aperture_border"] * 2)
 
-                        out_file.write("X{:.0f}Y{:.0f}D02*\n".format((_aperture_coords[0] - _aperture_size / 2 + _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] - _aperture_size / 2 + _roundness / 2) * 10000))
+        # Top and bottom soldermask layers have the same content, fiducials and mask for drills
+        for _layer in ("top_soldermask", "bottom_soldermask"):
+            _library = ApertureLibrary()
+            _body = io.StringIO()
 
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] - _aperture_size / 2 + _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] + _aperture_size / 2 - _roundness / 2) * 10000))
+            _body.write("D{}*\n".format(_library.circle(to_nm(self.fid_soldermask_dia))))
+            for loc in self.fid_coords:
+                _body.write("X{}Y{}D03*\n".format(format_gerber(loc[0]), format_gerber(loc[1])))
 
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] + _aperture_size / 2 - _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] + _aperture_size / 2 - _roundness / 2) * 10000))
+            _body.write("D{}*\n".format(_library.aperture("C,3.203200")))
+            for loc in self.drill_coords:
+                _body.write("X{}Y{}D03*\n".format(format_gerber(loc[0]), format_gerber(loc[1])))
 
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] + _aperture_size / 2 - _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] - _aperture_size / 2 + _roundness / 2) * 10000))
+            self._write_stencil_apertures(_body, _library, _layer, _aperture_size)
+            _layers[_layer] = self._layer_text(_library, _body.getvalue())
 
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] - _aperture_size / 2 + _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] - _aperture_size / 2 + _roundness / 2) * 10000))
+        # Excellon drill file, the header has the date in so is added when it is written
+        _body = io.StringIO()
+        _body.write("T1C{:.3f}\n".format(self.drill_dia))
+        _body.write("%\n")
 
-                out_file.write("M02*\n")
+        _body.write("G90\n")
+        _body.write("M71\n")
+        _body.write("T1\n")
 
-        _aperture_size = float(self.config["Fabrication"]["frame_stencil_aperture_size"]) + \
-                         (float(self.config["Fabrication"]["frame_stencil_aperture_border"]) * 2)
+        for loc in self.drill_coords:
+            _body.write("X{}Y{}\n".format(format_excellon(loc[0]), format_excellon(loc[1])))
 
-        # Top and bottom soldermask layers have the same content, fiducials and mask for drills
-        _files = [self.out_path / _file_names["top_soldermask"], self.out_path / _file_names["bottom_soldermask"]]
-        for _file in _files:
-            self.file_list.append(_file)
-            self.logger.debug("Writing gerber file: {}".format(_file.name))
-            with open(_file, 'w') as out_file:
-                out_file.writelines(gerber_header.format(_file.stem))
+        _body.write("M30\n")
+        _layers["drills"] = _body.getvalue()
 
-                out_file.write("G01*\n")
-                out_file.write("%ADD10C,{:.6f}*%\n".format(float(self.fid_soldermask_dia)))
-                out_file.write("%ADD11R,{:.6f}X{:.6f}*%\n".format(_aperture_size - _roundness, _aperture_size - _roundness))
-                out_file.write("%ADD12C,{:.6f}*%\n".format(_roundness))
-                out_file.write("%ADD13C,3.203200*%\n")
+        return _layers
 
-                out_file.write("\n")
+    def _write_drills_with_tab_holes(self, out_file):
+        """
+        Writes the corner drills and the mousebite holes, the holes change with the tabs so this isn't cached
+        :param out_file: Text stream of the drill file
+        :return:
+        """
+        from excellon import DrillTable
 
-                out_file.write("D10*\n")
-                for loc in self.fid_coords:
-                    out_file.write("X{:.0f}Y{:.0f}D03*\n".format(loc[0] * 10000, loc[1] * 10000))
+        _drills = DrillTable(self.config["NativeExport"]["order_drill_hits"])
+        # Tooling holes and mousebites aren't plated
+        _drills.add_hits(to_nm(self.drill_dia), self.drill_coords, plated=False)
+        _drills.add_hits(*self.tab_holes, plated=False)
+        _drills.write(out_file)
 
-                out_file.write("D13*\n")
-                for loc in self.drill_coords:
-                    out_file.write("X{:.0f}Y{:.0f}D03*\n".format(loc[0] * 10000, loc[1] * 10000))
+    def _layout_frame_text(self):
+        """
+        Fits the frame text between the fiducials, shortening, wrapping or shrinking it if it is too long
+        :return: list of text_layout.FrameText, not mirrored
+        """
+        _panel_width = self.config["PanelOptions"]["panel_width"]
+        _fid_radius = half_nm(to_nm(self.fid_soldermask_dia))
+        _repeat = (self.panel.repeat_x, self.panel.repeat_y)
+        _step = (format_decimal(self.panel.step_x, 4), format_decimal(self.panel.step_y, 4))
+        _now = datetime.datetime.now()
+        _strings = {
+            "title": (self.panel.title, self.panel.title),
+            "date": (_now.strftime("%d/%b/%Y"), _now.strftime("%d/%m/%y")),
+            "repeat": ("Repeat: {} x {}".format(*_repeat), "Rep: {}x{}".format(*_repeat)),
+            "step": ("Step: {}mm x {}mm".format(*_step), "Step: {}x{}mm".format(*_step)),
+        }
 
-                if self.config["Fabrication"]["add_frame_stencil_apertures"].lower() == "true":
-                    _aperture_locations = self.config["Fabrication"]["frame_stencil_aperture_locations"].replace(' ', '').split(',')
-                    _aperture_locations = [int(x) for x in _aperture_locations]
-                    if "bottom" in str(_file):
-                        _aperture_locations = [self.aperture_coords[x][2] for x in _aperture_locations]
+        # Along the bottom of the frame, from clear of the bottom left fiducial up to the bottom right one
+        _layout = FrameTextLayout(self.width_table, to_nm(self.text_size), self.min_text_size)
+        _texts = _layout.fit(_strings, to_nm(25.4), self.fid_coords[1][0] - _fid_radius)
+        if _layout.style != "full" or _layout.size != to_nm(self.text_size):
+            self.logger.info("Frame text {} at {}mm to fit between the fiducials".format(
+                _layout.style, format_decimal(_layout.size, 2)))
+
+        if self.config["Fabrication"]["add_order_number_placeholder"]:
+            # Centred on the top of the frame, between the top fiducials
+            _centre = half_nm(self.panel.width)
+            _available = 2 * min(_centre - self.fid_coords[2][0], self.fid_coords[3][0] - _centre) - 2 * _fid_radius
+            _texts.append(_layout.fit_centred("placeholder",
+                                              self.config["Fabrication"]["order_number_placeholder_text"],
+                                              _centre, self.panel.height - half_nm(_panel_width), _available))
+
+        if not _layout.fits:
+            self.logger.warning("Silkscreen text on panel frame will extend beyond the edge of the panel")
+            self.logger.warning("The step and repeat information will still be output in the report file")
+
+        self.logger.debug("Frame text: {}".format(_texts))
+        return _texts
+
+    def _write_serial_marks(self, file):
+        """
+        Writes a serial mark on every board to its own layer, the label and optionally a Data Matrix code of it
+        Each letter is defined once as a block aperture and each aperture is selected once, so every letter of every
+        label is a single flash and the layer grows with the number of boards rather than the strokes in each label
+        :param file: Path of the gerber file
+        :return:
+        """
+        import numpy
+
+        from serial_marks import code_runs, mark_labels, to_gerber_units
+
+        _options = self.config["SerialMarks"]
+        _size = _options["serial_text_size"]
+        _module = _options["serial_code_module"]
+        _corners = numpy.array([_box[:2] for _box in self.board_boxes], dtype=numpy.int64).reshape(-1, 2)
+        _labels = mark_labels(_options["serial_format"], _options["serial_start"], _corners)
+        _anchors = _corners + numpy.array(_options["serial_anchor"], dtype=numpy.int64)
+
+        _library = ApertureLibrary()
+        _stroke_code = _library.aperture("C,{}".format((to_mm(_size) * (self.text_ratio / 100)) - 0.004))
+        _letter_gap = to_nm(self.font_definition["text_letter_gap"])
+        _space_advance = to_nm(self.font_definition["space_char_width"]) - _letter_gap
+
+        # numpy arrays of (D code, x, y) of the flashes, sorted by D code before writing
+        _flashes = list()
+        _text_x = _anchors[:, 0]
+        _tops = _anchors[:, 1] + _size
+        if _options["serial_code"]:
+            _modules, _runs = code_runs(_labels)
+            # Flashed at the centre of each run, the runs start on the bottom left corner of a module
+            # D code of the rectangle of each run length
+            _codes = numpy.zeros(int(_runs[:, 3].max()) + 1, dtype=numpy.int64)
+            for _length in numpy.unique(_runs[:, 3]).tolist():
+                _codes[_length] = _library.rectangle(_length * _module, _module)
+            _flashes.append(numpy.column_stack([
+                _codes[_runs[:, 3]],
+                _anchors[_runs[:, 0], 0] + _runs[:, 2] * _module + (_runs[:, 3] * _module) // 2,
+                _anchors[_runs[:, 0], 1] + _runs[:, 1] * _module + half_nm(_module)]))
+
+            _tops = numpy.maximum(_tops, _anchors[:, 1] + _modules * _module)
+            # The text starts half a letter clear of the quiet zone
+            _text_x = _text_x + _modules * _module + half_nm(_size)
+
+        # {letter: (block D code, distance to the start of the next letter)}
+        _glyphs = dict()
+        _missing = set()
+        _letters = list()
+        _ends = list()
+        for _label, _x, _y in zip(_labels, _text_x.tolist(), _anchors[:, 1].tolist()):
+            for _letter in _label.strip():
+                if _letter == " ":
+                    _x += _space_advance
+                    continue
 
-                    for _location in _aperture_locations:
-                        out_file.write("D11*\n")
-                        _aperture_coords = self.aperture_coords[_location]
-                        out_file.write("X{:.0f}Y{:.0f}D03*\n".format(_aperture_coords[0] * 10000, _aperture_coords[1] * 10000))
-                        out_file.write("D12*\n")
+                try:
+                    _code, _advance = _glyphs[_letter]
+                except KeyError:
+                    if _letter not in self.font_definition["letters"]:
+                        _missing.add(_letter)
+                        continue
+
+                    _coords = self._glyph_coords(_letter, _size)
+                    _code = _library.block((_letter, False, _size),
+                                           lambda: self._glyph_block_lines(_coords, False, _stroke_code))
+                    _advance = self._glyph_end(_coords, 0) + _letter_gap
+                    _glyphs[_letter] = (_code, _advance)
+
+                _letters.append((_code, _x, _y))
+                _x += _advance
+            _ends.append(_x - _letter_gap)
+        _flashes.append(numpy.array(_letters, dtype=numpy.int64).reshape(-1, 3))
+
+        if _missing:
+            self.logger.warning("Letters {} aren't in the font, left out of the serial marks".format(
+                ", ".join(repr(_letter) for _letter in sorted(_missing))))
+
+        _boxes = numpy.array(self.board_boxes, dtype=numpy.int64).reshape(-1, 4)
+        _overhanging = int(numpy.count_nonzero((numpy.array(_ends) > _boxes[:, 2]) | (_tops > _boxes[:, 3])))
+        if _overhanging:
+            self.logger.warning("Serial marks extend past the edge of {} of {} boards".format(_overhanging,
+                                                                                              len(_labels)))
+
+        _flashes = numpy.concatenate(_flashes)
+        _flashes = _flashes[numpy.argsort(_flashes[:, 0], kind="stable")]
+        _coords = to_gerber_units(_flashes[:, 1:])
+        _body = io.StringIO()
+        # Runs of flashes with the same D code
+        _breaks = numpy.flatnonzero(numpy.diff(_flashes[:, 0])) + 1
+        for _start, _end in zip([0] + _breaks.tolist(), _breaks.tolist() + [len(_flashes)]):
+            _body.write("D{}*\n".format(_flashes[_start, 0]))
+            _body.write(("X{}Y{}D03*\n" * (_end - _start)).format(*_coords[_start:_end].ravel().tolist()))
+
+        self._write_gerber_file(file, _library, _body.getvalue())
+        self.logger.info("Serial marks {} to {} on {} boards".format(_labels[0], _labels[-1], len(_labels)))
 
-                        out_file.write("X{:.0f}Y{:.0f}D02*\n".format((_aperture_coords[0] - _aperture_size / 2 + _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] - _aperture_size / 2 + _roundness / 2) * 10000))
+    def _write_gerbers(self):
+        """
+        Write gerber files, fiducial locations and drills
+        :return:
+        """
+        self.logger.info("== Generating frame gerbers ==")
 
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] - _aperture_size / 2 + _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] + _aperture_size / 2 - _roundness / 2) * 10000))
+        _panel_width = self.config["PanelOptions"]["panel_width"]
+        _y_offset = half_nm(_panel_width)
+        # Absolute coords for fiducial marks
+        self.fid_coords = [
+            (self.fid_points[0], _y_offset),
+            (self.panel.width + self.fid_points[1], _y_offset),
+            (self.fid_points[2], self.panel.height - _y_offset),
+            (self.panel.width + self.fid_points[3], self.panel.height - _y_offset)
+        ]
+        self.logger.debug("Fiducial coords: {}".format(self.fid_coords))
 
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] + _aperture_size / 2 - _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] + _aperture_size / 2 - _roundness / 2) * 10000))
+        # Absolute coords for corner drills
+        self.drill_coords = [
+            (_y_offset, _y_offset),
+            (self.panel.width - _y_offset, _y_offset),
+            (_y_offset, self.panel.height - _y_offset),
+            (self.panel.width - _y_offset, self.panel.height - _y_offset)
+        ]
+        self.logger.debug("Drill coords: {}".format(self.drill_coords))
 
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] + _aperture_size / 2 - _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] - _aperture_size / 2 + _roundness / 2) * 10000))
+        # Absolute coords for stencil apertures
+        # Aperture locations - tl: 0, tr: 1, bl: 2, br: 3
+        # (X, Y, bottom_mirror_index)
+        _aperture_y_offset = _panel_width + to_nm(5)
+        self.aperture_coords = [
+            (_y_offset, self.panel.height - _aperture_y_offset, 1),
+            (self.panel.width - _y_offset, self.panel.height - _aperture_y_offset, 0),
+            (_y_offset, _aperture_y_offset, 3),
+            (self.panel.width - _y_offset, _aperture_y_offset, 2),
+        ]
 
-                        out_file.write("X{:.0f}Y{:.0f}D01*\n".format((_aperture_coords[0] - _aperture_size / 2 + _roundness / 2) * 10000,
-                                                                     (_aperture_coords[1] - _aperture_size / 2 + _roundness / 2) * 10000))
+        # Get file names from config file
+        _file_names = self.config["GerberFilenames"]
 
-                out_file.write("M02*\n")
+        # Everything but the silkscreen text and the profile is the same for every panel of the same size
+        # The drills are last in template_layers, they are written after the silkscreen
+        _template_layers = self._template_layers()
+        for _layer in template_layers[:-1]:
+            self._write_layer_text(self.out_path / _file_names[_layer], _template_layers[_layer])
 
         # Make silkscreen layers
         self._load_font()
+        _texts = self._layout_frame_text()
         _files = [self.out_path / _file_names["top_silkscreen"], self.out_path / _file_names["bottom_silkscreen"]]
         for _file in _files:
-            self.file_list.append(_file)
-            self.logger.debug("Writing gerber file: {}".format(_file.name))
-            with open(_file, 'w') as out_file:
-                out_file.writelines(gerber_header.format(_file.stem))
-
-                out_file.write("G01*\n")
-                _text_aperture = (self.text_size * (self.text_ratio / 100)) - 0.004
-                out_file.write("%ADD10C,{}*%\n".format(_text_aperture))
-                out_file.write("\n")
-                out_file.write("D10*\n")
-
-            # Repeat and Step x coords are determined dynamically based on text size
-            text_locations = {
-                "title": {"pos": [25.4, 5.3 - (self.text_size / 2)],
-                          "string": self.panel_info["title"]
-                          },
-                "date": {"pos": [25.4, 2.6 - (self.text_size / 2)],
-                         "string": datetime.datetime.now().strftime("%d/%b/%Y")
-                         },
-                "repeat": {"pos": [0, 5.3 - (self.text_size / 2)],
-                           "string": "Repeat: {} x {}".format(self.panel_info["repeat"][0], self.panel_info["repeat"][1])
-                           },
-                "step": {"pos": [0, 2.6 - (self.text_size / 2)],
-                         "string": "Step: {}mm x {}mm".format(round(self.panel_info["step"][0], 4),
-                                                              round(self.panel_info["step"][1], 4))
-                         }
-            }
-
-            # Title and Date are written first, get the length of those
-            _title_len = self._text_to_silk_mm(text_locations["title"]["string"])
-            _date_len = self._text_to_silk_mm(text_locations["date"]["string"])
-            _repeat_len = self._text_to_silk_mm(text_locations["repeat"]["string"])
-            _step_len = self._text_to_silk_mm(text_locations["step"]["string"])
-
-            # Add offset just calculated to the base location for the text
-            _text_x_offset = max(_title_len, _date_len) + 5
-            _base_x = text_locations["title"]["pos"][0]
-            text_locations["repeat"]["pos"][0] = _base_x + _text_x_offset
-            text_locations["step"]["pos"][0] = _base_x + _text_x_offset
-
-            # Find if the strings to be drawn are going to end up off the PCB
-            # Issue a warning to the user and ask for their input if this is the case
-            _max_text_x = max((_repeat_len + text_locations["repeat"]["pos"][0]),
-                              (_step_len + text_locations["step"]["pos"][0]))
-            self.logger.debug("Max silk X: {}".format(_max_text_x))
-
-            _output_silk_layers = 1
-            if _max_text_x > (self.fid_coords[1][0] - (self.fid_soldermask_dia / 2)):
-                self.logger.warning("Silkscreen text on panel frame will extend beyond the edge of the panel")
-                self.logger.warning("Do you still want to output the silkscreen layer?")
-                self.logger.warning("The step and repeat information will still be output in the report file")
-                _output_silk_input = input("Ouput panel silkscreen: (*Y/N)") or "Y"
-
-                if _output_silk_input == "N":
-                    _output_silk_layers = 0
-                    self.logger.info("Skipping silkscreen layer output")
-                elif _output_silk_input == "Y":
-                    pass
-                else:
-                    self.logger.warning("input '{}' not recognised, assuming 'Y'".format(_output_silk_layers))
-
-            if _output_silk_layers:
-                self.logger.info("Outputting silkscreen layers")
-                for text, value in text_locations.items():
-                    x_start = value["pos"][0]
-                    y_start = value["pos"][1]
-                    _string = value["string"]
-
-                    mirror = False
-                    if _file == self.out_path / _file_names["bottom_silkscreen"]:
-                        # Mirror the text on the bottom
-                        mirror = True
-                        x_start = round(self.panel_info["width"], 6) - value["pos"][0]
-
-                    self._add_text_to_silk_file(_string, _file, x_start, y_start, mirror)
-
-                if _file == self.out_path / _file_names["top_silkscreen"]:
-                    # Only output placeholder to the top silkscreen file
-                    if self.config["Fabrication"]["add_order_number_placeholder"].lower() == 'true':
-                        _placeholder = self.config["Fabrication"]["order_number_placeholder_text"]
-                        _placeholder_xstart = (self.panel_info["width"] / 2) - self._text_to_silk_mm(_placeholder)
-                        _placeholder_ystart = self.panel_info["height"] - (_panel_width / 2) - (self.text_size / 2)
-
-                        self._add_text_to_silk_file(_placeholder, _file, _placeholder_xstart, _placeholder_ystart)
-
-            with open(_file, 'a') as out_file:
-                out_file.write("M02*\n")
+            _library = ApertureLibrary()
+            _body = io.StringIO()
+            # Only the top silkscreen has the order number placeholder
+            _bottom = _file == self.out_path / _file_names["bottom_silkscreen"]
+
+            # Letters drawn as strokes all use the aperture of their size, block apertures select it themselves
+            _glyph_library = None
+            if self.glyph_blocks:
+                _glyph_library = _library
+
+            _selected_size = None
+            for _text in _texts:
+                if _bottom and _text.name == "placeholder":
+                    continue
+
+                _text_aperture = (to_mm(_text.size) * (self.text_ratio / 100)) - 0.004
+                _stroke_code = _library.aperture("C,{}".format(_text_aperture))
+                if _glyph_library is None and _text.size != _selected_size:
+                    _body.write("D{}*\n".format(_stroke_code))
+                    _selected_size = _text.size
+
+                x_start = _text.x
+                if _bottom:
+                    # Mirror the text on the bottom
+                    x_start = self.panel.width - _text.x
+
+                self._add_text_to_silk_file(_text.text, _body, x_start, _text.y, _bottom, _glyph_library,
+                                            _stroke_code, _text.size)
+
+            self._write_gerber_file(_file, _library, _body.getvalue())
+
+        if self.board_boxes is not None and self.config["SerialMarks"]["serial_marks"]:
+            self._write_serial_marks(self.out_path / _file_names["serial_silkscreen"])
 
         # Write excellon drill file
         _file = self.out_path / _file_names["drills"]
         self.file_list.append(_file)
         self.logger.debug("Writing drill file: {}".format(_file.name))
         with open(_file, 'w') as out_file:
-            out_file.writelines(excellon_header)
-            out_file.write("T1C{:.3f}\n".format(self.drill_dia))
-            out_file.write("%\n")
-
-            out_file.write("G90\n")
-            out_file.write("M71\n")
-            out_file.write("T1\n")
-
-            for loc in self.drill_coords:
-                out_file.write("X{}Y{}\n".format(int(loc[0] * 1000), int(loc[1] * 1000)))
-
-            out_file.write("M30\n")
+            if self.tab_holes is None:
+                out_file.write(excellon_header + _template_layers["drills"])
+            else:
+                self._write_drills_with_tab_holes(out_file)
 
-        # Make blank profile file
+        # Make profile file, blank unless the panel outline has been worked out natively
         _file = self.out_path / _file_names["profile"]
-        self.file_list.append(_file)
-        self.logger.debug("Writing profile file: {}".format(_file.name))
-        with open(_file, 'w') as out_file:
-            out_file.writelines(gerber_header)
-            out_file.write("G01*\n")
-            out_file.write("M02*\n")
+        _library = ApertureLibrary()
+        _body = io.StringIO()
+        if self.panel_outline is not None:
+            _body.write("D{}*\n".format(_library.aperture("C,{:.6f}".format(self.profile_line_width))))
+            for _contour in self.panel_outline.profile_contours:
+                # Close the contour by going back to the first vertex
+                for index, loc in enumerate(_contour + _contour[:1]):
+                    _body.write("X{}Y{}{}*\n".format(format_gerber(loc[0]), format_gerber(loc[1]),
+                                                     "D02" if index == 0 else "D01"))
+        self._write_gerber_file(_file, _library, _body.getvalue())
+
+        if self.panel_outline is not None:
+            # Router center lines, drawn with the router diameter so the layer shows what is cut away
+            _file = self.out_path / _file_names["mill"]
+            _library = ApertureLibrary()
+            _body = io.StringIO()
+            _body.write("D{}*\n".format(_library.circle(self.panel_outline.route_diameter)))
+            for _start, _end in self.panel_outline.route_segments:
+                _body.write("X{}Y{}D02*\n".format(format_gerber(_start[0]), format_gerber(_start[1])))
+                _body.write("X{}Y{}D01*\n".format(format_gerber(_end[0]), format_gerber(_end[1])))
+            self._write_gerber_file(_file, _library, _body.getvalue())
 
     def _get_report_data(self):
         """
@@ -513,26 +735,40 @@ class GerberGenerator:
 
         return _data
 
-    def make_frame_gerbers(self, panel_dims, pcb_step, pcb_repeat, frame_title, output_directory, frame_config):
+    def make_frame_gerbers(self, panel, output_directory, frame_config, panel_outline=None, tab_holes=None,
+                           board_boxes=None):
         """
         Generate a set of gerbers to place on the outer frame of the panel, contains fiducials and text
-        :param panel_dims: A tuple containing (width, height) of the overall panel
-        :param pcb_step: A tuple (step_x, step_y)
-        :param pcb_repeat: A tuple (repeat_x, repeat_y)
-        :param frame_title: Title of the panel, printed on the frame
+        :param panel: panel_model.PanelSpec, the size, step, repeat and title of the panel
         :param output_directory: A Path() object that specifies where the original gerber files are located
-        :param frame_config: Configparser object containing read "config.ini" file
+        :param frame_config: snapshot.ConfigSnapshot of "config.ini"
+        :param panel_outline: Optional panel_outline.PanelOutline, written to the profile and mill layers
+        :param tab_holes: Optional (diameter, numpy array of shape (tabs, holes per tab, 2)) of the mousebite holes in
+        nm, added to the drills
+        :param board_boxes: Optional list of (x0, y0, x1, y1) bounding boxes of each board, each is given a serial mark
+        if enabled in the config
         :return:
         """
         self.out_path = Path(output_directory) / "_paneliser_temp_gerbers"
         self.logger.debug("Panel gerber output dir: {}".format(self.out_path))
 
-        self.panel_info["width"] = panel_dims[0]
-        self.panel_info["height"] = panel_dims[1]
-        self.panel_info["step"] = pcb_step
-        self.panel_info["repeat"] = pcb_repeat
-        self.panel_info["title"] = frame_title
+        self.panel = panel
         self.config = frame_config
+        self.panel_outline = panel_outline
+        self.tab_holes = tab_holes
+        self.board_boxes = board_boxes
+        _frame_options = self.config["FrameGerbers"]
+        self.aperture_macros = _frame_options["aperture_macros"]
+        self.glyph_blocks = _frame_options["glyph_blocks"]
+        self.min_text_size = _frame_options["min_text_size"]
+
+        self.template_cache = None
+        if _frame_options["template_cache_size"] > 0:
+            _cache_folder = None
+            if _frame_options["template_cache_folder"]:
+                _cache_folder = Path.cwd() / _frame_options["template_cache_folder"]
+            self.template_cache = shared_cache(_cache_folder, _frame_options["template_cache_size"],
+                                               _frame_options["template_cache_files"])
 
         self._make_output_dir()
         self._write_gerbers()
@@ -586,14 +822,17 @@ class GerberGenerator:
             self.zip_output = False
             break
 
-        self.make_frame_gerbers(_panel_dims, _pcb_step, _pcb_repeat, _title, Path.cwd(), _config)
+        _panel_dims = point_to_nm(_panel_dims)
+        _pcb_step = point_to_nm(_pcb_step)
+        _panel = PanelSpec(_title, _pcb_repeat[0], _pcb_repeat[1], _panel_dims[0], _panel_dims[1], _pcb_step[0],
+                           _pcb_step[1])
+        self.make_frame_gerbers(_panel, Path.cwd(), _config)
 
 
 if __name__ == '__main__':
-    _config_path = Path.cwd() / "config.ini"
-    config = ConfigParser()
-    config.read(_config_path)
+    config = load_config(Path.cwd() / "config.ini")
     # Testing dimensions, in mm
     app = GerberGenerator()
     app.get_user_input(config)
-    # app.make_frame_gerbers((100, 100), (5, 4), (25, 25), "Test. 12 34.0", Path.cwd(), config)
+    # app.make_frame_gerbers(PanelSpec("Test. 12 34.0", 25, 25, to_nm(100), to_nm(100), to_nm(5), to_nm(4)), Path.cwd(),
+    #                        config)
@@ -0,0 +1,230 @@
+#! /usr/bin/env python3
+"""
+Rewrites every gerber layer of a board zip in one canonical dialect before the board is panelised
+Board zips come in mixed dialects, inch or mm, any coordinate format, leading or trailing zero omission, incremental
+coordinates and deprecated codes like G54 and G70. Each layer is converted to the dialect of gerber_stream.py, mm with
+an absolute 4.6 coordinate format and modal coordinates, a statement at a time straight into the output so memory use
+doesn't depend on the size of the layer. Layers are converted in parallel once the zip is big enough for it to be worth
+it, and the normalised zip is cached on the content hash of the board zip so a board seen before is only copied
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import logzero
+
+from file_cache import FileCache
+from gerber_stream import canonical_header, canonical_statements, open_text
+
+# Changed whenever the normalised output changes, so older cached zips aren't used
+normalise_version = 1
+
+# Convert in worker processes when the layers add up to more than this many bytes, below it starting them costs more
+parallel_size = 4 << 20
+
+# Size of the blocks the board zip is hashed in
+_hash_block_size = 1 << 20
+
+
+def normalise_layer(lines, out_file, name):
+    """
+    Converts a gerber layer to the canonical dialect
+    :param lines: Iterable of lines of gerber source, e.g. a zip member wrapped in a text reader
+    :param out_file: Text stream the layer is written to
+    :param name: Name of the layer, for the %IN statement
+    :return: Number of coordinate statements written
+    """
+    out_file.write(canonical_header.format(name))
+
+    _operations = 0
+    # Last point written, coordinates that haven't changed are left out. None when it isn't known, e.g. around a
+    # block aperture, so both coordinates are written
+    _written = None
+
+    for _kind, _value, _point in canonical_statements(lines, attributes=True):
+        if _kind == "aperture":
+            out_file.write("%ADD{}{}*%\n".format(*_value))
+        elif _kind == "macro":
+            out_file.write("%AM{}*\n{}*%\n".format(_value[0], _value[1].replace("*", "*\n")))
+        elif _kind == "block":
+            out_file.write("%AB*%\n" if _value is None else "%ABD{}*%\n".format(_value))
+            _written = None
+        elif _point is None:
+            out_file.write(_value)
+            if _kind == "step_repeat" or _value == "%SR*%\n":
+                _written = None
+        else:
+            _x, _y = _point
+            if _written is None:
+                _coords = "X{}Y{}".format(_x, _y)
+            elif _y == _written[1]:
+                # A statement needs at least one coordinate, X is written if neither has changed
+                _coords = "X{}".format(_x)
+            elif _x == _written[0]:
+                _coords = "Y{}".format(_y)
+            else:
+                _coords = "X{}Y{}".format(_x, _y)
+
+            out_file.write(_value.replace("X{}Y{}", _coords, 1))
+            _written = _point
+            _operations += 1
+
+    out_file.write("M02*\n")
+    return _operations
+
+
+def normalise_entry(zip_path, name, out_path):
+    """
+    Converts a single layer of the zip, run in a worker process so only takes simple arguments
+    :param zip_path: str path of the board gerber zip
+    :param name: Name of the layer in the zip
+    :param out_path: str path the normalised layer is written to
+    :return: (name, number of coordinate statements, error message or None)
+    """
+    try:
+        with ZipFile(zip_path, 'r') as zip_file, open(out_path, 'w', encoding="ascii", newline="\n") as out_file:
+            return name, normalise_layer(open_text(zip_file, name), out_file, Path(name).stem), None
+    except (ValueError, IndexError) as e:
+        return name, 0, str(e)
+
+
+def content_key(zip_path, names):
+    """
+    :param zip_path: Path of the board gerber zip
+    :param names: Names of the layers that are normalised
+    :return: Hex digest of the zip content, the layers picked and the normaliser version
+    """
+    _hash = hashlib.sha1(json.dumps([normalise_version, sorted(names)]).encode("utf-8"))
+    with open(str(zip_path), 'rb') as in_file:
+        for _block in iter(lambda: in_file.read(_hash_block_size), b""):
+            _hash.update(_block)
+
+    return _hash.hexdigest()
+
+
+def _dump_zip(zip_path, file):
+    with open(str(zip_path), 'rb') as _zip_file:
+        shutil.copyfileobj(_zip_file, file)
+
+
+def _cached_zip(path):
+    """
+    :return: Path of the cached zip, it is copied out rather than read into memory
+    """
+    if not path.is_file():
+        raise OSError("Not cached: {}".format(path))
+    return path
+
+
+class GerberNormaliser:
+    """
+    Writes a copy of a board zip with its gerber layers normalised, the other files are copied as they are
+    """
+    logger = None
+    # Number of layers to convert at the same time, None is one per cpu
+    max_workers = None
+
+    def __init__(self, logger=None, cache_folder=None, cache_files=64, max_workers=None):
+        """
+        :param logger: logzero logger
+        :param cache_folder: Folder normalised zips are kept in, None to always normalise
+        :param cache_files: Number of zips kept in the cache folder
+        :param max_workers: Number of worker processes, None is one per cpu
+        """
+        self.logger = logger or logzero.logger
+        # file_cache.FileCache of the paths of the normalised zips, the zips themselves are only kept in the folder
+        self.cache = None
+        if cache_folder is not None:
+            self.cache = FileCache(cache_folder, ".zip", _dump_zip, _cached_zip, max_entries=0, max_files=cache_files)
+        if max_workers:
+            self.max_workers = max_workers
+
+        # True if the last zip came from the cache
+        self.from_cache = False
+        # (name, number of coordinate statements, error message or None) of every layer converted, in archive order
+        self.layers = list()
+
+    def normalise(self, manifest, names, out_path):
+        """
+        :param manifest: layer_manifest.LayerManifest of the board zip
+        :param names: Names of the gerber layers to normalise
+        :param out_path: Path the normalised zip is written to
+        :return: self
+        """
+        out_path = Path(out_path)
+        self.layers = list()
+        self.from_cache = False
+
+        _key = content_key(manifest.zip_path, names)
+        if self._copy_cached(_key, out_path):
+            self.from_cache = True
+            self.logger.debug("Using cached normalised zip {}".format(_key[:12]))
+            return self
+
+        _names = set(names)
+        _entries = [_entry for _entry in manifest.entries if _entry.name in _names]
+
+        with tempfile.TemporaryDirectory(dir=str(out_path.parent)) as _temp:
+            _temp_paths = {_entry.name: os.path.join(_temp, "{}.gbr".format(_index))
+                           for _index, _entry in enumerate(_entries)}
+            _jobs = [(str(manifest.zip_path), _entry.name, _temp_paths[_entry.name]) for _entry in _entries]
+
+            _max_workers = min(len(_jobs), self.max_workers or os.cpu_count() or 1)
+            if _max_workers > 1 and sum(_entry.size for _entry in _entries) > parallel_size:
+                self.logger.debug("Normalising {} layers with {} workers".format(len(_jobs), _max_workers))
+                with ProcessPoolExecutor(max_workers=_max_workers) as executor:
+                    _futures = [executor.submit(normalise_entry, *_job) for _job in _jobs]
+                    self.layers = [_future.result() for _future in _futures]
+            else:
+                self.layers = [normalise_entry(*_job) for _job in _jobs]
+
+            # Layers that couldn't be read are copied as they are, GerberPanelizer may still manage them
+            _normalised = {_name: _temp_paths[_name] for _name, _operations, _error in self.layers if _error is None}
+            _zip_path = os.path.join(_temp, "normalised.zip")
+            self._write_zip(manifest.zip_path, _normalised, _zip_path)
+
+            if self.cache is not None:
+                self.cache.put(_key, _zip_path)
+            os.replace(_zip_path, str(out_path))
+
+        return self
+
+    @staticmethod
+    def _write_zip(source_path, normalised, out_path):
+        """
+        :param source_path: Path of the board gerber zip
+        :param normalised: dict of {name in the zip: path of the normalised layer}
+        :param out_path: str path of the zip to write
+        :return:
+        """
+        with ZipFile(str(source_path), 'r') as in_zip, ZipFile(out_path, 'w', ZIP_DEFLATED) as out_zip:
+            for _info in in_zip.infolist():
+                if _info.filename in normalised:
+                    out_zip.write(normalised[_info.filename], _info.filename)
+                elif not _info.is_dir():
+                    with in_zip.open(_info) as _in_file, out_zip.open(_info.filename, 'w') as _out_file:
+                        shutil.copyfileobj(_in_file, _out_file)
+
+    def _copy_cached(self, key, out_path):
+        """
+        :return: True if the zip was in the cache and has been copied to out_path
+        """
+        if self.cache is None:
+            return False
+
+        _path = self.cache.get(key)
+        if _path is None:
+            return False
+        try:
+            shutil.copyfile(str(_path), str(out_path))
+        except OSError:
+            # Pruned by another worker since it was found
+            return False
+
+        return True
@@ -0,0 +1,577 @@
+#! /usr/bin/env python3
+"""
+Streaming gerber reader and writer used to build panel layers natively, without GerberPanelizer
+Each layer is read statement by statement and converted to a single canonical dialect, mm with an absolute 4.6
+coordinate format. In that format a coordinate is exactly one nm so the fixed point values from geometry.py are written
+as they are. Apertures and macros are collected into a table so layers from several files can share one header
+"""
+
+import io
+import re
+
+import numpy
+
+from geometry import NM_PER_MM, div_round
+
+# Header written at the top of every panel layer, coordinates are integer nm
+canonical_header = """G04 Paneliser panel layer export*
+%FSLAX46Y46*%
+%MOMM*%
+%IN{}*%
+%IPPOS*%
+%LPD*%
+G75*
+"""
+
+# Statements written before each copy of a layer so it can't inherit state from whatever was written before it
+reset_statements = "%LPD*%\nG01*\n"
+
+# Data block words, deprecated G54/G55 prefixes are split off as G codes
+_word_re = re.compile(r"([GDMXYIJ])([+-]?[\d.]+)")
+_format_re = re.compile(r"FS([LTD]?)([AI]?).*?X(\d)(\d)Y(\d)(\d)")
+_aperture_re = re.compile(r"ADD(\d+)([^,]+)(?:,(.*))?$")
+_select_re = re.compile(r"^D(\d+)\*$", re.MULTILINE)
+_step_repeat_re = re.compile(r"SRX(\d+)Y(\d+)I([\d.+-]+)J([\d.+-]+)")
+
+# Extended commands that only belong in the file header, they are consumed while parsing
+_header_commands = ("FS", "MO", "IP", "IN", "OF", "SF", "AS", "IR", "MI")
+# X2 attributes are dropped, file attributes would be wrong for a merged layer and aperture attributes don't survive
+# being moved into the shared table
+_attribute_commands = ("TF", "TA", "TO", "TD")
+
+# Which parameters of each standard aperture are lengths and need scaling for inch files, None is all of them
+_standard_length_params = {"C": None, "R": None, "O": None, "P": (0, 3)}
+# Which parameters of each macro primitive are lengths, keyed on primitive code
+_macro_length_params = {
+    "1": (1, 2, 3),
+    "2": (1, 2, 3, 4, 5),
+    "20": (1, 2, 3, 4, 5),
+    "21": (1, 2, 3, 4),
+    "22": (1, 2, 3, 4),
+    "5": (2, 3, 4),
+    "6": (0, 1, 2, 3, 4, 6, 7),
+    "7": (0, 1, 2, 3, 4),
+}
+
+# Length of an inch in nm
+_nm_per_inch = 25400000
+
+
+def open_text(zip_file, name):
+    """
+    Opens a member of a zip archive as a stream of text lines
+    :param zip_file: Open ZipFile
+    :param name: Name of the member
+    :return: text stream
+    """
+    return io.TextIOWrapper(zip_file.open(name), encoding="ascii", errors="replace")
+
+
+def iter_statements(lines):
+    """
+    Splits gerber source into statements
+    Extended commands are yielded one command at a time, apart from aperture macros which are yielded whole
+    :param lines: Iterable of lines of gerber source, e.g. an open file
+    :return: generator of (is_extended, statement) tuples, statements have the '*' and '%' delimiters removed
+    """
+    _pending = ""
+
+    for line in lines:
+        _line = line.strip()
+        if not _line:
+            continue
+
+        # Fast path for the usual case of one data block per line
+        if not _pending and _line[-1] == "*" and _line[0] != "%" and _line.count("*") == 1 and "%" not in _line:
+            yield False, _line[:-1]
+            continue
+
+        _pending += _line
+
+        while _pending:
+            if _pending[0] == "%":
+                _end = _pending.find("%", 1)
+                if _end == -1:
+                    # Extended command continues on the next line, e.g. a macro definition
+                    break
+
+                _command = _pending[1:_end]
+                _pending = _pending[_end + 1:]
+
+                if _command.startswith("AM"):
+                    yield True, _command
+                else:
+                    for _part in _command.split("*"):
+                        if _part:
+                            yield True, _part
+            else:
+                _end = _pending.find("*")
+                _extended_start = _pending.find("%")
+                if _extended_start != -1 and (_end == -1 or _extended_start < _end):
+                    # Unterminated word before an extended command, shouldn't happen in a valid file
+                    _pending = _pending[_extended_start:]
+                    continue
+
+                if _end == -1:
+                    break
+
+                if _end:
+                    yield False, _pending[:_end]
+                _pending = _pending[_end + 1:]
+
+
+def _format_number(value):
+    """
+    Formats a real number for an aperture definition, 6 decimal places with trailing zeros removed
+    :param value: float
+    :return: str
+    """
+    _text = "{:.6f}".format(value).rstrip("0").rstrip(".")
+    return "0" if _text in ("", "-0") else _text
+
+
+class CoordinateFormat:
+    """
+    Coordinate format and units of a gerber file, converts coordinate strings to integer nm
+    Defaults are leading zero omission, absolute, 2.4 inch which is what most old RS-274X files without headers expect
+    """
+
+    def __init__(self):
+        self.zeros = "L"
+        self.notation = "A"
+        self.integer = 2
+        self.decimal = 4
+        self.units = "inch"
+        self._update_scale()
+
+    def set_format(self, statement):
+        """
+        Reads a %FS format statement
+        :param statement: FS statement without delimiters e.g. "FSLAX34Y34"
+        :return:
+        """
+        _match = _format_re.match(statement)
+        if _match is None:
+            raise ValueError("Unable to read format statement: {}".format(statement))
+
+        self.zeros = _match.group(1) or "L"
+        self.notation = _match.group(2) or "A"
+        self.integer = int(_match.group(3))
+        self.decimal = int(_match.group(4))
+        self._update_scale()
+
+    def set_units(self, units):
+        """
+        :param units: "mm" or "inch"
+        :return:
+        """
+        self.units = units
+        self._update_scale()
+
+    def _update_scale(self):
+        # nm = units * numerator / denominator, kept as integers so conversion is exact for metric files
+        if self.units == "mm":
+            self._numerator = NM_PER_MM
+        else:
+            self._numerator = _nm_per_inch
+        self._denominator = 10 ** self.decimal
+
+        # Scale for real numbers like aperture sizes, to mm
+        self.mm_scale = 1.0 if self.units == "mm" else 25.4
+
+    def to_nm(self, number):
+        """
+        Converts a coordinate from the file to integer nm
+        :param number: Coordinate string as it appears in the file, e.g. "-012345"
+        :return: int nm
+        """
+        if "." in number:
+            # Some exporters write decimal points even though the spec doesn't allow it
+            return int(round(float(number) * self._numerator))
+
+        _sign = 1
+        if number[0] in "+-":
+            if number[0] == "-":
+                _sign = -1
+            number = number[1:]
+
+        if self.zeros == "T":
+            number = number.ljust(self.integer + self.decimal, "0")
+
+        return div_round(int(number) * self._numerator, self._denominator) * _sign
+
+    def scale_aperture(self, definition):
+        """
+        Converts a standard aperture definition to mm
+        :param definition: Aperture definition without the D code, e.g. "C,0.010"
+        :return: str definition in mm
+        """
+        _name, _, _params = definition.partition(",")
+        if not _params:
+            return _name
+
+        _params = _params.split("X")
+        if _name in _standard_length_params:
+            _length_params = _standard_length_params[_name] or range(len(_params))
+            for _index in _length_params:
+                if _index < len(_params):
+                    _params[_index] = _format_number(float(_params[_index]) * self.mm_scale)
+        else:
+            # Macro aperture, parameters are passed through and the lengths are scaled where the macro uses them
+            _params = [_format_number(float(_param)) for _param in _params]
+
+        return "{},{}".format(_name, "X".join(_params))
+
+    def scale_macro(self, macro):
+        """
+        Converts an aperture macro to mm, length parameters of each primitive are multiplied by 25.4 for inch files
+        Expressions are wrapped so variables passed in from the aperture definition are scaled where they are used
+        :param macro: Macro body without delimiters, e.g. "AMOC8*5,1,8,0,0,$1,22.5*"
+        :return: (name, body) where body is the primitives joined by '*'
+        """
+        _parts = [_part for _part in macro.split("*") if _part]
+        _name = _parts[0][2:]
+        _primitives = _parts[1:]
+
+        if self.units == "mm":
+            return _name, "*".join(_primitives)
+
+        _scaled = list()
+        for _primitive in _primitives:
+            _fields = _primitive.split(",")
+            _code = _fields[0].strip()
+            if _primitive.startswith("$") or not _code.isdigit():
+                # Variable definition or comment, variables are scaled where they are used
+                _scaled.append(_primitive)
+                continue
+
+            if _code == "4":
+                # Outline, all of the vertex coords are lengths, the last field is the rotation
+                _length_params = range(2, len(_fields) - 2)
+            else:
+                _length_params = _macro_length_params.get(_code, ())
+
+            for _index in _length_params:
+                _field_index = _index + 1
+                if _field_index < len(_fields):
+                    _fields[_field_index] = self._scale_expression(_fields[_field_index])
+
+            _scaled.append(",".join(_fields))
+
+        return _name, "*".join(_scaled)
+
+    def _scale_expression(self, expression):
+        try:
+            return _format_number(float(expression) * self.mm_scale)
+        except ValueError:
+            return "({})x{}".format(expression, _format_number(self.mm_scale))
+
+
+def canonical_statements(lines, attributes=False):
+    """
+    Reads gerber source and converts it to the canonical dialect a statement at a time
+    Only the coordinate format, the current point and the current operation are kept between statements, so memory
+    use doesn't depend on the size of the file. Header commands, comments and M02 are consumed
+    :param lines: Iterable of lines of gerber source, e.g. an open file or a zip member wrapped in a text reader
+    :param attributes: Also yield X2 attribute statements, they are dropped otherwise
+    :return: generator of (kind, value, point) tuples, kind is one of
+        "aperture": value is (original_code, definition in mm)
+        "macro": value is (name, body in mm)
+        "block": value is the D code at the start of a block aperture, None at the end of one
+        "attribute": value is the statement as a line of gerber source
+        "step_repeat": value is the %SR statement as a line of gerber source
+        "body": value is one or more lines of gerber source
+        For a body statement with a coordinate, value is a str.format template with two fields for the x and y in nm
+        and point is the (x, y) tuple, point is None otherwise
+    """
+    _format = CoordinateFormat()
+    _x = 0
+    _y = 0
+    _operation = "D01"
+
+    for _is_extended, _statement in iter_statements(lines):
+        if _is_extended:
+            _command = _statement[:2]
+            if _command == "FS":
+                _format.set_format(_statement)
+            elif _command == "MO":
+                _format.set_units("mm" if _statement[2:4] == "MM" else "inch")
+            elif _command == "AD":
+                _match = _aperture_re.match(_statement)
+                if _match is None:
+                    raise ValueError("Unable to read aperture definition: {}".format(_statement))
+                _definition = _match.group(2)
+                if _match.group(3):
+                    _definition += "," + _match.group(3)
+                yield "aperture", (int(_match.group(1)), _format.scale_aperture(_definition)), None
+            elif _command == "AM":
+                yield "macro", _format.scale_macro(_statement), None
+            elif _command == "AB":
+                yield "block", None if _statement == "AB" else int(_statement[3:]), None
+            elif _command == "SR":
+                _match = _step_repeat_re.match(_statement)
+                if _match:
+                    yield "step_repeat", "%SRX{}Y{}I{}J{}*%\n".format(
+                        _match.group(1), _match.group(2),
+                        _format_number(float(_match.group(3)) * _format.mm_scale),
+                        _format_number(float(_match.group(4)) * _format.mm_scale)), None
+                else:
+                    yield "body", "%SR*%\n", None
+            elif _command in _attribute_commands:
+                if attributes:
+                    yield "attribute", "%{}*%\n".format(_statement), None
+            elif _command not in _header_commands:
+                # Polarity, mirroring etc
+                yield "body", "%{}*%\n".format(_statement), None
+            continue
+
+        if _statement.startswith("G04") or _statement.startswith("G4 "):
+            continue
+
+        _words = _word_re.findall(_statement)
+        _lines = list()
+        _has_coord = False
+        _arc_offsets = ""
+        _new_x = None
+        _new_y = None
+        _d_code = None
+
+        for _letter, _value in _words:
+            if _letter == "G":
+                _g_code = int(_value)
+                if _g_code in (1, 2, 3, 36, 37, 74, 75):
+                    _lines.append("G{:02d}*\n".format(_g_code))
+                elif _g_code == 70:
+                    _format.set_units("inch")
+                elif _g_code == 71:
+                    _format.set_units("mm")
+                elif _g_code == 90:
+                    _format.notation = "A"
+                elif _g_code == 91:
+                    _format.notation = "I"
+            elif _letter == "X":
+                _new_x = _format.to_nm(_value)
+                _has_coord = True
+            elif _letter == "Y":
+                _new_y = _format.to_nm(_value)
+                _has_coord = True
+            elif _letter == "I":
+                _arc_offsets += "I{}".format(_format.to_nm(_value))
+                _has_coord = True
+            elif _letter == "J":
+                _arc_offsets += "J{}".format(_format.to_nm(_value))
+                _has_coord = True
+            elif _letter == "D":
+                _d_code = int(_value)
+            elif _letter == "M" and int(_value) == 2:
+                break
+
+        if _d_code is not None and _d_code >= 10:
+            _lines.append("D{}*\n".format(_d_code))
+        elif _d_code is not None:
+            _operation = "D{:02d}".format(_d_code)
+
+        _point = None
+        if _has_coord or (_d_code is not None and _d_code < 10):
+            if _format.notation == "I":
+                _x += _new_x or 0
+                _y += _new_y or 0
+            else:
+                _x = _x if _new_x is None else _new_x
+                _y = _y if _new_y is None else _new_y
+
+            # Coordinates are always written in full so that a copy never depends on the previous copy
+            _lines.append("X{}Y{}" + _arc_offsets + _operation + "*\n")
+            _point = (_x, _y)
+
+        if _lines:
+            yield "body", "".join(_lines), _point
+
+
+class GerberLayer:
+    """
+    A gerber layer read into the canonical dialect, kept as chunks of output text with the coordinates pulled out
+    Each chunk is a str.format template and a numpy array of the interleaved x, y coords, so writing a translated copy
+    of the layer is one vectorised add and one format call per chunk rather than any per line python
+    """
+    # Statements per chunk, bounds the size of each format call
+    chunk_size = 4096
+
+    def __init__(self, name):
+        self.name = name
+        # [(original_code, definition)] in file order, definitions are in mm
+        self.apertures = list()
+        # [(name, body)] in file order
+        self.macros = list()
+        # [(original_code, [statement lines])] block apertures in file order, content is never translated
+        self.blocks = list()
+        # [(template, coords)] body of the layer
+        self.chunks = list()
+        # Number of coordinate pairs in the layer
+        self.operation_count = 0
+        # Gerber files can contain their own %SR blocks, which can't be nested in another %SR
+        self.has_step_repeat = False
+
+    def load(self, lines):
+        """
+        Reads a gerber layer
+        :param lines: Iterable of lines of gerber source, e.g. an open file or a zip member wrapped in a text reader
+        :return: self
+        """
+        _parts = list()
+        _coords = list()
+        # Stack of block apertures being read, (original_code, [lines])
+        _block_stack = list()
+
+        for _kind, _value, _point in canonical_statements(lines):
+            if _kind == "aperture":
+                self.apertures.append(_value)
+                continue
+            elif _kind == "macro":
+                self.macros.append(_value)
+                continue
+            elif _kind == "block":
+                if _value is None:
+                    self.blocks.append(_block_stack.pop())
+                else:
+                    _block_stack.append((_value, list()))
+                continue
+            elif _kind == "step_repeat":
+                self.has_step_repeat = True
+
+            if _block_stack:
+                # Content of a block aperture is relative to the block origin, store it literally
+                _block_stack[-1][1].append(_value.format(*_point) if _point else _value)
+                continue
+
+            if _point is None:
+                _parts.append(_value.replace("{", "{{").replace("}", "}}"))
+            else:
+                _parts.append(_value)
+                _coords.extend(_point)
+                self.operation_count += 1
+
+            if len(_parts) >= self.chunk_size:
+                self._add_chunk(_parts, _coords)
+                _parts = list()
+                _coords = list()
+
+        if _parts:
+            self._add_chunk(_parts, _coords)
+
+        return self
+
+    def _add_chunk(self, parts, coords):
+        self.chunks.append(("".join(parts), numpy.array(coords, dtype=numpy.int64)))
+
+    def remap_apertures(self, mapping):
+        """
+        Renumbers aperture selections in the layer body, done once before the layer is written any number of times
+        :param mapping: dict of {original_code: new_code}
+        :return:
+        """
+        def _replace(match):
+            return "D{}*".format(mapping.get(int(match.group(1)), int(match.group(1))))
+
+        self.chunks = [(_select_re.sub(_replace, _template), _coords) for _template, _coords in self.chunks]
+        self.blocks = [(_code, [_select_re.sub(_replace, _line) for _line in _lines]) for _code, _lines in self.blocks]
+
+    def iter_body(self, offset=(0, 0)):
+        """
+        Generates the layer body translated by an offset
+        :param offset: (x, y) tuple in nm
+        :return: generator of str chunks of gerber source
+        """
+        _offset = None
+        if offset[0] or offset[1]:
+            _offset = numpy.array(offset, dtype=numpy.int64)
+
+        for _template, _coords in self.chunks:
+            if not len(_coords):
+                yield _template
+                continue
+
+            if _offset is not None:
+                _coords = (_coords.reshape(-1, 2) + _offset).ravel()
+
+            yield _template.format(*_coords.tolist())
+
+
+class ApertureTable:
+    """
+    Shared aperture, macro and block aperture definitions for one output layer
+    Identical definitions from different source layers are given the same D code
+    """
+
+    def __init__(self, first_code=10):
+        self._next_code = first_code
+        # {definition: code}
+        self._codes = dict()
+        # {body: name}, [(name, body)]
+        self._macro_names = dict()
+        self._macros = list()
+        # [(code, definition)], [(code, lines)]
+        self._apertures = list()
+        self._blocks = list()
+
+    def add_layer(self, layer):
+        """
+        Adds the definitions used by a layer to the table and renumbers the layer to match
+        :param layer: GerberLayer
+        :return: dict of {original_code: new_code}
+        """
+        _macro_mapping = dict()
+        for _name, _body in layer.macros:
+            if _body not in self._macro_names:
+                _new_name = _name
+                _existing = [_macro[0] for _macro in self._macros]
+                _suffix = 1
+                while _new_name in _existing:
+                    _new_name = "{}_{}".format(_name, _suffix)
+                    _suffix += 1
+
+                self._macro_names[_body] = _new_name
+                self._macros.append((_new_name, _body))
+            _macro_mapping[_name] = self._macro_names[_body]
+
+        _mapping = dict()
+        for _code, _definition in layer.apertures:
+            _template, _, _params = _definition.partition(",")
+            _template = _macro_mapping.get(_template, _template)
+            _definition = "{},{}".format(_template, _params) if _params else _template
+
+            if _definition not in self._codes:
+                self._codes[_definition] = self._take_code()
+                self._apertures.append((self._codes[_definition], _definition))
+            _mapping[_code] = self._codes[_definition]
+
+        # Blocks can't be de-duplicated on their text until their content is renumbered, so they always get a new code
+        for _code, _lines in layer.blocks:
+            _mapping[_code] = self._take_code()
+
+        layer.remap_apertures(_mapping)
+        for _code, _lines in layer.blocks:
+            self._blocks.append((_mapping[_code], _lines))
+
+        return _mapping
+
+    def _take_code(self):
+        _code = self._next_code
+        self._next_code += 1
+        return _code
+
+    def header(self):
+        """
+        :return: str of all of the definitions, to be written after the canonical header
+        """
+        _lines = list()
+        for _name, _body in self._macros:
+            _lines.append("%AM{}*\n{}*%\n".format(_name, _body.replace("*", "*\n")))
+        for _code, _definition in self._apertures:
+            _lines.append("%ADD{}{}*%\n".format(_code, _definition))
+        for _code, _block_lines in self._blocks:
+            _lines.append("%ABD{}*%\n".format(_code))
+            _lines.extend(_block_lines)
+            _lines.append("%AB*%\n")
+
+        return "".join(_lines)
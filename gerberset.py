@@ -0,0 +1,347 @@
+#! /usr/bin/env python3
+"""
+Reader, editor and writer for GerberPanelizer .gerberset files
+The file is read with iterparse an element at a time into a compact model of the loaded outlines, board instances,
+break tabs and panel settings, no DOM is built. Coordinates are held as integer nm. The writer streams the model back
+out in the same layout GerberPanelizer and Panel._write_xml use, so a file can be edited and written back without
+running the whole interactive flow again
+Usage: ./gerberset.py <file.gerberset> [--move-tabs X0,Y0,X1,Y1 DX,DY] [--delete-tabs X0,Y0,X1,Y1]
+                      [--add-instance PATH X,Y] [--remove-instances X0,Y0,X1,Y1] [--output <file>]
+"""
+
+import argparse
+import sys
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from geometry import to_nm, format_decimal
+
+# Attributes of the root element
+root_attributes = (("xmlns:xsd", "http://www.w3.org/2001/XMLSchema"),
+                   ("xmlns:xsi", "http://www.w3.org/2001/XMLSchema-instance"))
+
+# Text escapes, the same as minidom uses
+_text_escapes = {'"': "&quot;"}
+
+_instance_template = """    <GerberInstance>
+      <Center>
+        <X>{}</X>
+        <Y>{}</Y>
+      </Center>
+      <Angle>{}</Angle>
+      <GerberPath>{}</GerberPath>
+      <Generated>{}</Generated>
+    </GerberInstance>
+"""
+
+_tab_template = """    <BreakTab>
+      <Center>
+        <X>{}</X>
+        <Y>{}</Y>
+      </Center>
+      <Angle>{}</Angle>
+      <Radius>{}</Radius>
+      <Valid>{}</Valid>
+    </BreakTab>
+"""
+
+
+def _format_angle(angle):
+    """
+    :param angle: float degrees
+    :return: str with no trailing zeros, e.g. "0" or "22.5"
+    """
+    _text = "{:f}".format(angle).rstrip("0").rstrip(".")
+    return "0" if _text in ("", "-0") else _text
+
+
+def _format_bool(value):
+    return "true" if value else "false"
+
+
+def _in_region(x, y, region):
+    return region[0] <= x <= region[2] and region[1] <= y <= region[3]
+
+
+class GerberInstance:
+    """
+    A gerber zip placed on the panel
+    """
+
+    __slots__ = ("x", "y", "gerber_path", "angle", "generated")
+
+    def __init__(self, x, y, gerber_path, angle=0.0, generated=False):
+        """
+        :param x: X of the instance origin in nm
+        :param y: Y of the instance origin in nm
+        :param gerber_path: Path of the gerber zip as written in the file
+        :param angle: Rotation in degrees
+        :param generated: GerberPanelizer's generated flag
+        """
+        self.x = x
+        self.y = y
+        self.gerber_path = gerber_path
+        self.angle = angle
+        self.generated = generated
+
+    def __repr__(self):
+        return "GerberInstance({}, ({}, {}))".format(self.gerber_path, format_decimal(self.x, 4),
+                                                     format_decimal(self.y, 4))
+
+
+class BreakTab:
+    """
+    A mousebite break tab
+    """
+
+    __slots__ = ("x", "y", "radius", "angle", "valid")
+
+    def __init__(self, x, y, radius, angle=0.0, valid=False):
+        """
+        :param x: X of the tab center in nm
+        :param y: Y of the tab center in nm
+        :param radius: Tab size in nm, GerberPanelizer calls it the radius but the paneliser gives it the diameter
+        :param angle: Rotation in degrees
+        :param valid: GerberPanelizer's valid flag
+        """
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.angle = angle
+        self.valid = valid
+
+    def __repr__(self):
+        return "BreakTab(({}, {}), {})".format(format_decimal(self.x, 4), format_decimal(self.y, 4),
+                                               format_decimal(self.radius, 4))
+
+
+class Gerberset:
+    """
+    Everything in a .gerberset file
+    """
+
+    def __init__(self):
+        # Paths of the gerber zips, as written in the file
+        self.outlines = list()
+        self.instances = list()
+        self.tabs = list()
+        # {tag: text} of the panel settings after the tabs, in file order
+        self.settings = dict()
+
+    @classmethod
+    def read(cls, path):
+        """
+        Reads a gerberset an element at a time, each instance and tab is dropped from the tree once it has been read
+        :param path: Path of the .gerberset file
+        :return: Gerberset
+        """
+        _gerberset = cls()
+        # Panel coordinates repeat a lot, each distinct value is only converted once
+        _nm = dict()
+        _root = None
+
+        for _event, _element in ET.iterparse(str(path), events=("end",)):
+            _tag = _element.tag
+            if _tag == "GerberInstance" or _tag == "BreakTab":
+                _x = _element.findtext("Center/X", "0")
+                _y = _element.findtext("Center/Y", "0")
+                if _x not in _nm:
+                    _nm[_x] = to_nm(_x)
+                if _y not in _nm:
+                    _nm[_y] = to_nm(_y)
+
+                if _tag == "GerberInstance":
+                    _gerberset.instances.append(GerberInstance(
+                        _nm[_x], _nm[_y], _element.findtext("GerberPath", ""),
+                        float(_element.findtext("Angle", "0")), _element.findtext("Generated", "false") == "true"))
+                else:
+                    _gerberset.tabs.append(BreakTab(
+                        _nm[_x], _nm[_y], to_nm(_element.findtext("Radius", "0")),
+                        float(_element.findtext("Angle", "0")), _element.findtext("Valid", "false") == "true"))
+                # Done with it, only the empty element is left until the end of the section
+                _element.clear()
+            elif _tag == "LoadedOutlines":
+                _gerberset.outlines = [_string.text or "" for _string in _element]
+                _element.clear()
+            elif _tag == "Instances" or _tag == "Tabs":
+                _element.clear()
+            _root = _element
+
+        # The settings are whatever else is in the root, the last element to end
+        for _element in _root:
+            if _element.tag not in ("LoadedOutlines", "Instances", "Tabs"):
+                _gerberset.settings[_element.tag] = _element.text or ""
+
+        return _gerberset
+
+    def write(self, out_file, decimals=4):
+        """
+        Writes the gerberset in the same layout as minidom's toprettyxml with a two space indent
+        :param out_file: Text stream to write to, opened with utf-8 encoding
+        :param decimals: Decimal places of the lengths
+        :return:
+        """
+        out_file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        out_file.write("<GerberLayoutSet {}>\n".format(" ".join('{}="{}"'.format(_name, _value)
+                                                                for _name, _value in root_attributes)))
+
+        out_file.write("  <LoadedOutlines>\n")
+        for _outline in self.outlines:
+            out_file.write("    <string>{}</string>\n".format(escape(_outline, _text_escapes)))
+        out_file.write("  </LoadedOutlines>\n")
+
+        # Paths are escaped once each rather than once per instance, and coordinates repeat a lot so each distinct
+        # value is only formatted once
+        _paths = {_path: escape(_path, _text_escapes) for _path in set(_instance.gerber_path
+                                                                         for _instance in self.instances)}
+        _formatted = dict()
+
+        def _mm(nm):
+            try:
+                return _formatted[nm]
+            except KeyError:
+                _formatted[nm] = format_decimal(nm, decimals)
+                return _formatted[nm]
+
+        out_file.write("  <Instances>\n")
+        out_file.write("".join(_instance_template.format(_mm(_instance.x), _mm(_instance.y),
+                                                         _format_angle(_instance.angle),
+                                                         _paths[_instance.gerber_path],
+                                                         _format_bool(_instance.generated))
+                               for _instance in self.instances))
+        out_file.write("  </Instances>\n")
+
+        out_file.write("  <Tabs>\n")
+        out_file.write("".join(_tab_template.format(_mm(_tab.x), _mm(_tab.y), _format_angle(_tab.angle),
+                                                    _mm(_tab.radius), _format_bool(_tab.valid))
+                               for _tab in self.tabs))
+        out_file.write("  </Tabs>\n")
+
+        for _tag, _text in self.settings.items():
+            out_file.write("  <{0}>{1}</{0}>\n".format(_tag, escape(_text, _text_escapes)))
+
+        out_file.write("</GerberLayoutSet>\n")
+
+    def save(self, path, decimals=4):
+        """
+        :param path: Path of the .gerberset file to write
+        :param decimals: Decimal places of the lengths
+        :return:
+        """
+        with open(str(path), 'w', encoding="utf-8", newline="\n") as out_file:
+            self.write(out_file, decimals)
+
+    def move_tabs(self, region, dx, dy):
+        """
+        :param region: (min_x, min_y, max_x, max_y) in nm, tabs with their center inside it are moved
+        :param dx: Distance to move in X in nm
+        :param dy: Distance to move in Y in nm
+        :return: Number of tabs moved
+        """
+        _moved = 0
+        for _tab in self.tabs:
+            if _in_region(_tab.x, _tab.y, region):
+                _tab.x += dx
+                _tab.y += dy
+                _moved += 1
+
+        return _moved
+
+    def delete_tabs(self, region):
+        """
+        :param region: (min_x, min_y, max_x, max_y) in nm, tabs with their center inside it are deleted
+        :return: Number of tabs deleted
+        """
+        _count = len(self.tabs)
+        self.tabs = [_tab for _tab in self.tabs if not _in_region(_tab.x, _tab.y, region)]
+        return _count - len(self.tabs)
+
+    def add_tab(self, x, y, radius, angle=0.0):
+        """
+        :param x: X of the tab center in nm
+        :param y: Y of the tab center in nm
+        :param radius: Tab size in nm
+        :param angle: Rotation in degrees
+        :return: BreakTab
+        """
+        _tab = BreakTab(x, y, radius, angle)
+        self.tabs.append(_tab)
+        return _tab
+
+    def add_instance(self, gerber_path, x, y, angle=0.0):
+        """
+        Places a gerber zip on the panel, the zip is added to the loaded outlines if it isn't already there
+        :param gerber_path: Path of the gerber zip as it should be written in the file
+        :param x: X of the instance origin in nm
+        :param y: Y of the instance origin in nm
+        :param angle: Rotation in degrees
+        :return: GerberInstance
+        """
+        if gerber_path not in self.outlines:
+            self.outlines.append(gerber_path)
+
+        _instance = GerberInstance(x, y, gerber_path, angle)
+        self.instances.append(_instance)
+        return _instance
+
+    def remove_instances(self, region=None, gerber_path=None):
+        """
+        Removes instances with their origin inside a region and/or of a gerber zip
+        Outlines that no longer have any instances are kept, GerberPanelizer is fine with that
+        :param region: (min_x, min_y, max_x, max_y) in nm, None for anywhere
+        :param gerber_path: Only remove instances of this zip, None for any
+        :return: Number of instances removed
+        """
+        _count = len(self.instances)
+        self.instances = [_instance for _instance in self.instances
+                          if not ((region is None or _in_region(_instance.x, _instance.y, region)) and
+                                  (gerber_path is None or _instance.gerber_path == gerber_path))]
+        return _count - len(self.instances)
+
+
+def _parse_mm(text, count):
+    """
+    :param text: Comma separated values in mm
+    :param count: Number of values expected
+    :return: list of int nm
+    """
+    _values = [to_nm(_value) for _value in text.replace(' ', '').split(',')]
+    if len(_values) != count:
+        raise argparse.ArgumentTypeError("Expected {} comma separated values, got {}".format(count, text))
+    return _values
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("gerberset", help="Path of the .gerberset file")
+    _parser.add_argument("--move-tabs", nargs=2, action="append", default=list(), metavar=("X0,Y0,X1,Y1", "DX,DY"),
+                         help="Move the tabs inside a region, in mm")
+    _parser.add_argument("--delete-tabs", action="append", default=list(), metavar="X0,Y0,X1,Y1",
+                         help="Delete the tabs inside a region, in mm")
+    _parser.add_argument("--add-instance", nargs=2, action="append", default=list(), metavar=("PATH", "X,Y"),
+                         help="Add an instance of a gerber zip, in mm")
+    _parser.add_argument("--remove-instances", action="append", default=list(), metavar="X0,Y0,X1,Y1",
+                         help="Remove the instances with their origin inside a region, in mm")
+    _parser.add_argument("--decimals", type=int, default=4, help="Decimal places of the lengths")
+    _parser.add_argument("--output", help="File to write, the input file is overwritten if not given")
+    _args = _parser.parse_args()
+
+    _gerberset = Gerberset.read(_args.gerberset)
+    print("Read {} instances and {} tabs".format(len(_gerberset.instances), len(_gerberset.tabs)))
+
+    for _region, _offset in _args.move_tabs:
+        print("Moved {} tabs".format(_gerberset.move_tabs(_parse_mm(_region, 4), *_parse_mm(_offset, 2))))
+    for _region in _args.delete_tabs:
+        print("Deleted {} tabs".format(_gerberset.delete_tabs(_parse_mm(_region, 4))))
+    for _region in _args.remove_instances:
+        print("Removed {} instances".format(_gerberset.remove_instances(_parse_mm(_region, 4))))
+    for _path, _location in _args.add_instance:
+        _gerberset.add_instance(_path, *_parse_mm(_location, 2))
+        print("Added an instance of {}".format(_path))
+
+    _gerberset.save(_args.output or _args.gerberset, _args.decimals)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
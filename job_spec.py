@@ -0,0 +1,191 @@
+#! /usr/bin/env python3
+"""
+Job specs for panelising a board without anyone typing in the answers
+A spec comes from a sidecar file next to the zip, <name>.job, or from the zip file name e.g. board_3x2_bc+tc.zip
+Sidecar files are in the same ini format as config.ini:
+    [Job]
+    title = My Board
+    repeat = 3, 2
+    horizontal_bars_every = 1
+    vertical_bars_every = 0
+    mousebites = bc, tc
+"""
+
+import re
+from configparser import ConfigParser, Error as ConfigParserError
+from pathlib import Path
+
+# Extension of job spec sidecar files
+sidecar_extension = ".job"
+
+# <name>_<repeat x>x<repeat y>, optionally followed by _<mousebites> joined with +
+_file_name_re = re.compile(r"^(?P<name>.+?)[_-](?P<repeat_x>\d+)x(?P<repeat_y>\d+)(?:[_-](?P<mousebites>[a-z]{2}(?:\+[a-z]{2})*))?$",
+                           re.IGNORECASE)
+
+
+class JobSpecError(ValueError):
+    """
+    The sidecar job file can't be read, or is missing a value or has one that can't be used
+    """
+
+
+class JobSpec:
+    """
+    Everything Panel would otherwise ask the user for
+    """
+
+    def __init__(self, gerber_file_path, repeat_x, repeat_y, mousebites, title="", horizontal_bars_every=0,
+                 vertical_bars_every=0, output_name=""):
+        """
+        :param gerber_file_path: Path of the gerber zip
+        :param repeat_x: Number of boards in the X direction
+        :param repeat_y: Number of boards in the Y direction
+        :param mousebites: list of 2 letter mousebite locations e.g. ["bc", "tc"]
+        :param title: Title for the panel frame, blank uses the default from the file name
+        :param horizontal_bars_every: Add a horizontal support bar every n boards, 0 for none
+        :param vertical_bars_every: Add a vertical support bar every n boards, 0 for none
+        :param output_name: Name the output files start with, blank uses the zip file name
+        """
+        self.gerber_file_path = Path(gerber_file_path)
+        self.repeat_x = int(repeat_x)
+        self.repeat_y = int(repeat_y)
+        self.mousebites = [_bite.strip().lower() for _bite in mousebites if _bite.strip()]
+        self.title = title
+        self.horizontal_bars_every = int(horizontal_bars_every)
+        self.vertical_bars_every = int(vertical_bars_every)
+        self.output_name = output_name
+
+    @property
+    def output_stem(self):
+        """
+        :return: Name the output files start with, e.g. <output_stem>-report.txt
+        """
+        return self.output_name or self.gerber_file_path.stem
+
+    def __repr__(self):
+        return "JobSpec({}, {}x{}, mousebites={}, bars={}/{})".format(
+            self.gerber_file_path.name, self.repeat_x, self.repeat_y, ",".join(self.mousebites),
+            self.horizontal_bars_every, self.vertical_bars_every)
+
+    def to_dict(self):
+        """
+        :return: dict of the spec that can be written as json
+        """
+        return {
+            "gerber_file_path": str(self.gerber_file_path),
+            "repeat_x": self.repeat_x,
+            "repeat_y": self.repeat_y,
+            "mousebites": self.mousebites,
+            "title": self.title,
+            "horizontal_bars_every": self.horizontal_bars_every,
+            "vertical_bars_every": self.vertical_bars_every,
+            "output_name": self.output_name,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        :param data: dict from to_dict()
+        :return: JobSpec
+        """
+        return cls(**data)
+
+    def answer(self, key):
+        """
+        Answers one of the questions Panel asks, in the same form the user would type it
+        :param key: Name of the question
+        :return: str
+        """
+        _add_bars = self.horizontal_bars_every > 0 or self.vertical_bars_every > 0
+        _answers = {
+            "file": str(self.gerber_file_path),
+            "title": self.title,
+            "repeat_x": str(self.repeat_x),
+            "repeat_y": str(self.repeat_y),
+            # Size warnings are still logged, there is nobody to ask so the panel is always accepted
+            "size_ok": "Y",
+            "add_bars": "Y" if _add_bars else "N",
+            "add_horizontal_bars": "Y" if self.horizontal_bars_every > 0 else "N",
+            "horizontal_bars_every": str(self.horizontal_bars_every),
+            "add_vertical_bars": "Y" if self.vertical_bars_every > 0 else "N",
+            "vertical_bars_every": str(self.vertical_bars_every),
+            "mousebites": ",".join(self.mousebites),
+        }
+
+        return _answers[key]
+
+    @staticmethod
+    def sidecar_path(gerber_file_path):
+        """
+        :param gerber_file_path: Path of the gerber zip
+        :return: Path the sidecar job file would be at
+        """
+        return Path(gerber_file_path).with_suffix(sidecar_extension)
+
+    @classmethod
+    def from_sidecar(cls, gerber_file_path, sidecar_path):
+        """
+        :param gerber_file_path: Path of the gerber zip
+        :param sidecar_path: Path of the .job file
+        :return: JobSpec
+        :raises JobSpecError: If the file can't be read or isn't a valid job, e.g. it is still being written
+        """
+        _config = ConfigParser()
+        try:
+            with open(str(sidecar_path), 'r') as _file:
+                _config.read_file(_file)
+        except (OSError, UnicodeDecodeError, ConfigParserError) as e:
+            raise JobSpecError("Can't read {}: {}".format(Path(sidecar_path).name, e))
+
+        if not _config.has_section("Job"):
+            raise JobSpecError("{} has no [Job] section".format(Path(sidecar_path).name))
+        _job = _config["Job"]
+        for _key in ("repeat", "mousebites"):
+            if _key not in _job:
+                raise JobSpecError("{} is missing '{}' in [Job]".format(Path(sidecar_path).name, _key))
+
+        _repeat = _job["repeat"].replace(' ', '').split(',')
+        if len(_repeat) != 2:
+            raise JobSpecError("{}: repeat should be the number of boards in X and Y e.g. '3, 2', not '{}'".format(
+                Path(sidecar_path).name, _job["repeat"]))
+
+        try:
+            return cls(gerber_file_path, _repeat[0], _repeat[1], _job["mousebites"].replace(' ', '').split(','),
+                       title=_job.get("title", ""),
+                       horizontal_bars_every=_job.get("horizontal_bars_every", "0"),
+                       vertical_bars_every=_job.get("vertical_bars_every", "0"))
+        except ValueError as e:
+            raise JobSpecError("{} has a value that isn't a whole number: {}".format(Path(sidecar_path).name, e))
+
+    @classmethod
+    def from_file_name(cls, gerber_file_path, default_mousebites):
+        """
+        :param gerber_file_path: Path of the gerber zip
+        :param default_mousebites: list of mousebite locations to use if the file name doesn't have any
+        :return: JobSpec or None if the file name doesn't match the naming convention
+        """
+        _match = _file_name_re.match(Path(gerber_file_path).stem)
+        if not _match:
+            return None
+
+        _mousebites = default_mousebites
+        if _match.group("mousebites"):
+            _mousebites = _match.group("mousebites").split("+")
+
+        return cls(gerber_file_path, _match.group("repeat_x"), _match.group("repeat_y"), _mousebites,
+                   title=_match.group("name").replace("_", " "))
+
+    @classmethod
+    def find(cls, gerber_file_path, default_mousebites):
+        """
+        Finds the job spec for a zip, a sidecar file takes priority over the file name
+        :param gerber_file_path: Path of the gerber zip
+        :param default_mousebites: list of mousebite locations to use if the file name doesn't have any
+        :return: JobSpec or None if there isn't one
+        :raises JobSpecError: If there is a sidecar file that isn't a valid job
+        """
+        _sidecar_path = cls.sidecar_path(gerber_file_path)
+        if _sidecar_path.exists():
+            return cls.from_sidecar(gerber_file_path, _sidecar_path)
+
+        return cls.from_file_name(gerber_file_path, default_mousebites)
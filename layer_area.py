@@ -0,0 +1,774 @@
+#! /usr/bin/env python3
+"""
+Copper, soldermask and paste areas of the panel layers
+Each layer is read once into a list of dark and clear polygons, one per flash, draw and region, and filled into a
+boolean pixel mask with a numpy scanline fill. The mask is filled one tile at a time so memory stays bounded however
+big the board is. Each board layer is measured once and multiplied by the number of boards on the panel, then the frame
+overlay layers are added
+"""
+
+import argparse
+import math
+import re
+import sys
+from zipfile import ZipFile
+
+import numpy
+
+from geometry import NM_PER_MM, to_nm, format_decimal, arc_points, convex_hull as point_hull
+from gerber_stream import CoordinateFormat, iter_statements, open_text
+
+# Layers that are measured, [GerberFilenames] keys, the area of a soldermask layer is its openings
+area_layers = ("top_copper", "bottom_copper", "top_soldermask", "bottom_soldermask", "top_paste", "bottom_paste")
+
+# Pairs of copper layers the balance is worked out for
+copper_pairs = (("top_copper", "bottom_copper"),)
+
+# Segments in a circle, the radius is scaled so the polygon has the same area as the circle
+circle_segments = 32
+_circle_angles = numpy.linspace(0, 2 * math.pi, circle_segments, endpoint=False)
+_circle_unit = numpy.stack([numpy.cos(_circle_angles), numpy.sin(_circle_angles)], axis=1) * \
+    math.sqrt(2 * math.pi / (circle_segments * math.sin(2 * math.pi / circle_segments)))
+
+# Length of the straight segments arcs are split into, as a fraction of the radius
+_arc_step = 0.1
+
+# Deepest nesting of parentheses and unary signs in an aperture macro expression
+_max_expression_depth = 64
+
+_word_re = re.compile(r"([GDMXYIJ])([+-]?[\d.]+)")
+_aperture_re = re.compile(r"ADD(\d+)([^,]+)(?:,(.*))?$")
+_step_repeat_re = re.compile(r"SRX(\d+)Y(\d+)I([\d.+-]+)J([\d.+-]+)")
+_token_re = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|\$(\d+)|([-+xX/()]))")
+
+
+def circle(diameter, x=0.0, y=0.0):
+    """
+    :param diameter: Diameter in nm
+    :param x: X of the center
+    :param y: Y of the center
+    :return: (n, 2) float array of the polygon
+    """
+    return _circle_unit * (diameter / 2) + (x, y)
+
+
+def rectangle(width, height, x=0.0, y=0.0):
+    """
+    :return: (4, 2) float array of a rectangle centered on x, y
+    """
+    _w = width / 2
+    _h = height / 2
+    return numpy.array([(x - _w, y - _h), (x + _w, y - _h), (x + _w, y + _h), (x - _w, y + _h)])
+
+
+def convex_hull(points):
+    """
+    :param points: (n, 2) float array
+    :return: (k, 2) float array of the hull, anticlockwise
+    """
+    return numpy.array(point_hull(map(tuple, points.tolist())))
+
+
+def _rotate(points, degrees):
+    if not degrees:
+        return points
+    _angle = math.radians(degrees)
+    _cos, _sin = math.cos(_angle), math.sin(_angle)
+    return points @ numpy.array([[_cos, _sin], [-_sin, _cos]])
+
+
+def _tokenise(expression, variables):
+    """
+    :return: list of the numbers, with the variables replaced by their values, and operator characters
+    """
+    _tokens = list()
+    _position = 0
+    _expression = expression.rstrip()
+    while _position < len(_expression):
+        _match = _token_re.match(_expression, _position)
+        if _match is None:
+            raise ValueError("Unable to evaluate aperture macro expression: {}".format(expression))
+        _number, _variable, _operator = _match.groups()
+        if _number is not None:
+            _tokens.append(float(_number))
+        elif _variable is not None:
+            _tokens.append(float(variables.get(int(_variable), 0.0)))
+        else:
+            _tokens.append("x" if _operator == "X" else _operator)
+        _position = _match.end()
+    return _tokens
+
+
+def _evaluate(expression, variables):
+    """
+    Evaluates an aperture macro expression, the arithmetic of the gerber spec, + - x / and parentheses with unary + -
+    :param expression: e.g. "$1x0.5+0.1"
+    :param variables: {number: value}
+    :return: float
+    """
+    _tokens = _tokenise(expression, variables)
+    if not _tokens:
+        return 0.0
+    _position = 0
+
+    def _peek():
+        return _tokens[_position] if _position < len(_tokens) else None
+
+    def _take():
+        nonlocal _position
+        _position += 1
+        return _tokens[_position - 1]
+
+    def _error():
+        return ValueError("Unable to evaluate aperture macro expression: {}".format(expression))
+
+    def _factor(depth):
+        if depth > _max_expression_depth:
+            raise _error()
+        _token = _take() if _peek() is not None else None
+        if _token == "-":
+            return -_factor(depth + 1)
+        if _token == "+":
+            return _factor(depth + 1)
+        if _token == "(":
+            _value = _sum(depth + 1)
+            if _peek() != ")":
+                raise _error()
+            _take()
+            return _value
+        if isinstance(_token, float):
+            return _token
+        raise _error()
+
+    def _product(depth):
+        _value = _factor(depth)
+        while _peek() in ("x", "/"):
+            if _take() == "x":
+                _value *= _factor(depth)
+            else:
+                _divisor = _factor(depth)
+                if _divisor == 0:
+                    raise ValueError("Division by zero in aperture macro expression: {}".format(expression))
+                _value /= _divisor
+        return _value
+
+    def _sum(depth):
+        _value = _product(depth)
+        while _peek() in ("+", "-"):
+            if _take() == "+":
+                _value += _product(depth)
+            else:
+                _value -= _product(depth)
+        return _value
+
+    _result = _sum(0)
+    if _position != len(_tokens):
+        raise _error()
+    return _result
+
+
+def macro_shapes(body, params):
+    """
+    Works out the shape of a macro aperture
+    :param body: Macro primitives in mm joined by '*', from CoordinateFormat.scale_macro()
+    :param params: list of float parameters from the aperture definition
+    :return: list of (exposure, [contours]) in nm, exposure False clears
+    """
+    _variables = {_index + 1: _value for _index, _value in enumerate(params)}
+    _shapes = list()
+
+    for _primitive in body.split("*"):
+        _primitive = _primitive.strip()
+        if not _primitive or _primitive.startswith("0"):
+            continue
+
+        if _primitive.startswith("$"):
+            _name, _, _expression = _primitive.partition("=")
+            _variables[int(_name[1:])] = _evaluate(_expression, _variables)
+            continue
+
+        _fields = _primitive.split(",")
+        _code = _fields[0].strip()
+        _values = [_evaluate(_field, _variables) for _field in _fields[1:]]
+        _mm = [_value * NM_PER_MM for _value in _values]
+
+        if _code == "1":
+            _contours = [circle(_mm[1], _mm[2], _mm[3])]
+            _rotation = _values[4] if len(_values) > 4 else 0
+        elif _code in ("20", "2"):
+            _length = math.hypot(_mm[4] - _mm[2], _mm[5] - _mm[3])
+            _angle = math.degrees(math.atan2(_mm[5] - _mm[3], _mm[4] - _mm[2]))
+            _line = _rotate(rectangle(_length, _mm[1]), -_angle) + ((_mm[2] + _mm[4]) / 2, (_mm[3] + _mm[5]) / 2)
+            _contours = [_line]
+            _rotation = _values[6]
+        elif _code == "21":
+            _contours = [rectangle(_mm[1], _mm[2], _mm[3], _mm[4])]
+            _rotation = _values[5]
+        elif _code == "22":
+            _contours = [rectangle(_mm[1], _mm[2], _mm[3] + _mm[1] / 2, _mm[4] + _mm[2] / 2)]
+            _rotation = _values[5]
+        elif _code == "4":
+            _count = int(_values[1])
+            _contours = [numpy.array(_mm[2:4 + _count * 2]).reshape(-1, 2)[:-1]]
+            _rotation = _values[4 + _count * 2]
+        elif _code == "5":
+            _count = int(_values[1])
+            _angles = numpy.linspace(0, 2 * math.pi, _count, endpoint=False)
+            _contours = [numpy.stack([numpy.cos(_angles), numpy.sin(_angles)], axis=1) * (_mm[4] / 2) +
+                         (_mm[2], _mm[3])]
+            _rotation = _values[5]
+        elif _code == "6":
+            # Moire, the outer circle
+            _shapes.append((True, [_rotate(circle(_mm[2], _mm[0], _mm[1]), _values[8])]))
+            continue
+        elif _code == "7":
+            # Thermal, the ring without the gaps
+            _shapes.append((True, [_rotate(circle(_mm[2], _mm[0], _mm[1]), _values[5]),
+                                   _rotate(circle(_mm[3], _mm[0], _mm[1]), _values[5])]))
+            continue
+        else:
+            raise ValueError("Unknown aperture macro primitive: {}".format(_primitive))
+
+        _shapes.append((_values[0] != 0, [_rotate(_contour, _rotation) for _contour in _contours]))
+
+    return _shapes
+
+
+def standard_shapes(definition):
+    """
+    :param definition: Standard aperture definition in mm, e.g. "C,0.25"
+    :return: list of (exposure, [contours]) in nm, holes are a second contour
+    """
+    _name, _, _params = definition.partition(",")
+    _mm = [float(_param) * NM_PER_MM for _param in _params.split("X") if _param]
+
+    if _name == "C":
+        _contours = [circle(_mm[0])]
+        _hole = _mm[1:2]
+    elif _name == "R":
+        _contours = [rectangle(_mm[0], _mm[1])]
+        _hole = _mm[2:3]
+    elif _name == "O":
+        # Stadium, the hull of a circle at each end
+        _width, _height = _mm[0], _mm[1]
+        _diameter = min(_width, _height)
+        _offset = (max(_width, _height) - _diameter) / 2
+        _ends = (_offset, 0) if _width > _height else (0, _offset)
+        _contours = [convex_hull(numpy.concatenate([circle(_diameter, *_ends), circle(_diameter, -_ends[0],
+                                                                                      -_ends[1])]))]
+        _hole = _mm[2:3]
+    elif _name == "P":
+        _count = int(round(_mm[1] / NM_PER_MM))
+        _rotation = _mm[2] / NM_PER_MM if len(_mm) > 2 else 0
+        _angles = numpy.radians(numpy.linspace(0, 360, _count, endpoint=False) + _rotation)
+        _contours = [numpy.stack([numpy.cos(_angles), numpy.sin(_angles)], axis=1) * (_mm[0] / 2)]
+        _hole = _mm[3:4]
+    else:
+        return None
+
+    if _hole:
+        _contours.append(circle(_hole[0]))
+    return [(True, _contours)]
+
+
+class LayerShapes:
+    """
+    Every dark and clear polygon of a gerber layer in nm, in the order they are drawn
+    A shape is one or more contours filled even-odd, e.g. a region with a hole
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # [contour arrays], the shape each contour is part of and whether each shape is dark
+        self.contours = list()
+        self.contour_shapes = list()
+        self.shape_dark = list()
+
+    def __len__(self):
+        return len(self.shape_dark)
+
+    def add(self, dark, contours):
+        _shape = len(self.shape_dark)
+        self.shape_dark.append(dark)
+        for _contour in contours:
+            if len(_contour) >= 3:
+                self.contours.append(_contour)
+                self.contour_shapes.append(_shape)
+
+    def extend(self, other, offset=(0, 0)):
+        """
+        Adds every shape of another LayerShapes, e.g. the content of a block aperture or step and repeat
+        :param other: LayerShapes
+        :param offset: (x, y) in nm
+        :return:
+        """
+        _start = len(self.shape_dark)
+        self.shape_dark.extend(other.shape_dark)
+        self.contours.extend(_contour + offset for _contour in other.contours)
+        self.contour_shapes.extend(_shape + _start for _shape in other.contour_shapes)
+
+    def load(self, lines):
+        """
+        Reads a gerber layer
+        :param lines: Iterable of lines of gerber source
+        :return: self
+        """
+        _format = CoordinateFormat()
+        _x = 0
+        _y = 0
+        _operation = 1
+        _interpolation = 1
+        _multi_quadrant = True
+        _dark = True
+        _region = None
+        _contour = list()
+
+        # {code: [(exposure, [contours])]} or LayerShapes for block apertures
+        _apertures = dict()
+        _macros = dict()
+        _aperture = None
+        # Stack of (code, step and repeat, LayerShapes) being read, the layer itself is at the bottom
+        _stack = [(None, None, self)]
+
+        def _close_contour():
+            if len(_contour) >= 3:
+                _region.append(numpy.array(_contour, dtype=numpy.float64))
+            del _contour[:]
+
+        for _is_extended, _statement in iter_statements(lines):
+            _shapes = _stack[-1][2]
+
+            if _is_extended:
+                _command = _statement[:2]
+                if _command == "FS":
+                    _format.set_format(_statement)
+                elif _command == "MO":
+                    _format.set_units("mm" if _statement[2:4] == "MM" else "inch")
+                elif _command == "LP":
+                    _dark = _statement[2:3] != "C"
+                elif _command == "AM":
+                    _name, _body = _format.scale_macro(_statement)
+                    _macros[_name] = _body
+                elif _command == "AD":
+                    _match = _aperture_re.match(_statement)
+                    if _match is None:
+                        raise ValueError("Unable to read aperture definition: {}".format(_statement))
+                    _definition = _match.group(2)
+                    if _match.group(3):
+                        _definition += "," + _match.group(3)
+                    _definition = _format.scale_aperture(_definition)
+                    _name, _, _params = _definition.partition(",")
+                    if _name in _macros:
+                        _apertures[int(_match.group(1))] = macro_shapes(
+                            _macros[_name], [float(_param) for _param in _params.split("X") if _param])
+                    else:
+                        _apertures[int(_match.group(1))] = standard_shapes(_definition)
+                elif _command == "AB":
+                    if _statement == "AB":
+                        _code, _, _block = _stack.pop()
+                        _apertures[_code] = _block
+                    else:
+                        _stack.append((int(_statement[3:]), None, LayerShapes(self.name)))
+                elif _command == "SR":
+                    _match = _step_repeat_re.match(_statement)
+                    if _stack[-1][1] is not None:
+                        # A new %SR also closes the one before it
+                        _, _step_repeat, _block = _stack.pop()
+                        self._repeat(_stack[-1][2], _block, _step_repeat)
+                    if _match:
+                        _step_repeat = (int(_match.group(1)), int(_match.group(2)),
+                                        to_nm(float(_match.group(3)) * _format.mm_scale),
+                                        to_nm(float(_match.group(4)) * _format.mm_scale))
+                        _stack.append((None, _step_repeat, LayerShapes(self.name)))
+                continue
+
+            if _statement.startswith("G04") or _statement.startswith("G4 "):
+                continue
+
+            _new_x = None
+            _new_y = None
+            _i = 0
+            _j = 0
+            _d_code = None
+            for _letter, _value in _word_re.findall(_statement):
+                if _letter == "G":
+                    _g_code = int(_value)
+                    if _g_code in (1, 2, 3):
+                        _interpolation = _g_code
+                    elif _g_code == 36:
+                        _region = list()
+                    elif _g_code == 37:
+                        _close_contour()
+                        _shapes.add(_dark, _region)
+                        _region = None
+                    elif _g_code == 74:
+                        _multi_quadrant = False
+                    elif _g_code == 75:
+                        _multi_quadrant = True
+                    elif _g_code == 70:
+                        _format.set_units("inch")
+                    elif _g_code == 71:
+                        _format.set_units("mm")
+                    elif _g_code == 90:
+                        _format.notation = "A"
+                    elif _g_code == 91:
+                        _format.notation = "I"
+                elif _letter == "X":
+                    _new_x = _format.to_nm(_value)
+                elif _letter == "Y":
+                    _new_y = _format.to_nm(_value)
+                elif _letter == "I":
+                    _i = _format.to_nm(_value)
+                elif _letter == "J":
+                    _j = _format.to_nm(_value)
+                elif _letter == "D":
+                    _d_code = int(_value)
+                elif _letter == "M" and int(_value) == 2:
+                    break
+
+            if _d_code is not None and _d_code >= 10:
+                _aperture = _apertures.get(_d_code)
+                continue
+            if _d_code is not None:
+                _operation = _d_code
+            elif _new_x is None and _new_y is None:
+                continue
+
+            _start = (_x, _y)
+            if _format.notation == "I":
+                _x += _new_x or 0
+                _y += _new_y or 0
+            else:
+                _x = _x if _new_x is None else _new_x
+                _y = _y if _new_y is None else _new_y
+
+            if _operation == 2:
+                if _region is not None:
+                    _close_contour()
+                    _contour.append((_x, _y))
+            elif _operation == 1:
+                _points = [_start, (_x, _y)]
+                if _interpolation != 1:
+                    _points = arc_points(_start, (_x, _y), (_i, _j), _interpolation == 2, _multi_quadrant, _arc_step)
+                if _region is not None:
+                    if not _contour:
+                        _contour.append(_start)
+                    _contour.extend(_points[1:])
+                elif _aperture is not None and not isinstance(_aperture, LayerShapes):
+                    for _segment_start, _segment_end in zip(_points[:-1], _points[1:]):
+                        self._draw(_shapes, _dark, _aperture, _segment_start, _segment_end)
+            elif _operation == 3:
+                if isinstance(_aperture, LayerShapes):
+                    _shapes.extend(_aperture, (_x, _y))
+                elif _aperture is not None:
+                    for _exposure, _contours in _aperture:
+                        _shapes.add(_dark == _exposure, [_contour + (_x, _y) for _contour in _contours])
+
+        while len(_stack) > 1:
+            _, _step_repeat, _block = _stack.pop()
+            if _step_repeat is not None:
+                self._repeat(_stack[-1][2], _block, _step_repeat)
+
+        return self
+
+    @staticmethod
+    def _repeat(shapes, block, step_repeat):
+        _repeat_x, _repeat_y, _step_x, _step_y = step_repeat
+        for _index_y in range(_repeat_y):
+            for _index_x in range(_repeat_x):
+                shapes.extend(block, (_index_x * _step_x, _index_y * _step_y))
+
+    @staticmethod
+    def _draw(shapes, dark, aperture, start, end):
+        """
+        Adds a straight draw, apertures are convex so this is the aperture at each end and the parallelogram swept by
+        the widest chord of the aperture across the direction of the draw
+        """
+        _exposure, _contours = aperture[0]
+        _outline = _contours[0]
+        shapes.add(dark, [_outline + start])
+        if start == end:
+            return
+
+        _across = _outline @ (start[1] - end[1], end[0] - start[0])
+        _left = _outline[numpy.argmax(_across)]
+        _right = _outline[numpy.argmin(_across)]
+        shapes.add(dark, [numpy.array([_left + start, _right + start, _right + end, _left + end])])
+        shapes.add(dark, [_outline + end])
+
+    def bounds(self):
+        """
+        :return: (min_x, min_y, max_x, max_y) in nm, or None for an empty layer
+        """
+        if not self.contours:
+            return None
+        _points = numpy.concatenate(self.contours)
+        return tuple(_points.min(axis=0).tolist() + _points.max(axis=0).tolist())
+
+
+class AreaRaster:
+    """
+    Scanline fill of a LayerShapes at a fixed pixel size, a pixel is covered if its center is inside the shapes
+    """
+
+    def __init__(self, shapes, pixel_size, tile_size=2048):
+        """
+        :param shapes: LayerShapes
+        :param pixel_size: Size of a pixel in nm
+        :param tile_size: Pixels along each side of a tile
+        """
+        self.pixel_size = pixel_size
+        self.tile_size = tile_size
+        self.bounds = shapes.bounds()
+        if self.bounds is None:
+            return
+
+        # Every edge of every contour, (x0, y0, x1, y1) and the shape it belongs to
+        _points = numpy.concatenate(shapes.contours)
+        _lengths = numpy.array([len(_contour) for _contour in shapes.contours])
+        _next = numpy.arange(len(_points)) + 1
+        _ends = numpy.cumsum(_lengths)
+        _next[_ends - 1] = _ends - _lengths
+        _edge_shapes = numpy.repeat(numpy.array(shapes.contour_shapes), _lengths)
+
+        _keep = _points[:, 1] != _points[_next, 1]
+        self._edges = numpy.concatenate([_points, _points[_next]], axis=1)[_keep]
+        self._edge_shapes = _edge_shapes[_keep]
+
+        # Consecutive shapes of the same polarity are filled together
+        _dark = numpy.array(shapes.shape_dark, dtype=bool)
+        self._shape_dark = _dark
+        self._shape_runs = numpy.concatenate([[0], numpy.cumsum(_dark[1:] != _dark[:-1])])
+
+        # The points of each shape are together, shapes without any points are never selected
+        _point_shapes = numpy.repeat(numpy.array(shapes.contour_shapes), _lengths)
+        _with_points, _first_points = numpy.unique(_point_shapes, return_index=True)
+        _shape_min = numpy.full((len(_dark), 2), numpy.inf)
+        _shape_max = numpy.full((len(_dark), 2), -numpy.inf)
+        _shape_min[_with_points] = numpy.minimum.reduceat(_points, _first_points)
+        _shape_max[_with_points] = numpy.maximum.reduceat(_points, _first_points)
+        self._shape_min = _shape_min
+        self._shape_max = _shape_max
+
+    def tiles(self):
+        """
+        :return: generator of (x0, y0) of the bottom left of each tile in nm
+        """
+        if self.bounds is None:
+            return
+        _span = self.pixel_size * self.tile_size
+        _x = self.bounds[0]
+        while _x < self.bounds[2]:
+            _y = self.bounds[1]
+            while _y < self.bounds[3]:
+                yield _x, _y
+                _y += _span
+            _x += _span
+
+    def fill_tile(self, x0, y0):
+        """
+        :param x0: X of the left edge of the tile in nm
+        :param y0: Y of the bottom edge of the tile in nm
+        :return: (tile_size, tile_size) bool array, row 0 is the bottom
+        """
+        _size = self.tile_size
+        _span = self.pixel_size * _size
+        _mask = numpy.zeros((_size, _size), dtype=bool)
+
+        _shapes = numpy.all((self._shape_max >= (x0, y0)) & (self._shape_min <= (x0 + _span, y0 + _span)), axis=1)
+        _selected = _shapes[self._edge_shapes]
+        if not _selected.any():
+            return _mask
+
+        _edges = self._edges[_selected]
+        _edge_shapes = self._edge_shapes[_selected]
+        _edge_runs = self._shape_runs[_edge_shapes]
+        for _run in numpy.unique(_edge_runs):
+            _in_run = _edge_runs == _run
+            _filled = self._fill(_edges[_in_run], _edge_shapes[_in_run], x0, y0)
+            if _filled is None:
+                continue
+
+            _coverage, _row, _column = _filled
+            _window = _mask[_row:_row + _coverage.shape[0], _column:_column + _coverage.shape[1]]
+            if self._shape_dark[_edge_shapes[_in_run][0]]:
+                _window |= _coverage
+            else:
+                _window &= ~_coverage
+
+        return _mask
+
+    def _fill(self, edges, edge_shapes, x0, y0):
+        """
+        Even-odd fill of each shape, then the union of the shapes
+        Only the window of the tile the shapes cover is filled, so small runs of shapes are cheap
+        :return: (bool array of the window, first row, first column), or None if no pixels are covered
+        """
+        _size = self.tile_size
+        _pixel = self.pixel_size
+
+        # Rows whose center is in [y_low, y_high) of each edge, so every closed contour crosses a row an even number
+        # of times
+        _y_low = numpy.minimum(edges[:, 1], edges[:, 3])
+        _y_high = numpy.maximum(edges[:, 1], edges[:, 3])
+        _row_start = numpy.clip(numpy.ceil((_y_low - y0) / _pixel - 0.5), 0, _size).astype(numpy.int64)
+        _row_end = numpy.clip(numpy.ceil((_y_high - y0) / _pixel - 0.5), 0, _size).astype(numpy.int64)
+        _counts = _row_end - _row_start
+        if not _counts.any():
+            return None
+
+        _edge_index = numpy.repeat(numpy.arange(len(edges)), _counts)
+        _rows = numpy.arange(len(_edge_index)) - numpy.repeat(numpy.cumsum(_counts) - _counts, _counts) + \
+            _row_start[_edge_index]
+        _row_y = y0 + (_rows + 0.5) * _pixel
+        _edge = edges[_edge_index]
+        _x = _edge[:, 0] + (_row_y - _edge[:, 1]) * (_edge[:, 2] - _edge[:, 0]) / (_edge[:, 3] - _edge[:, 1])
+
+        _order = numpy.lexsort((_x, _rows, edge_shapes[_edge_index]))
+        _rows = _rows[_order][::2]
+        _columns = numpy.clip(numpy.ceil((_x[_order] - x0) / _pixel - 0.5), 0, _size).astype(numpy.int64)
+        _starts = _columns[::2]
+        _ends = _columns[1::2]
+
+        # Difference array of the spans over the window, a pixel is covered if any span covers it
+        _row = int(_rows.min())
+        _column = int(_starts.min())
+        _height = int(_rows.max()) + 1 - _row
+        _width = int(_ends.max()) + 1 - _column
+        _index = (_rows - _row) * _width
+        _diff = numpy.bincount(_index + _starts - _column, minlength=_height * _width) - \
+            numpy.bincount(_index + _ends - _column, minlength=_height * _width)
+        return numpy.cumsum(_diff.reshape(_height, _width), axis=1)[:, :-1] > 0, _row, _column
+
+    def area(self):
+        """
+        :return: Covered area in mm2
+        """
+        _pixels = 0
+        for _x, _y in self.tiles():
+            _pixels += int(numpy.count_nonzero(self.fill_tile(_x, _y)))
+
+        return _pixels * (self.pixel_size / NM_PER_MM) ** 2
+
+
+def measure_layer(lines, name, pixel_size, tile_size=2048):
+    """
+    :param lines: Iterable of lines of gerber source
+    :param name: Name of the layer, for error messages
+    :param pixel_size: Size of a pixel in nm
+    :param tile_size: Pixels along each side of a tile
+    :return: Dark area of the layer in mm2
+    """
+    return AreaRaster(LayerShapes(name).load(lines), pixel_size, tile_size).area()
+
+
+class LayerAreas:
+    """
+    Area of each measured layer for a board, the frame and the whole panel
+    """
+
+    def __init__(self, pixel_size, panel_width, panel_height, board_count):
+        """
+        :param pixel_size: Size of a pixel in nm
+        :param panel_width: Width of the panel in nm
+        :param panel_height: Height of the panel in nm
+        :param board_count: Number of boards on the panel
+        """
+        self.pixel_size = pixel_size
+        self.panel_area = (panel_width / NM_PER_MM) * (panel_height / NM_PER_MM)
+        self.board_count = board_count
+        # {layer: mm2}
+        self.board = dict()
+        self.frame = dict()
+
+    def measure(self, board_zip_path, board_entries, frame_zip_path, file_names, tile_size=2048):
+        """
+        :param board_zip_path: Path of the board zip
+        :param board_entries: list of layer_manifest.LayerEntry for the board gerber layers
+        :param frame_zip_path: Path of the frame overlay zip, or None
+        :param file_names: [GerberFilenames] config section
+        :param tile_size: Pixels along each side of a tile
+        :return: self
+        """
+        with ZipFile(str(board_zip_path), 'r') as zip_file:
+            for _entry in board_entries:
+                if _entry.layer in area_layers and _entry.layer not in self.board:
+                    with open_text(zip_file, _entry.name) as _lines:
+                        self.board[_entry.layer] = measure_layer(_lines, _entry.name, self.pixel_size, tile_size)
+
+        if frame_zip_path is not None:
+            with ZipFile(str(frame_zip_path), 'r') as zip_file:
+                _names = set(zip_file.namelist())
+                for _layer in area_layers:
+                    if file_names[_layer] in _names:
+                        with open_text(zip_file, file_names[_layer]) as _lines:
+                            self.frame[_layer] = measure_layer(_lines, file_names[_layer], self.pixel_size,
+                                                               tile_size)
+
+        return self
+
+    def panel(self, layer):
+        """
+        :return: Area of a layer over the whole panel in mm2
+        """
+        return self.board.get(layer, 0.0) * self.board_count + self.frame.get(layer, 0.0)
+
+    def coverage(self, layer):
+        """
+        :return: Fraction of the panel the layer covers
+        """
+        return self.panel(layer) / self.panel_area if self.panel_area else 0.0
+
+    def copper_balance(self):
+        """
+        :return: list of (top layer, bottom layer, smaller / larger copper area), 1 is perfectly balanced
+        """
+        _balance = list()
+        for _top, _bottom in copper_pairs:
+            _areas = (self.panel(_top), self.panel(_bottom))
+            if max(_areas):
+                _balance.append((_top, _bottom, min(_areas) / max(_areas)))
+
+        return _balance
+
+    def report_lines(self):
+        """
+        :return: list of lines for the report, without line endings
+        """
+        _lines = ["Resolution: {}mm".format(format_decimal(self.pixel_size, 4))]
+        for _layer in area_layers:
+            if _layer not in self.board and _layer not in self.frame:
+                continue
+            _lines.append("  {} - board: {}mm2, panel: {}mm2 ({}%)".format(
+                _layer, round(self.board.get(_layer, 0.0), 2), round(self.panel(_layer), 2),
+                round(self.coverage(_layer) * 100, 1)))
+
+        for _top, _bottom, _ratio in self.copper_balance():
+            _lines.append("Copper balance ({} / {}): {}".format(_top, _bottom, round(_ratio, 3)))
+
+        return _lines
+
+
+def main():
+    _parser = argparse.ArgumentParser(description="Measures the copper, soldermask opening and paste area of a board")
+    _parser.add_argument("zip", help="Board gerber zip")
+    _parser.add_argument("--resolution", type=float, default=0.025, help="Pixel size in mm (0.025)")
+    _args = _parser.parse_args()
+
+    from layer_manifest import LayerManifest
+
+    _pixel_size = to_nm(_args.resolution)
+    _manifest = LayerManifest.from_zip(_args.zip)
+    with ZipFile(_args.zip, 'r') as zip_file:
+        for _entry in _manifest.layers():
+            if _entry.layer not in area_layers:
+                continue
+            with open_text(zip_file, _entry.name) as _lines:
+                _area = measure_layer(_lines, _entry.name, _pixel_size)
+            print("{}: {} {}mm2".format(_entry.name, _entry.layer, round(_area, 3)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,412 @@
+#! /usr/bin/env python3
+"""
+Bounds and primitive counts of every layer in a board zip, checked against the board profile
+Each layer is scanned as raw bytes with a few regular expressions rather than being parsed statement by statement, the
+coordinates between two aperture selections are reduced to a min and max straight away and the size of the aperture is
+added on. Layers are scanned in parallel, one process per layer, once the zip is big enough for it to be worth it.
+The bounds are of the coordinates plus the aperture, arcs are only counted by their end points and regions by their
+vertices, so a bulging arc can be missed. Overhang is against the bounding box of the profile, not its exact shape
+"""
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import ZipFile
+
+import logzero
+
+from geometry import NM_PER_MM, div_round, format_decimal, to_nm
+
+# Scan in worker processes when the layers add up to more than this many bytes, below it starting them costs more
+parallel_size = 4 << 20
+
+_nm_per_inch = 25400000
+
+_extended_re = re.compile(rb"%([^%]*)%")
+_comment_re = re.compile(rb"G0?4[^*]*\*")
+_format_re = re.compile(rb"FS([LTD]?)([AI]?)[^*]*?X(\d)(\d)Y(\d)(\d)")
+_units_re = re.compile(rb"MO(MM|IN)|G7([01])\*")
+_step_repeat_re = re.compile(rb"SRX(\d+)Y(\d+)I([\d.+-]+)J([\d.+-]+)")
+# Block apertures, their content is relative to where they are flashed so it is scanned on its own
+_block_re = re.compile(rb"%ABD(\d+)\*%(.*?)%AB\*%", re.DOTALL)
+# Aperture selections (D10 and up) and region starts and ends, the span between two of them is drawn the same way
+_event_re = re.compile(rb"D0*([1-9]\d+)\*|G3([67])")
+_x_re = re.compile(rb"X([+-]?[\d.]+)")
+_y_re = re.compile(rb"Y([+-]?[\d.]+)")
+_flash_re = re.compile(rb"D0*3\*")
+_draw_re = re.compile(rb"D0*1\*")
+
+# Excellon files are small and already have a parser of their own
+_drill_kinds = ("excellon",)
+
+
+class LayerBounds:
+    """
+    Extent of one layer in nm, including the size of the apertures
+    """
+
+    __slots__ = ("name", "kind", "min_x", "min_y", "max_x", "max_y", "counts", "error")
+
+    def __init__(self, name, kind):
+        """
+        :param name: Name of the file in the zip
+        :param kind: layer_manifest kind, gerber or excellon
+        """
+        self.name = name
+        self.kind = kind
+        self.min_x = None
+        self.min_y = None
+        self.max_x = None
+        self.max_y = None
+        # {primitive: count}, e.g. flashes, draws, regions for gerber and hits, slots for excellon
+        self.counts = dict()
+        # Why the layer couldn't be scanned, None if it was
+        self.error = None
+
+    @property
+    def empty(self):
+        return self.min_x is None
+
+    def add_box(self, min_x, min_y, max_x, max_y):
+        """
+        Grows the bounds to include a box
+        :return:
+        """
+        if self.min_x is None:
+            self.min_x, self.min_y, self.max_x, self.max_y = min_x, min_y, max_x, max_y
+            return
+
+        self.min_x = min(self.min_x, min_x)
+        self.min_y = min(self.min_y, min_y)
+        self.max_x = max(self.max_x, max_x)
+        self.max_y = max(self.max_y, max_y)
+
+    def overhang(self, profile):
+        """
+        :param profile: LayerBounds of the profile
+        :return: (left, bottom, right, top) in nm of how far the layer goes past the profile on each side, 0 if it doesn't
+        """
+        if self.empty or profile.empty:
+            return 0, 0, 0, 0
+
+        return (max(0, profile.min_x - self.min_x), max(0, profile.min_y - self.min_y),
+                max(0, self.max_x - profile.max_x), max(0, self.max_y - profile.max_y))
+
+    def __repr__(self):
+        if self.empty:
+            return "LayerBounds({}, empty)".format(self.name)
+        return "LayerBounds({}, ({}, {}) - ({}, {}))".format(self.name, format_decimal(self.min_x, 4),
+                                                             format_decimal(self.min_y, 4),
+                                                             format_decimal(self.max_x, 4),
+                                                             format_decimal(self.max_y, 4))
+
+
+class _ByteFormat:
+    """
+    Converts coordinate matches from a gerber file to nm in bulk
+    """
+
+    def __init__(self, header):
+        """
+        :param header: Extended commands of the layer joined together, as bytes
+        """
+        _match = _format_re.search(header)
+        self.zeros = b"L"
+        self.incremental = False
+        self.decimal = 4
+        self.digits = 6
+        if _match is not None:
+            self.zeros = _match.group(1) or b"L"
+            self.incremental = _match.group(2) == b"I"
+            self.decimal = int(_match.group(4))
+            self.digits = int(_match.group(3)) + self.decimal
+
+        self.numerator = _nm_per_inch
+        self.mm_scale = 25.4
+        # Some exporters write decimal points even though the spec doesn't allow it
+        self.decimal_points = False
+
+    def set_units(self, mm):
+        self.numerator = NM_PER_MM if mm else _nm_per_inch
+        self.mm_scale = 1.0 if mm else 25.4
+
+    def extremes(self, values):
+        """
+        :param values: list of coordinate bytes as they appear in the file
+        :return: (min, max) in nm
+        """
+        if self.decimal_points:
+            _numbers = list(map(float, values))
+            return int(round(min(_numbers) * self.numerator)), int(round(max(_numbers) * self.numerator))
+
+        if self.zeros == b"T":
+            # Trailing zeros omitted, pad every value out before it can be compared
+            _numbers = [int(_value.lstrip(b"+-").ljust(self.digits, b"0")) * (-1 if _value[:1] == b"-" else 1)
+                        for _value in values]
+        else:
+            _numbers = list(map(int, values))
+
+        # The conversion only scales so the extremes stay the extremes
+        _denominator = 10 ** self.decimal
+        return (div_round(min(_numbers) * self.numerator, _denominator),
+                div_round(max(_numbers) * self.numerator, _denominator))
+
+
+def _aperture_extents(header, byte_format):
+    """
+    Works out how far each aperture reaches from the point it is flashed or drawn at
+    :param header: Extended commands of the layer, as bytes
+    :param byte_format: _ByteFormat of the layer
+    :return: dict of {code: (min x, min y, max x, max y)} in nm
+    """
+    from gerber_stream import CoordinateFormat
+    from layer_area import macro_shapes, standard_shapes
+
+    # Only used to scale apertures and macros to mm
+    _format = CoordinateFormat()
+    _format.set_units("mm" if byte_format.mm_scale == 1.0 else "inch")
+
+    _macros = dict()
+    _extents = dict()
+    for _match in _extended_re.finditer(header):
+        _command = _match.group(1).decode("ascii", errors="replace")
+        if _command.startswith("AM"):
+            _name, _body = _format.scale_macro(_command)
+            _macros[_name] = _body
+            continue
+
+        for _statement in _command.split("*"):
+            if not _statement.startswith("ADD"):
+                continue
+
+            _code = re.match(r"ADD(\d+)", _statement).group(1)
+            _definition = _format.scale_aperture(_statement[3 + len(_code):])
+            _name, _, _params = _definition.partition(",")
+            try:
+                if _name in _macros:
+                    _shapes = macro_shapes(_macros[_name], [float(_param) for _param in _params.split("X") if _param])
+                else:
+                    _shapes = standard_shapes(_definition)
+            except (ValueError, IndexError, ZeroDivisionError):
+                _shapes = list()
+
+            _points = [_point for _exposure, _contours in _shapes if _exposure
+                       for _contour in _contours for _point in _contour]
+            if _points:
+                _extents[int(_code)] = (int(min(_point[0] for _point in _points)),
+                                        int(min(_point[1] for _point in _points)),
+                                        int(max(_point[0] for _point in _points)),
+                                        int(max(_point[1] for _point in _points)))
+
+    return _extents
+
+
+def scan_gerber(data, name, apertures=True):
+    """
+    :param data: Contents of a gerber file as bytes
+    :param name: Name of the file
+    :param apertures: Add the size of the apertures, False for the bounds of the coordinates alone
+    :return: LayerBounds
+    """
+    _bounds = LayerBounds(name, "gerber")
+
+    _blocks = [(int(_match.group(1)), _match.group(2)) for _match in _block_re.finditer(data)]
+    if _blocks:
+        data = _block_re.sub(b"", data)
+
+    _header = b"".join(_match.group(0) for _match in _extended_re.finditer(data))
+    _format = _ByteFormat(_header)
+    _units = _units_re.search(data)
+    if _units is not None:
+        _format.set_units(_units.group(1) == b"MM" or _units.group(2) == b"1")
+
+    # Everything outside the extended commands and comments is coordinate data
+    _body = _comment_re.sub(b"", _extended_re.sub(b"", data))
+    if _format.incremental or b"G91" in _body:
+        _bounds.error = "incremental coordinates aren't scanned"
+        return _bounds
+    _format.decimal_points = b"." in _body
+
+    _bounds.counts["apertures"] = _header.count(b"ADD")
+    _bounds.counts["flashes"] = len(_flash_re.findall(_body))
+    _bounds.counts["draws"] = len(_draw_re.findall(_body))
+    _bounds.counts["regions"] = _body.count(b"G36")
+
+    _extents = _aperture_extents(_header, _format) if apertures else dict()
+    for _code, _content in _blocks:
+        # The extent of a block aperture is the bounds of what is in it
+        _block = scan_gerber(_header + _content, name, apertures)
+        if not _block.empty:
+            _extents[_code] = (_block.min_x, _block.min_y, _block.max_x, _block.max_y)
+    _aperture = None
+    _in_region = False
+    _start = 0
+    # Extremes of each span, x and y separately as a span may only move along one axis
+    _xs = list()
+    _ys = list()
+    for _match in list(_event_re.finditer(_body)) + [None]:
+        _end = len(_body) if _match is None else _match.start()
+        # Regions are filled inside their outline, the aperture isn't drawn along it
+        _extent = (0, 0, 0, 0) if _in_region else _extents.get(_aperture, (0, 0, 0, 0))
+        _values = _x_re.findall(_body, _start, _end)
+        if _values:
+            _min, _max = _format.extremes(_values)
+            _xs += [_min + _extent[0], _max + _extent[2]]
+        _values = _y_re.findall(_body, _start, _end)
+        if _values:
+            _min, _max = _format.extremes(_values)
+            _ys += [_min + _extent[1], _max + _extent[3]]
+
+        if _match is None:
+            break
+        if _match.group(1) is not None:
+            _aperture = int(_match.group(1))
+        else:
+            _in_region = _match.group(2) == b"6"
+        _start = _match.end()
+
+    if _xs and _ys:
+        _bounds.add_box(min(_xs), min(_ys), max(_xs), max(_ys))
+
+    # Step and repeat copies, the whole layer is stretched by the largest repeat as the blocks aren't tracked
+    for _match in _step_repeat_re.finditer(_header):
+        if _bounds.empty:
+            break
+        _bounds.max_x += (int(_match.group(1)) - 1) * to_nm(float(_match.group(3)) * _format.mm_scale)
+        _bounds.max_y += (int(_match.group(2)) - 1) * to_nm(float(_match.group(4)) * _format.mm_scale)
+
+    return _bounds
+
+
+def scan_excellon(data, name):
+    """
+    :param data: Contents of an excellon file as bytes
+    :param name: Name of the file
+    :return: LayerBounds
+    """
+    from excellon import ExcellonFile
+
+    _bounds = LayerBounds(name, "excellon")
+    _excellon = ExcellonFile(name).load(data.decode("ascii", errors="replace").splitlines())
+
+    _bounds.counts["tools"] = len(_excellon.tools)
+    _bounds.counts["hits"] = sum(len(_hits) for _hits in _excellon.hits.values())
+    _bounds.counts["slots"] = sum(len(_slots) for _slots in _excellon.slots.values())
+
+    for _tool, _hits in list(_excellon.hits.items()) + [(_tool, _slots.reshape(-1, 2))
+                                                         for _tool, _slots in _excellon.slots.items()]:
+        if not len(_hits):
+            continue
+        _radius = _excellon.tools.get(_tool, 0) // 2
+        _bounds.add_box(int(_hits[:, 0].min()) - _radius, int(_hits[:, 1].min()) - _radius,
+                        int(_hits[:, 0].max()) + _radius, int(_hits[:, 1].max()) + _radius)
+
+    return _bounds
+
+
+def scan_entry(zip_path, name, kind):
+    """
+    Scans a single file of the zip, run in a worker process so only takes simple arguments
+    :param zip_path: str path of the board gerber zip
+    :param name: Name of the file in the zip
+    :param kind: layer_manifest kind, gerber or excellon
+    :return: LayerBounds
+    """
+    with ZipFile(zip_path, 'r') as zip_file:
+        _data = zip_file.read(name)
+
+    try:
+        if kind in _drill_kinds:
+            return scan_excellon(_data, name)
+        return scan_gerber(_data, name)
+    except (ValueError, IndexError) as e:
+        _bounds = LayerBounds(name, kind)
+        _bounds.error = str(e)
+        return _bounds
+
+
+class LayerBoundsScan:
+    """
+    Bounds of every gerber and excellon layer in a board zip, and how far each one goes past the profile
+    """
+    logger = None
+    # Number of layers to scan at the same time, None is one per cpu
+    max_workers = None
+
+    def __init__(self, logger=None, max_workers=None):
+        self.logger = logger or logzero.logger
+        if max_workers:
+            self.max_workers = max_workers
+
+        # LayerBounds of the profile, scanned without the outline's aperture so it is the cut line
+        self.profile = None
+        # LayerBounds of every other layer in the zip, in archive order
+        self.layers = list()
+
+    def scan(self, manifest, profile_entry):
+        """
+        :param manifest: layer_manifest.LayerManifest of the board zip
+        :param profile_entry: LayerEntry of the profile layer
+        :return: self
+        """
+        _entries = [_entry for _entry in manifest.layers() + manifest.drills() if _entry.name != profile_entry.name]
+        _jobs = [(str(manifest.zip_path), _entry.name, _entry.kind) for _entry in _entries]
+
+        _max_workers = min(len(_jobs), self.max_workers or os.cpu_count() or 1)
+        if _max_workers > 1 and sum(_entry.size for _entry in _entries) > parallel_size:
+            self.logger.debug("Scanning {} layers with {} workers".format(len(_jobs), _max_workers))
+            with ProcessPoolExecutor(max_workers=_max_workers) as executor:
+                _futures = [executor.submit(scan_entry, *_job) for _job in _jobs]
+                self.layers = [_future.result() for _future in _futures]
+        else:
+            self.layers = [scan_entry(*_job) for _job in _jobs]
+
+        with ZipFile(str(manifest.zip_path), 'r') as zip_file:
+            _data = zip_file.read(profile_entry.name)
+        # Drawn with a thin line, its centre is where the board is cut
+        self.profile = scan_gerber(_data, profile_entry.name, apertures=False)
+
+        return self
+
+    def overhangs(self, tolerance=0):
+        """
+        :param tolerance: Overhang in nm that is ignored
+        :return: list of (LayerBounds, (left, bottom, right, top)) of the layers that go past the profile
+        """
+        _overhangs = list()
+        for _layer in self.layers:
+            _overhang = _layer.overhang(self.profile)
+            if max(_overhang) > tolerance:
+                _overhangs.append((_layer, _overhang))
+
+        return _overhangs
+
+    def report_lines(self, tolerance=0):
+        """
+        :param tolerance: Overhang in nm that is ignored
+        :return: list of lines for the report
+        """
+        _overhangs = {_layer.name: _overhang for _layer, _overhang in self.overhangs(tolerance)}
+        _lines = ["Profile: {}".format(self._format_bounds(self.profile))]
+
+        for _layer in self.layers:
+            _counts = ", ".join("{} {}".format(_count, _name) for _name, _count in _layer.counts.items())
+            if _layer.error is not None:
+                _lines.append("  {} - not scanned, {}".format(_layer.name, _layer.error))
+                continue
+
+            _lines.append("  {} - {}, {}".format(_layer.name, self._format_bounds(_layer), _counts))
+            if _layer.name in _overhangs:
+                _lines.append("    overhang: {}".format(", ".join(
+                    "{} {}mm".format(_side, format_decimal(_value, 3))
+                    for _side, _value in zip(("left", "bottom", "right", "top"), _overhangs[_layer.name]) if _value)))
+
+        return _lines
+
+    @staticmethod
+    def _format_bounds(bounds):
+        if bounds.empty:
+            return "empty"
+        return "({}, {}) to ({}, {})mm".format(format_decimal(bounds.min_x, 3), format_decimal(bounds.min_y, 3),
+                                               format_decimal(bounds.max_x, 3), format_decimal(bounds.max_y, 3))
+
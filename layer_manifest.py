@@ -0,0 +1,288 @@
+#! /usr/bin/env python3
+"""
+Index of the layers in a board zip, built in a single pass over the archive
+Every entry is classified by its file extension and by the gerber X2 %TF.FileFunction attribute if it has one, only
+the first few KB of each file are read to do this. Sizes and CRCs come from the zip directory so nothing is
+decompressed in full. The manifest is then passed to everything else that needs to know what is in the zip
+"""
+
+import itertools
+import re
+from pathlib import Path
+from zipfile import ZipFile
+
+# File extensions that may be excellon drill files, they are checked for an M48 header before being read
+drill_extensions = (".txt", ".drl", ".xln", ".exc", ".drd", ".tap")
+
+# Board layer file extensions and the [GerberFilenames] config key of the frame layer that goes with them
+layer_extensions = {
+    ".gtl": "top_copper",
+    ".gbl": "bottom_copper",
+    ".gto": "top_silkscreen",
+    ".gbo": "bottom_silkscreen",
+    ".gts": "top_soldermask",
+    ".gbs": "bottom_soldermask",
+    ".gtp": "top_paste",
+    ".gbp": "bottom_paste",
+    ".gko": "profile",
+    ".gml": "mill",
+}
+
+# Other gerber layers that are repeated on their own, inner copper and mechanical layers
+extra_layer_extensions = (".g1", ".g2", ".g3", ".g4", ".g5", ".g6", ".gm1", ".gm2", ".gm3", ".gm4", ".gm13", ".gm15")
+
+# File extensions that may be pick and place centroid files, they are checked for a designator and X header
+# Eagle .mnt and .mnb files don't have a header so are taken on their extension alone
+centroid_extensions = (".csv", ".pos", ".xy", ".txt", ".mnt", ".mnb")
+
+# Gerber X2 file functions and the layer they are, {(function, side): layer}, a side of None matches any side
+file_functions = {
+    ("Copper", "Top"): "top_copper",
+    ("Copper", "Bot"): "bottom_copper",
+    ("Legend", "Top"): "top_silkscreen",
+    ("Legend", "Bot"): "bottom_silkscreen",
+    ("Soldermask", "Top"): "top_soldermask",
+    ("Soldermask", "Bot"): "bottom_soldermask",
+    ("Paste", "Top"): "top_paste",
+    ("Paste", "Bot"): "bottom_paste",
+    ("Profile", None): "profile",
+}
+
+# How much of each file is read to classify it
+_sniff_size = 4096
+
+_file_function_re = re.compile(r"%TF\.FileFunction,([^*]*)\*%")
+_gerber_units_re = re.compile(r"%MO(MM|IN)\*%|\bG7([01])\*")
+_centroid_header_re = re.compile(r"^.*\b(?:designator|ref|refdes|reference)\b.*(?:\b|mid|pos|cent(?:er|re|roid)|location)[ _-]?x\b",
+                                 re.IGNORECASE | re.MULTILINE)
+
+
+def read_header_start(lines):
+    """
+    Reads up to the first line of a file that isn't blank or a comment, to check if it is an excellon drill file
+    :param lines: Iterator of lines
+    :return: (is_excellon, lines) where lines is the full file including the lines already read
+    """
+    _read = list()
+    for line in lines:
+        _read.append(line)
+        _line = line.strip()
+        if _line and not _line.startswith(";"):
+            return _line == "M48", itertools.chain(_read, lines)
+
+    return False, iter(_read)
+
+
+class LayerEntry:
+    """
+    A single file in the board zip
+    """
+
+    __slots__ = ("name", "size", "compressed_size", "crc", "kind", "layer", "source", "file_function", "units")
+
+    def __init__(self, name, size, compressed_size, crc):
+        self.name = name
+        self.size = size
+        self.compressed_size = compressed_size
+        self.crc = crc
+        # "gerber", "excellon", "centroid", "other" or "ignored"
+        self.kind = "other"
+        # [GerberFilenames] key of the layer, None for inner or mechanical layers that have no frame layer
+        self.layer = None
+        # Where the layer came from, "extension", "x2", or "conflict" if they disagree and the extension was used
+        self.source = None
+        # %TF.FileFunction value if the file has one
+        self.file_function = None
+        # "mm", "inch" or None if the head of the file didn't say
+        self.units = None
+
+    @property
+    def file_name(self):
+        return Path(self.name).name
+
+    @property
+    def suffix(self):
+        return Path(self.name).suffix.lower()
+
+    def __repr__(self):
+        return "LayerEntry({}, {}, {}, {} bytes)".format(self.name, self.kind, self.layer, self.size)
+
+
+def classify_file_function(file_function):
+    """
+    Finds the layer for a gerber X2 file function
+    :param file_function: Value of the %TF.FileFunction attribute e.g. "Copper,L1,Top"
+    :return: ("gerber" or "extra", layer key or None)
+    """
+    _fields = file_function.split(",")
+    _function = _fields[0]
+    _side = _fields[-1] if len(_fields) > 1 else None
+
+    for (_known_function, _known_side), _layer in file_functions.items():
+        if _function == _known_function and (_known_side is None or _known_side == _side):
+            return "gerber", _layer
+
+    # Inner copper, mechanical layers and so on are repeated without a frame layer
+    return "extra", None
+
+
+def _sniff(entry, head):
+    """
+    Works out what a file is from its extension and the first few KB of it
+    :param entry: LayerEntry to fill in
+    :param head: str of the start of the file
+    :return:
+    """
+    _suffix = entry.suffix
+
+    if _suffix in drill_extensions:
+        _is_excellon, _lines = read_header_start(iter(head.splitlines()))
+        if _is_excellon:
+            entry.kind = "excellon"
+            entry.layer = "drills"
+            entry.source = "extension"
+            for _line in _lines:
+                _line = _line.strip()
+                if _line.startswith("METRIC") or _line == "M71":
+                    entry.units = "mm"
+                    break
+                if _line.startswith("INCH") or _line == "M72":
+                    entry.units = "inch"
+                    break
+            return
+
+    if _suffix in centroid_extensions:
+        if _suffix in (".mnt", ".mnb") or _centroid_header_re.search(head):
+            entry.kind = "centroid"
+            entry.source = "extension"
+            return
+
+    _units = _gerber_units_re.search(head)
+    if _units:
+        entry.units = "mm" if _units.group(1) == "MM" or _units.group(2) == "1" else "inch"
+
+    if _suffix in layer_extensions:
+        entry.kind = "gerber"
+        entry.layer = layer_extensions[_suffix]
+        entry.source = "extension"
+    elif _suffix in extra_layer_extensions:
+        entry.kind = "gerber"
+        entry.source = "extension"
+
+    _file_function = _file_function_re.search(head)
+    if _file_function:
+        entry.file_function = _file_function.group(1)
+        _, _layer = classify_file_function(entry.file_function)
+        if entry.kind == "gerber" and entry.layer is not None and entry.layer != _layer:
+            # Keep the extension classification but let the manifest flag the conflict
+            entry.source = "conflict"
+            return
+        entry.kind = "gerber"
+        entry.layer = _layer
+        entry.source = "x2"
+
+
+class LayerManifest:
+    """
+    Every file in a board zip and what layer it is
+    """
+
+    def __init__(self, zip_path):
+        self.zip_path = Path(zip_path)
+        # LayerEntry for every file in the zip, in archive order
+        self.entries = list()
+        # Human readable descriptions of duplicate or conflicting layers
+        self.warnings = list()
+
+    @classmethod
+    def from_zip(cls, zip_path, ignored_file_starts=("._", ".DS_Store")):
+        """
+        Builds the manifest, each file is only opened once to read its head
+        :param zip_path: Path of the board gerber zip
+        :param ignored_file_starts: Files whose name starts with any of these are ignored
+        :return: LayerManifest
+        """
+        _manifest = cls(zip_path)
+
+        with ZipFile(str(zip_path), 'r') as zip_file:
+            for _info in zip_file.infolist():
+                if _info.is_dir():
+                    continue
+
+                _entry = LayerEntry(_info.filename, _info.file_size, _info.compress_size, _info.CRC)
+                _manifest.entries.append(_entry)
+
+                if any(_entry.file_name.startswith(_start) for _start in ignored_file_starts):
+                    _entry.kind = "ignored"
+                    continue
+
+                with zip_file.open(_info) as _file:
+                    _head = _file.read(_sniff_size).decode("ascii", errors="replace")
+                _sniff(_entry, _head)
+
+        _manifest._check()
+        return _manifest
+
+    def _check(self):
+        """
+        Flags layers that appear more than once, files with the same content, and extension/X2 conflicts
+        :return:
+        """
+        _layers = dict()
+        _contents = dict()
+        for _entry in self.entries:
+            if _entry.kind == "ignored":
+                continue
+
+            if _entry.source == "conflict":
+                self.warnings.append("{} is {} by extension but its X2 file function is {}".format(
+                    _entry.name, _entry.layer, _entry.file_function))
+
+            if _entry.kind in ("gerber", "excellon") and _entry.layer not in (None, "drills"):
+                _layers.setdefault(_entry.layer, list()).append(_entry.name)
+
+            # Empty files all have the same CRC, they aren't duplicates of each other
+            if _entry.size:
+                _contents.setdefault((_entry.crc, _entry.size), list()).append(_entry.name)
+
+        for _layer, _names in sorted(_layers.items()):
+            if len(_names) > 1:
+                self.warnings.append("More than one {} layer: {}".format(_layer, ", ".join(_names)))
+
+        for _names in _contents.values():
+            if len(_names) > 1:
+                self.warnings.append("Files have the same content: {}".format(", ".join(_names)))
+
+    def layers(self):
+        """
+        :return: list of LayerEntry for every gerber layer in the zip
+        """
+        return [_entry for _entry in self.entries if _entry.kind == "gerber"]
+
+    def drills(self):
+        """
+        :return: list of LayerEntry for every excellon file in the zip
+        """
+        return [_entry for _entry in self.entries if _entry.kind == "excellon"]
+
+    def centroids(self):
+        """
+        :return: list of LayerEntry for every pick and place centroid file in the zip
+        """
+        return [_entry for _entry in self.entries if _entry.kind == "centroid"]
+
+    def profile(self, profile_file_extensions=None):
+        """
+        Finds the board profile layer
+        :param profile_file_extensions: Optional list of extra extensions that are a profile, from the config
+        :return: LayerEntry or None
+        """
+        for _entry in self.entries:
+            if _entry.kind == "ignored":
+                continue
+            if _entry.layer == "profile":
+                return _entry
+            if profile_file_extensions and Path(_entry.name).suffix in profile_file_extensions:
+                return _entry
+
+        return None
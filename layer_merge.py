@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+"""
+Merges the panel layers natively, for fabs that don't accept gerber step and repeat
+Every board layer is translated to each location in the panel and written out in full with the frame overlay, which is
+what GerberPanelizer does when it exports a gerberset. Each board layer is only read once, the copies are streamed to
+disk chunk by chunk so memory use depends on the size of the board layer and not on the number of boards.
+Layers are merged in parallel, one process per layer
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from zipfile import ZipFile
+
+import logzero
+
+from step_repeat import match_layers, load_layers, write_panel_layer, explicit_blocks
+
+# Size of the write buffer for each output layer
+_write_buffer_size = 1 << 20
+
+
+def merge_layer(board_zip_path, frame_zip_path, output_dir, output_name, board_name, frame_name, board_coords):
+    """
+    Merges a single layer, run in a worker process so only takes simple arguments
+    :param board_zip_path: str path of the board gerber zip
+    :param frame_zip_path: str path of the frame overlay zip
+    :param output_dir: str directory to write the merged layer to
+    :param output_name: File name of the merged layer
+    :param board_name: Name of the board layer in the board zip or None
+    :param frame_name: Name of the frame layer in the frame zip or None
+    :param board_coords: list of (x, y) locations in nm of each board instance
+    :return: (output_name, size in bytes of the written layer)
+    """
+    with ZipFile(board_zip_path, 'r') as board_zip, ZipFile(frame_zip_path, 'r') as frame_zip:
+        _board_layer, _frame_layer = load_layers(board_zip, frame_zip, board_name, frame_name)
+
+    _out_path = Path(output_dir) / output_name
+    with open(str(_out_path), 'w', encoding="ascii", buffering=_write_buffer_size) as out_file:
+        write_panel_layer(out_file, output_name, _board_layer, _frame_layer, explicit_blocks(board_coords))
+
+    return output_name, _out_path.stat().st_size
+
+
+class LayerMerger:
+    """
+    Writes fully merged panel gerbers from the board zip and the frame overlay zip
+    """
+    logger = None
+    # Number of layers to merge at the same time, None is one per cpu
+    max_workers = None
+
+    def __init__(self, logger=None, max_workers=None):
+        if logger:
+            self.logger = logger
+        else:
+            self.logger = logzero.logger
+            logzero.loglevel(logging.DEBUG)
+
+        if max_workers:
+            self.max_workers = max_workers
+
+    def merge(self, manifest, frame_zip_path, board_coords, output_dir, file_names, drill_table=None):
+        """
+        Write the merged panel gerbers
+        :param manifest: layer_manifest.LayerManifest of the board gerber zip
+        :param frame_zip_path: Path of the frame overlay zip from GerberGenerator
+        :param board_coords: list of (x, y) locations in nm of each board instance, the same as in the gerberset
+        :param output_dir: Path of the directory to write the layers to
+        :param file_names: [GerberFilenames] config section, used to match up layers and name the output
+        :param drill_table: Optional excellon.DrillTable of the panel drills
+        :return: list of str paths of the written layers
+        """
+        self.logger.info("== Merging panel gerbers ==")
+
+        with ZipFile(str(frame_zip_path), 'r') as frame_zip:
+            _pairs = match_layers(manifest.layers(), frame_zip.namelist(), file_names)
+
+        _board_coords = list(board_coords)
+        _max_workers = min(len(_pairs), self.max_workers or os.cpu_count() or 1) or 1
+        self.logger.info("Merging {} layers x {} boards with {} workers".format(len(_pairs), len(_board_coords), _max_workers))
+
+        _written = list()
+        with ProcessPoolExecutor(max_workers=_max_workers) as executor:
+            _futures = [executor.submit(merge_layer, str(manifest.zip_path), str(frame_zip_path), str(output_dir),
+                                        _output_name, _board_name, _frame_name, _board_coords)
+                        for _output_name, _board_name, _frame_name in _pairs]
+
+            for _future in _futures:
+                _output_name, _size = _future.result()
+                self.logger.debug("Merged layer {}: {} bytes".format(_output_name, _size))
+                _written.append(str(Path(output_dir) / _output_name))
+
+        if drill_table is not None:
+            _drill_path = Path(output_dir) / file_names["drills"]
+            with open(str(_drill_path), 'w', encoding="ascii", buffering=_write_buffer_size) as out_file:
+                drill_table.write(out_file)
+            _written.append(str(_drill_path))
+
+        self.logger.info("Merged gerbers written to: {}".format(output_dir))
+        return _written
@@ -1,18 +1,22 @@
 #! /usr/bin/env python3
 
-import gerber
 import shutil
 import logzero
 import logging
 import math
+import os
 import datetime
 from pathlib import Path, PureWindowsPath
 from zipfile import ZipFile
-import xml.etree.ElementTree as ET
-import xml.dom.minidom as minidom
-from configparser import ConfigParser
 
 from gerber_gen import GerberGenerator
+from layer_manifest import LayerManifest
+from geometry import to_nm, scale_nm, half_nm, format_decimal, format_point
+from panel_model import BoardInfo, CoordTable, FrameInfo, PanelSpec, board_positions
+from snapshot import ConfigError, load_config
+
+# pcb-tools (gerber), numpy (through the excellon and native export modules) and the xml modules are slow to import,
+# so they are only imported by the methods that use them, see startup_benchmark.py
 
 
 class Panel:
@@ -25,21 +29,26 @@ class Panel:
     temp_path = Path.cwd() / "temp"
 
     config_file_path = Path.cwd() / "config.ini"
-    config = ConfigParser()
+    # snapshot.ConfigSnapshot, typed and read only, kept for the whole panel even if the file changes while it is made
+    config = None
 
     logger = None
     # Path where the user inputted gerber file is
     gerber_file_path = None
+    # Name the output files start with, the zip file name unless the job gives one
+    output_stem = None
     # Top level output directory
     out_path = None
+    # Directory the merged panel layers are exported to, named after the output so panels of the same zip don't share it
+    panel_path = None
 
-    # {size_x, size_y, surface_area, origin_x, origin_y}
-    pcb_info = dict()
-    # {width, height, surface_area, repeat_x, repeat_y, step_x, step_y, title}
-    panel_info = dict()
+    # panel_model.BoardInfo, size and origin of the board, all dimensions are integer nm
+    board = None
+    # panel_model.PanelSpec, filled in as the questions are answered
+    panel = None
 
-    # list of tuples of x, y locations for each pcb instance
-    pbc_coords = list()
+    # panel_model.CoordTable of the x, y location in nm of each board instance
+    board_coords = None
 
     # Possible mousebite locations around the PCB split up for easy mixing and matching
     # Locations are bottom, top, left and right, the name key is used as a description for the user
@@ -52,13 +61,17 @@ class Panel:
     mousebite_alignments = {"c": {"name": "center", "translation": 0}, "l": {"name": "left", "translation": -0.8},
                             "r": {"name": "right", "translation": 0.8}, "x": {"name": "left 1/3", "translation": -0.5},
                             "v": {"name": "right 1/3", "translation": 0.5}}
-    # list of tuples of x, y locations for each mousebite locations
-    mousebite_coords = list()
+    # panel_model.CoordTable of the x, y location in nm of every mousebite, sorted with no duplicates
+    mousebite_coords = None
+    # panel_model.CoordTable of the x, y location in nm of the mousebites relative to the origin of a single pcb
+    mousebite_offsets = None
 
     # Options that are used a lot, taken from the config file
+    # Dimensions are converted to integer nm when the config is read
     route_diameter = None
     decimal_precision = None
     mousebite_diameter = None
+    support_bar_width = None
     # Max dimensions before a warning is generated
     max_panel_dimensions = None
     # Manufacturers maximum buildable dimensions
@@ -69,62 +82,109 @@ class Panel:
     max_panel_surface_area = None
     # If the gerber file contains any of these then ignore it
     ignored_file_starts = ['._', '.DS_Store']
+    # layer_manifest.LayerManifest of the gerber zip, built once when the file is loaded
+    manifest = None
 
     # GerberGenerator class object
     gerber_gen = None
-    # panel_frame_gerber_dir = None
-    # {fid_locations, drill_locations, fid_to_board_0_locations}
-    panel_frame_info = dict()
-
-    def __init__(self):
+    # panel_model.FrameInfo, the frame overlay zip and the fiducial and drill locations on the frame
+    frame_info = None
+    # excellon.DrillTable of every drill hit on the panel, boards and frame
+    drill_table = None
+    # panel_outline.PanelOutline when the profile and route paths are generated natively
+    panel_outline = None
+    # (diameter, numpy int64 array of shape (tabs, holes per tab, 2)) of the mousebite holes in nm, None if
+    # GerberPanelizer makes them
+    tab_holes = None
+    # layer_bounds.LayerBoundsScan of every layer in the zip against the profile, None if they weren't scanned
+    layer_bounds = None
+    # layer_area.LayerAreas of the copper, soldermask and paste layers, None if they weren't measured
+    layer_areas = None
+    # Report lines of the board outline and the nested lattices, None if the boards weren't nested
+    nesting_lines = None
+
+    # job_spec.JobSpec with the answers to every question when running without a user, e.g. from the watch daemon
+    job = None
+
+    def __init__(self, job=None, config=None):
+        """
+        :param job: Optional job_spec.JobSpec, answers the questions instead of asking them
+        :param config: Optional snapshot.ConfigSnapshot to use instead of reading config.ini, e.g. the one a daemon
+        had when the job was started
+        """
         self.logger = logzero.logger
         # logzero.loglevel(logging.DEBUG)
         logzero.loglevel(logging.INFO)
 
+        # Per panel state, so more than one panel can be made in the same process
+        self.board = None
+        self.panel = PanelSpec()
+        self.board_coords = CoordTable()
+        self.mousebite_coords = CoordTable()
+        self.mousebite_offsets = CoordTable()
+        self.frame_info = None
+        self.tab_holes = None
+        self.layer_bounds = None
+        self.layer_areas = None
+        self.nesting_lines = None
+
+        self.config = config
+        self.job = job
+        if self.job is not None:
+            # Jobs can run at the same time so each one gets its own temp directory
+            self.temp_path = self.temp_path / "{}-{}".format(self.job.output_stem, os.getpid())
+
         # make sure the temp directory is valid, if not, create it
         if not self.temp_path.exists() or not self.temp_path.is_dir():
-            Path.mkdir(self.temp_path)
+            self.temp_path.mkdir(parents=True)
 
         # Init the gerber generator
         self.gerber_gen = GerberGenerator(self.logger)
+        if self.job is not None:
+            # Jobs from the same folder share the panel folder, so each needs its own frame overlay
+            self.gerber_gen.overlay_zip_name = self.job.output_stem + "-panel_frame_overlay.zip"
 
     def _read_config(self):
         """
         Parse the config file and make available to the rest of the program
         :return:
         """
-        if not self.config_file_path.exists():
-            return self._exit_error("Config file not found, please make sure it is located at: {}".format(self.config_file_path))
+        if self.config is None:
+            if not self.config_file_path.exists():
+                return self._exit_error("Config file not found, please make sure it is located at: {}".format(self.config_file_path))
+
+            try:
+                self.config = load_config(self.config_file_path)
+            except ConfigError as e:
+                return self._exit_error(str(e))
 
-        self.config.read(self.config_file_path)
         self.logger.debug("Config sections: {}".format(self.config.sections()))
+        self.logger.debug("Config snapshot: {}".format(self.config.hash))
 
+        # The snapshot has already converted everything, dimensions are in nm
         _panel_options = self.config["PanelOptions"]
-        self.route_diameter = float(_panel_options["route_diameter"])
-        self.decimal_precision = int(_panel_options["decimal_precision"])
-        self.mousebite_diameter = float(_panel_options["mousebite_diameter"])
-        self.panel_frame_width = float(_panel_options["panel_width"])
-
-        self.profile_file_extensions = _panel_options["profile_file_extension"].replace(' ', '').split(',')
-
-        # Config file stores everything as strings
-        _max_dims = _panel_options["max_panel_dimensions"].replace(' ', '').split(',')
-        self.max_panel_dimensions = [float(x) for x in _max_dims]
+        self.route_diameter = _panel_options["route_diameter"]
+        self.decimal_precision = _panel_options["decimal_precision"]
+        self.mousebite_diameter = _panel_options["mousebite_diameter"]
+        self.panel_frame_width = _panel_options["panel_width"]
+        self.support_bar_width = _panel_options["support_bar_width"]
+        self.profile_file_extensions = _panel_options["profile_file_extension"]
+        self.max_panel_dimensions = _panel_options["max_panel_dimensions"]
 
         _fab_options = self.config["Fabrication"]
-        self.max_panel_surface_area = float(_fab_options["max_panel_surface_area"])
-        _max_dims = _fab_options["max_panel_dimensions"].replace(' ', '').split(',')
-        self._manf_max_panel_dimensions = [float(x) for x in _max_dims]
+        self.max_panel_surface_area = _fab_options["max_panel_surface_area"]
+        self._manf_max_panel_dimensions = _fab_options["max_panel_dimensions"]
 
     def _make_output_dir(self):
         """
         Makes various output directories for generated files
         output structure is the directory where the gerber zip is
            |-- panel
-              report.txt
-              panel.gerberset
+              <name>-report.txt
+              <name>-panel.gerberset
               panel_frame_overlay.zip
-              |-- panellised_gerbers
+              <name>-panel-step-repeat.zip (optional)
+              |-- <name>-panellised_gerbers
                  various gerber files
         :return:
         """
@@ -132,9 +192,9 @@ class Panel:
         if not self.out_path.exists():
             self.out_path.mkdir()
 
-        _panel_path = self.out_path / "panellised_gerbers"
-        if not _panel_path.exists():
-            _panel_path.mkdir()
+        self.panel_path = self.out_path / (self.output_stem + "-panellised_gerbers")
+        if not self.panel_path.exists():
+            self.panel_path.mkdir()
 
     def _load_file(self):
         """
@@ -143,34 +203,35 @@ class Panel:
         :return:
         """
         self.logger.info("Please input path to gerber file")
-        self.gerber_file_path = Path(input("File: ").strip().replace("\\", ""))
+        self.gerber_file_path = Path(self._ask("File: ", "file").strip().replace("\\", ""))
         # self.gerber_file_path = Path(self._temp_path)
-        _found_profile_file = None
-
         self.logger.info("Loading file: {}".format(self.gerber_file_path))
+        # Jobs can give the outputs a name of their own, e.g. more than one panel of the same board
+        self.output_stem = self.gerber_file_path.stem if self.job is None else self.job.output_stem
 
-        if self.gerber_file_path.suffix == ".zip":
-            with ZipFile(self.gerber_file_path, 'r') as zip_file:
-                for file in zip_file.namelist():
-                    _file_name = Path(file).name
-
-                    # First check that the file is not in the ignored list
-                    if True not in [part.startswith(_file_name) for part in self.ignored_file_starts]:
-                        self.logger.debug("File from zip archive: {}".format(_file_name))
-                        if True in [ext in _file_name for ext in self.profile_file_extensions]:
-                            # Got a profile file, now we can have a look at the max bounds of the file
-                            self.logger.debug("Found a profile file")
-                            self.logger.info("Profile file name: {}".format(_file_name))
-                            _found_profile_file = file
-
-                            # Extract profile file to temp dir
-                            zip_file.extract(file, str(self.temp_path))
-                            break
+        if self.gerber_file_path.suffix != ".zip":
+            return self._exit_error("Can't load file, needs to be a .zip.")
 
-        else:
-            self._exit_error("Can't load file, needs to be a .zip.")
+        self.manifest = LayerManifest.from_zip(self.gerber_file_path, self.ignored_file_starts)
+        for _entry in self.manifest.entries:
+            self.logger.debug("File from zip archive: {}".format(_entry))
+        for _warning in self.manifest.warnings:
+            self.logger.warning(_warning)
+
+        _found_profile_file = None
+        _profile = self.manifest.profile(self.profile_file_extensions)
+        if _profile is not None:
+            # Got a profile file, now we can have a look at the max bounds of the file
+            self.logger.info("Profile file name: {}".format(_profile.file_name))
+            _found_profile_file = _profile.name
+
+            # Extract profile file to temp dir
+            with ZipFile(self.gerber_file_path, 'r') as zip_file:
+                zip_file.extract(_found_profile_file, str(self.temp_path))
 
         if _found_profile_file is not None:
+            import gerber
+
             read_pcb = gerber.read(str(self.temp_path / _found_profile_file))
 
             # Check what units the gerber file is in
@@ -182,33 +243,87 @@ class Panel:
                 read_pcb.to_metric()
 
             # bounds is a tuple of the form ((min_x, max_x), (min_y, max_y))
+            # Convert to nm here, this is the only place the board dimensions are floats
             pcb_bounds = read_pcb.bounds
+            self.board = BoardInfo.from_bounds(to_nm(pcb_bounds[0][0]), to_nm(pcb_bounds[0][1]),
+                                               to_nm(pcb_bounds[1][0]), to_nm(pcb_bounds[1][1]))
 
-            self.pcb_info["size_x"] = round(pcb_bounds[0][1] - pcb_bounds[0][0], 6)
-            self.pcb_info["size_y"] = round(pcb_bounds[1][1] - pcb_bounds[1][0], 6)
-            # Work out surface area in dm2
-            _surface_area = (self.pcb_info["size_x"] * self.pcb_info["size_y"]) / 10000
-            self.pcb_info["surface_area"] = round(_surface_area, 6)
-
-            # origin is how far away the bottom left corner of the pcb is to the 'origin' of the board
-            # need to flip the sign to get the coord of the origin wrt the bl corner
-            self.pcb_info["origin_x"] = round(pcb_bounds[0][0] * -1, 6)
-            self.pcb_info["origin_y"] = round(pcb_bounds[1][0] * -1, 6)
-
-            self.logger.info("PCB info: {}".format(self.pcb_info))
+            self.logger.info("PCB size: {}mm x {}mm, origin: {}".format(
+                format_decimal(self.board.size_x, 6), format_decimal(self.board.size_y, 6),
+                format_point((self.board.origin_x, self.board.origin_y), 6)))
 
         else:
             self._exit_error("No profile file found in zip, does it have the extension .gko?")
 
+    def _normalise_layers(self):
+        """
+        Rewrites the gerber layers of the board zip in a single dialect, if enabled in the config
+        Everything after this reads the normalised copy in the panel folder, including GerberPanelizer
+        :return:
+        """
+        _native_options = self.config["NativeExport"]
+        if not _native_options["normalise_gerbers"]:
+            return
+
+        from gerber_normalise import GerberNormaliser
+
+        self.logger.info("== Normalising gerber layers ==")
+        _names = [_entry.name for _entry in self.manifest.layers()]
+        _profile = self.manifest.profile(self.profile_file_extensions)
+        if _profile is not None and _profile.name not in _names:
+            _names.append(_profile.name)
+
+        _cache_folder = None
+        if _native_options["normalise_cache_folder"]:
+            _cache_folder = Path.cwd() / _native_options["normalise_cache_folder"]
+
+        _out_path = self.out_path / (self.gerber_file_path.stem + "-normalised.zip")
+        _normaliser = GerberNormaliser(self.logger, _cache_folder, _native_options["normalise_cache_files"])
+        _normaliser.normalise(self.manifest, _names, _out_path)
+
+        if _normaliser.from_cache:
+            self.logger.info("Normalised layers from cache")
+        for _name, _operations, _error in _normaliser.layers:
+            if _error is not None:
+                self.logger.warning("Unable to normalise {}, copied as it is: {}".format(_name, _error))
+            else:
+                self.logger.debug("Normalised {}, {} coordinates".format(_name, _operations))
+
+        self.manifest = LayerManifest.from_zip(_out_path, self.ignored_file_starts)
+
+    def _scan_layer_bounds(self):
+        """
+        Scans the bounds of every layer in the zip and warns about any that go past the profile, if enabled in the
+        config
+        :return:
+        """
+        if not self.config["Report"]["layer_bounds"]:
+            return
+
+        from layer_bounds import LayerBoundsScan
+
+        self.logger.info("== Scanning layer bounds ==")
+        self.layer_bounds = LayerBoundsScan(self.logger).scan(self.manifest,
+                                                              self.manifest.profile(self.profile_file_extensions))
+
+        for _layer in self.layer_bounds.layers:
+            if _layer.error is not None:
+                self.logger.warning("Unable to scan {}: {}".format(_layer.name, _layer.error))
+
+        _sides = ("left", "bottom", "right", "top")
+        for _layer, _overhang in self.layer_bounds.overhangs(self.config["Report"]["overhang_tolerance"]):
+            self.logger.warning("{} goes past the board profile by {}".format(_layer.name, ", ".join(
+                "{}mm {}".format(format_decimal(_value, 3), _side) for _side, _value in zip(_sides, _overhang) if _value)))
+
     def _make_mousebite_primitive_array(self, mousebite_list):
         """
         Takes in a list of mousebite locations and works out the relative coords of them in relation to the PCB
         offsets are calculated in relation to the PCB origin
         :param mousebite_list:
-        :return: list of tuples of x, y locations for the relative coords
+        :return: CoordTable of the x, y locations in nm relative to the PCB origin
         """
         self.logger.debug("Building mousebite primitive array")
-        _primitive_array = list()
+        _primitive_array = CoordTable()
 
         for location in mousebite_list:
             # loop through the list of locations that the user has entered
@@ -237,14 +352,14 @@ class Panel:
             self.logger.debug("User entered location: {}".format(location))
             self.logger.debug("Location: {} - Alignment: {}".format(_location, _alignment))
 
-            _mousebite_x_distance = (self.pcb_info['size_x'] / 2) + (self.route_diameter / 2)
-            _mousebite_y_distance = (self.pcb_info['size_y'] / 2) + (self.route_diameter / 2)
+            _mousebite_x_distance = half_nm(self.board.size_x + self.route_diameter)
+            _mousebite_y_distance = half_nm(self.board.size_y + self.route_diameter)
 
             # Adjustment of the mousebite in the x and y direction to compensate for the mousebite 'diameter' on the edge of boards
             _mousebite_adjustment = [0, 0]
             # Small extra adjustment to move the mousebite away from corners
             # This also takes into  account the radius
-            _extra_adjustment_for_bite = 1.2
+            _extra_adjustment_for_bite = to_nm(1.2)
 
             _size_key = None
             _alignment_index = None
@@ -264,39 +379,37 @@ class Panel:
 
             ## Work out where to place the mousebite depending on whether the we need to shift in the X or Y direction
             # Consider only positive direction
-            _center_to_bite_edge = (abs(_alignment) * (self.pcb_info[_size_key] / 2)) + self.mousebite_diameter
+            _half_size = half_nm(getattr(self.board, _size_key))
+            _center_to_bite_edge = scale_nm(_half_size, abs(_alignment)) + self.mousebite_diameter
             # Convert to actual direction of the mousebite
             _center_to_bite_edge *= self._get_sign(_alignment)
-            self.logger.debug("Center to bite edge {}: {}".format(_direction, round(_center_to_bite_edge, 6)))
+            self.logger.debug("Center to bite edge {}: {}".format(_direction, format_decimal(_center_to_bite_edge, 6)))
 
-            if abs(_center_to_bite_edge) > (self.pcb_info[_size_key] / 2):
+            if abs(_center_to_bite_edge) > _half_size:
                 # Mousebite will end up off the edge of the PCB to move it in by the diameter of the bite
                 # Add a little bit to the diameter so we end up out the way of any small corner radii
-                _mousebite_adjustment[_alignment_index] = (self.pcb_info[_size_key] / 2) - (self.mousebite_diameter + _extra_adjustment_for_bite)
+                _mousebite_adjustment[_alignment_index] = _half_size - (self.mousebite_diameter + _extra_adjustment_for_bite)
 
             else:
                 # Mousebite will end up inside the pcb, so take off half the diameter from the dimension
-                _mousebite_adjustment[_alignment_index] = abs(_center_to_bite_edge) - (self.mousebite_diameter / 2) - _extra_adjustment_for_bite
+                _mousebite_adjustment[_alignment_index] = abs(_center_to_bite_edge) - half_nm(self.mousebite_diameter) - _extra_adjustment_for_bite
 
             # Change the sign so the direction is correct
             _mousebite_adjustment[_alignment_index] *= self._get_sign(_alignment)
-            self.logger.debug("Mousebite {} adjustment: {}".format(_direction, round(_mousebite_adjustment[_alignment_index], 6)))
+            self.logger.debug("Mousebite {} adjustment: {}".format(_direction, format_decimal(_mousebite_adjustment[_alignment_index], 6)))
 
             ## Combine the calculated mousebite adjustment with the unit vector to produce a location on the PCB bounds
             # Convert the unit vector location to a location on the PCB bounding box
             _x_vector = (_location[0] * _mousebite_x_distance) + _mousebite_adjustment[0]
             _y_vector = (_location[1] * _mousebite_y_distance) + _mousebite_adjustment[1]
-            self.logger.debug("Mousebite location on pcb: ({}, {})".format(round(_x_vector, 6), round(_y_vector, 6)))
+            self.logger.debug("Mousebite location on pcb: {}".format(format_point((_x_vector, _y_vector), 6)))
 
             # Find the offset from the origin of the PCB to the center of the PCB
-            _x_origin_to_center = (self.pcb_info['size_x'] / 2) - self.pcb_info['origin_x']
-            _y_origin_to_center = (self.pcb_info['size_y'] / 2) - self.pcb_info['origin_y']
+            _x_origin_to_center = half_nm(self.board.size_x) - self.board.origin_x
+            _y_origin_to_center = half_nm(self.board.size_y) - self.board.origin_y
 
-            # Round primitive components
-            _primitive_x = round(_x_vector + _x_origin_to_center, 6)
-            _primitive_y = round(_y_vector + _y_origin_to_center, 6)
-            # Append vector tuple to array
-            _primitive_array.append((_primitive_x, _primitive_y))
+            # Append vector tuple to array, everything is already in whole nm so no rounding is needed
+            _primitive_array.append(_x_vector + _x_origin_to_center, _y_vector + _y_origin_to_center)
 
         self.logger.debug("Primitive array: {}".format(_primitive_array))
         return _primitive_array
@@ -307,37 +420,36 @@ class Panel:
         1. Checks the panel is within the dimensions of your machines
         2. Checks the surface area is withing manufacturer limits (if warning enabled)
         3. Checks the panel is withing the manufacturer maximum dimensions
-        :param width: Width of the panel in mm
-        :param height: Height  of the panel in mm
+        Panel and limit dimensions are all in nm
         :return:
         """
         _warning_index = 0
 
         # Display a warning to the user if the dimensions will be outside the max dims in any orientation
-        if not (self.panel_info["width"] <= self.max_panel_dimensions[0] and self.panel_info["height"] <=
+        if not (self.panel.width <= self.max_panel_dimensions[0] and self.panel.height <=
                 self.max_panel_dimensions[1]) and not \
-                (self.panel_info["width"] <= self.max_panel_dimensions[1] and self.panel_info["height"] <=
+                (self.panel.width <= self.max_panel_dimensions[1] and self.panel.height <=
                  self.max_panel_dimensions[0]):
             _warning_index += 1
             self.logger.warning("[#{}] Panel size is larger than max defined in config".format(_warning_index))
-            self.logger.warning("Max panel dimensions: {}mm x {}mm".format(self.max_panel_dimensions[0],
-                                                                           self.max_panel_dimensions[1]))
+            self.logger.warning("Max panel dimensions: {}mm x {}mm".format(format_decimal(self.max_panel_dimensions[0], 4),
+                                                                           format_decimal(self.max_panel_dimensions[1], 4)))
 
-        if (self.panel_info["surface_area"] > self.max_panel_surface_area) and \
-                self.config["Fabrication"]["show_surface_area_warning"].lower() == 'true':
+        if (self.panel.surface_area > self.max_panel_surface_area) and \
+                self.config["Fabrication"]["show_surface_area_warning"]:
             _warning_index += 1
             self.logger.warning("[#{}] Panel surface area is larger than max defined in config".format(_warning_index))
             self.logger.warning("Max panel surface area: {}dm2".format(self.max_panel_surface_area))
 
         # Display a warning to the user if the dimensions will be outside the max dims for the manufacturer in any orientation
-        if not (self.panel_info["width"] <= self._manf_max_panel_dimensions[0] and self.panel_info["height"] <=
+        if not (self.panel.width <= self._manf_max_panel_dimensions[0] and self.panel.height <=
                 self._manf_max_panel_dimensions[1]) and not \
-                (self.panel_info["width"] <= self._manf_max_panel_dimensions[1] and self.panel_info["height"] <=
+                (self.panel.width <= self._manf_max_panel_dimensions[1] and self.panel.height <=
                  self._manf_max_panel_dimensions[0]):
             _warning_index += 1
             self.logger.warning("[#{}] Panel size is larger than manufacturer max".format(_warning_index))
-            self.logger.warning("Max manufacturer dimensions: {}mm x {}mm".format(self._manf_max_panel_dimensions[0],
-                                                                                  self._manf_max_panel_dimensions[1]))
+            self.logger.warning("Max manufacturer dimensions: {}mm x {}mm".format(format_decimal(self._manf_max_panel_dimensions[0], 4),
+                                                                                  format_decimal(self._manf_max_panel_dimensions[1], 4)))
 
     def _make_array(self):
         """
@@ -346,62 +458,56 @@ class Panel:
         Then ask for a list of mousebite locations
         :return:
         """
+        from sweep import panel_size
+
         _mousebite_list = list()
 
         self.logger.info("== Input information for array ==")
-        self.logger.info("PCB Size: {}mm x {}mm".format(self.pcb_info['size_x'], self.pcb_info['size_y']))
+        self.logger.info("PCB Size: {}mm x {}mm".format(format_decimal(self.board.size_x, 4),
+                                                        format_decimal(self.board.size_y, 4)))
 
         self.logger.info("= Title =")
         self.logger.info("Input title for panel frame")
         _default_title = self.gerber_file_path.stem.replace("_", " ")
         self.logger.info("Default: {}".format(_default_title))
 
-        self.panel_info["title"] = input("Title: ").strip() or _default_title
-        self.logger.debug("Title for frame: {}".format(self.panel_info["title"]))
+        self.panel.title = self._ask("Title: ", "title").strip() or _default_title
+        self.logger.debug("Title for frame: {}".format(self.panel.title))
 
         # Get the user to enter the desired step in the X and Y direction for the panel
         while 1:
             self.logger.info("= Repeat =")
             self.logger.info("How many boards to arrange in the X and Y directions")
-            _x_repeat = self._try_int(input("X Repeat: "))
+            _x_repeat = self._try_int(self._ask("X Repeat: ", "repeat_x"))
             if _x_repeat < 1:
                 self.logger.error("X repeat must be greater or equal to 1")
                 continue
 
-            _y_repeat = self._try_int(input("Y Repeat: "))
+            _y_repeat = self._try_int(self._ask("Y Repeat: ", "repeat_y"))
             if _y_repeat < 1:
                 self.logger.error("Y repeat must be greater or equal to 1")
                 continue
 
-            self.panel_info["width"] = round(self.panel_frame_width + self.route_diameter +
-                                             ((self.pcb_info['size_x'] + self.route_diameter) * float(_x_repeat)) +
-                                             self.panel_frame_width,
-                                             6)
-
-            self.panel_info["height"] = round(self.panel_frame_width + self.route_diameter +
-                                              ((self.pcb_info['size_y'] + self.route_diameter) * float(_y_repeat)) +
-                                              self.panel_frame_width,
-                                              6)
-
-            _surface_area = (self.panel_info["width"] * self.panel_info["height"]) / 10000
-            self.panel_info["surface_area"] = round(_surface_area, 6)
+            self.panel.width = panel_size(self.board.size_x, _x_repeat, self.route_diameter, self.panel_frame_width)
+            self.panel.height = panel_size(self.board.size_y, _y_repeat, self.route_diameter, self.panel_frame_width)
 
             self.logger.info("Total number of PCBs in panel: {}".format(_x_repeat * _y_repeat))
-            self.logger.info("Panel surface area: {}dm2".format(round(self.panel_info["surface_area"], 4)))
-            self.logger.info("Panel Size: {}mm x {}mm".format(self.panel_info["width"], self.panel_info["height"]))
+            self.logger.info("Panel surface area: {}dm2".format(round(self.panel.surface_area, 4)))
+            self.logger.info("Panel Size: {}mm x {}mm".format(format_decimal(self.panel.width, 4),
+                                                              format_decimal(self.panel.height, 4)))
 
             # Display warnings if necessary
             self._check_panel_dims()
 
-            _size_ok = input("Panel size acceptable? (*Y/N): ") or "Y"
+            _size_ok = self._ask("Panel size acceptable? (*Y/N): ", "size_ok") or "Y"
             if _size_ok.upper() == "Y":
                 break
 
         # Store panel info for report generation
-        self.panel_info["repeat_x"] = _x_repeat
-        self.panel_info["repeat_y"] = _y_repeat
-        self.panel_info["step_x"] = self.pcb_info['size_x'] + self.route_diameter
-        self.panel_info["step_y"] = self.pcb_info['size_y'] + self.route_diameter
+        self.panel.repeat_x = _x_repeat
+        self.panel.repeat_y = _y_repeat
+        self.panel.step_x = self.board.size_x + self.route_diameter
+        self.panel.step_y = self.board.size_y + self.route_diameter
 
         self.logger.info("")
         _horiz_bars_every = 0
@@ -411,15 +517,15 @@ class Panel:
             self.logger.info("= Inter-board support bars =")
             self.logger.info("These are extra bits of panel in the X and/or Y direction that add support for odd shaped boards")
 
-            _add_bars = input("Add inter-board support bars? (Y/*N): ") or "N"
+            _add_bars = self._ask("Add inter-board support bars? (Y/*N): ", "add_bars") or "N"
             if _add_bars.upper() == "N":
                 break
 
             # User has selected to add support bars so make "Y" into a boolean variable for easier logic
             _add_bars = 1
-            _input = input("Add horizontal support bars? (Y/N): ") or "N"
+            _input = self._ask("Add horizontal support bars? (Y/N): ", "add_horizontal_bars") or "N"
             if _input.upper() == "Y":
-                _horiz_bars_every = input("Horizontal supports every Y PCBs: ")
+                _horiz_bars_every = self._ask("Horizontal supports every Y PCBs: ", "horizontal_bars_every")
                 try:
                     _horiz_bars_every = int(_horiz_bars_every)
                 except ValueError:
@@ -430,9 +536,9 @@ class Panel:
                     self.logger.error("Input needs to be greater than 0")
                     continue
 
-            _input = input("Add vertical support bars? (Y/N): ") or "N"
+            _input = self._ask("Add vertical support bars? (Y/N): ", "add_vertical_bars") or "N"
             if _input.upper() == "Y":
-                _vert_bars_every = input("Vertical supports every X PCBs: ")
+                _vert_bars_every = self._ask("Vertical supports every X PCBs: ", "vertical_bars_every")
                 try:
                     _vert_bars_every = int(_vert_bars_every)
                 except ValueError:
@@ -447,11 +553,11 @@ class Panel:
             if _vert_bars_every != 0:
                 # Fence post vs holes problem, need to take 1 from the repeat to get the number of holes in the pcb array
                 self.logger.debug("Vertical supports every: {}, total: {}".format(_vert_bars_every, math.floor((_x_repeat - 1) / _vert_bars_every)))
-                # Find out how many supports we need to add then multiply that by the extra height added by one support and one router width
+                # Each support adds its own width and one router width
                 # The router width the other side of the support is already taken care of in the case of a normal array w/o supports
-                _extra_width = math.floor((_x_repeat - 1) / _vert_bars_every) * (float(self.config["PanelOptions"]["support_bar_width"]) + self.route_diameter)
-                self.panel_info["width"] += _extra_width
-                self.panel_info["step_x"] += float(self.config["PanelOptions"]["support_bar_width"]) + self.route_diameter
+                self.panel.width = panel_size(self.board.size_x, _x_repeat, self.route_diameter,
+                                              self.panel_frame_width, self.support_bar_width, _vert_bars_every)
+                self.panel.step_x += self.support_bar_width + self.route_diameter
 
                 # Issue a warning to the user if the maths doesn't quite work
                 if ((_x_repeat - 1) % _vert_bars_every) != 0:
@@ -460,9 +566,9 @@ class Panel:
 
             if _horiz_bars_every != 0:
                 self.logger.debug("Horizontal supports every: {}, total: {}".format(_horiz_bars_every, math.floor((_y_repeat - 1) / _horiz_bars_every)))
-                _extra_height = math.floor((_y_repeat - 1) / _horiz_bars_every) * (float(self.config["PanelOptions"]["support_bar_width"]) + self.route_diameter)
-                self.panel_info["height"] += _extra_height
-                self.panel_info["step_y"] += float(self.config["PanelOptions"]["support_bar_width"]) + self.route_diameter
+                self.panel.height = panel_size(self.board.size_y, _y_repeat, self.route_diameter,
+                                               self.panel_frame_width, self.support_bar_width, _horiz_bars_every)
+                self.panel.step_y += self.support_bar_width + self.route_diameter
 
                 # Issue a warning to the user if the maths doesn't quite work
                 if ((_y_repeat - 1) % _horiz_bars_every) != 0:
@@ -471,11 +577,12 @@ class Panel:
 
             # Update the user on the new bounds of the panel
             if _horiz_bars_every != 0 or _vert_bars_every != 0:
-                self.logger.info("New panel Size: {}mm x {}mm".format(self.panel_info["width"], self.panel_info["height"]))
+                self.logger.info("New panel Size: {}mm x {}mm".format(format_decimal(self.panel.width, 4),
+                                                                      format_decimal(self.panel.height, 4)))
 
                 self._check_panel_dims()
 
-                _size_ok = input("Panel size acceptable? (*Y/N): ") or "Y"
+                _size_ok = self._ask("Panel size acceptable? (*Y/N): ", "size_ok") or "Y"
                 if _size_ok.upper() == "Y":
                     break
 
@@ -504,7 +611,7 @@ class Panel:
         self.logger.info("Mousebite locations list:")
 
         while 1:
-            _mousebite_list = input("Locations: ")
+            _mousebite_list = self._ask("Locations: ", "mousebites")
             # _mousebite_list = ['bl']
             if len(_mousebite_list) > 0:
                 _mousebite_list = _mousebite_list.replace(' ', '').split(',')
@@ -517,42 +624,75 @@ class Panel:
         # Remove duplicates from the location list
         _mousebite_list = set(_mousebite_list)
         _mousebite_primitives = self._make_mousebite_primitive_array(_mousebite_list)
-        _mousebite_coords = list()
+        self.mousebite_offsets = _mousebite_primitives.unique()
+
+        # Board x, y need to take into account the gerber 'origin'
+        # Add the support bar width after every bars_every boards if there are support bars
+        _bar_pitch = self.support_bar_width + self.route_diameter
+        _xs = board_positions(self.panel_frame_width + self.route_diameter + self.board.origin_x, _x_repeat,
+                              self.board.size_x + self.route_diameter, _vert_bars_every, _bar_pitch)
+        _ys = board_positions(self.panel_frame_width + self.route_diameter + self.board.origin_y, _y_repeat,
+                              self.board.size_y + self.route_diameter, _horiz_bars_every, _bar_pitch)
+        self.panel.horizontal_bars_every = _horiz_bars_every
+        self.panel.vertical_bars_every = _vert_bars_every
+
+        # A row at a time from the bottom left board
+        self.board_coords = CoordTable.grid(_xs, _ys)
+        self.logger.debug("PCB Coords: {}".format(self.board_coords))
+
+        # Mousebite x, y are located from the center of the mousebite
+        # Remove any duplicates from the mousebite coords array, coords are integers so this is exact
+        self.mousebite_coords = CoordTable((_x + _bite_x, _y + _bite_y) for _x, _y in self.board_coords
+                                           for _bite_x, _bite_y in _mousebite_primitives).unique()
+        self.logger.debug("Mousebite Coords: {}".format(self.mousebite_coords))
 
-        _x_start = float(self.config["PanelOptions"]["panel_width"]) + self.route_diameter + self.pcb_info['origin_x']
-        _y_start = float(self.config["PanelOptions"]["panel_width"]) + self.route_diameter + self.pcb_info['origin_y']
-        _x_loc = _x_start
-        _y_loc = _y_start
+    def _make_panel_outline(self):
+        """
+        Works out the panel profile and the router paths around each board, if enabled in the config
+        The router goes around the bounding box of each board, breaking for a tab at each mousebite
+        :return:
+        """
+        if not self.config["NativeExport"]["panel_profile"]:
+            return
 
-        for y_index in range(_y_repeat):
-            for x_index in range(_x_repeat):
-                # make a list of all the x, y locations that the boards should be
-                # board x, y need to take into account the gerber 'origin'
-                # also make a list of all the x, y locations that the mousebites should be
-                # mousebite x, y are located from the center of the mousebite
-                self.pbc_coords.append((round(_x_loc, 6), round(_y_loc, 6)))
-                for bite in _mousebite_primitives:
-                    _mousebite_coords.append((round(_x_loc + bite[0], 6), round(_y_loc + bite[1], 6)))
+        from panel_outline import PanelOutline
 
-                _x_loc += self.pcb_info['size_x'] + self.route_diameter
+        self.logger.info("== Generating panel profile and route paths ==")
+        _board_boxes = [self.board.box_at(_x, _y) for _x, _y in self.board_coords]
 
-                # Add the the support bar width to the next x location if we need to
-                # x_index will start at 0 so need to add 1 to get the intended result from the modulus function
-                if (_vert_bars_every != 0) and ((x_index + 1) % _vert_bars_every == 0):
-                    _x_loc += float(self.config["PanelOptions"]["support_bar_width"]) + self.route_diameter
+        self.panel_outline = PanelOutline(self.panel.width, self.panel.height,
+                                          self.route_diameter, self.mousebite_diameter)
+        self.panel_outline.build(_board_boxes, self.mousebite_coords)
 
-            _x_loc = _x_start
-            _y_loc += self.pcb_info['size_y'] + self.route_diameter
+        _route_length = sum(abs(_end[0] - _start[0]) + abs(_end[1] - _start[1])
+                            for _start, _end in self.panel_outline.route_segments)
+        self.logger.info("Route paths: {} segments, {}mm total".format(len(self.panel_outline.route_segments),
+                                                                       format_decimal(_route_length, 1)))
+        self.logger.info("Profile: {} contours".format(len(self.panel_outline.profile_contours)))
 
-            # Add the support bar width to the next y location if we need to
-            if (_horiz_bars_every != 0) and ((y_index + 1) % _horiz_bars_every == 0):
-                _y_loc += float(self.config["PanelOptions"]["support_bar_width"]) + self.route_diameter
+    def _make_mousebite_holes(self):
+        """
+        Works out the holes of every mousebite natively, if enabled in the config
+        :return:
+        """
+        _options = self.config["NativeExport"]
+        if not _options["mousebite_holes"]:
+            return
 
-        self.logger.debug("PCB Coords: {}".format(self.pbc_coords))
+        import numpy
 
-        # Remove any duplicates from the mousebite coords array
-        self.mousebite_coords = set(_mousebite_coords)
-        self.logger.debug("Mousebite Coords: {}".format(self.mousebite_coords))
+        from mousebites import MousebitePattern, tab_axes
+
+        self.logger.info("== Generating mousebite holes ==")
+        _pattern = MousebitePattern(_options["mousebite_hole_diameter"], _options["mousebite_hole_pitch"],
+                                    _options["mousebite_edge_offset"], self.mousebite_diameter, self.route_diameter)
+        _tabs = numpy.array(self.mousebite_coords)
+        _board_boxes = [self.board.box_at(_x, _y) for _x, _y in self.board_coords]
+        self.tab_holes = (_pattern.hole_diameter, _pattern.holes(_tabs, tab_axes(_tabs, _board_boxes,
+                                                                                 self.route_diameter)))
+
+        self.logger.info("Mousebite holes: {} per tab, {} in total".format(2 * _pattern.holes_per_row,
+                                                                          self.tab_holes[1].size // 2))
 
     def _make_frame_gerbers(self):
         """
@@ -560,109 +700,190 @@ class Panel:
         :return:
         """
         self.logger.info("== Making panel frame overlay gerbers ==")
-        _panel_dims = (self.panel_info["width"], self.panel_info["height"])
-        _panel_step = (self.panel_info["step_x"], self.panel_info["step_y"])
-        _panel_repeat = (self.panel_info["repeat_x"], self.panel_info["repeat_y"])
-        _frame_title = self.panel_info["title"]
-        _output_dir = self.out_path
+        _board_boxes = None
+        if self.config["SerialMarks"]["serial_marks"]:
+            _board_boxes = [self.board.box_at(_x, _y) for _x, _y in self.board_coords]
 
-        _data = self.gerber_gen.make_frame_gerbers(_panel_dims, _panel_step, _panel_repeat, _frame_title, _output_dir, self.config)
+        _data = self.gerber_gen.make_frame_gerbers(self.panel, self.out_path, self.config, self.panel_outline,
+                                                   self.tab_holes, _board_boxes)
 
         # Returned data is a dict containing fid locations, drill locations and the location of the output zip
-        self.panel_frame_gerber_dir = _data["gerber_location"]
-        self.panel_frame_info["fiducial_locations"] = _data["fiducial_locations"]
-        self.panel_frame_info["drill_locations"] = _data["drill_locations"]
-
-        _panel_to_board_offset = self.panel_frame_width + self.route_diameter
-        _fids_to_board_0 = list()
-        for _loc in self.panel_frame_info["fiducial_locations"]:
-            # Fiducial locations are a tuple of (x, y) locations
-            # Calculate the location from each of the fiducials to the origin of the first board
-            _fids_to_board_0.append(
-                (
-                    round(_loc[0] - (self.pcb_info["origin_x"] + _panel_to_board_offset), 4),
-                    round(_loc[1] - (self.pcb_info["origin_y"] + _panel_to_board_offset), 4)
-                )
-            )
-
-        self.panel_frame_info["fid_to_board_0_locations"] = _fids_to_board_0
+        self.frame_info = FrameInfo(_data["gerber_location"], CoordTable(_data["fiducial_locations"]),
+                                    CoordTable(_data["drill_locations"]))
+
+        _fids_to_board_0 = self.frame_info.fiducials_from(*self.board_coords[0])
         self.logger.debug("Fids to first board: {}".format(_fids_to_board_0))
 
+    def _make_panel_drills(self):
+        """
+        Reads the drill files from the board zip and replicates them for every board on the panel
+        The frame corner drills are merged in so the table holds every hit on the panel
+        :return:
+        """
+        from excellon import DrillTable, load_board_drills
+
+        self.logger.info("== Panelising drills ==")
+        self.drill_table = DrillTable(self.config["NativeExport"]["order_drill_hits"])
+
+        with ZipFile(str(self.manifest.zip_path), 'r') as zip_file:
+            _board_drills = load_board_drills(zip_file, self.manifest)
+
+        if not _board_drills:
+            self.logger.warning("No excellon drill files found in zip")
+
+        for _drills in _board_drills:
+            self.logger.info("Drill file name: {}".format(_drills.name))
+            if _drills.skipped_routes:
+                self.logger.warning("{} routed moves in {} were skipped".format(_drills.skipped_routes, _drills.name))
+            self.drill_table.add_file(_drills, self.board_coords)
+
+        # Tooling holes and mousebites aren't plated
+        self.drill_table.add_hits(to_nm(self.gerber_gen.drill_dia), self.frame_info.drills, plated=False)
+        if self.tab_holes is not None:
+            self.drill_table.add_hits(*self.tab_holes, plated=False)
+
+        _stats = self.drill_table.stats()
+        self.logger.info("Panel drills: {} tools, {} hits".format(_stats["distinct_tools"], _stats["total_hits"]))
+
+    def _measure_layer_areas(self):
+        """
+        Measures the copper, soldermask opening and paste area of every board layer and the frame, if enabled in the
+        config, for the report
+        :return:
+        """
+        if not self.config["Report"]["layer_areas"]:
+            return
+
+        from layer_area import LayerAreas
+
+        self.logger.info("== Measuring layer areas ==")
+        _areas = LayerAreas(self.config["Report"]["layer_area_resolution"], self.panel.width, self.panel.height, len(self.board_coords))
+        try:
+            _areas.measure(self.manifest.zip_path, self.manifest.layers(), self.frame_info.overlay_path,
+                           self.config["GerberFilenames"], self.config["Report"]["layer_area_tile_size"])
+        except ValueError as e:
+            self.logger.warning("Unable to measure layer areas: {}".format(e))
+            return
+
+        self.layer_areas = _areas
+        for _line in _areas.report_lines():
+            self.logger.info(_line.strip())
+
+    def _nest_boards(self):
+        """
+        Reads the real board outline from the profile and finds the lattices that nest it tightest, if enabled in the
+        config, for the report. The panel itself is still made on the bounding box grid
+        :return:
+        """
+        _report_options = self.config["Report"]
+        if not _report_options["nesting"]:
+            return
+
+        from board_outline import BoardOutline
+        from gerber_stream import open_text
+        from nesting import Nesting, shared_cache
+
+        _profile = self.manifest.profile(self.profile_file_extensions)
+        if _profile is None:
+            return
+
+        self.logger.info("== Nesting board outline ==")
+        with ZipFile(str(self.manifest.zip_path), 'r') as zip_file:
+            with open_text(zip_file, _profile.name) as _lines:
+                _outline = BoardOutline.from_lines(_lines)
+        if _outline is None:
+            self.logger.warning("Nothing is drawn in the profile, unable to nest the board outline")
+            return
+        if not _outline.closed:
+            self.logger.warning("The profile doesn't close, nesting the convex hull of it instead")
+
+        _cache_folder = None
+        if _report_options["nesting_cache_folder"]:
+            _cache_folder = Path.cwd() / _report_options["nesting_cache_folder"]
+
+        _nesting = Nesting(_outline, self.route_diameter, _report_options["nesting_resolution"],
+                           shared_cache(_cache_folder, _report_options["nesting_cache_files"]))
+        self.nesting_lines = _nesting.report_lines(panel_area=self.panel.width * self.panel.height,
+                                                   board_count=self.panel.board_count)
+        for _line in self.nesting_lines:
+            self.logger.info(_line.strip())
+
+    def _write_step_repeat_gerbers(self):
+        """
+        Writes the merged panel layers using gerber step and repeat blocks, if enabled in the config
+        :return:
+        """
+        if not self.config["NativeExport"]["step_repeat_gerbers"]:
+            return
+
+        from step_repeat import StepRepeatExporter
+
+        _out_path = self.out_path / (self.output_stem + "-panel-step-repeat.zip")
+        StepRepeatExporter(self.logger).export(self.manifest, self.frame_info.overlay_path, self.board_coords,
+                                               _out_path, self.config["GerberFilenames"], self.drill_table)
+
+    def _write_merged_gerbers(self):
+        """
+        Writes the fully merged panel layers into the panellised gerbers directory, if enabled in the config
+        :return:
+        """
+        if not self.config["NativeExport"]["merged_gerbers"]:
+            return
+
+        from layer_merge import LayerMerger
+
+        LayerMerger(self.logger).merge(self.manifest, self.frame_info.overlay_path, self.board_coords,
+                                       self.panel_path, self.config["GerberFilenames"], self.drill_table)
+
     def _write_xml(self):
         """
         Writes the .gerberset file for processing with panelizer
         GP abbreviation = GerberPanelizer
         :return:
         """
-        root = ET.Element("GerberLayoutSet", {"xmlns:xsd": "http://www.w3.org/2001/XMLSchema", "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance"})
-        loaded_outlines = ET.SubElement(root, "LoadedOutlines")
+        from gerberset import Gerberset
+
+        gerberset = Gerberset()
 
         _loaded_outlines = {
-            str(self.panel_frame_gerber_dir): [(0, 0)],
-            str(self.gerber_file_path): self.pbc_coords
+            str(self.frame_info.overlay_path): [(0, 0)],
+            str(self.manifest.zip_path): self.board_coords
         }
 
-        # Tell GP where the gerber zip file is
-        ET.SubElement(loaded_outlines, "string").text = str(PureWindowsPath(self.gerber_file_path))
-        ET.SubElement(loaded_outlines, "string").text = str(PureWindowsPath(self.panel_frame_gerber_dir))
-        instances = ET.SubElement(root, "Instances")
+        # Tell GP where the gerber zip file is, the normalised copy if there is one
+        gerberset.outlines.append(str(PureWindowsPath(self.manifest.zip_path)))
+        gerberset.outlines.append(str(PureWindowsPath(self.frame_info.overlay_path)))
 
         for _gerber_path, _gerber_coords in _loaded_outlines.items():
+            # Tell GP which gerber file each instance is for, rotation angle is always 0
+            _gerber_path = str(PureWindowsPath(_gerber_path))
             for _loc in _gerber_coords:
-                gerber_instance = ET.SubElement(instances, "GerberInstance")
-                center = ET.SubElement(gerber_instance, "Center")
-                # X and Y location of each thing
-                ET.SubElement(center, "X").text = str(round(_loc[0], self.decimal_precision))
-                ET.SubElement(center, "Y").text = str(round(_loc[1], self.decimal_precision))
-                # Gerber rotation angle = 0
-                ET.SubElement(gerber_instance, "Angle").text = str(0)
-                # Tell GP which gerber file this is for
-                ET.SubElement(gerber_instance, "GerberPath").text = str(PureWindowsPath(_gerber_path))
-                # File hasn't been generated
-                ET.SubElement(gerber_instance, "Generated").text = "false"
-
-        tabs = ET.SubElement(root, "Tabs")
-
-        for _tab in self.mousebite_coords:
-            breaktab = ET.SubElement(tabs, "BreakTab")
-            center = ET.SubElement(breaktab, "Center")
-            # X and Y location of each thing
-            ET.SubElement(center, "X").text = str(round(_tab[0], self.decimal_precision))
-            ET.SubElement(center, "Y").text = str(round(_tab[1], self.decimal_precision))
-            # tab rotation angle = 0
-            ET.SubElement(breaktab, "Angle").text = str(0)
-            ET.SubElement(breaktab, "Radius").text = str(self.mousebite_diameter)
-            # Don't know why the valid tag is always false, but it is
-            ET.SubElement(breaktab, "Valid").text = "false"
+                gerberset.add_instance(_gerber_path, _loc[0], _loc[1])
+
+        for _x, _y in self.mousebite_coords:
+            gerberset.add_tab(_x, _y, self.mousebite_diameter)
 
         # EOF settings and configurations
-        ET.SubElement(root, "Width").text = str(round(self.panel_info['width'], self.decimal_precision))
-        ET.SubElement(root, "Height").text = str(round(self.panel_info['height'], self.decimal_precision))
-        ET.SubElement(root, "MarginBetweenBoards").text = str(self.route_diameter)
-        # Fill the outside of the board
-        ET.SubElement(root, "ConstructNegativePolygon").text = "true"
+        _settings = gerberset.settings
+        _settings["Width"] = format_decimal(self.panel.width, self.decimal_precision)
+        _settings["Height"] = format_decimal(self.panel.height, self.decimal_precision)
+        _settings["MarginBetweenBoards"] = format_decimal(self.route_diameter, self.decimal_precision)
+        # Fill the outside of the board, not needed if the profile has already been generated
+        _settings["ConstructNegativePolygon"] = "false" if self.panel_outline is not None else "true"
         # There is an issue with odd sized boards where GP will think breaktabs are invalid sometimes
-        ET.SubElement(root, "FillOffset").text = str(self.route_diameter)
-        ET.SubElement(root, "Smoothing").text = str(0.5)
-        ET.SubElement(root, "ExtraTabDrillDistance").text = str(0)
+        _settings["FillOffset"] = format_decimal(self.route_diameter, self.decimal_precision)
+        _settings["Smoothing"] = str(0.5)
+        _settings["ExtraTabDrillDistance"] = str(0)
         # This can sometimes cause issues if the silk layer is over the edge of the board
-        ET.SubElement(root, "ClipToOutlines").text = "true"
-
-        # make last export folder
-        # _export_dir = self.gerber_file_path.parent / self.config['PanelOptions']['default_export_folder_name']
-        # if not _export_dir.exists() or not _export_dir.is_dir():
-        #     _export_dir.mkdir()
+        _settings["ClipToOutlines"] = "true"
 
         # Last export folder, already taken care on in _make_output_dir() function
-        _panel_path = self.out_path / "panellised_gerbers"
-        ET.SubElement(root, "LastExportFolder").text = str(PureWindowsPath(_panel_path))
-        ET.SubElement(root, "DoNotGenerateMouseBites").text = "false"
+        _settings["LastExportFolder"] = str(PureWindowsPath(self.panel_path))
+        # The holes are already in the frame overlay drills if they were made natively
+        _settings["DoNotGenerateMouseBites"] = "true" if self.tab_holes is not None else "false"
 
-        out_string = minidom.parseString(ET.tostring(root)).toprettyxml(indent="  ", newl="\n", encoding='utf-8')
-
-        _out_path = self.out_path / (self.gerber_file_path.stem + "-panel.gerberset")
-        with open(_out_path, 'wb') as out:
-            out.write(out_string)
+        _out_path = self.out_path / (self.output_stem + "-panel.gerberset")
+        gerberset.save(_out_path, self.decimal_precision)
 
         self.logger.info("")
         self.logger.info("============== Success ==============")
@@ -676,40 +897,128 @@ class Panel:
         """
         self.logger.info("== Writing panel generation report ==")
 
-        _out_path = self.out_path / (self.gerber_file_path.stem + "-report.txt")
+        _out_path = self.out_path / (self.output_stem + "-report.txt")
         with open(_out_path, 'w', newline="\r\n") as out:
             out.write("=" * 40 + "\n")
             out.write("GerberPanelizer Paneliser - V{}\n".format(self._version))
-            out.write("Panel file generation report for: {}\n".format(self.panel_info["title"]))
+            out.write("Panel file generation report for: {}\n".format(self.panel.title))
             out.write("File generated on: {} at {}\n".format(
                 datetime.datetime.now().strftime("%d/%b/%Y"),
                 datetime.datetime.now().strftime("%H:%M")
             ))
-            out.write("Gerberset path: {}\n".format(str(self.gerber_file_path.parent / (self.gerber_file_path.stem + "-panel.gerberset"))))
+            out.write("Gerberset path: {}\n".format(str(self.gerber_file_path.parent / (self.output_stem + "-panel.gerberset"))))
             out.write("=" * 40 + "\n")
             out.write("\n")
 
-            out.write("Total number of PCBs on panel: {}\n".format(self.panel_info["repeat_x"] * self.panel_info["repeat_y"]))
-            out.write("Repeat (X*Y): {} x {}\n".format(self.panel_info["repeat_x"], self.panel_info["repeat_y"]))
-            out.write("Step (X*Y): {}mm x {}mm\n".format(round(self.panel_info["step_x"], 4), round(self.panel_info["step_y"], 4)))
+            out.write("Total number of PCBs on panel: {}\n".format(self.panel.board_count))
+            out.write("Repeat (X*Y): {} x {}\n".format(self.panel.repeat_x, self.panel.repeat_y))
+            out.write("Step (X*Y): {}mm x {}mm\n".format(format_decimal(self.panel.step_x, 4), format_decimal(self.panel.step_y, 4)))
             out.write("\n")
 
-            out.write("Panel size (W*H): {}mm x {}mm\n".format(round(self.panel_info["width"], 4), round(self.panel_info["height"], 4)))
-            out.write("Panel surface area: {}dm2\n".format(round(self.panel_info["surface_area"], 4)))
-            out.write("PCB size (X*Y): {}mm x {}mm\n".format(round(self.pcb_info["size_x"], 4), round(self.pcb_info["size_y"], 4)))
-            out.write("PCB surface area: {}dm2\n".format(round(self.pcb_info["surface_area"], 4)))
+            out.write("Panel size (W*H): {}mm x {}mm\n".format(format_decimal(self.panel.width, 4), format_decimal(self.panel.height, 4)))
+            out.write("Panel surface area: {}dm2\n".format(round(self.panel.surface_area, 4)))
+            out.write("PCB size (X*Y): {}mm x {}mm\n".format(format_decimal(self.board.size_x, 4), format_decimal(self.board.size_y, 4)))
+            out.write("PCB surface area: {}dm2\n".format(round(self.board.surface_area, 4)))
             out.write("\n")
 
             out.write("== Panel Fiducials ==\n")
             _fids_order = ["BL", "BR", "TL", "TR"]
             # out.write("Fiducial locations (X, Y):\n")
-            # for index, _loc in enumerate(self.panel_frame_info["fiducial_locations"]):
+            # for index, _loc in enumerate(self.frame_info.fiducials):
             #     out.write("  {} - {}\n".format(_fids_order[index], _loc))
             # out.write("\n")
 
             out.write("Fiducials to board 0 (X, Y)\n")
-            for index, _loc in enumerate(self.panel_frame_info["fid_to_board_0_locations"]):
-                out.write("  {} - {}\n".format(_fids_order[index], _loc))
+            _board_0 = self.board_coords[0]
+            for index, _loc in enumerate(self.frame_info.fiducials_from(*_board_0)):
+                out.write("  {} - {}\n".format(_fids_order[index], format_point(_loc)))
+            out.write("\n")
+
+            out.write("== Panel Drills ==\n")
+            _drill_stats = self.drill_table.stats()
+            out.write("Distinct tools: {}\n".format(_drill_stats["distinct_tools"]))
+            out.write("Total hits: {}\n".format(_drill_stats["total_hits"]))
+            if _drill_stats["total_slots"]:
+                out.write("Total slots: {}\n".format(_drill_stats["total_slots"]))
+            for index, (_diameter, _plated, _hits, _slots) in enumerate(_drill_stats["tools"]):
+                out.write("  T{} - {}mm{}: {} holes".format(index + 1, format_decimal(_diameter, 3),
+                                                          "" if _plated else " NPTH", _hits))
+                out.write(", {} slots\n".format(_slots) if _slots else "\n")
+
+            if self.layer_bounds is not None:
+                out.write("\n")
+                out.write("== Layer Bounds ==\n")
+                for _line in self.layer_bounds.report_lines(self.config["Report"]["overhang_tolerance"]):
+                    out.write(_line + "\n")
+
+            if self.layer_areas is not None:
+                out.write("\n")
+                out.write("== Layer Areas ==\n")
+                for _line in self.layer_areas.report_lines():
+                    out.write(_line + "\n")
+
+            if self.nesting_lines is not None:
+                out.write("\n")
+                out.write("== Nesting ==\n")
+                for _line in self.nesting_lines:
+                    out.write(_line + "\n")
+
+    def _write_placements(self):
+        """
+        Writes the location of every board on the panel for setting up pick and place, if enabled in the config
+        <name>-placements.csv has a row per board, <name>-tabs.csv a row per tab and <name>-placements.json both
+        :return:
+        """
+        if not self.config["Report"]["placement_tables"]:
+            return
+
+        from placements import PlacementTable
+
+        self.logger.info("== Writing board placement tables ==")
+        _table = PlacementTable(self.board_coords, self.frame_info.fiducials, self.mousebite_offsets)
+
+        _stem = self.out_path / self.output_stem
+        with open(str(_stem) + "-placements.csv", 'w', newline="") as out:
+            _table.write_boards_csv(out, self.decimal_precision)
+        with open(str(_stem) + "-tabs.csv", 'w', newline="") as out:
+            _table.write_tabs_csv(out, self.decimal_precision)
+        with open(str(_stem) + "-placements.json", 'w') as out:
+            _table.write_json(out, self.decimal_precision)
+
+        self.logger.info("Placements written for {} boards".format(len(self.board_coords)))
+
+    def _write_centroids(self):
+        """
+        Writes a panel pick and place file for each centroid file in the zip, if enabled in the config
+        Every part is repeated on every board with the board number added to its designator
+        :return:
+        """
+        if not self.config["Report"]["panel_centroid"]:
+            return
+
+        _centroids = self.manifest.centroids()
+        if not _centroids:
+            self.logger.debug("No pick and place centroid file in the zip")
+            return
+
+        from centroid import CentroidError, load_centroid
+
+        self.logger.info("== Writing panel pick and place files ==")
+        _suffix = self.config["Report"]["designator_suffix"]
+        with ZipFile(str(self.manifest.zip_path), 'r') as zip_file:
+            for _entry in _centroids:
+                try:
+                    _centroid = load_centroid(zip_file, _entry)
+                except CentroidError as e:
+                    self.logger.warning("Skipping {}: {}".format(_entry.name, e))
+                    continue
+
+                _out_path = self.out_path / "{}-panel-{}".format(self.output_stem, _entry.file_name)
+                with open(str(_out_path), 'w', newline="") as out:
+                    _parts = _centroid.write_panel(out, self.board_coords, _suffix, self.decimal_precision)
+
+                self.logger.info("{} parts from {} ({}) written to {}".format(_parts, _entry.file_name,
+                                                                             _centroid.units, _out_path.name))
 
     def _clean_tempfiles(self):
         """
@@ -721,6 +1030,20 @@ class Panel:
 
         shutil.rmtree(self.temp_path)
 
+    def _ask(self, prompt, key):
+        """
+        Asks the user a question, or takes the answer from the job spec if there is one
+        :param prompt: Prompt to show the user
+        :param key: Name of the answer in the job spec
+        :return: str answer
+        """
+        if self.job is None:
+            return input(prompt)
+
+        _answer = self.job.answer(key)
+        self.logger.debug("{}{}".format(prompt, _answer))
+        return _answer
+
     def _try_int(self, _input):
         """
         Checks whether a user input can bed turned into an in, otherwise throws an error
@@ -763,11 +1086,22 @@ class Panel:
 
         self._read_config()
         self._load_file()
+        self._scan_layer_bounds()
         self._make_output_dir()
+        self._normalise_layers()
         self._make_array()
+        self._make_panel_outline()
+        self._make_mousebite_holes()
         self._make_frame_gerbers()
+        self._make_panel_drills()
+        self._measure_layer_areas()
+        self._nest_boards()
+        self._write_step_repeat_gerbers()
+        self._write_merged_gerbers()
         self._clean_tempfiles()
         self._write_report()
+        self._write_placements()
+        self._write_centroids()
         self._write_xml()
 
 
@@ -0,0 +1,83 @@
+#! /usr/bin/env python3
+"""
+Native mousebite drill patterns, replaces GerberPanelizer's mousebite generation
+Each tab crosses the route channel at a mousebite location. A row of holes is drilled along the edge of the board on
+each side of the channel, centred on the tab and set into the board by the edge offset so the board breaks off
+cleanly. Every tab on a panel gets the same pattern, so the holes of all of them are one broadcast add
+"""
+
+import numpy
+
+from geometry import half_nm
+from panel_outline import snap_tabs
+
+
+def tab_axes(tab_coords, board_boxes, route_diameter):
+    """
+    Works out which way the route channel runs at each tab, from the route center line nearest to it
+    :param tab_coords: numpy int64 array of shape (n, 2) of the tab locations, on or within a few nm of the line
+    :param board_boxes: list of (x0, y0, x1, y1) bounding boxes of each board instance
+    :param route_diameter: Diameter of the router bit, the route center line is half of it from the board edge
+    :return: numpy bool array of shape (n,), True where the channel runs along x, i.e. a top or bottom tab
+    """
+    return snap_tabs(tab_coords, board_boxes, route_diameter)[1]
+
+
+class MousebitePattern:
+    """
+    Holes drilled at every tab, all dimensions in nm
+    """
+
+    def __init__(self, hole_diameter, pitch, edge_offset, tab_width, route_diameter):
+        """
+        :param hole_diameter: Diameter of each hole
+        :param pitch: Distance between the centres of neighbouring holes
+        :param edge_offset: How far the centre of each hole is set into the board from its edge
+        :param tab_width: Width of the tab along the route channel, the holes fit inside it
+        :param route_diameter: Width of the route channel
+        """
+        if pitch <= 0 or hole_diameter <= 0:
+            raise ValueError("Mousebite hole diameter and pitch must be more than 0")
+
+        self.hole_diameter = hole_diameter
+        self.pitch = pitch
+        self.edge_offset = edge_offset
+        self.tab_width = tab_width
+        self.route_diameter = route_diameter
+
+    @property
+    def holes_per_row(self):
+        """
+        :return: Number of holes that fit across the tab, at least 1
+        """
+        return max(0, (self.tab_width - self.hole_diameter) // self.pitch) + 1
+
+    def offsets(self):
+        """
+        Holes of a single tab on a horizontal channel, relative to the tab, in drilling order
+        The first row goes left to right and the second comes back, so there is no long move in the middle
+        :return: numpy int64 array of shape (2 * holes_per_row, 2)
+        """
+        _count = self.holes_per_row
+        # Centred on the tab, kept as integers by centring twice the position
+        _along = (2 * numpy.arange(_count, dtype=numpy.int64) - (_count - 1)) * self.pitch // 2
+        _across = half_nm(self.route_diameter) + self.edge_offset
+
+        _below = numpy.stack([_along, numpy.full(_count, -_across, dtype=numpy.int64)], axis=1)
+        _above = numpy.stack([_along[::-1], numpy.full(_count, _across, dtype=numpy.int64)], axis=1)
+        return numpy.concatenate([_below, _above])
+
+    def holes(self, tab_coords, horizontal):
+        """
+        :param tab_coords: numpy int64 array of shape (n, 2) of the tab locations
+        :param horizontal: numpy bool array of shape (n,) from tab_axes()
+        :return: numpy int64 array of shape (n, 2 * holes_per_row, 2) of the holes of each tab
+        """
+        _offsets = self.offsets()
+        # Vertical channels use the same pattern with x and y swapped
+        _patterns = numpy.stack([_offsets[:, ::-1], _offsets])
+        return tab_coords[:, None, :] + _patterns[horizontal.astype(numpy.intp)]
+
+    def __repr__(self):
+        return "MousebitePattern({} x 2 holes, {}nm at {}nm pitch)".format(self.holes_per_row, self.hole_diameter,
+                                                                          self.pitch)
@@ -0,0 +1,629 @@
+#! /usr/bin/env python3
+"""
+Nests boards with irregular outlines by their real shape rather than their bounding box
+The outline from board_outline.py is rasterised for each quarter turn and the no-fit polygon of every pair of
+orientations, every offset of the second board that brings it closer than the route diameter to the first, is worked
+out as a cross-correlation of the two masks with numpy FFTs. The pixels are grown so the no-fit polygons are
+conservative, a lattice clear of them keeps at least the route diameter between the real outlines. The no-fit polygons
+are cached in memory and in a folder, keyed on the outline, route diameter and resolution, so only the lattice search
+is done again for a board that has been seen before.
+Lattices are rows of boards along X, either all the same way round or alternating between two orientations half a turn
+apart so odd shapes can interlock. The utilisation of each is the outline area of its boards over the area of its cell
+Usage: ./nesting.py <board zip> [--route-diameter 2] [--resolution 0.1] [--panel 100x100]
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import sys
+from pathlib import Path
+from zipfile import ZipFile
+
+import numpy
+
+import file_cache
+from board_outline import BoardOutline
+from geometry import NM_PER_MM, format_decimal, to_nm
+from gerber_stream import open_text
+
+# Changed whenever the no-fit polygons change, so older cached ones aren't used
+nesting_version = 1
+
+# Quarter turns the board is tried at, in degrees anticlockwise
+orientations = (0, 90, 180, 270)
+
+# Orientations that are tried in alternating rows, half a turn apart so the boards interlock
+alternating_pairs = ((0, 180), (90, 270))
+
+# Most row pitches tried for each kind of lattice, spread evenly from the tightest row to the bounding box pitch
+pitch_steps = 32
+
+# Most shifts tried between a row and the alternating row above it, spread evenly along the pitch
+shift_steps = 32
+
+# Lattices that pass the nearest neighbour check but are checked in full before one is taken, for each pitch and shift
+_lattice_attempts = 8
+
+
+def rotate_points(points, degrees):
+    """
+    :param points: list of (x, y)
+    :param degrees: Multiple of 90, anticlockwise
+    :return: list of the rotated (x, y), moved so the bottom left of their bounds is at 0, 0
+    """
+    _points = points
+    for _turn in range(degrees // 90 % 4):
+        _points = [(-_y, _x) for _x, _y in _points]
+
+    _min_x = min(_x for _x, _y in _points)
+    _min_y = min(_y for _x, _y in _points)
+    return [(_x - _min_x, _y - _min_y) for _x, _y in _points]
+
+
+def rasterise(points, pixel_size):
+    """
+    Fills a polygon into a mask, a pixel is set if its centre is inside the polygon or an edge passes through it, so
+    every part of the polygon is covered
+    :param points: list of (x, y) in nm, with the bottom left of their bounds at 0, 0
+    :param pixel_size: Pixel size in nm
+    :return: bool array of shape (x pixels, y pixels)
+    """
+    _points = numpy.array(points, dtype=numpy.float64) / pixel_size
+    _width = int(math.floor(_points[:, 0].max())) + 1
+    _height = int(math.floor(_points[:, 1].max())) + 1
+
+    _start = _points
+    _end = numpy.roll(_points, -1, axis=0)
+
+    # Scanline fill at the pixel centres, each edge toggles every pixel to the right of where it crosses a row
+    _rows = numpy.arange(_height) + 0.5
+    _low = numpy.minimum(_start[:, 1], _end[:, 1])
+    _high = numpy.maximum(_start[:, 1], _end[:, 1])
+    _edge, _row = numpy.nonzero((_low[:, None] <= _rows[None, :]) & (_rows[None, :] < _high[:, None]))
+    _fraction = (_rows[_row] - _start[_edge, 1]) / (_end[_edge, 1] - _start[_edge, 1])
+    _x = _start[_edge, 0] + _fraction * (_end[_edge, 0] - _start[_edge, 0])
+    _first = numpy.clip(numpy.ceil(_x - 0.5).astype(numpy.int64), 0, _width)
+
+    _toggles = numpy.zeros((_width + 1, _height), dtype=numpy.int64)
+    numpy.add.at(_toggles, (_first, _row), 1)
+    _mask = (numpy.cumsum(_toggles, axis=0)[:_width] % 2).astype(bool)
+
+    # Pixels the edges pass through, sampled every half pixel along each edge
+    _lengths = numpy.hypot(*(_end - _start).T)
+    _counts = numpy.ceil(_lengths * 2).astype(numpy.int64) + 1
+    _edges = numpy.repeat(numpy.arange(len(_points)), _counts)
+    _steps = numpy.arange(_counts.sum()) - numpy.repeat(numpy.cumsum(_counts) - _counts, _counts)
+    _fraction = _steps / numpy.repeat(numpy.maximum(_counts - 1, 1), _counts)
+    _samples = _start[_edges] + _fraction[:, None] * (_end[_edges] - _start[_edges])
+    _mask[numpy.clip(numpy.floor(_samples[:, 0]).astype(numpy.int64), 0, _width - 1),
+          numpy.clip(numpy.floor(_samples[:, 1]).astype(numpy.int64), 0, _height - 1)] = True
+
+    return _mask
+
+
+def _correlate(a, b):
+    """
+    :param a: 2d float array
+    :param b: 2d float array
+    :return: Full linear convolution of a with b flipped in both axes, index i is the offset i - (len(b) - 1) of b
+    """
+    _shape = (a.shape[0] + b.shape[0] - 1, a.shape[1] + b.shape[1] - 1)
+    _a = numpy.fft.rfft2(a, _shape)
+    _b = numpy.fft.rfft2(b[::-1, ::-1], _shape)
+    return numpy.fft.irfft2(_a * _b, _shape)
+
+
+def disc(radius):
+    """
+    :param radius: Radius in pixels
+    :return: bool array of shape (2 * ceil(radius) + 1, 2 * ceil(radius) + 1), set within the radius of the centre
+    """
+    _size = int(math.ceil(radius))
+    _offsets = numpy.arange(-_size, _size + 1)
+    return _offsets[:, None] ** 2 + _offsets[None, :] ** 2 <= radius ** 2
+
+
+class NoFitPolygon:
+    """
+    Offsets of board b from board a that bring them too close, as a mask
+    mask[i, j] is the offset (i - origin[0], j - origin[1]) in pixels between the bottom lefts of their bounds
+    """
+
+    __slots__ = ("mask", "origin")
+
+    def __init__(self, mask, origin):
+        self.mask = mask
+        self.origin = origin
+
+    @classmethod
+    def between(cls, grown, radius, mask):
+        """
+        :param grown: Mask of board a grown by the clearance
+        :param radius: Pixels the mask of board a was grown by on each side
+        :param mask: Mask of board b
+        :return: NoFitPolygon
+        """
+        _overlap = _correlate(grown.astype(numpy.float64), mask.astype(numpy.float64)) > 0.5
+        return cls(_overlap, (mask.shape[0] - 1 + radius, mask.shape[1] - 1 + radius))
+
+    def reversed(self):
+        """
+        :return: NoFitPolygon of board a from board b
+        """
+        return NoFitPolygon(self.mask[::-1, ::-1], (self.mask.shape[0] - 1 - self.origin[0],
+                                                    self.mask.shape[1] - 1 - self.origin[1]))
+
+    def collides(self, x, y):
+        """
+        :param x: Offset in pixels
+        :param y: Offset in pixels
+        :return: True if board b at the offset is too close to board a
+        """
+        _i = x + self.origin[0]
+        _j = y + self.origin[1]
+        return 0 <= _i < self.mask.shape[0] and 0 <= _j < self.mask.shape[1] and bool(self.mask[_i, _j])
+
+    def folded(self, pitch):
+        """
+        Folds the mask along X by the row pitch, an offset collides with some board in a row if the fold is set
+        :param pitch: Row pitch in pixels
+        :return: _Fold
+        """
+        _shift = -self.origin[0] % pitch
+        _columns = -(-(self.mask.shape[0] + _shift) // pitch) * pitch
+        _padded = numpy.zeros((_columns, self.mask.shape[1]), dtype=bool)
+        _padded[_shift:_shift + self.mask.shape[0]] = self.mask
+        return _Fold(_padded.reshape(-1, pitch, self.mask.shape[1]).any(axis=0), self.origin[1])
+
+    def row_clear(self, pitch):
+        """
+        :param pitch: Row pitch in pixels
+        :return: True if boards in a row at this pitch are clear of each other
+        """
+        _row = numpy.flatnonzero(self.mask[:, self.origin[1]]) - self.origin[0]
+        _row = _row[_row != 0]
+        return not numpy.any(_row % pitch == 0)
+
+
+class _Fold:
+    """
+    No-fit polygon folded by a row pitch, fold[x % pitch, y] is set if the offset x, y collides with any board in the row
+    """
+
+    __slots__ = ("mask", "origin_y")
+
+    def __init__(self, mask, origin_y):
+        self.mask = mask
+        self.origin_y = origin_y
+
+    def rows(self, start, stop, shift=0):
+        """
+        :param start: First y offset in pixels
+        :param stop: y offset after the last
+        :param shift: Shift along X, column t of the result is the offset t + shift
+        :return: bool array of shape (pitch, stop - start), clear outside the no-fit polygon
+        """
+        _rows = numpy.zeros((self.mask.shape[0], stop - start), dtype=bool)
+        _first = max(start + self.origin_y, 0)
+        _last = min(stop + self.origin_y, self.mask.shape[1])
+        if _first < _last:
+            _rows[:, _first - self.origin_y - start:_last - self.origin_y - start] = self.mask[:, _first:_last]
+        return numpy.roll(_rows, -shift, axis=0) if shift else _rows
+
+    def collides(self, x, y):
+        _j = y + self.origin_y
+        return 0 <= _j < self.mask.shape[1] and bool(self.mask[x % self.mask.shape[0], _j])
+
+    @property
+    def reach(self):
+        """
+        :return: Furthest y offset in pixels that can collide, either way
+        """
+        return max(self.origin_y, self.mask.shape[1] - 1 - self.origin_y)
+
+
+class Lattice:
+    """
+    Repeating arrangement of boards, rows along X at the pitch with each row offset by the step from the one below
+    All dimensions are integer nm, positions are of the bottom left of the bounds of each rotated board
+    """
+
+    __slots__ = ("name", "boards", "pitch", "step", "outline_area")
+
+    def __init__(self, name, boards, pitch, step, outline_area):
+        """
+        :param name: Description of the lattice
+        :param boards: list of (orientation, (x, y)) of the boards in one cell
+        :param pitch: Distance between boards along a row
+        :param step: (x, y) from one row to the next
+        :param outline_area: Area of the board outline in nm2
+        """
+        self.name = name
+        self.boards = boards
+        self.pitch = pitch
+        self.step = step
+        self.outline_area = outline_area
+
+    @property
+    def cell_area(self):
+        return self.pitch * self.step[1]
+
+    @property
+    def utilisation(self):
+        """
+        :return: Fraction of the lattice covered by the board outlines
+        """
+        return len(self.boards) * self.outline_area / self.cell_area
+
+    def fit_count(self, width, height, sizes):
+        """
+        Counts the boards of the lattice that fit in an area, with the first board of the cell at its bottom left
+        :param width: Width in nm
+        :param height: Height in nm
+        :param sizes: {orientation: (x, y)} size of the bounds of the rotated board
+        :return: Number of boards
+        """
+        _count = 0
+        for _orientation, (_x, _y) in self.boards:
+            _size_x, _size_y = sizes[_orientation]
+            for _row in range(-(_y // self.step[1]), (height - _size_y - _y) // self.step[1] + 1):
+                _row_x = _x + _row * self.step[0]
+                _count += max(0, (width - _size_x - _row_x) // self.pitch + _row_x // self.pitch + 1)
+        return _count
+
+    def format_lattice(self):
+        """
+        :return: str of the lattice on one line
+        """
+        return "{}: {:.1f}% utilisation, pitch {}mm, row step {}mm x {}mm, {} per {}mm2".format(
+            self.name, self.utilisation * 100, format_decimal(self.pitch, 4), format_decimal(self.step[0], 4),
+            format_decimal(self.step[1], 4), len(self.boards),
+            round(self.cell_area / (NM_PER_MM * NM_PER_MM), 2))
+
+    def __repr__(self):
+        return "Lattice({}, {:.4f})".format(self.name, self.utilisation)
+
+
+def _dump(polygons, file):
+    _arrays = dict()
+    for (_a, _b), _polygon in polygons.items():
+        _arrays["mask_{}_{}".format(_a, _b)] = _polygon.mask
+        _arrays["origin_{}_{}".format(_a, _b)] = numpy.array(_polygon.origin)
+    numpy.savez_compressed(file, **_arrays)
+
+
+def _load(path):
+    _polygons = dict()
+    with numpy.load(str(path)) as _arrays:
+        for _name in _arrays.files:
+            if _name.startswith("mask"):
+                _pair = tuple(int(_part) for _part in _name.split("_")[1:])
+                _origin = tuple(_arrays["origin_{}_{}".format(*_pair)].tolist())
+                _polygons[_pair] = NoFitPolygon(_arrays[_name], _origin)
+    return _polygons
+
+
+def shared_cache(folder=None, max_files=256, max_entries=16):
+    """
+    :param folder: Folder the entries are also written to, None to only keep them in memory
+    :param max_files: Number of outlines kept in the folder
+    :param max_entries: Number of outlines kept in memory
+    :return: file_cache.FileCache of {(orientation a, orientation b): NoFitPolygon} dicts, one per outline, the same
+    one every time in a process
+    """
+    def _make(_folder):
+        return file_cache.FileCache(_folder, ".npz", _dump, _load, max_entries, max_files)
+
+    return file_cache.shared_cache(_make, "nesting", folder, max_entries, max_files)
+
+
+def nesting_key(outline, clearance, pixel_size):
+    """
+    :return: Hex digest identifying the no-fit polygons of the outline
+    """
+    _text = json.dumps([nesting_version, outline.key, clearance, pixel_size], separators=(",", ":"))
+    return hashlib.sha1(_text.encode("utf-8")).hexdigest()
+
+
+class Nesting:
+    """
+    Finds the lattices that pack the most board outline into the panel
+    """
+
+    def __init__(self, outline, clearance, pixel_size, cache=None):
+        """
+        :param outline: board_outline.BoardOutline
+        :param clearance: Smallest gap between boards in nm, the route diameter
+        :param pixel_size: Pixel size in nm the outline is rasterised at
+        :param cache: FileCache from shared_cache(), None to work the no-fit polygons out every time
+        """
+        self.outline = outline
+        self.clearance = clearance
+        self.pixel_size = pixel_size
+        self.cache = cache
+        self.key = nesting_key(outline, clearance, pixel_size)
+
+        # {orientation: rotated outline points}
+        self.points = {_orientation: rotate_points(outline.points, _orientation) for _orientation in orientations}
+        # {orientation: (x, y)} size of the bounds of the rotated outline in nm
+        self.sizes = {_orientation: (max(_x for _x, _y in _points), max(_y for _x, _y in _points))
+                      for _orientation, _points in self.points.items()}
+        # Pixels the first board of each pair is grown by, the clearance plus a pixel diagonal and a half for the pixels
+        # of the edges only being sampled, so the lattices are never closer than the clearance
+        self.radius = clearance / pixel_size + math.sqrt(2) + 0.5
+
+        self._masks = dict()
+        # {(orientation a, orientation b): NoFitPolygon}, a copy as the cached dict is shared
+        self._polygons = dict((cache.get(self.key) if cache is not None else None) or {})
+        self._computed = False
+
+    def _mask(self, orientation):
+        if orientation not in self._masks:
+            self._masks[orientation] = rasterise(self.points[orientation], self.pixel_size)
+        return self._masks[orientation]
+
+    def no_fit(self, a, b):
+        """
+        :param a: Orientation of the first board
+        :param b: Orientation of the second board
+        :return: NoFitPolygon of b from a
+        """
+        if (a, b) in self._polygons:
+            return self._polygons[(a, b)]
+        if (b, a) in self._polygons:
+            return self._polygons[(b, a)].reversed()
+
+        _radius = int(math.ceil(self.radius))
+        _grown = _correlate(numpy.pad(self._mask(a), _radius).astype(numpy.float64),
+                            disc(self.radius).astype(numpy.float64))[_radius:-_radius, _radius:-_radius] > 0.5
+        self._polygons[(a, b)] = NoFitPolygon.between(_grown, _radius, self._mask(b))
+        self._computed = True
+        return self._polygons[(a, b)]
+
+    def grid(self, orientation=0):
+        """
+        :return: Lattice of the boards on the bounding box grid, as main.py lays them out
+        """
+        _size_x, _size_y = self.sizes[orientation]
+        return Lattice("Grid {}deg".format(orientation), [(orientation, (0, 0))], _size_x + self.clearance,
+                       (0, _size_y + self.clearance), self.outline.area)
+
+    def search(self):
+        """
+        :return: list of the best Lattice of each kind, highest utilisation first
+        """
+        _lattices = [self.grid(0), self.grid(90)]
+        for _orientation in orientations:
+            _lattice = self._search((_orientation,))
+            if _lattice is not None:
+                _lattices.append(_lattice)
+        for _pair in alternating_pairs:
+            _lattice = self._search(_pair)
+            if _lattice is not None:
+                _lattices.append(_lattice)
+
+        if self._computed and self.cache is not None:
+            self.cache.put(self.key, dict(self._polygons))
+            self._computed = False
+
+        _lattices.sort(key=lambda lattice: lattice.utilisation, reverse=True)
+        return _lattices
+
+    def _pitches(self, rotated):
+        """
+        :param rotated: Orientations in the rows
+        :return: list of the row pitches in pixels to try
+        """
+        _widest = max(self.sizes[_orientation][0] for _orientation in rotated)
+        _grid = int(math.ceil((_widest + self.clearance) / self.pixel_size))
+        _polygons = [self.no_fit(_orientation, _orientation) for _orientation in rotated]
+        _reach = max(_polygon.mask.shape[0] - _polygon.origin[0] for _polygon in _polygons)
+
+        _tightest = next((_pitch for _pitch in range(1, _reach + 1)
+                          if all(_polygon.row_clear(_pitch) for _polygon in _polygons)), _reach)
+        _widest_pitch = max(_tightest, _grid + int(math.ceil(self.radius)))
+        return sorted(set(numpy.linspace(_tightest, _widest_pitch, pitch_steps).round().astype(int).tolist()))
+
+    def _search(self, rotated):
+        """
+        :param rotated: (orientation,) for rows of boards the same way round, or (a, b) for alternating rows
+        :return: Lattice with the highest utilisation, None if there isn't one
+        """
+        _best = None
+        for _pitch in self._pitches(rotated):
+            if rotated[1:]:
+                _found = self._alternating(rotated, _pitch)
+            else:
+                _found = self._single(rotated[0], _pitch)
+            if _found is not None and (_best is None or _found[1][1] * _pitch < _best[1][1] * _best[2]):
+                _best = _found + (_pitch,)
+
+        if _best is None:
+            return None
+
+        _boards, _step, _pitch = _best
+        _name = "Alternating {}/{}deg".format(*rotated) if rotated[1:] else "Nested {}deg".format(rotated[0])
+        _lattice = Lattice(_name, [(_orientation, (_x * self.pixel_size, _y * self.pixel_size))
+                                   for _orientation, (_x, _y) in _boards], _pitch * self.pixel_size,
+                           (_step[0] * self.pixel_size, _step[1] * self.pixel_size), self.outline.area)
+
+        # Rows on the bounding box grid are a lattice of this kind too, and can be tighter than one found on pixels
+        # rounded up, e.g. for a rectangle
+        _size_y = max(self.sizes[_orientation][1] for _orientation in rotated) + self.clearance
+        _grid = Lattice(_name, [(_orientation, (0, _row * _size_y)) for _row, _orientation in enumerate(rotated)],
+                        max(self.sizes[_orientation][0] for _orientation in rotated) + self.clearance,
+                        (0, len(rotated) * _size_y), self.outline.area)
+        return _grid if _grid.utilisation >= _lattice.utilisation else _lattice
+
+    def _single(self, orientation, pitch):
+        """
+        :return: (boards, step) in pixels of the lowest clear row step, None if there isn't one
+        """
+        _fold = self.no_fit(orientation, orientation).folded(pitch)
+        _reach = _fold.reach + 1
+        _boards = [(orientation, (0, 0))]
+        _step = self._lowest_step(_boards, {(0, 0): _fold}, _fold.rows(1, _reach + 1), 1, pitch)
+        return None if _step is None else (_boards, _step)
+
+    def _alternating(self, rotated, pitch):
+        """
+        :return: (boards, step) in pixels of the lowest clear row step over the shifts of the second row, None if
+        there isn't one
+        """
+        _a, _b = rotated
+        _folds = {(0, 0): self.no_fit(_a, _a).folded(pitch), (1, 1): self.no_fit(_b, _b).folded(pitch),
+                  (0, 1): self.no_fit(_a, _b).folded(pitch), (1, 0): self.no_fit(_b, _a).folded(pitch)}
+        _reach = max(_fold.reach for _fold in _folds.values()) + 1
+
+        _best = None
+        for _shift in sorted(set(numpy.linspace(0, pitch, min(pitch, shift_steps), endpoint=False)
+                                 .astype(int).tolist())):
+            # Lowest clear height of the second row over the first at this shift
+            _clear = numpy.flatnonzero(~_folds[(0, 1)].rows(0, _reach + 1, _shift)[0])
+            _clear = _clear[_clear > 0] if _shift == 0 else _clear
+            if not len(_clear):
+                continue
+            _height = int(_clear[0])
+            if _best is not None and _height + 1 >= _best[1][1]:
+                # Even the tightest row above can't beat the best so far
+                continue
+
+            _start = _height + 1
+            _stop = _height + _reach + 1
+            _blocked = _folds[(0, 0)].rows(_start, _stop) | _folds[(1, 1)].rows(_start, _stop) | \
+                _folds[(0, 1)].rows(_start + _height, _stop + _height, _shift) | \
+                _folds[(1, 0)].rows(_start - _height, _stop - _height, -_shift)
+
+            _boards = [(_a, (0, 0)), (_b, (_shift, _height))]
+            _step = self._lowest_step(_boards, _folds, _blocked, _start, pitch)
+            if _step is not None and (_best is None or _step[1] < _best[1][1]):
+                _best = (_boards, _step)
+
+        return _best
+
+    @staticmethod
+    def _lowest_step(boards, folds, blocked, start, pitch):
+        """
+        Picks the lowest row step clear of the rows next to it, then checks it against every row in reach
+        :param boards: list of (orientation, (x, y)) in pixels of the boards in a cell
+        :param folds: {(index of board a, index of board b): _Fold}
+        :param blocked: bool array of shape (pitch, heights), set where a step collides with the rows next to it
+        :param start: Height of the first column of blocked
+        :param pitch: Row pitch in pixels
+        :return: (x, y) step in pixels, None if no step in reach is clear
+        """
+        _free = ~blocked
+        _heights = numpy.where(_free.any(axis=1), _free.argmax(axis=1), blocked.shape[1])
+        _order = numpy.argsort(_heights, kind="stable")[:_lattice_attempts]
+
+        for _shift in _order.tolist():
+            _step = (_shift, int(_heights[_shift]) + start)
+            if _step[1] >= blocked.shape[1] + start:
+                break
+            if Nesting._lattice_clear(boards, folds, _step):
+                return _step
+
+        # Every row in reach is clear at the full reach
+        return (0, blocked.shape[1] + start)
+
+    @staticmethod
+    def _lattice_clear(boards, folds, step):
+        """
+        :return: True if no two boards of the lattice are too close
+        """
+        for (_i, _j), _fold in folds.items():
+            _x = boards[_j][1][0] - boards[_i][1][0]
+            _y = boards[_j][1][1] - boards[_i][1][1]
+            _rows = _fold.reach // step[1] + 2
+            for _row in range(-_rows, _rows + 1):
+                if _i == _j and _row == 0:
+                    # Boards in the same row, already checked when the pitch was picked
+                    continue
+                if _fold.collides(_x + _row * step[0], _y + _row * step[1]):
+                    return False
+        return True
+
+    def report_lines(self, lattices=None, panel_area=None, board_count=None):
+        """
+        :param lattices: From search(), searched if not given
+        :param panel_area: Panel area in nm2, for the utilisation of the panel as made
+        :param board_count: Number of boards on the panel
+        :return: list of lines for the report
+        """
+        lattices = self.search() if lattices is None else lattices
+        _lines = ["PCB outline area: {}mm2{}".format(round(self.outline.area / (NM_PER_MM * NM_PER_MM), 2),
+                                                     "" if self.outline.closed else " (profile not closed, hull used)")]
+        if panel_area:
+            _lines.append("Panel utilisation by outline: {:.1f}%".format(
+                board_count * self.outline.area / panel_area * 100))
+        _grid = self.grid(0)
+        for _lattice in lattices:
+            _lines.append("  " + _lattice.format_lattice() + (", {:+.1f}% on the grid".format(
+                (_grid.cell_area / _lattice.cell_area * len(_lattice.boards) - 1) * 100)
+                if _lattice.name != _grid.name else ""))
+        return _lines
+
+
+def load_outline(zip_path, profile_file_extensions):
+    """
+    :param zip_path: Path of the board gerber zip
+    :param profile_file_extensions: Extensions of the profile layer, from the config
+    :return: board_outline.BoardOutline, None if there is no profile or nothing is drawn in it
+    """
+    from layer_manifest import LayerManifest
+
+    _profile = LayerManifest.from_zip(zip_path).profile(profile_file_extensions)
+    if _profile is None:
+        return None
+
+    with ZipFile(str(zip_path), 'r') as zip_file:
+        with open_text(zip_file, _profile.name) as _lines:
+            return BoardOutline.from_lines(_lines)
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("zip", help="Board gerber zip")
+    _parser.add_argument("--config", default=str(Path(__file__).parent / "config.ini"), help="Path of config.ini")
+    _parser.add_argument("--route-diameter", type=float, default=None,
+                         help="Gap between boards in mm, default from the config")
+    _parser.add_argument("--resolution", type=float, default=None, help="Pixel size in mm, default from the config")
+    _parser.add_argument("--panel", default=None, help="Count the boards each lattice fits in an area, e.g. 100x100")
+    _args = _parser.parse_args()
+
+    from snapshot import load_config
+
+    _config = load_config(_args.config)
+    _panel_options = _config["PanelOptions"]
+    _report = _config["Report"]
+
+    _outline = load_outline(_args.zip, _panel_options["profile_file_extension"])
+    if _outline is None:
+        print("No board outline found in the profile layer")
+        return 1
+
+    _clearance = _panel_options["route_diameter"] if _args.route_diameter is None else to_nm(_args.route_diameter)
+    _pixel_size = _report["nesting_resolution"] if _args.resolution is None else to_nm(_args.resolution)
+    _cache_folder = _report["nesting_cache_folder"]
+    if _cache_folder:
+        _cache_folder = Path.cwd() / _cache_folder
+    _cache = shared_cache(_cache_folder or None, _report["nesting_cache_files"])
+
+    _nesting = Nesting(_outline, _clearance, _pixel_size, _cache)
+    _lattices = _nesting.search()
+    print("Board outline: {}".format(_outline))
+    for _line in _nesting.report_lines(_lattices):
+        print(_line)
+
+    if _args.panel:
+        _width, _height = (to_nm(_size) for _size in _args.panel.lower().split('x'))
+        for _lattice in _lattices:
+            print("{}: {} boards in {}".format(_lattice.name, _lattice.fit_count(_width, _height, _nesting.sizes),
+                                              _args.panel))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
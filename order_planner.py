@@ -0,0 +1,266 @@
+#! /usr/bin/env python3
+"""
+Plans an order of N boards as the cheapest mix of panels
+The candidate panels are every repeat and support bar option that is within the config limits, priced with the [Cost]
+model the same way as sweep.py. Only the cheapest panel of each board count is kept, then a dynamic programme over the
+number of boards finds the cheapest set of panels that makes at least N boards, e.g. four full panels and a smaller one
+for the remainder. With --make every panel in the plan is made, a gerberset and report each, in the same run
+Usage: ./order_planner.py <board zip or WxH in mm> <boards> [--repeat-x 1-10] [--repeat-y 1-10] [--make]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy
+
+from geometry import NM_PER_MM, to_nm
+from snapshot import load_config
+from sweep import Sweep, SweepLimits, TieredCostModel, board_size_from_zip, parse_values
+
+# Costs closer than this are the same, so the ties are broken on the number of panels and then spare boards
+_cost_tolerance = 1e-9
+
+
+class PanelVariant:
+    """
+    One of the panels an order can be made from, all dimensions are integer nm
+    """
+
+    __slots__ = ("repeat_x", "repeat_y", "horizontal_bars_every", "vertical_bars_every", "boards", "width", "height",
+                 "surface_area", "cost")
+
+    def __init__(self, repeat_x, repeat_y, horizontal_bars_every, vertical_bars_every, boards, width, height,
+                 surface_area, cost):
+        self.repeat_x = repeat_x
+        self.repeat_y = repeat_y
+        self.horizontal_bars_every = horizontal_bars_every
+        self.vertical_bars_every = vertical_bars_every
+        self.boards = boards
+        self.width = width
+        self.height = height
+        self.surface_area = surface_area
+        self.cost = cost
+
+    @property
+    def name(self):
+        """
+        :return: Short name of the panel, e.g. 4x3 or 4x3-bars0x2
+        """
+        _name = "{}x{}".format(self.repeat_x, self.repeat_y)
+        if self.horizontal_bars_every or self.vertical_bars_every:
+            _name += "-bars{}x{}".format(self.vertical_bars_every, self.horizontal_bars_every)
+        return _name
+
+    def __repr__(self):
+        return "PanelVariant({}, {} boards, {:.4f}mm x {:.4f}mm, {:.2f})".format(
+            self.name, self.boards, self.width / NM_PER_MM, self.height / NM_PER_MM, self.cost)
+
+
+def candidate_variants(result):
+    """
+    The panels worth considering from a sweep, the cheapest one within the limits for each number of boards
+    :param result: sweep.SweepResult
+    :return: list of PanelVariant, fewest boards first
+    """
+    _result = result.within_limits()
+    _result = _result.take(~numpy.isnan(_result["cost"]))
+    # Cheapest first, then the smallest, so the first of each board count is the one kept
+    _result = _result.sort("boards", "cost", "surface_area")
+
+    _variants = list()
+    for _index in numpy.flatnonzero(numpy.diff(_result["boards"], prepend=-1)).tolist():
+        _variants.append(PanelVariant(*(_result[_name][_index].item() for _name in PanelVariant.__slots__)))
+
+    return _variants
+
+
+class OrderPlan:
+    """
+    How many of each panel to make for an order
+    """
+
+    def __init__(self, boards, panels):
+        """
+        :param boards: Number of boards ordered
+        :param panels: list of (PanelVariant, count), most boards first
+        """
+        self.boards = boards
+        self.panels = panels
+
+    @property
+    def panel_count(self):
+        return sum(_count for _variant, _count in self.panels)
+
+    @property
+    def boards_made(self):
+        return sum(_variant.boards * _count for _variant, _count in self.panels)
+
+    @property
+    def spare_boards(self):
+        return self.boards_made - self.boards
+
+    @property
+    def cost(self):
+        return sum(_variant.cost * _count for _variant, _count in self.panels)
+
+    def format_plan(self):
+        """
+        :return: str of the plan, a line per panel and the totals
+        """
+        _lines = list()
+        for _variant, _count in self.panels:
+            _lines.append("{} x {} panel, {} boards, {:.4f}mm x {:.4f}mm, {:.4f}dm2, {:.2f} each, {:.2f}".format(
+                _count, _variant.name, _variant.boards, _variant.width / NM_PER_MM, _variant.height / NM_PER_MM,
+                _variant.surface_area, _variant.cost, _variant.cost * _count))
+
+        _lines.append("{} boards ordered, {} made in {} panels, {} spare".format(self.boards, self.boards_made,
+                                                                                self.panel_count, self.spare_boards))
+        _lines.append("Total cost: {:.2f}, {:.4f} per board ordered".format(self.cost, self.cost / self.boards))
+        return "\n".join(_lines)
+
+
+def plan_order(variants, boards):
+    """
+    Cheapest set of panels that makes at least the number of boards, ties go to fewer panels and then fewer spares
+    :param variants: list of PanelVariant from candidate_variants()
+    :param boards: Number of boards to make
+    :return: OrderPlan
+    """
+    if not variants:
+        raise ValueError("No panel is within the limits")
+    if boards < 1:
+        raise ValueError("At least one board has to be ordered")
+
+    _boards = numpy.array([_variant.boards for _variant in variants], dtype=numpy.int64)
+    _costs = numpy.array([_variant.cost for _variant in variants], dtype=numpy.float64)
+
+    # There is always a cheapest plan with fewer than best boards panels of anything but the panel with the lowest cost
+    # per board. Any more and some of them add up to a multiple of its boards, so could be swapped for it for no more.
+    # Orders bigger than that start with that many of its panels and only the rest is planned
+    _best = int(numpy.argmin(_costs / _boards))
+    _bound = int(_boards[_best]) * int(_boards.max())
+    _fixed = max(0, boards - _bound) // int(_boards[_best])
+    _remaining = boards - _fixed * int(_boards[_best])
+
+    # Cheapest way to make at least n boards, the panels in it and the boards made, with the panel added last
+    _cost = numpy.zeros(_remaining + 1)
+    _panels = numpy.zeros(_remaining + 1, dtype=numpy.int64)
+    _made = numpy.zeros(_remaining + 1, dtype=numpy.int64)
+    _choice = numpy.full(_remaining + 1, -1, dtype=numpy.int64)
+
+    for _count in range(1, _remaining + 1):
+        _previous = numpy.maximum(_count - _boards, 0)
+        _candidates = _cost[_previous] + _costs
+        _cheapest = numpy.flatnonzero(_candidates <= _candidates.min() + _cost_tolerance)
+        _cheapest = _cheapest[numpy.lexsort((_made[_previous[_cheapest]] + _boards[_cheapest],
+                                             _panels[_previous[_cheapest]]))[0]]
+
+        _cost[_count] = _candidates[_cheapest]
+        _panels[_count] = _panels[_previous[_cheapest]] + 1
+        _made[_count] = _made[_previous[_cheapest]] + _boards[_cheapest]
+        _choice[_count] = _cheapest
+
+    _counts = numpy.zeros(len(variants), dtype=numpy.int64)
+    _counts[_best] += _fixed
+    _count = _remaining
+    while _count > 0:
+        _counts[_choice[_count]] += 1
+        _count = max(0, _count - int(_boards[_choice[_count]]))
+
+    _plan = [(variants[_index], int(_counts[_index])) for _index in numpy.flatnonzero(_counts)[::-1].tolist()]
+    return OrderPlan(boards, _plan)
+
+
+def make_panels(plan, gerber_file_path, mousebites, title="", config=None):
+    """
+    Makes every panel in the plan, each one's outputs are named <zip name>-<panel name>
+    :param plan: OrderPlan
+    :param gerber_file_path: Path of the board gerber zip
+    :param mousebites: list of mousebite locations
+    :param title: Frame title, blank for the default from the zip name
+    :param config: snapshot.ConfigSnapshot every panel is made with
+    :return: list of the output names
+    """
+    from job_spec import JobSpec
+    from main import Panel
+
+    _names = list()
+    for _variant, _count in plan.panels:
+        _name = "{}-{}".format(Path(gerber_file_path).stem, _variant.name)
+        Panel(JobSpec(gerber_file_path, _variant.repeat_x, _variant.repeat_y, mousebites, title=title,
+                      horizontal_bars_every=_variant.horizontal_bars_every,
+                      vertical_bars_every=_variant.vertical_bars_every, output_name=_name), config).on_execute()
+        _names.append(_name)
+
+    return _names
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("board", help="Gerber zip to read the board size from, or the size in mm e.g. 30x20")
+    _parser.add_argument("boards", type=int, help="Number of boards to order")
+    _parser.add_argument("--config", default=str(Path(__file__).parent / "config.ini"), help="Path of config.ini")
+    _parser.add_argument("--repeat-x", default="1-10", help="Repeats to consider, e.g. 1,2,4 or 1-8")
+    _parser.add_argument("--repeat-y", default="1-10", help="Repeats to consider, e.g. 1,2,4 or 1-8")
+    _parser.add_argument("--horizontal-bars-every", default="0", help="Support bar options to consider, 0 for none")
+    _parser.add_argument("--vertical-bars-every", default="0", help="Support bar options to consider, 0 for none")
+    _parser.add_argument("--make", action="store_true", help="Make every panel in the plan, needs a board zip")
+    _parser.add_argument("--mousebites", default=None,
+                         help="Mousebite locations of the panels made, default from the [Daemon] section")
+    _parser.add_argument("--title", default="", help="Frame title of the panels made")
+    _args = _parser.parse_args()
+
+    _config = load_config(_args.config)
+    _panel_options = _config["PanelOptions"]
+
+    _is_zip = Path(_args.board).suffix.lower() == ".zip"
+    if _is_zip:
+        _board_size = board_size_from_zip(_args.board, _panel_options["profile_file_extension"])
+    else:
+        _board_size = [to_nm(_size) for _size in _args.board.lower().split('x')]
+
+    _sweep = Sweep(_board_size, SweepLimits.from_config(_config), TieredCostModel.from_config(_config))
+    _result = _sweep.run(route_diameter=[_panel_options["route_diameter"]],
+                         panel_width=[_panel_options["panel_width"]],
+                         support_bar_width=[_panel_options["support_bar_width"]],
+                         repeat_x=parse_values(_args.repeat_x, False), repeat_y=parse_values(_args.repeat_y, False),
+                         horizontal_bars_every=parse_values(_args.horizontal_bars_every, False),
+                         vertical_bars_every=parse_values(_args.vertical_bars_every, False))
+
+    _variants = candidate_variants(_result)
+    try:
+        _plan = plan_order(_variants, _args.boards)
+    except ValueError as e:
+        print("Can't plan the order: {}".format(e))
+        return 1
+
+    print("Board: {:.4f}mm x {:.4f}mm, {} panel options, {} within the limits".format(
+        _board_size[0] / NM_PER_MM, _board_size[1] / NM_PER_MM, len(_result), len(_variants)))
+    print(_plan.format_plan())
+
+    if _args.make:
+        if not _is_zip:
+            print("--make needs a board zip")
+            return 1
+
+        _mousebites = _config["Daemon"]["default_mousebites"]
+        if _args.mousebites is not None:
+            _mousebites = _args.mousebites.replace(' ', '').split(',')
+
+        _gerber_file_path = Path(_args.board).resolve()
+        _names = make_panels(_plan, _gerber_file_path, _mousebites, _args.title, _config)
+
+        _plan_path = _gerber_file_path.parent / "panel" / (_gerber_file_path.stem + "-order-plan.txt")
+        with open(str(_plan_path), 'w') as out:
+            out.write(_plan.format_plan() + "\n")
+            out.write("\n")
+            for _name in _names:
+                out.write("Gerberset: {}-panel.gerberset\n".format(_name))
+        print("Order plan written to: {}".format(_plan_path))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#! /usr/bin/env python3
+"""
+Data model of a panel, built up by main.Panel and passed to every stage after it
+The board and the panel are small slotted classes, and the board instances and tabs are CoordTables, which keep the
+coords packed two int64s each rather than as a tuple of ints per location. All dimensions are integer nm
+"""
+
+import itertools
+from array import array
+
+from geometry import area_dm2, format_decimal, format_point
+
+
+class CoordTable:
+    """
+    list of (x, y) coords in nm, packed into a single array('q') as x0, y0, x1, y1...
+    Iterates as (x, y) tuples, and numpy.array() of it is an (n, 2) int64 array
+    """
+
+    __slots__ = ("_values",)
+
+    def __init__(self, coords=()):
+        """
+        :param coords: Iterable of (x, y) in nm
+        """
+        self._values = array("q", itertools.chain.from_iterable(coords))
+
+    @classmethod
+    def grid(cls, xs, ys):
+        """
+        :param xs: X of each column
+        :param ys: Y of each row
+        :return: CoordTable of every column in every row, a row at a time from the first row
+        """
+        _table = cls()
+        _row = array("q", itertools.chain.from_iterable((_x, 0) for _x in xs))
+        for _y in ys:
+            _row[1::2] = array("q", [_y]) * len(xs)
+            _table._values.extend(_row)
+
+        return _table
+
+    def append(self, x, y):
+        self._values.append(x)
+        self._values.append(y)
+
+    def extend(self, coords):
+        """
+        :param coords: Iterable of (x, y) in nm
+        :return:
+        """
+        self._values.extend(itertools.chain.from_iterable(coords))
+
+    def unique(self):
+        """
+        :return: New CoordTable of the distinct coords, sorted by x then y
+        """
+        return CoordTable(sorted(set(self)))
+
+    def __len__(self):
+        return len(self._values) // 2
+
+    def __iter__(self):
+        return zip(itertools.islice(self._values, 0, None, 2), itertools.islice(self._values, 1, None, 2))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CoordTable index out of range")
+        return self._values[index * 2], self._values[index * 2 + 1]
+
+    def __eq__(self, other):
+        if isinstance(other, CoordTable):
+            return self._values == other._values
+        return NotImplemented
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy
+
+        return numpy.array(self._values, dtype=dtype or numpy.int64).reshape(-1, 2)
+
+    def __repr__(self):
+        return "CoordTable([{}])".format(", ".join(format_point(_loc) for _loc in self))
+
+
+class BoardInfo:
+    """
+    Size and origin of the board, from the bounds of its profile layer
+    """
+
+    __slots__ = ("size_x", "size_y", "origin_x", "origin_y")
+
+    def __init__(self, size_x, size_y, origin_x, origin_y):
+        """
+        :param size_x: Width of the board
+        :param size_y: Height of the board
+        :param origin_x: X of the gerber origin from the bottom left corner of the board
+        :param origin_y: Y of the gerber origin from the bottom left corner of the board
+        """
+        self.size_x = size_x
+        self.size_y = size_y
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+
+    @classmethod
+    def from_bounds(cls, min_x, max_x, min_y, max_y):
+        """
+        :return: BoardInfo of a board with these bounds in its gerber coords
+        """
+        # The origin is how far the gerber origin is from the bottom left corner, so the sign is flipped
+        return cls(max_x - min_x, max_y - min_y, -min_x, -min_y)
+
+    @property
+    def surface_area(self):
+        """
+        :return: Surface area in dm2
+        """
+        return area_dm2(self.size_x, self.size_y)
+
+    def box_at(self, x, y):
+        """
+        :param x: X of the gerber origin of a board instance
+        :param y: Y of the gerber origin of a board instance
+        :return: (x0, y0, x1, y1) bounding box of the instance
+        """
+        _x0 = x - self.origin_x
+        _y0 = y - self.origin_y
+        return _x0, _y0, _x0 + self.size_x, _y0 + self.size_y
+
+    def __repr__(self):
+        return "BoardInfo({}mm x {}mm, origin: {})".format(format_decimal(self.size_x, 4),
+                                                           format_decimal(self.size_y, 4),
+                                                           format_point((self.origin_x, self.origin_y), 4))
+
+
+class PanelSpec:
+    """
+    Everything about the panel array, filled in as the questions are answered
+    """
+
+    __slots__ = ("title", "repeat_x", "repeat_y", "width", "height", "step_x", "step_y", "horizontal_bars_every",
+                 "vertical_bars_every")
+
+    def __init__(self, title="", repeat_x=1, repeat_y=1, width=0, height=0, step_x=0, step_y=0,
+                 horizontal_bars_every=0, vertical_bars_every=0):
+        """
+        :param title: Title printed on the frame
+        :param repeat_x: Number of boards across
+        :param repeat_y: Number of boards up
+        :param width: Width of the panel
+        :param height: Height of the panel
+        :param step_x: Step between boards across, without any support bars
+        :param step_y: Step between boards up, without any support bars
+        :param horizontal_bars_every: Boards between each horizontal support bar, 0 for none
+        :param vertical_bars_every: Boards between each vertical support bar, 0 for none
+        """
+        self.title = title
+        self.repeat_x = repeat_x
+        self.repeat_y = repeat_y
+        self.width = width
+        self.height = height
+        self.step_x = step_x
+        self.step_y = step_y
+        self.horizontal_bars_every = horizontal_bars_every
+        self.vertical_bars_every = vertical_bars_every
+
+    @property
+    def board_count(self):
+        return self.repeat_x * self.repeat_y
+
+    @property
+    def surface_area(self):
+        """
+        :return: Surface area in dm2
+        """
+        return area_dm2(self.width, self.height)
+
+    def __repr__(self):
+        return "PanelSpec({}, {} x {}, {}mm x {}mm)".format(self.title, self.repeat_x, self.repeat_y,
+                                                            format_decimal(self.width, 4),
+                                                            format_decimal(self.height, 4))
+
+
+def board_positions(start, count, pitch, bars_every=0, bar_pitch=0):
+    """
+    Positions of the boards along one axis of the array
+    :param start: Position of the first board
+    :param count: Number of boards
+    :param pitch: Board size plus the route between boards
+    :param bars_every: Boards between each support bar, 0 for none
+    :param bar_pitch: Support bar width plus the extra route it needs
+    :return: list of positions
+    """
+    _positions = list()
+    _position = start
+    for _index in range(count):
+        _positions.append(_position)
+        _position += pitch
+
+        # The index starts at 0 so add 1 to get a bar after every bars_every boards
+        if bars_every != 0 and (_index + 1) % bars_every == 0:
+            _position += bar_pitch
+
+    return _positions
+
+
+class FrameInfo:
+    """
+    Locations of the things on the panel frame, from GerberGenerator
+    """
+
+    __slots__ = ("overlay_path", "fiducials", "drills")
+
+    def __init__(self, overlay_path, fiducials, drills):
+        """
+        :param overlay_path: Path of the frame overlay zip
+        :param fiducials: CoordTable of the fiducials, bl, br, tl, tr
+        :param drills: CoordTable of the corner drills
+        """
+        self.overlay_path = overlay_path
+        self.fiducials = fiducials
+        self.drills = drills
+
+    def fiducials_from(self, x, y):
+        """
+        :param x: X of a location on the panel, e.g. the origin of the first board
+        :param y: Y of the location
+        :return: CoordTable of each fiducial relative to the location
+        """
+        return CoordTable((_x - x, _y - y) for _x, _y in self.fiducials)
@@ -0,0 +1,270 @@
+#! /usr/bin/env python3
+"""
+Native panel profile and route path generation, replaces GerberPanelizer's negative polygon processing
+The router path around each board is its bounding box offset by half the route diameter. Boards are spaced by exactly
+one route diameter so the paths of neighbouring boards land on the same integer lines, merging them is an interval
+union per line rather than any polygon boolean maths. Tabs are cut out of the paths where the mousebites are.
+The profile is the boundary of the milled area, found by rasterising the mill rectangles onto a grid of their own
+edge coordinates and tracing the edges of the filled cells, so everything stays in integer nm
+"""
+
+import numpy
+
+from geometry import half_nm
+
+
+def merge_intervals(intervals):
+    """
+    Union of a list of intervals
+    :param intervals: list of (start, end) tuples
+    :return: sorted list of non overlapping (start, end) tuples
+    """
+    _merged = list()
+    for _start, _end in sorted(intervals):
+        if _merged and _start <= _merged[-1][1]:
+            if _end > _merged[-1][1]:
+                _merged[-1] = (_merged[-1][0], _end)
+        else:
+            _merged.append((_start, _end))
+
+    return _merged
+
+
+def subtract_intervals(intervals, cuts):
+    """
+    Removes a list of cut intervals from a list of merged intervals
+    :param intervals: sorted list of non overlapping (start, end) tuples
+    :param cuts: list of (start, end) tuples
+    :return: list of (start, end) tuples
+    """
+    _result = list()
+    _cuts = merge_intervals(cuts)
+
+    for _start, _end in intervals:
+        for _cut_start, _cut_end in _cuts:
+            if _cut_end <= _start or _cut_start >= _end:
+                continue
+            if _cut_start > _start:
+                _result.append((_start, _cut_start))
+            _start = max(_start, _cut_end)
+            if _start >= _end:
+                break
+
+        if _start < _end:
+            _result.append((_start, _end))
+
+    return _result
+
+
+def _nearest(lines, values):
+    """
+    :param lines: numpy int64 array of line coordinates
+    :param values: numpy int64 array of coordinates
+    :return: (nearest line, distance to it) numpy int64 arrays the shape of values
+    """
+    _lines = numpy.unique(lines)
+    _index = numpy.searchsorted(_lines, values)
+    _below = _lines[numpy.maximum(_index - 1, 0)]
+    _above = _lines[numpy.minimum(_index, len(_lines) - 1)]
+    _nearest = numpy.where(numpy.abs(values - _below) <= numpy.abs(values - _above), _below, _above)
+    return _nearest, numpy.abs(values - _nearest)
+
+
+def snap_tabs(tab_coords, board_boxes, route_diameter):
+    """
+    Moves each tab onto the route center line it is nearest to
+    Tab locations are worked out from the board center, so with an odd nm board size they can be 1nm off the line
+    :param tab_coords: list of (x, y) tab locations
+    :param board_boxes: list of (x0, y0, x1, y1) bounding boxes of each board instance
+    :param route_diameter: Diameter of the router bit, the route center line is half of it from the board edge
+    :return: (numpy int64 array of shape (n, 2) of the tabs on the lines, numpy bool array of shape (n,) True where the
+    line runs along x, i.e. a top or bottom tab)
+    """
+    _offset = half_nm(route_diameter)
+    _tabs = numpy.array(tab_coords, dtype=numpy.int64).reshape(-1, 2)
+    _boxes = numpy.array(board_boxes, dtype=numpy.int64).reshape(-1, 4)
+    if not len(_tabs) or not len(_boxes):
+        return _tabs, numpy.ones(len(_tabs), dtype=bool)
+
+    _horizontal_y, _horizontal_distance = _nearest(numpy.concatenate([_boxes[:, 1] - _offset, _boxes[:, 3] + _offset]),
+                                                   _tabs[:, 1])
+    _vertical_x, _vertical_distance = _nearest(numpy.concatenate([_boxes[:, 0] - _offset, _boxes[:, 2] + _offset]),
+                                               _tabs[:, 0])
+
+    # Tabs are kept away from the corners, so the line they are on is much nearer than any line across it
+    _horizontal = _horizontal_distance <= _vertical_distance
+    _snapped = _tabs.copy()
+    _snapped[:, 1] = numpy.where(_horizontal, _horizontal_y, _tabs[:, 1])
+    _snapped[:, 0] = numpy.where(_horizontal, _tabs[:, 0], _vertical_x)
+    return _snapped, _horizontal
+
+
+def rectangle_union_contours(rects):
+    """
+    Finds the outline of the union of a set of axis aligned rectangles
+    The rectangles are drawn onto a grid of their own unique edge coordinates with a 2D prefix sum, then the edges
+    between filled and empty cells are linked into closed contours. Outer contours run anticlockwise, holes clockwise
+    :param rects: list of (x0, y0, x1, y1) tuples in nm
+    :return: list of contours, each a list of (x, y) vertices in nm without the closing vertex
+    """
+    if not len(rects):
+        return list()
+
+    _rects = numpy.array(rects, dtype=numpy.int64).reshape(-1, 4)
+    _xs = numpy.unique(_rects[:, [0, 2]])
+    _ys = numpy.unique(_rects[:, [1, 3]])
+
+    _x0 = numpy.searchsorted(_xs, _rects[:, 0])
+    _x1 = numpy.searchsorted(_xs, _rects[:, 2])
+    _y0 = numpy.searchsorted(_ys, _rects[:, 1])
+    _y1 = numpy.searchsorted(_ys, _rects[:, 3])
+
+    _coverage = numpy.zeros((len(_xs), len(_ys)), dtype=numpy.int32)
+    numpy.add.at(_coverage, (_x0, _y0), 1)
+    numpy.add.at(_coverage, (_x1, _y0), -1)
+    numpy.add.at(_coverage, (_x0, _y1), -1)
+    numpy.add.at(_coverage, (_x1, _y1), 1)
+    _filled = _coverage.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0
+
+    # Pad with empty cells so edges on the outside of the grid are found
+    _padded = numpy.pad(_filled, 1, mode="constant")
+
+    # Edges are directed so the filled cell is on the left, (start_i, start_j, end_i, end_j) in grid vertex indices
+    _left = _padded[:-1, 1:-1]
+    _right = _padded[1:, 1:-1]
+    _below = _padded[1:-1, :-1]
+    _above = _padded[1:-1, 1:]
+
+    _edges = list()
+    _i, _j = numpy.nonzero(_left & ~_right)
+    _edges.append(numpy.stack([_i, _j, _i, _j + 1], axis=1))
+    _i, _j = numpy.nonzero(_right & ~_left)
+    _edges.append(numpy.stack([_i, _j + 1, _i, _j], axis=1))
+    _i, _j = numpy.nonzero(_above & ~_below)
+    _edges.append(numpy.stack([_i, _j, _i + 1, _j], axis=1))
+    _i, _j = numpy.nonzero(_below & ~_above)
+    _edges.append(numpy.stack([_i + 1, _j, _i, _j], axis=1))
+
+    # {start vertex: [end vertex]}, a vertex can have two outgoing edges where two filled cells only touch at a corner
+    _outgoing = dict()
+    for _edge in numpy.concatenate(_edges).tolist():
+        _outgoing.setdefault((_edge[0], _edge[1]), list()).append((_edge[2], _edge[3]))
+
+    _contours = list()
+    while _outgoing:
+        _start = next(iter(_outgoing))
+        _vertices = [_start]
+        _current = _start
+        _direction = None
+
+        while True:
+            _ends = _outgoing[_current]
+            _end = _ends[0]
+            if len(_ends) > 1 and _direction is not None:
+                # The filled side is on the left, turning left keeps shapes that only touch at a corner separate
+                _left_turn = (-_direction[1], _direction[0])
+                for _candidate in _ends:
+                    if (_candidate[0] - _current[0], _candidate[1] - _current[1]) == _left_turn:
+                        _end = _candidate
+                        break
+
+            _ends.remove(_end)
+            if not _ends:
+                del _outgoing[_current]
+
+            _direction = (_end[0] - _current[0], _end[1] - _current[1])
+            _current = _end
+            if _current == _start:
+                break
+            _vertices.append(_current)
+
+        _contours.append(_simplify_contour([(int(_xs[_i]), int(_ys[_j])) for _i, _j in _vertices]))
+
+    return _contours
+
+
+def _simplify_contour(vertices):
+    """
+    Removes vertices in the middle of straight edges
+    :param vertices: list of (x, y) tuples of a closed contour
+    :return: list of (x, y) tuples
+    """
+    _simplified = list()
+    _count = len(vertices)
+    for _index, _vertex in enumerate(vertices):
+        _previous = vertices[_index - 1]
+        _next = vertices[(_index + 1) % _count]
+        _collinear = (_previous[0] == _vertex[0] == _next[0]) or (_previous[1] == _vertex[1] == _next[1])
+        if not _collinear:
+            _simplified.append(_vertex)
+
+    return _simplified
+
+
+class PanelOutline:
+    """
+    Route paths and profile of a panel, all in nm
+    """
+
+    def __init__(self, width, height, route_diameter, tab_width):
+        """
+        :param width: Width of the panel
+        :param height: Height of the panel
+        :param route_diameter: Diameter of the router bit, this is the gap between boards
+        :param tab_width: Width of the tab left across the route channel at each mousebite
+        """
+        self.width = width
+        self.height = height
+        self.route_diameter = route_diameter
+        self.tab_width = tab_width
+
+        # [((x0, y0), (x1, y1))] center line of the router, horizontal and vertical segments only
+        self.route_segments = list()
+        # [[(x, y), ...]] closed contours of the panel profile, the panel edge and the edges of the route channels
+        self.profile_contours = list()
+
+    def build(self, board_boxes, tab_coords):
+        """
+        Works out the route paths and the profile
+        :param board_boxes: list of (x0, y0, x1, y1) bounding boxes of each board instance
+        :param tab_coords: list of (x, y) tab locations, each is moved onto the route center line nearest to it
+        :return: self
+        """
+        _offset = half_nm(self.route_diameter)
+
+        # {(axis, fixed coord): [(start, end)]}, axis "h" is a line of constant y
+        _lines = dict()
+        for _x0, _y0, _x1, _y1 in board_boxes:
+            _x0, _y0, _x1, _y1 = _x0 - _offset, _y0 - _offset, _x1 + _offset, _y1 + _offset
+            _lines.setdefault(("h", _y0), list()).append((_x0, _x1))
+            _lines.setdefault(("h", _y1), list()).append((_x0, _x1))
+            _lines.setdefault(("v", _x0), list()).append((_y0, _y1))
+            _lines.setdefault(("v", _x1), list()).append((_y0, _y1))
+
+        # The router leaves a round end, stop it half a diameter short so the edge of the cut is at the edge of the tab
+        _tab_half_length = half_nm(self.tab_width) + _offset
+        _cuts = dict()
+        _tabs, _horizontal = snap_tabs(tab_coords, board_boxes, self.route_diameter)
+        for (_x, _y), _along_x in zip(_tabs.tolist(), _horizontal.tolist()):
+            if _along_x:
+                _cuts.setdefault(("h", _y), list()).append((_x - _tab_half_length, _x + _tab_half_length))
+            else:
+                _cuts.setdefault(("v", _x), list()).append((_y - _tab_half_length, _y + _tab_half_length))
+
+        self.route_segments = list()
+        _mill_rects = list()
+        for _key in sorted(_lines.keys()):
+            _axis, _fixed = _key
+            _intervals = subtract_intervals(merge_intervals(_lines[_key]), _cuts.get(_key, ()))
+            for _start, _end in _intervals:
+                if _axis == "h":
+                    self.route_segments.append(((_start, _fixed), (_end, _fixed)))
+                    _mill_rects.append((_start - _offset, _fixed - _offset, _end + _offset, _fixed + _offset))
+                else:
+                    self.route_segments.append(((_fixed, _start), (_fixed, _end)))
+                    _mill_rects.append((_fixed - _offset, _start - _offset, _fixed + _offset, _end + _offset))
+
+        _panel_edge = [(0, 0), (self.width, 0), (self.width, self.height), (0, self.height)]
+        self.profile_contours = [_panel_edge] + rectangle_union_contours(_mill_rects)
+
+        return self
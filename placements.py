@@ -0,0 +1,164 @@
+#! /usr/bin/env python3
+"""
+Per board placement tables for pick and place setup
+Works out the offset of every board on the panel from the first board and from each fiducial, along with the tab
+locations, as numpy arrays over all the boards at once. The tables are formatted a chunk of rows at a time and
+streamed to disk as csv and json, so a panel of thousands of boards takes no time at all
+"""
+
+import numpy
+
+from geometry import NM_PER_MM
+
+# Names of the frame fiducials in the order GerberGenerator places them
+fiducial_names = ("bl", "br", "tl", "tr")
+
+# Number of rows formatted per write
+_write_chunk_size = 4096
+
+
+def format_mm_array(nm, decimals=4):
+    """
+    Vectorised conversion of nm to mm strings with a fixed number of decimal places, rounding half away from zero
+    :param nm: numpy int64 array
+    :param decimals: Number of decimal places
+    :return: numpy array of str with the same shape
+    """
+    _unit = NM_PER_MM // (10 ** decimals)
+    _fixed = numpy.sign(nm) * ((numpy.abs(nm) + (_unit // 2)) // _unit)
+    _whole = (numpy.abs(_fixed) // (10 ** decimals)).astype(str)
+    _fraction = numpy.char.zfill((numpy.abs(_fixed) % (10 ** decimals)).astype(str), decimals)
+
+    _sign = numpy.where(_fixed < 0, "-", "")
+    return numpy.char.add(numpy.char.add(_sign, _whole), numpy.char.add(".", _fraction))
+
+
+def round_mm_array(nm, decimals=4):
+    """
+    Vectorised conversion of nm to mm, rounded half away from zero the same as format_mm_array
+    The result formatted with "{:.<decimals>f}" gives the same strings as format_mm_array, the rounding is done on
+    integers first so the float is always the closest one to the rounded value
+    :param nm: numpy int64 array
+    :param decimals: Number of decimal places
+    :return: numpy float64 array with the same shape
+    """
+    _unit = NM_PER_MM // (10 ** decimals)
+    _fixed = numpy.sign(nm) * ((numpy.abs(nm) + (_unit // 2)) // _unit)
+    return _fixed / (10 ** decimals)
+
+
+def write_csv_rows(out_file, columns):
+    """
+    Streams a table of string columns to a csv file a chunk at a time
+    :param out_file: Text stream to write to
+    :param columns: list of numpy arrays of str, all the same length
+    :return:
+    """
+    _table = numpy.stack(columns, axis=1) if columns else numpy.zeros((0, 0), dtype=str)
+    _row_template = ",".join(["{}"] * _table.shape[1]) + "\n"
+
+    for _start in range(0, len(_table), _write_chunk_size):
+        _chunk = _table[_start:_start + _write_chunk_size]
+        out_file.write((_row_template * len(_chunk)).format(*_chunk.ravel().tolist()))
+
+
+class PlacementTable:
+    """
+    Location of every board instance on the panel, all arrays are int64 nm
+    """
+
+    def __init__(self, board_coords, fiducial_coords, tab_offsets=()):
+        """
+        :param board_coords: list of (x, y) origin of each board instance, the same as in the gerberset
+        :param fiducial_coords: list of (x, y) frame fiducial locations in the order bl, br, tl, tr
+        :param tab_offsets: list of (x, y) tab locations relative to the origin of a board
+        """
+        self.boards = numpy.array(board_coords, dtype=numpy.int64).reshape(-1, 2)
+        self.fiducials = numpy.array(fiducial_coords, dtype=numpy.int64).reshape(-1, 2)
+        self.tab_offsets = numpy.array(tab_offsets, dtype=numpy.int64).reshape(-1, 2)
+
+        # Column and row of each board, support bars break the pitch so these come from the sorted unique locations
+        self.columns = numpy.searchsorted(numpy.unique(self.boards[:, 0]), self.boards[:, 0])
+        self.rows = numpy.searchsorted(numpy.unique(self.boards[:, 1]), self.boards[:, 1])
+
+        # Offset of each board from the first board, (n, 2)
+        self.offsets = self.boards - self.boards[:1]
+        # Origin of each board measured from each fiducial, (n, fiducials, 2)
+        self.from_fiducials = self.boards[:, None, :] - self.fiducials[None, :, :]
+        # Absolute location of each tab on each board, (n, tabs, 2)
+        # Tabs between two boards belong to both of them
+        self.tabs = self.boards[:, None, :] + self.tab_offsets[None, :, :]
+
+    def _fiducial_names(self):
+        return [fiducial_names[_index] if _index < len(fiducial_names) else "fid{}".format(_index)
+                for _index in range(len(self.fiducials))]
+
+    def write_boards_csv(self, out_file, decimals=4):
+        """
+        One row per board: index, column, row, origin, offset from board 0 and origin from each fiducial
+        :param out_file: Text stream to write to
+        :param decimals: Decimal places of the mm values
+        :return:
+        """
+        _header = ["board", "column", "row", "origin_x", "origin_y", "offset_x", "offset_y"]
+        for _name in self._fiducial_names():
+            _header += ["from_{}_x".format(_name), "from_{}_y".format(_name)]
+        out_file.write(",".join(_header) + "\n")
+
+        _columns = [numpy.arange(len(self.boards)).astype(str), self.columns.astype(str), self.rows.astype(str)]
+        _columns += list(format_mm_array(self.boards, decimals).T)
+        _columns += list(format_mm_array(self.offsets, decimals).T)
+        _columns += list(format_mm_array(self.from_fiducials.reshape(len(self.boards), -1), decimals).T)
+        write_csv_rows(out_file, _columns)
+
+    def write_tabs_csv(self, out_file, decimals=4):
+        """
+        One row per tab per board
+        :param out_file: Text stream to write to
+        :param decimals: Decimal places of the mm values
+        :return:
+        """
+        out_file.write("board,tab,x,y\n")
+
+        _tab_count = len(self.tab_offsets)
+        _tabs = format_mm_array(self.tabs.reshape(-1, 2), decimals)
+        _columns = [numpy.repeat(numpy.arange(len(self.boards)), _tab_count).astype(str),
+                    numpy.tile(numpy.arange(_tab_count), len(self.boards)).astype(str),
+                    _tabs[:, 0], _tabs[:, 1]]
+        write_csv_rows(out_file, _columns)
+
+    def write_json(self, out_file, decimals=4):
+        """
+        Everything in one json document, written a chunk of boards at a time
+        :param out_file: Text stream to write to
+        :param decimals: Decimal places of the mm values
+        :return:
+        """
+        _fiducials = format_mm_array(self.fiducials, decimals)
+        out_file.write('{"units": "mm",\n "fiducials": {')
+        out_file.write(", ".join('"{}": [{}, {}]'.format(_name, *_loc)
+                                 for _name, _loc in zip(self._fiducial_names(), _fiducials.tolist())))
+        out_file.write('},\n "boards": [\n')
+
+        _fid_count = len(self.fiducials)
+        _tab_count = len(self.tab_offsets)
+        _board_template = '  {{"board": {}, "column": {}, "row": {}, "origin": [{}, {}], "offset": [{}, {}], ' \
+                          '"from_fiducials": {{' + \
+                          ", ".join('"{}": [{{}}, {{}}]'.format(_name) for _name in self._fiducial_names()) + \
+                          '}}, "tabs": [' + ", ".join(["[{}, {}]"] * _tab_count) + ']}}'
+
+        _table = numpy.concatenate([
+            numpy.arange(len(self.boards)).astype(str)[:, None], self.columns.astype(str)[:, None],
+            self.rows.astype(str)[:, None],
+            format_mm_array(self.boards, decimals), format_mm_array(self.offsets, decimals),
+            format_mm_array(self.from_fiducials.reshape(len(self.boards), _fid_count * 2), decimals),
+            format_mm_array(self.tabs.reshape(len(self.boards), _tab_count * 2), decimals),
+        ], axis=1)
+
+        for _start in range(0, len(_table), _write_chunk_size):
+            _chunk = _table[_start:_start + _write_chunk_size]
+            if _start:
+                out_file.write(",\n")
+            out_file.write(",\n".join([_board_template] * len(_chunk)).format(*_chunk.ravel().tolist()))
+
+        out_file.write("\n ]\n}\n")
@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+"""
+Serial marks for traceability, a unique label on each board of the panel with an optional Data Matrix code of it
+Each label is formatted from the board number and its row and column in the panel. The codes are printed on the
+silkscreen, so the silkscreen is the light part of the symbol and the solder mask showing through it is the dark part,
+which is the polarity a reader expects. All dimensions are integer nm
+"""
+
+import numpy
+
+import datamatrix
+
+
+def board_grid(origins):
+    """
+    :param origins: numpy int64 array of shape (n, 2) of a point on each board, e.g. its bottom left corner
+    :return: (rows, columns) numpy int arrays of shape (n,), counted from 1 at the bottom left board
+    """
+    _columns = numpy.unique(origins[:, 0], return_inverse=True)[1].reshape(-1)
+    _rows = numpy.unique(origins[:, 1], return_inverse=True)[1].reshape(-1)
+    return _rows + 1, _columns + 1
+
+
+def mark_labels(text_format, start, origins):
+    """
+    :param text_format: str.format() template, with {serial}, {index}, {row} and {column}
+    :param start: Serial number of the first board
+    :param origins: numpy int64 array of shape (n, 2) of the bottom left corner of each board, in board order
+    :return: list of the label of each board
+    """
+    _rows, _columns = board_grid(origins)
+    return [text_format.format(serial=start + _index, index=_index, row=int(_row), column=int(_column))
+            for _index, (_row, _column) in enumerate(zip(_rows, _columns))]
+
+
+def code_runs(texts):
+    """
+    Light modules of the Data Matrix symbol of each text, including its quiet zone, as runs along each row
+    Symbols of the same size are stacked and their runs found together
+    :param texts: list of text to encode
+    :return: (numpy int array of shape (len(texts),) of the modules along each side including the quiet zone,
+    numpy int array of shape (n, 4) of the text index, row from the bottom, first module and number of modules of
+    each run)
+    """
+    _symbols = [datamatrix.encode(_text) for _text in texts]
+    _modules = numpy.array([len(_symbol) + 2 for _symbol in _symbols], dtype=numpy.int64)
+
+    _runs = list()
+    for _size in numpy.unique(_modules).tolist():
+        _indices = numpy.flatnonzero(_modules == _size)
+        # Quiet zone all the way around the symbol, then a dark column either side so every run has two edges
+        _light = numpy.zeros((len(_indices), _size, _size + 2), dtype=numpy.int8)
+        _light[:, :, 1:-1] = 1
+        _light[:, 1:-1, 2:-2] = ~numpy.stack([_symbols[_index] for _index in _indices])[:, ::-1]
+        _edges = numpy.diff(_light, axis=2)
+
+        _starts = numpy.argwhere(_edges == 1)
+        _ends = numpy.argwhere(_edges == -1)
+        _runs.append(numpy.column_stack([_indices[_starts[:, 0]], _starts[:, 1], _starts[:, 2],
+                                         _ends[:, 2] - _starts[:, 2]]))
+
+    return _modules, numpy.concatenate(_runs).reshape(-1, 4)
+
+
+def to_gerber_units(nm):
+    """
+    Vectorised conversion from nm to the units of a 3.4 gerber file, rounding half away from zero like format_gerber()
+    :param nm: numpy int64 array
+    :return: numpy int64 array
+    """
+    return numpy.sign(nm) * ((numpy.abs(nm) + 50) // 100)
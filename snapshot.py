@@ -0,0 +1,425 @@
+#! /usr/bin/env python3
+"""
+Cached snapshots of the config file and the vector font
+Each file is only read and parsed again if its modification time or size has changed, so a long running process
+(e.g. the watch folder daemon) only pays for it once. The returned objects are shared, don't modify them
+
+The config is compiled into a ConfigSnapshot, every value converted to its type and checked once when the file is read
+rather than wherever it is used. Snapshots are never changed, a changed file gives a new snapshot, so anything still
+holding the old one (e.g. a job that was already running) carries on with the values it started with
+"""
+
+import hashlib
+import json
+from configparser import ConfigParser, Error as ConfigParserError
+from pathlib import Path
+from types import MappingProxyType
+
+from geometry import to_nm
+
+# {(kind, resolved path): ((mtime_ns, size), parsed object)}
+_cache = dict()
+
+
+def _load_cached(kind, path, parse):
+    """
+    Returns the parsed contents of a file, parsing it again only if it has changed on disk
+    :param kind: Name of the cache the file is kept in
+    :param path: Path of the file
+    :param parse: Function that takes the Path and returns the parsed object
+    :return: Parsed object
+    """
+    _path = Path(path).resolve()
+    _stat = _path.stat()
+    _stamp = (_stat.st_mtime_ns, _stat.st_size)
+
+    _cached = _cache.get((kind, _path))
+    if _cached is not None and _cached[0] == _stamp:
+        return _cached[1]
+
+    _parsed = parse(_path)
+    _cache[(kind, _path)] = (_stamp, _parsed)
+    return _parsed
+
+
+class ConfigError(ValueError):
+    """
+    The config file is missing a value or has one that can't be used
+    """
+
+
+def boolean(text):
+    """
+    :param text: true/false, yes/no, on/off or 1/0
+    :return: bool
+    """
+    _text = text.strip().lower()
+    if _text in ("true", "yes", "on", "1"):
+        return True
+    if _text in ("false", "no", "off", "0"):
+        return False
+    raise ValueError("expected true or false")
+
+
+def text_list(text):
+    """
+    :param text: Comma separated list
+    :return: tuple of the stripped items, blank items are left out
+    """
+    return tuple(_item.strip() for _item in text.split(',') if _item.strip())
+
+
+def nm_pair(text):
+    """
+    :param text: Comma separated x, y in mm
+    :return: (x, y) in nm
+    """
+    _values = tuple(to_nm(_item) for _item in text_list(text))
+    if len(_values) != 2:
+        raise ValueError("expected x, y")
+    return _values
+
+
+def area_tiers(text):
+    """
+    :param text: Comma separated list of <max area dm2>:<price per dm2>, inf for no max
+    :return: tuple of (max area, price) floats, smallest area first
+    """
+    _tiers = list()
+    for _tier in text_list(text):
+        _area, _price = _tier.split(':')
+        _tiers.append((float(_area), float(_price)))
+    return tuple(sorted(_tiers))
+
+
+def at_least(minimum, convert):
+    """
+    :param minimum: Smallest allowed value
+    :param convert: Converter of the value
+    :return: Converter that also checks every value is at least the minimum
+    """
+    def _convert(text):
+        _value = convert(text)
+        for _item in _value if isinstance(_value, tuple) else (_value,):
+            if _item < minimum:
+                raise ValueError("must be at least {}".format(minimum))
+        return _value
+
+    return _convert
+
+
+def one_of(choices, convert):
+    """
+    :param choices: Allowed values
+    :param convert: Converter of the value
+    :return: Converter that also checks every value is one of the choices
+    """
+    def _convert(text):
+        _value = convert(text)
+        for _item in _value if isinstance(_value, tuple) else (_value,):
+            if _item not in choices:
+                raise ValueError("must be one of {}".format(", ".join(str(_choice) for _choice in choices)))
+        return _value
+
+    return _convert
+
+
+def serial_format(text):
+    """
+    :param text: str.format() template of the serial marks
+    :return: The template, checked by formatting the mark of the first board
+    """
+    try:
+        text.format(serial=1, index=0, row=1, column=1)
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError("can't be formatted, {}".format(e))
+    return text
+
+
+def _ints(text):
+    return tuple(int(_item) for _item in text_list(text))
+
+
+# Type of every config value, {section: {key: function from the text in the file to the value}}
+# Lengths are in mm in the file and integer nm in the snapshot. Keys that aren't listed are kept as text
+config_schema = {
+    "PanelOptions": {
+        "mousebite_diameter": at_least(1, to_nm),
+        "route_diameter": at_least(1, to_nm),
+        "panel_width": at_least(0, to_nm),
+        "support_bar_width": at_least(0, to_nm),
+        "default_export_folder_name": str,
+        "decimal_precision": at_least(0, int),
+        "profile_file_extension": text_list,
+        "max_panel_dimensions": at_least(1, nm_pair),
+    },
+    "Fabrication": {
+        "show_surface_area_warning": boolean,
+        "max_panel_surface_area": at_least(0, float),
+        "max_panel_dimensions": at_least(1, nm_pair),
+        "add_order_number_placeholder": boolean,
+        "order_number_placeholder_text": str,
+        "add_frame_stencil_apertures": boolean,
+        # tl: 0, tr: 1, bl: 2, br: 3
+        "frame_stencil_aperture_locations": one_of(range(4), _ints),
+        "frame_stencil_aperture_size": at_least(1, to_nm),
+        "frame_stencil_aperture_border": at_least(0, to_nm),
+    },
+    "FrameGerbers": {
+        "aperture_macros": boolean,
+        "glyph_blocks": boolean,
+        "min_text_size": at_least(1, to_nm),
+        "template_cache_size": at_least(0, int),
+        "template_cache_folder": str.strip,
+        "template_cache_files": at_least(0, int),
+    },
+    "SerialMarks": {
+        "serial_marks": boolean,
+        "serial_format": serial_format,
+        "serial_start": at_least(0, int),
+        "serial_anchor": nm_pair,
+        "serial_text_size": at_least(1, to_nm),
+        "serial_code": boolean,
+        "serial_code_module": at_least(1, to_nm),
+    },
+    "GerberFilenames": {
+        "top_copper": str,
+        "bottom_copper": str,
+        "top_silkscreen": str,
+        "bottom_silkscreen": str,
+        "top_soldermask": str,
+        "bottom_soldermask": str,
+        "top_paste": str,
+        "bottom_paste": str,
+        "profile": str,
+        "drills": str,
+        "mill": str,
+        "serial_silkscreen": str,
+    },
+    "Report": {
+        "placement_tables": boolean,
+        "panel_centroid": boolean,
+        "designator_suffix": str,
+        "layer_bounds": boolean,
+        "overhang_tolerance": at_least(0, to_nm),
+        "layer_areas": boolean,
+        "layer_area_resolution": at_least(1, to_nm),
+        "layer_area_tile_size": at_least(16, int),
+        "nesting": boolean,
+        "nesting_resolution": at_least(1, to_nm),
+        "nesting_cache_folder": str.strip,
+        "nesting_cache_files": at_least(0, int),
+    },
+    "Cost": {
+        "area_tiers": area_tiers,
+        "panel_fee": at_least(0, float),
+    },
+    "NativeExport": {
+        "step_repeat_gerbers": boolean,
+        "merged_gerbers": boolean,
+        "panel_profile": boolean,
+        "mousebite_holes": boolean,
+        "mousebite_hole_diameter": at_least(1, to_nm),
+        "mousebite_hole_pitch": at_least(1, to_nm),
+        "mousebite_edge_offset": to_nm,
+        "order_drill_hits": boolean,
+        "normalise_gerbers": boolean,
+        "normalise_cache_folder": str.strip,
+        "normalise_cache_files": at_least(0, int),
+    },
+    "Daemon": {
+        "watch_folders": text_list,
+        "max_workers": at_least(1, int),
+        "settle_time": at_least(0, float),
+        "poll_interval": at_least(0.01, float),
+        "default_mousebites": text_list,
+    },
+}
+# Text of the values used when a key is left out of the file, so a config.ini from before a feature was added still
+# loads. Converted with config_schema the same as a value in the file. Keys without a default have to be in the file
+config_defaults = {
+    "FrameGerbers": {
+        "aperture_macros": "true",
+        "glyph_blocks": "false",
+        "min_text_size": "0.8",
+        "template_cache_size": "32",
+        "template_cache_folder": "frame_cache",
+        "template_cache_files": "256",
+    },
+    "SerialMarks": {
+        "serial_marks": "false",
+        "serial_format": "SN{serial:05d}",
+        "serial_start": "1",
+        "serial_anchor": "1, 1",
+        "serial_text_size": "1",
+        "serial_code": "false",
+        "serial_code_module": "0.25",
+    },
+    "GerberFilenames": {
+        "mill": "mill.gml",
+        "serial_silkscreen": "serial_silkscreen.gto",
+    },
+    "Report": {
+        "placement_tables": "true",
+        "panel_centroid": "true",
+        "designator_suffix": "_{}",
+        "layer_bounds": "true",
+        "overhang_tolerance": "0.01",
+        "layer_areas": "false",
+        "layer_area_resolution": "0.025",
+        "layer_area_tile_size": "2048",
+        "nesting": "false",
+        "nesting_resolution": "0.1",
+        "nesting_cache_folder": "nesting_cache",
+        "nesting_cache_files": "256",
+    },
+    "Cost": {
+        "area_tiers": "2:1.5, 6:1.2, 12:1.0, inf:0.9",
+        "panel_fee": "10",
+    },
+    "NativeExport": {
+        "step_repeat_gerbers": "false",
+        "merged_gerbers": "false",
+        "panel_profile": "false",
+        "mousebite_holes": "false",
+        "mousebite_hole_diameter": "0.5",
+        "mousebite_hole_pitch": "0.8",
+        "mousebite_edge_offset": "0.25",
+        "order_drill_hits": "true",
+        "normalise_gerbers": "false",
+        "normalise_cache_folder": "normalise_cache",
+        "normalise_cache_files": "64",
+    },
+    "Daemon": {
+        "watch_folders": "",
+        "max_workers": "2",
+        "settle_time": "5",
+        "poll_interval": "2",
+        "default_mousebites": "bc, tc",
+    },
+}
+
+
+class ConfigSnapshot:
+    """
+    Immutable, typed copy of config.ini, snapshot["Section"]["key"] gives the converted value
+    Sections are read only mappings and list values are tuples, so a snapshot can be shared between jobs
+    """
+
+    __slots__ = ("path", "text", "hash", "_sections")
+
+    def __init__(self, sections, text="", path=None):
+        """
+        Use from_text() or load_config() rather than making one directly
+        :param sections: dict of {section: {key: value}}, already converted
+        :param text: Text of the file it was compiled from
+        :param path: Path of the file, None if it didn't come from one
+        """
+        self.path = path
+        self.text = text
+        self._sections = MappingProxyType({_name: MappingProxyType(dict(_values))
+                                           for _name, _values in sections.items()})
+        # Of the values rather than the text, so comments and formatting don't change it
+        _values = json.dumps({_name: dict(_values) for _name, _values in self._sections.items()}, sort_keys=True)
+        self.hash = hashlib.sha1(_values.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def from_text(cls, text, path=None):
+        """
+        Compiles the text of a config file, checking every value against config_schema
+        Keys and sections that are left out take their value from config_defaults, only keys without a default have to
+        be in the file
+        :param text: Contents of config.ini
+        :param path: Optional path it was read from, only used in messages
+        :return: ConfigSnapshot
+        """
+        _source = "config file" if path is None else str(path)
+        _parser = ConfigParser()
+        try:
+            _parser.read_string(text, source=_source)
+        except ConfigParserError as e:
+            raise ConfigError(str(e))
+
+        _errors = list()
+        _sections = dict()
+        for _name in _parser.sections():
+            _types = config_schema.get(_name, dict())
+            _values = dict()
+            for _key, _text in _parser[_name].items():
+                _convert = _types.get(_key, str)
+                try:
+                    _values[_key] = _convert(_text)
+                except ValueError as e:
+                    _errors.append("[{}] {} = {}: {}".format(_name, _key, _text, e))
+            _sections[_name] = _values
+
+        for _name, _types in config_schema.items():
+            _defaults = config_defaults.get(_name, dict())
+            _values = _sections.setdefault(_name, dict())
+            for _key, _convert in _types.items():
+                if _parser.has_option(_name, _key):
+                    continue
+                if _key in _defaults:
+                    _values[_key] = _convert(_defaults[_key])
+                elif not _parser.has_section(_name):
+                    _errors.append("[{}] section is missing".format(_name))
+                    break
+                else:
+                    _errors.append("[{}] {} is missing".format(_name, _key))
+
+        if _errors:
+            raise ConfigError("Invalid {}:\n  {}".format(_source, "\n  ".join(_errors)))
+
+        return cls(_sections, text, path)
+
+    def sections(self):
+        return list(self._sections)
+
+    def __getitem__(self, section):
+        return self._sections[section]
+
+    def __contains__(self, section):
+        return section in self._sections
+
+    def __repr__(self):
+        return "ConfigSnapshot({}, {})".format(self.path, self.hash[:12])
+
+
+def _parse_config(path):
+    return ConfigSnapshot.from_text(path.read_text(encoding="utf-8"), path)
+
+
+def load_config(path):
+    """
+    Reads the config, compiling it again only if the file has changed, so calling it again picks up any edits
+    :param path: Path of config.ini
+    :return: ConfigSnapshot
+    :raises ConfigError: If a value is missing or invalid, it is checked again on every call until the file is fixed
+    """
+    return _load_cached("config", path, _parse_config)
+
+
+def load_font(path):
+    """
+    :param path: Path of vector_font.json
+    :return: dict of the font definition
+    """
+    return _load_cached("font", path, lambda _path: json.loads(_path.read_text()))
+
+
+def preload(config_path=None, font_path=None):
+    """
+    Imports the heavy dependencies and reads the config and font up front, for processes that run more than one job
+    :param config_path: Optional path of config.ini
+    :param font_path: Optional path of vector_font.json
+    :return:
+    """
+    import gerber  # noqa: F401
+    import layer_merge  # noqa: F401
+    import panel_outline  # noqa: F401
+    import step_repeat  # noqa: F401
+
+    if config_path is not None:
+        load_config(config_path)
+    if font_path is not None:
+        load_font(font_path)
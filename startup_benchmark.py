@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+"""
+Startup benchmark, fails if importing main gets slower than a budget or starts importing the heavy dependencies
+Uses python -X importtime in a fresh interpreter for each run and takes the best run, to keep out as much noise as possible
+Usage: ./startup_benchmark.py [--runs 5] [--budget 150]
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+# Modules that must only be imported by the code paths that need them, not when main is imported
+lazy_modules = ("gerber", "numpy", "xml.dom.minidom", "step_repeat", "layer_merge", "panel_outline", "excellon",
+                "centroid", "sweep", "gerberset", "layer_area", "layer_bounds",
+                "mousebites", "gerber_normalise", "serial_marks", "datamatrix", "board_outline", "nesting")
+
+
+def measure_import(module):
+    """
+    Imports a module in a fresh interpreter with -X importtime
+    :param module: Name of the module to import
+    :return: (cumulative import time of the module in us, {imported module name: cumulative us})
+    """
+    _result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+                             cwd=str(Path(__file__).parent), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+
+    _imports = dict()
+    for _line in _result.stderr.splitlines():
+        if not _line.startswith("import time:"):
+            continue
+        _fields = _line[len("import time:"):].split("|")
+        if not _fields[1].strip().isdigit():
+            # Column headings
+            continue
+        _imports[_fields[2].strip()] = int(_fields[1])
+
+    return _imports[module], _imports
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("--module", default="main", help="Module to import")
+    _parser.add_argument("--runs", type=int, default=5, help="Number of cold starts, the best one is used")
+    _parser.add_argument("--budget", type=float, default=150, help="Maximum import time in ms")
+    _args = _parser.parse_args()
+
+    _best = None
+    for _ in range(_args.runs):
+        _time, _imports = measure_import(_args.module)
+        if _best is None or _time < _best[0]:
+            _best = (_time, _imports)
+
+    _time, _imports = _best
+    print("Import time of {}: {:.1f}ms (best of {}, budget {:.1f}ms)".format(_args.module, _time / 1000, _args.runs,
+                                                                            _args.budget))
+
+    print("Slowest imports:")
+    _slowest = sorted(((_us, _name) for _name, _us in _imports.items() if _name != _args.module), reverse=True)
+    for _us, _name in _slowest[:8]:
+        print("  {:>8.1f}ms  {}".format(_us / 1000, _name))
+
+    _failed = False
+    _eager = [_name for _name in lazy_modules if _name in _imports]
+    if _eager:
+        print("FAIL: imported at startup but should be lazy: {}".format(", ".join(_eager)))
+        _failed = True
+
+    if _time / 1000 > _args.budget:
+        print("FAIL: import time is over budget")
+        _failed = True
+
+    if _failed:
+        return 1
+
+    print("OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
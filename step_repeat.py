@@ -0,0 +1,217 @@
+#! /usr/bin/env python3
+"""
+Writes the panel layers natively using gerber step and repeat (%SR) blocks
+Each output layer is the frame overlay followed by one copy of the board layer wrapped in an %SR block, so the size
+of the output doesn't depend on how many boards are on the panel. Support bars break the regular pitch of the array,
+the array is split into regular blocks either side of the bars and each block gets its own %SR
+"""
+
+import io
+import logging
+from pathlib import Path
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import logzero
+
+from geometry import format_decimal
+from gerber_stream import GerberLayer, ApertureTable, canonical_header, reset_statements, open_text
+from layer_manifest import layer_extensions
+
+
+def regular_runs(values):
+    """
+    Splits a sorted list of unique values into runs with a constant pitch
+    :param values: Sorted list of ints
+    :return: list of (start, count, pitch) tuples, pitch is 0 for a run of 1
+    """
+    _runs = list()
+    _start = 0
+
+    while _start < len(values):
+        _end = _start + 1
+        _pitch = 0
+        if _end < len(values):
+            _pitch = values[_end] - values[_start]
+            while _end + 1 < len(values) and values[_end + 1] - values[_end] == _pitch:
+                _end += 1
+            _end += 1
+
+        _runs.append((values[_start], _end - _start, _pitch))
+        _start = _end
+
+    return _runs
+
+
+def step_repeat_blocks(coords):
+    """
+    Splits a list of board locations into regular rectangular blocks that can each be written as one %SR
+    If the locations don't form a complete grid every board becomes its own 1 x 1 block
+    :param coords: list of (x, y) tuples in nm
+    :return: list of ((x, y), repeat_x, repeat_y, step_x, step_y) tuples
+    """
+    _coords = set(coords)
+    _xs = sorted({_loc[0] for _loc in _coords})
+    _ys = sorted({_loc[1] for _loc in _coords})
+
+    if len(_coords) != len(_xs) * len(_ys):
+        return explicit_blocks(coords)
+
+    _blocks = list()
+    for _y_start, _y_count, _y_pitch in regular_runs(_ys):
+        for _x_start, _x_count, _x_pitch in regular_runs(_xs):
+            _blocks.append(((_x_start, _y_start), _x_count, _y_count, _x_pitch, _y_pitch))
+
+    return _blocks
+
+
+def explicit_blocks(coords):
+    """
+    One 1 x 1 block per board, for writing every copy of a layer explicitly
+    :param coords: list of (x, y) tuples in nm
+    :return: list of ((x, y), 1, 1, 0, 0) tuples
+    """
+    return [(_loc, 1, 1, 0, 0) for _loc in coords]
+
+
+def match_layers(board_layers, frame_names, file_names):
+    """
+    Pairs up board layers with the frame overlay layers that go on top of them
+    :param board_layers: list of layer_manifest.LayerEntry for the gerber layers in the board zip
+    :param frame_names: list of file names in the frame overlay zip
+    :param file_names: [GerberFilenames] config section
+    :return: list of (output_name, board_name, frame_name) tuples, either name may be None
+    """
+    _pairs = list()
+    _used_frame_names = set()
+
+    for _entry in board_layers:
+        if _entry.layer is None:
+            _pairs.append((_entry.file_name, _entry.name, None))
+            continue
+
+        _output_name = file_names[_entry.layer]
+        _frame_name = _output_name if _output_name in frame_names else None
+        _pairs.append((_output_name, _entry.name, _frame_name))
+        _used_frame_names.add(_frame_name)
+
+    # Frame layers that don't have a layer in the board, e.g. paste for a board without smd parts
+    for _frame_name in frame_names:
+        if _frame_name not in _used_frame_names and Path(_frame_name).suffix.lower() in layer_extensions:
+            _pairs.append((_frame_name, None, _frame_name))
+
+    return _pairs
+
+
+def load_layers(board_zip, frame_zip, board_name, frame_name):
+    """
+    Reads the board layer and frame overlay layer that make up one panel layer
+    :param board_zip: Open ZipFile of the board gerbers
+    :param frame_zip: Open ZipFile of the frame overlay gerbers
+    :param board_name: Name of the board layer in the zip or None
+    :param frame_name: Name of the frame layer in the zip or None
+    :return: (board_layer, frame_layer) GerberLayers, either may be None
+    """
+    _board_layer = None
+    if board_name is not None:
+        with open_text(board_zip, board_name) as _lines:
+            _board_layer = GerberLayer(board_name).load(_lines)
+
+    _frame_layer = None
+    if frame_name is not None:
+        with open_text(frame_zip, frame_name) as _lines:
+            _frame_layer = GerberLayer(frame_name).load(_lines)
+
+    return _board_layer, _frame_layer
+
+
+def write_panel_layer(out_file, output_name, board_layer, frame_layer, blocks):
+    """
+    Writes a single panel layer, the frame overlay followed by the board layer at each block
+    :param out_file: Text stream to write to
+    :param output_name: Name of the layer, used for the %IN statement
+    :param board_layer: GerberLayer or None
+    :param frame_layer: GerberLayer or None
+    :param blocks: Output of step_repeat_blocks() or explicit_blocks()
+    :return:
+    """
+    _table = ApertureTable()
+    for _layer in (frame_layer, board_layer):
+        if _layer is not None:
+            _table.add_layer(_layer)
+
+    out_file.write(canonical_header.format(Path(output_name).stem))
+    out_file.write(_table.header())
+
+    if frame_layer is not None:
+        out_file.write(reset_statements)
+        for _chunk in frame_layer.iter_body():
+            out_file.write(_chunk)
+
+    if board_layer is not None:
+        for _origin, _repeat_x, _repeat_y, _step_x, _step_y in blocks:
+            _step_repeat = _repeat_x > 1 or _repeat_y > 1
+            if _step_repeat:
+                out_file.write("%SRX{}Y{}I{}J{}*%\n".format(_repeat_x, _repeat_y,
+                                                           format_decimal(_step_x, 6), format_decimal(_step_y, 6)))
+            out_file.write(reset_statements)
+            for _chunk in board_layer.iter_body(_origin):
+                out_file.write(_chunk)
+            if _step_repeat:
+                out_file.write("%SR*%\n")
+
+    out_file.write("M02*\n")
+
+
+class StepRepeatExporter:
+    """
+    Builds a zip of panel gerbers from the board zip and the frame overlay zip, using %SR for the board array
+    """
+    logger = None
+
+    def __init__(self, logger=None):
+        if logger:
+            self.logger = logger
+        else:
+            self.logger = logzero.logger
+            logzero.loglevel(logging.DEBUG)
+
+    def export(self, manifest, frame_zip_path, board_coords, output_path, file_names, drill_table=None):
+        """
+        Write the panel gerbers
+        :param manifest: layer_manifest.LayerManifest of the board gerber zip
+        :param frame_zip_path: Path of the frame overlay zip from GerberGenerator
+        :param board_coords: list of (x, y) locations in nm of each board instance, the same as in the gerberset
+        :param output_path: Path of the zip to write
+        :param file_names: [GerberFilenames] config section, used to match up layers and name the output
+        :param drill_table: Optional excellon.DrillTable of the panel drills, written with explicit hits
+        :return: str path of the written zip
+        """
+        self.logger.info("== Writing step and repeat panel gerbers ==")
+
+        _blocks = step_repeat_blocks(board_coords)
+        self.logger.info("{} boards in {} step and repeat blocks".format(len(board_coords), len(_blocks)))
+
+        with ZipFile(str(manifest.zip_path), 'r') as board_zip, ZipFile(str(frame_zip_path), 'r') as frame_zip, \
+                ZipFile(str(output_path), 'w', ZIP_DEFLATED) as out_zip:
+            _pairs = match_layers(manifest.layers(), frame_zip.namelist(), file_names)
+
+            for _output_name, _board_name, _frame_name in _pairs:
+                self.logger.debug("Panel layer {}: board {}, frame {}".format(_output_name, _board_name, _frame_name))
+
+                _board_layer, _frame_layer = load_layers(board_zip, frame_zip, _board_name, _frame_name)
+
+                _layer_blocks = _blocks
+                if _board_layer is not None and _board_layer.has_step_repeat:
+                    # %SR blocks can't be nested, fall back to writing every copy of this layer
+                    self.logger.warning("{} has its own step and repeat blocks, writing explicit copies".format(_board_name))
+                    _layer_blocks = explicit_blocks(board_coords)
+
+                with io.TextIOWrapper(out_zip.open(_output_name, "w"), encoding="ascii") as out_file:
+                    write_panel_layer(out_file, _output_name, _board_layer, _frame_layer, _layer_blocks)
+
+            if drill_table is not None:
+                with io.TextIOWrapper(out_zip.open(file_names["drills"], "w"), encoding="ascii") as out_file:
+                    drill_table.write(out_file)
+
+        self.logger.info("Step and repeat gerbers written to: {}".format(output_path))
+        return str(output_path)
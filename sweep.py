@@ -0,0 +1,389 @@
+#! /usr/bin/env python3
+"""
+What-if sweeps of the panel parameters, without making any files
+Every combination of route diameter, frame width, support bar width, repeats and support bar spacing is worked out at
+once as numpy arrays: the panel size and surface area, which of the config limits it breaks and what it costs from a
+cost model. The result is a table that can be sorted and filtered, 10k combinations take a few ms
+Usage: ./sweep.py <board zip or WxH in mm> --repeat-x 1-8 --repeat-y 1-8 [--route-diameter 2,2.4] [--sort cost_per_board]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy
+
+from geometry import NM2_PER_DM2, NM_PER_MM, to_nm
+from snapshot import load_config
+
+# Parameters that can be swept and the [PanelOptions] key each one defaults to, None if it has no config default
+sweep_parameters = {
+    "route_diameter": "route_diameter",
+    "panel_width": "panel_width",
+    "support_bar_width": "support_bar_width",
+    "repeat_x": None,
+    "repeat_y": None,
+    "horizontal_bars_every": None,
+    "vertical_bars_every": None,
+}
+
+# Parameters that are lengths, given in mm and held in nm
+_length_parameters = ("route_diameter", "panel_width", "support_bar_width")
+
+
+def support_bar_count(repeat, bars_every):
+    """
+    Number of support bars between the boards, works on ints and numpy arrays
+    :param repeat: Number of boards in that direction
+    :param bars_every: A support bar every n boards, 0 for none
+    :return: Number of bars
+    """
+    # Fence posts, there are repeat - 1 gaps between the boards. (bars_every == 0) stops a divide by zero
+    return ((repeat - 1) // (bars_every + (bars_every == 0))) * (bars_every != 0)
+
+
+def panel_size(board_size, repeat, route_diameter, panel_width, support_bar_width=0, bars_every=0):
+    """
+    Size of the panel in one direction, the same sum Panel uses, works on ints and numpy arrays
+    :param board_size: Size of the board in nm
+    :param repeat: Number of boards
+    :param route_diameter: Router diameter in nm
+    :param panel_width: Frame width in nm
+    :param support_bar_width: Support bar width in nm
+    :param bars_every: A support bar every n boards, 0 for none
+    :return: Panel size in nm
+    """
+    return panel_width + route_diameter + ((board_size + route_diameter) * repeat) + panel_width + \
+        support_bar_count(repeat, bars_every) * (support_bar_width + route_diameter)
+
+
+def fits(width, height, max_dimensions):
+    """
+    Checks a panel fits inside a maximum size in either orientation, works on ints and numpy arrays
+    :param width: Panel width in nm
+    :param height: Panel height in nm
+    :param max_dimensions: (x, y) maximum size in nm
+    :return: bool or bool array
+    """
+    return ((width <= max_dimensions[0]) & (height <= max_dimensions[1])) | \
+        ((width <= max_dimensions[1]) & (height <= max_dimensions[0]))
+
+
+class TieredCostModel:
+    """
+    Price per dm2 that depends on the surface area of the panel, plus a fixed fee per panel
+    Called with the sweep table, any other callable that takes the table and returns an array can price it instead
+    The price per dm2 of the first tier that the panel area is below is used for the whole panel
+    """
+
+    def __init__(self, area_tiers, panel_fee=0.0):
+        """
+        :param area_tiers: list of (max area in dm2, price per dm2), a max area of inf covers everything bigger
+        :param panel_fee: Fixed price per panel
+        """
+        self.area_tiers = sorted((float(_area), float(_price)) for _area, _price in area_tiers)
+        self.panel_fee = float(panel_fee)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: snapshot.ConfigSnapshot with a [Cost] section
+        :return: TieredCostModel
+        """
+        return cls(config["Cost"]["area_tiers"], config["Cost"]["panel_fee"])
+
+    def __call__(self, table):
+        _area = table["surface_area"]
+        _limits = numpy.array([_limit for _limit, _ in self.area_tiers])
+        # Panels bigger than the last tier can't be priced
+        _prices = numpy.array([_price for _, _price in self.area_tiers] + [numpy.nan])
+
+        return _prices[numpy.searchsorted(_limits, _area, side="left")] * _area + self.panel_fee
+
+
+class SweepLimits:
+    """
+    Limits each panel is checked against, the same ones Panel warns about
+    """
+
+    def __init__(self, max_panel_dimensions, max_panel_surface_area, manufacturer_max_panel_dimensions):
+        """
+        :param max_panel_dimensions: (x, y) in nm the machines can take
+        :param max_panel_surface_area: Maximum area in dm2
+        :param manufacturer_max_panel_dimensions: (x, y) in nm the manufacturer can take
+        """
+        self.max_panel_dimensions = max_panel_dimensions
+        self.max_panel_surface_area = max_panel_surface_area
+        self.manufacturer_max_panel_dimensions = manufacturer_max_panel_dimensions
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: snapshot.ConfigSnapshot
+        :return: SweepLimits
+        """
+        return cls(config["PanelOptions"]["max_panel_dimensions"], config["Fabrication"]["max_panel_surface_area"],
+                   config["Fabrication"]["max_panel_dimensions"])
+
+
+class SweepResult:
+    """
+    Table of sweep results, {column name: numpy array} with a row per parameter combination
+    """
+
+    # Order the columns are shown in
+    columns = ("route_diameter", "panel_width", "support_bar_width", "repeat_x", "repeat_y", "horizontal_bars_every",
+               "vertical_bars_every", "boards", "width", "height", "surface_area", "utilisation", "over_max_dimensions",
+               "over_max_surface_area", "over_manufacturer_dimensions", "uneven_bars", "within_limits", "cost",
+               "cost_per_board")
+
+    # Columns held in nm and shown in mm
+    length_columns = _length_parameters + ("width", "height")
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table["width"])
+
+    def __getitem__(self, column):
+        return self.table[column]
+
+    def take(self, indices):
+        """
+        :param indices: Index array or bool mask of the rows to keep
+        :return: SweepResult of just those rows, in that order
+        """
+        return SweepResult({_name: _column[indices] for _name, _column in self.table.items()})
+
+    def sort(self, *keys, descending=False):
+        """
+        Sorts by one or more columns, the first key is the most significant
+        :param keys: Column names
+        :param descending: Largest first
+        :return: SweepResult
+        """
+        # lexsort sorts by the last key first, it is also stable so ties keep the sweep order
+        _order = numpy.lexsort([self.table[_key] for _key in reversed(keys)])
+        if descending:
+            _order = _order[::-1]
+        return self.take(_order)
+
+    def within_limits(self):
+        """
+        :return: SweepResult of only the panels that don't break any of the limits
+        """
+        return self.take(self.table["within_limits"])
+
+    def head(self, count):
+        return self.take(slice(0, count))
+
+    def rows(self):
+        """
+        :return: list of dicts, one per row, with the lengths in mm
+        """
+        _columns = dict()
+        for _name in self.columns:
+            _column = self.table[_name]
+            _columns[_name] = (_column / NM_PER_MM if _name in self.length_columns else _column).tolist()
+
+        return [dict(zip(self.columns, _values)) for _values in zip(*(_columns[_name] for _name in self.columns))]
+
+    def format_table(self, columns=None, decimals=2):
+        """
+        :param columns: Column names to show, all of them if None
+        :param decimals: Decimal places of the real values
+        :return: str of the table with a column heading row
+        """
+        columns = columns or self.columns
+        _cells = [list(columns)]
+        for _row in self.rows():
+            _cells.append(["{:.{}f}".format(_row[_name], decimals) if isinstance(_row[_name], float)
+                           else str(_row[_name]) for _name in columns])
+
+        _widths = [max(len(_row[_index]) for _row in _cells) for _index in range(len(columns))]
+        return "\n".join("  ".join(_cell.rjust(_width) for _cell, _width in zip(_row, _widths)) for _row in _cells)
+
+
+class Sweep:
+    """
+    Works out every combination of the panel parameters for one board size
+    """
+
+    def __init__(self, board_size, limits, cost_model=None):
+        """
+        :param board_size: (x, y) size of the board in nm
+        :param limits: SweepLimits
+        :param cost_model: TieredCostModel or any callable (table) -> price array, None to leave the cost as nan
+        """
+        self.board_size = board_size
+        self.limits = limits
+        self.cost_model = cost_model
+
+    def grid(self, **parameters):
+        """
+        Every combination of the given values
+        :param parameters: {sweep_parameters name: list of values}, lengths are in nm
+        :return: {name: numpy array} with an entry per combination
+        """
+        _names = list(sweep_parameters)
+        for _name in parameters:
+            if _name not in sweep_parameters:
+                raise ValueError("Unknown sweep parameter: {}".format(_name))
+
+        _values = [numpy.asarray(parameters.get(_name, [1 if _name.startswith("repeat") else 0]), dtype=numpy.int64)
+                   for _name in _names]
+        _grids = numpy.meshgrid(*_values, indexing="ij")
+        return {_name: _grid.ravel() for _name, _grid in zip(_names, _grids)}
+
+    def run(self, **parameters):
+        """
+        Evaluates every combination of the parameters, no files are read or written
+        :param parameters: {sweep_parameters name: list of values}, lengths are in nm, missing repeats are 1 and the
+                           rest are 0
+        :return: SweepResult
+        """
+        return self.evaluate(self.grid(**parameters))
+
+    def evaluate(self, table):
+        """
+        :param table: {sweep_parameters name: numpy array}, all the same length
+        :return: SweepResult
+        """
+        _route = table["route_diameter"]
+        _frame = table["panel_width"]
+        _bar = table["support_bar_width"]
+        _repeat_x = table["repeat_x"]
+        _repeat_y = table["repeat_y"]
+        _horizontal = table["horizontal_bars_every"]
+        _vertical = table["vertical_bars_every"]
+
+        table["boards"] = _repeat_x * _repeat_y
+        table["width"] = panel_size(self.board_size[0], _repeat_x, _route, _frame, _bar, _vertical)
+        table["height"] = panel_size(self.board_size[1], _repeat_y, _route, _frame, _bar, _horizontal)
+
+        # Floats from here on, nm^2 of a big panel is too close to the top of an int64
+        _area = table["width"].astype(numpy.float64) * table["height"]
+        table["surface_area"] = _area / NM2_PER_DM2
+        table["utilisation"] = (float(self.board_size[0]) * self.board_size[1] * table["boards"]) / _area
+
+        table["over_max_dimensions"] = ~fits(table["width"], table["height"], self.limits.max_panel_dimensions)
+        table["over_max_surface_area"] = table["surface_area"] > self.limits.max_panel_surface_area
+        table["over_manufacturer_dimensions"] = ~fits(table["width"], table["height"],
+                                                      self.limits.manufacturer_max_panel_dimensions)
+        table["uneven_bars"] = (((_repeat_x - 1) % (_vertical + (_vertical == 0))) != 0) | \
+            (((_repeat_y - 1) % (_horizontal + (_horizontal == 0))) != 0)
+        table["within_limits"] = ~(table["over_max_dimensions"] | table["over_max_surface_area"] |
+                                   table["over_manufacturer_dimensions"])
+
+        if self.cost_model is None:
+            table["cost"] = numpy.full(len(_route), numpy.nan)
+        else:
+            table["cost"] = numpy.asarray(self.cost_model(table), dtype=numpy.float64)
+        table["cost_per_board"] = table["cost"] / table["boards"]
+
+        return SweepResult(table)
+
+
+def board_size_from_zip(zip_path, profile_file_extensions=None):
+    """
+    Reads the board size from the profile layer of a zip, the same way Panel does
+    :param zip_path: Path of the board gerber zip
+    :param profile_file_extensions: Optional list of extra extensions that are a profile
+    :return: (x, y) in nm
+    """
+    import gerber
+    from zipfile import ZipFile
+
+    from layer_manifest import LayerManifest
+
+    _profile = LayerManifest.from_zip(zip_path).profile(profile_file_extensions)
+    if _profile is None:
+        raise ValueError("No profile file found in {}".format(zip_path))
+
+    with ZipFile(str(zip_path), 'r') as zip_file:
+        _data = zip_file.read(_profile.name).decode("ascii", errors="replace")
+
+    _layer = gerber.loads(_data, _profile.file_name)
+    if _layer.units == "inch":
+        _layer.to_metric()
+
+    (_min_x, _max_x), (_min_y, _max_y) = _layer.bounds
+    return to_nm(_max_x) - to_nm(_min_x), to_nm(_max_y) - to_nm(_min_y)
+
+
+def parse_values(text, length):
+    """
+    Parses a list of values from the command line, "1,2,5" or a range "1-8" or "2-3:0.5"
+    :param text: str
+    :param length: True for values in mm that are returned in nm
+    :return: list of int
+    """
+    _values = list()
+    for _part in text.replace(' ', '').split(','):
+        _range, _, _step = _part.partition(':')
+        _start, _dash, _stop = _range.partition('-')
+        if _dash:
+            _start, _stop, _step = float(_start), float(_stop), float(_step or 1)
+            _count = int(round((_stop - _start) / _step))
+            _values += [_start + _index * _step for _index in range(_count + 1)]
+        else:
+            _values.append(float(_start))
+
+    if length:
+        return [to_nm(_value) for _value in _values]
+    return [int(_value) for _value in _values]
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("board", help="Gerber zip to read the board size from, or the size in mm e.g. 30x20")
+    _parser.add_argument("--config", default=str(Path(__file__).parent / "config.ini"), help="Path of config.ini")
+    for _name, _config_key in sweep_parameters.items():
+        _default = "1" if _name.startswith("repeat") else "0"
+        _parser.add_argument("--" + _name.replace("_", "-"), default=None if _config_key else _default,
+                             help="Values to sweep, e.g. 1,2,4 or 1-8 or 2-3:0.5{}".format(
+                                 " (mm, default from config)" if _config_key else ""))
+    _parser.add_argument("--sort", default="cost_per_board", help="Columns to sort by, comma separated")
+    _parser.add_argument("--descending", action="store_true", help="Sort largest first")
+    _parser.add_argument("--all", action="store_true", help="Also show panels that break the limits")
+    _parser.add_argument("--top", type=int, default=20, help="Number of rows to show, 0 for all")
+    _args = _parser.parse_args()
+
+    _config = load_config(_args.config)
+    _panel_options = _config["PanelOptions"]
+
+    if Path(_args.board).suffix.lower() == ".zip":
+        _board_size = board_size_from_zip(_args.board, _panel_options["profile_file_extension"])
+    else:
+        _board_size = [to_nm(_size) for _size in _args.board.lower().split('x')]
+
+    _parameters = dict()
+    for _name, _config_key in sweep_parameters.items():
+        _text = getattr(_args, _name)
+        if _text is None:
+            # Already in nm in the config snapshot
+            _parameters[_name] = [_panel_options[_config_key]]
+        else:
+            _parameters[_name] = parse_values(_text, _name in _length_parameters)
+
+    _sweep = Sweep(_board_size, SweepLimits.from_config(_config), TieredCostModel.from_config(_config))
+    _result = _sweep.run(**_parameters)
+    _count = len(_result)
+    if not _args.all:
+        _result = _result.within_limits()
+    _result = _result.sort(*_args.sort.replace(' ', '').split(','), descending=_args.descending)
+    if _args.top:
+        _result = _result.head(_args.top)
+
+    print("Board: {:.4f}mm x {:.4f}mm, {} combinations, {} shown".format(
+        _board_size[0] / NM_PER_MM, _board_size[1] / NM_PER_MM, _count, len(_result)))
+    # Only show the parameters that were swept, plus the results
+    _swept = [_name for _name in sweep_parameters if len(set(_parameters[_name])) > 1]
+    print(_result.format_table(_swept + ["boards", "width", "height", "surface_area", "utilisation", "within_limits",
+                                         "cost", "cost_per_board"]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+#! /usr/bin/env python3
+"""
+Layout of the text on the panel frame, worked out from the font widths without drawing anything
+Each line of text has prefix sums of its letter widths, so the width of the line, or of any part of it, at any text
+size is a handful of additions. The text along the bottom of the frame is tried as it is, then with shorter versions
+of the generated text, then with the title wrapped onto both rows. If none of them fit at the configured text size, the
+largest size that fits is found by a binary search down to the smallest size allowed. All dimensions are integer nm
+"""
+
+from geometry import NM_PER_MM, div_round, half_nm, to_nm
+
+# Text sizes are searched in steps of this many nm
+size_step = to_nm(0.01)
+
+
+class WidthTable:
+    """
+    Widths of the letters of the font, as GerberGenerator._add_text_to_silk_file() draws them
+    Letters are scaled with the text size, the gap between letters and the width of a space are not
+    """
+
+    __slots__ = ("letter_gap", "space_advance", "_extents")
+
+    def __init__(self, font_definition):
+        """
+        :param font_definition: dict of the vector font
+        """
+        self.letter_gap = to_nm(font_definition["text_letter_gap"])
+        self.space_advance = to_nm(font_definition["space_char_width"]) - self.letter_gap
+        # How far right of where it starts each letter is drawn, in nm at a text size of 1mm
+        self._extents = {_letter: to_nm(max([0] + [_coord["x"] for _coord in _glyph["coords"]]))
+                         for _letter, _glyph in font_definition["letters"].items()}
+
+    def line(self, text):
+        """
+        :param text: A line of text
+        :return: LineWidths of the text
+        """
+        return LineWidths(self, text)
+
+
+class LineWidths:
+    """
+    Prefix sums of the letter widths, letter count and space count of a line of text
+    """
+
+    __slots__ = ("text", "_table", "_extents", "_letters", "_spaces")
+
+    def __init__(self, table, text):
+        """
+        :param table: WidthTable of the font
+        :param text: A line of text
+        """
+        self.text = text
+        self._table = table
+        self._extents = [0]
+        self._letters = [0]
+        self._spaces = [0]
+
+        for _letter in text:
+            _space = _letter == " "
+            self._extents.append(self._extents[-1] + (0 if _space else table._extents.get(_letter, 0)))
+            self._letters.append(self._letters[-1] + (0 if _space else 1))
+            self._spaces.append(self._spaces[-1] + (1 if _space else 0))
+
+    def width(self, size, start=0, end=None):
+        """
+        :param size: Text size in nm
+        :param start: Index of the first letter of the part of the line to measure
+        :param end: Index after the last letter, the end of the line if None
+        :return: Width in nm, leading and trailing spaces aren't drawn so they aren't counted
+        """
+        if end is None:
+            end = len(self.text)
+        while start < end and self.text[start] == " ":
+            start += 1
+        while end > start and self.text[end - 1] == " ":
+            end -= 1
+
+        _letters = self._letters[end] - self._letters[start]
+        if not _letters:
+            return 0
+
+        return (div_round((self._extents[end] - self._extents[start]) * size, NM_PER_MM) +
+                (_letters - 1) * self._table.letter_gap +
+                (self._spaces[end] - self._spaces[start]) * self._table.space_advance)
+
+    def wrap(self, size):
+        """
+        Splits the line in two at the space that gives the most even widths
+        :param size: Text size in nm
+        :return: (first line, second line), or None if there is no space to split it at
+        """
+        _best = None
+        for _index, _letter in enumerate(self.text):
+            if _letter != " ":
+                continue
+
+            _width = max(self.width(size, 0, _index), self.width(size, _index + 1))
+            if _best is None or _width < _best[0]:
+                _best = (_width, _index)
+
+        if _best is None:
+            return None
+        return self.text[:_best[1]].strip(), self.text[_best[1] + 1:].strip()
+
+
+class FrameText:
+    """
+    A line of text placed on the frame
+    """
+
+    __slots__ = ("name", "text", "x", "y", "size")
+
+    def __init__(self, name, text, x, y, size):
+        """
+        :param name: Which block of text it is, e.g. title
+        :param text: Text to draw
+        :param x: X of the start of the text, the panel is not mirrored
+        :param y: Y of the baseline of the text
+        :param size: Text size
+        """
+        self.name = name
+        self.text = text
+        self.x = x
+        self.y = y
+        self.size = size
+
+    def __repr__(self):
+        return "FrameText({}, '{}', {}, {}, {})".format(self.name, self.text, self.x, self.y, self.size)
+
+
+def largest_size(width, available, min_size, max_size):
+    """
+    Binary search for the largest text size that fits
+    :param width: Function of the text size to the width of the text, must grow with the size
+    :param available: Width the text has to fit in
+    :param min_size: Smallest text size allowed
+    :param max_size: Largest text size wanted
+    :return: Text size in nm, a multiple of size_step unless it is max_size, None if it doesn't fit at min_size
+    """
+    if width(max_size) <= available:
+        return max_size
+
+    _low = -(-min_size // size_step)
+    _high = max_size // size_step
+    if _low > _high or width(_low * size_step) > available:
+        return None
+
+    # _low always fits, _high never does
+    while _high - _low > 1:
+        _middle = (_low + _high) // 2
+        if width(_middle * size_step) <= available:
+            _low = _middle
+        else:
+            _high = _middle
+
+    return _low * size_step
+
+
+class FrameTextLayout:
+    """
+    Lays out the text along the bottom of the frame, in columns of two rows between the fiducials
+    """
+    # Gap between the columns of text
+    column_gap = to_nm(5)
+    # Y of the middle of the two rows of text
+    row_centres = (to_nm(5.3), to_nm(2.6))
+
+    def __init__(self, table, text_size, min_text_size):
+        """
+        :param table: WidthTable of the font
+        :param text_size: Text size wanted
+        :param min_text_size: Smallest text size the text can be shrunk to
+        """
+        self.table = table
+        self.text_size = text_size
+        self.min_text_size = min(min_text_size, text_size)
+
+        # Which of the layouts was used, how big the text is and whether it actually fits, from the last fit()
+        self.style = None
+        self.size = text_size
+        self.fits = True
+
+    def _styles(self, texts):
+        """
+        :param texts: dict of {name: (full text, short text)} of the title, date, repeat and step
+        :return: list of (style, columns), each column is a list of rows of (name, LineWidths), most wanted first
+        """
+        def _line(name, short=False):
+            return name, self.table.line(texts[name][1 if short else 0])
+
+        _styles = [
+            ("full", [[_line("title"), _line("date")], [_line("repeat"), _line("step")]]),
+            ("short", [[_line("title"), _line("date", True)], [_line("repeat", True), _line("step", True)]]),
+        ]
+
+        _title = self.table.line(texts["title"][0]).wrap(self.text_size)
+        if _title is not None:
+            _styles.append(("wrapped", [[("title", self.table.line(_title[0])), ("title", self.table.line(_title[1]))],
+                                        [_line("repeat", True), _line("step", True)], [_line("date", True)]]))
+
+        return _styles
+
+    def _width(self, columns, size):
+        return (sum(max(_line.width(size) for _name, _line in _column) for _column in columns) +
+                self.column_gap * (len(columns) - 1))
+
+    def fit(self, texts, x_start, x_end):
+        """
+        :param texts: dict of {name: (full text, short text)} of the title, date, repeat and step
+        :param x_start: X the first column starts at
+        :param x_end: X the text must finish before
+        :return: list of FrameText
+        """
+        _available = x_end - x_start
+        _styles = self._styles(texts)
+
+        # The text is only shrunk if nothing fits at the size wanted, then the largest text wins
+        _best = None
+        for _style, _columns in _styles:
+            _size = largest_size(lambda size: self._width(_columns, size), _available, self.min_text_size,
+                                 self.text_size)
+            if _size is not None and (_best is None or _size > _best[0]):
+                _best = (_size, _style, _columns)
+            if _size == self.text_size:
+                break
+
+        self.fits = _best is not None
+        if _best is None:
+            # Nothing fits, use whichever is narrowest at the smallest size
+            _style, _columns = min(_styles, key=lambda style: self._width(style[1], self.min_text_size))
+            _best = (self.min_text_size, _style, _columns)
+
+        self.size, self.style, _columns = _best
+        return self._place(_columns, x_start)
+
+    def _place(self, columns, x_start):
+        _texts = list()
+        _x = x_start
+        for _column in columns:
+            for _row, (_name, _line) in enumerate(_column):
+                _texts.append(FrameText(_name, _line.text, _x, self.row_centres[_row] - half_nm(self.size), self.size))
+            _x += max(_line.width(self.size) for _name, _line in _column) + self.column_gap
+
+        return _texts
+
+    def fit_centred(self, name, text, x_centre, y_centre, available):
+        """
+        Fits a single line of text centred on a point
+        :param name: Which block of text it is
+        :param text: Text to draw
+        :param x_centre: X of the middle of the text
+        :param y_centre: Y of the middle of the text
+        :param available: Width the text has to fit in
+        :return: FrameText
+        """
+        _line = self.table.line(text)
+        _size = largest_size(_line.width, available, self.min_text_size, self.text_size)
+        if _size is None:
+            _size = self.min_text_size
+            self.fits = False
+
+        return FrameText(name, text, x_centre - half_nm(_line.width(_size)), y_centre - half_nm(_size), _size)
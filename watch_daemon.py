@@ -0,0 +1,508 @@
+#! /usr/bin/env python3
+"""
+Watch folder daemon, panelises gerber zips as they are dropped into one or more folders
+Each zip needs a job spec, either a <name>.job sidecar file or a file name like board_3x2_bc+tc.zip, see job_spec.py.
+Output goes to the 'panel' folder next to the zip, the same as running main.py by hand. A marker file is written
+there when a zip is done so it isn't made again after a restart, unless the zip changes.
+Uses inotify on linux, other platforms fall back to polling the folders
+config.ini is read again whenever it changes, each job uses the config as it was when the job started
+Usage: ./watch_daemon.py [folder ...] [--poll]
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from zipfile import ZipFile, BadZipFile
+
+import logzero
+
+from job_spec import JobSpec, JobSpecError, sidecar_extension
+from snapshot import ConfigError, ConfigSnapshot, load_config
+
+# Number of times a zip that won't open is checked again before giving up on it
+_max_open_attempts = 3
+
+
+def file_stamp(path):
+    """
+    :param path: Path of a file
+    :return: str of the size and modification time, changes if the file is written to
+    """
+    _stat = path.stat()
+    return "{} {}".format(_stat.st_size, _stat.st_mtime_ns)
+
+
+def marker_paths(gerber_file_path):
+    """
+    :param gerber_file_path: Path of the gerber zip
+    :return: (done marker Path, failed marker Path) in the panel output folder
+    """
+    _out_path = gerber_file_path.parent / "panel"
+    return _out_path / (gerber_file_path.stem + ".done"), _out_path / (gerber_file_path.stem + ".failed")
+
+
+def is_done(gerber_file_path):
+    """
+    Checks if a zip has already been made into a panel, or failed, in its current state
+    :param gerber_file_path: Path of the gerber zip
+    :return: bool
+    """
+    _stamp = file_stamp(gerber_file_path)
+    for _marker in marker_paths(gerber_file_path):
+        if _marker.exists() and _marker.read_text().splitlines()[:1] == [_stamp]:
+            return True
+
+    return False
+
+
+def run_job(job, stamp, config=None):
+    """
+    Makes one panel in a fresh interpreter, so every job starts clean and an error can't take down the daemon
+    :param job: JobSpec
+    :param stamp: file_stamp() of the zip when the job was queued
+    :param config: Optional snapshot.ConfigSnapshot for the job, given to the worker so it isn't affected by the file
+    changing while it runs. None to let the worker read config.ini itself
+    :return: (job, stamp, return code)
+    """
+    _args = [sys.executable, str(Path(__file__).resolve()), "--run-job", json.dumps(job.to_dict())]
+    _input = None
+    if config is not None:
+        _args.append("--config-stdin")
+        _input = config.text.encode("utf-8")
+
+    _log_path = job.gerber_file_path.parent / "panel" / (job.gerber_file_path.stem + ".log")
+    with open(str(_log_path), 'w') as log_file:
+        _result = subprocess.run(_args, input=_input, stdout=log_file, stderr=subprocess.STDOUT)
+
+    return job, stamp, _result.returncode
+
+
+class PollingWatcher:
+    """
+    Finds changed files by listing the folders every poll interval
+    """
+
+    def __init__(self, folders, poll_interval):
+        self.folders = folders
+        self.poll_interval = poll_interval
+        # {path: (size, mtime)}
+        self._seen = dict()
+        self._scan()
+
+    def _scan(self):
+        _changed = set()
+        _seen = dict()
+        for _folder in self.folders:
+            for _path in _folder.iterdir():
+                if not _path.is_file():
+                    continue
+                _stat = _path.stat()
+                _seen[_path] = (_stat.st_size, _stat.st_mtime_ns)
+                if self._seen.get(_path) != _seen[_path]:
+                    _changed.add(_path)
+
+        self._seen = _seen
+        return _changed
+
+    def wait(self, timeout):
+        """
+        :param timeout: Longest time to wait in seconds
+        :return: set of Paths that have changed
+        """
+        time.sleep(min(timeout, self.poll_interval))
+        return self._scan()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Finds changed files with linux inotify, through ctypes so there is no extra dependency
+    """
+    _in_modify = 0x00000002
+    _in_close_write = 0x00000008
+    _in_moved_to = 0x00000080
+    _in_create = 0x00000100
+    _event_header = struct.Struct("iIII")
+
+    def __init__(self, folders):
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        _mask = self._in_modify | self._in_close_write | self._in_moved_to | self._in_create
+        # {watch descriptor: folder}
+        self._folders = dict()
+        for _folder in folders:
+            _wd = _libc.inotify_add_watch(self._fd, str(_folder).encode(), _mask)
+            if _wd < 0:
+                os.close(self._fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed for {}".format(_folder))
+            self._folders[_wd] = _folder
+
+    @staticmethod
+    def available():
+        """
+        :return: True if inotify can be used on this platform
+        """
+        if not sys.platform.startswith("linux"):
+            return False
+        _libc_name = ctypes.util.find_library("c")
+        return _libc_name is not None and hasattr(ctypes.CDLL(_libc_name), "inotify_init1")
+
+    def wait(self, timeout):
+        """
+        :param timeout: Longest time to wait in seconds
+        :return: set of Paths that have changed
+        """
+        _changed = set()
+        _readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not _readable:
+            return _changed
+
+        while True:
+            try:
+                _data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+
+            _offset = 0
+            while _offset < len(_data):
+                _wd, _mask, _cookie, _length = self._event_header.unpack_from(_data, _offset)
+                _offset += self._event_header.size
+                _name = _data[_offset:_offset + _length].rstrip(b"\0").decode(errors="replace")
+                _offset += _length
+                if _name and _wd in self._folders:
+                    _changed.add(self._folders[_wd] / _name)
+
+        return _changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class WatchDaemon:
+    """
+    Waits for zips to finish being written, finds their job spec and queues them to a bounded pool of workers
+    """
+    logger = None
+
+    def __init__(self, folders, max_workers=2, settle_time=5.0, poll_interval=2.0, default_mousebites=("bc", "tc"),
+                 use_inotify=True, logger=None, config_path=None):
+        """
+        :param folders: list of Paths to watch
+        :param max_workers: Number of panels to make at the same time
+        :param settle_time: Seconds a zip has to be unchanged for before it is picked up
+        :param poll_interval: Seconds between scans when polling
+        :param default_mousebites: Mousebite locations for file name jobs that don't give any
+        :param use_inotify: Use inotify if it is available
+        :param logger: Optional logger
+        :param config_path: Optional path of config.ini, read again when it changes, its [Daemon] options replace the
+        ones above and every job is given the snapshot that was current when it started
+        """
+        if logger:
+            self.logger = logger
+        else:
+            self.logger = logzero.logger
+            logzero.loglevel(logging.INFO)
+
+        self.folders = [Path(_folder).resolve() for _folder in folders]
+        self.max_workers = max_workers
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.default_mousebites = list(default_mousebites)
+        self.use_inotify = use_inotify
+        self.config_path = config_path
+
+        # snapshot.ConfigSnapshot given to new jobs, None if there is no config_path
+        self.config = None
+        # Message of the last failed reload, so a broken config file is only logged once
+        self._config_error = None
+        # Watcher in use while running, for changes to the poll interval
+        self._watcher = None
+
+        # {zip path: time of the last event}, zips waiting to settle
+        self._pending = dict()
+        # {zip path: stamp at the last check}, a zip has to have the same stamp twice in a row to be ready
+        self._stamps = dict()
+        # {zip path: number of times it failed to open}
+        self._open_attempts = dict()
+        # (JobSpec, stamp) waiting for a worker
+        self._queue = deque()
+        # {future: output folder}
+        self._running = dict()
+        # Output folders with a job running, jobs from the same folder share it so only one runs at a time
+        self._busy_folders = set()
+
+    def _make_watcher(self):
+        if self.use_inotify and InotifyWatcher.available():
+            self.logger.info("Watching with inotify")
+            return InotifyWatcher(self.folders)
+
+        self.logger.info("Watching by polling every {}s".format(self.poll_interval))
+        return PollingWatcher(self.folders, self.poll_interval)
+
+    def _reload_config(self):
+        """
+        Reads config.ini again if it has changed, keeping the last good snapshot if the new one isn't valid
+        Jobs that are already running carry on with the snapshot they were started with
+        :return:
+        """
+        if self.config_path is None:
+            return
+
+        try:
+            _config = load_config(self.config_path)
+        except (OSError, ConfigError) as e:
+            if str(e) != self._config_error:
+                self._config_error = str(e)
+                self.logger.error("Not reloading config, keeping the last good one: {}".format(e))
+            return
+
+        self._config_error = None
+        if _config is self.config:
+            return
+
+        if self.config is not None:
+            self.logger.info("Config changed, new jobs use snapshot {}".format(_config.hash[:12]))
+            if _config["Daemon"]["max_workers"] != self.max_workers:
+                self.logger.warning("max_workers only changes when the daemon is restarted")
+
+        self.config = _config
+        _options = _config["Daemon"]
+        self.settle_time = _options["settle_time"]
+        self.poll_interval = _options["poll_interval"]
+        self.default_mousebites = list(_options["default_mousebites"])
+        if isinstance(self._watcher, PollingWatcher):
+            self._watcher.poll_interval = self.poll_interval
+
+    def _add_event(self, path, now):
+        """
+        Debounces a file event, the zip is only looked at once it has had no events for the settle time
+        :param path: Path of the changed file, a zip or a sidecar job file
+        :param now: time.monotonic()
+        :return:
+        """
+        if path.suffix.lower() == sidecar_extension:
+            path = path.with_suffix(".zip")
+        if path.suffix.lower() != ".zip" or path.name.startswith("."):
+            return
+
+        self._pending[path] = now
+
+    def _check_pending(self, now):
+        """
+        Moves zips that have settled into the job queue
+        :param now: time.monotonic()
+        :return:
+        """
+        _queued = {_job.gerber_file_path for _job, _ in self._queue}
+
+        for _path, _last_event in list(self._pending.items()):
+            if now - _last_event < self.settle_time:
+                continue
+
+            if not _path.exists():
+                del self._pending[_path]
+                continue
+
+            # Still being written if the size or modification time has changed since the last check
+            _stamp = file_stamp(_path)
+            if self._stamps.get(_path) != _stamp:
+                self._stamps[_path] = _stamp
+                self._pending[_path] = now
+                continue
+
+            # Zips have their directory at the end, a zip that is still being written won't open
+            try:
+                with ZipFile(str(_path), 'r'):
+                    pass
+            except BadZipFile:
+                self._open_attempts[_path] = self._open_attempts.get(_path, 0) + 1
+                if self._open_attempts[_path] < _max_open_attempts:
+                    self._pending[_path] = now
+                else:
+                    self.logger.error("{} isn't a valid zip, skipping it".format(_path))
+                    del self._pending[_path]
+                continue
+
+            del self._pending[_path]
+            self._open_attempts.pop(_path, None)
+
+            if _path in _queued or is_done(_path):
+                continue
+
+            try:
+                _job = JobSpec.find(_path, self.default_mousebites)
+            except JobSpecError as e:
+                # Not marked as failed, saving the sidecar again picks the zip up after it settles
+                self.logger.error("Skipping {}, fix its job file to retry: {}".format(_path.name, e))
+                self._write_log(_path, "{}\n".format(e))
+                continue
+
+            if _job is None:
+                self.logger.warning("No job spec for {}, add a {} file or name it like board_3x2.zip".format(
+                    _path.name, sidecar_extension))
+                continue
+
+            self.logger.info("Queued {}".format(_job))
+            self._queue.append((_job, _stamp))
+
+    def _write_log(self, gerber_file_path, text):
+        """
+        Writes the .log of a zip that never got as far as a worker, where the worker would have written its output
+        :param gerber_file_path: Path of the gerber zip
+        :param text: str to write
+        :return:
+        """
+        _out_folder = gerber_file_path.parent / "panel"
+        try:
+            _out_folder.mkdir(exist_ok=True)
+            (_out_folder / (gerber_file_path.stem + ".log")).write_text(text)
+        except OSError as e:
+            self.logger.error("Can't write the log for {}: {}".format(gerber_file_path.name, e))
+
+    def _start_jobs(self, executor):
+        """
+        Starts queued jobs while there are free workers, skipping jobs whose output folder is busy
+        :param executor: ThreadPoolExecutor
+        :return:
+        """
+        for _ in range(len(self._queue)):
+            if len(self._running) >= self.max_workers:
+                return
+
+            _job, _stamp = self._queue.popleft()
+            _out_folder = _job.gerber_file_path.parent / "panel"
+            if _out_folder in self._busy_folders:
+                self._queue.append((_job, _stamp))
+                continue
+
+            _out_folder.mkdir(exist_ok=True)
+            self._busy_folders.add(_out_folder)
+            self._running[executor.submit(run_job, _job, _stamp, self.config)] = _out_folder
+            if self.config is None:
+                self.logger.info("Started {}".format(_job.gerber_file_path.name))
+            else:
+                self.logger.info("Started {} with config {}".format(_job.gerber_file_path.name, self.config.hash[:12]))
+
+    def _finish_jobs(self):
+        """
+        Writes the marker files of jobs that have finished
+        :return:
+        """
+        for _future in [_future for _future in self._running if _future.done()]:
+            self._busy_folders.discard(self._running.pop(_future))
+            _job, _stamp, _return_code = _future.result()
+            _done_path, _failed_path = marker_paths(_job.gerber_file_path)
+
+            if _return_code == 0:
+                self.logger.info("Finished {}".format(_job.gerber_file_path.name))
+                _done_path.write_text("{}\n{}\n".format(_stamp, _job))
+                if _failed_path.exists():
+                    _failed_path.unlink()
+            else:
+                self.logger.error("Failed {} with code {}, see {}.log".format(_job.gerber_file_path.name, _return_code,
+                                                                           _job.gerber_file_path.stem))
+                _failed_path.write_text("{}\n{}\n".format(_stamp, _job))
+
+    def run(self):
+        """
+        Runs until interrupted
+        :return:
+        """
+        self.logger.info("== Gerber Paneliser Paneliser watch daemon ==")
+        for _folder in self.folders:
+            self.logger.info("Watching folder: {}".format(_folder))
+
+        self._reload_config()
+        _watcher = self._make_watcher()
+        self._watcher = _watcher
+        # Zips that were dropped in while the daemon wasn't running
+        _now = time.monotonic()
+        for _folder in self.folders:
+            for _path in _folder.glob("*.zip"):
+                self._add_event(_path, _now - self.settle_time)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while True:
+                    # Wake up often enough to catch zips settling and jobs finishing
+                    for _path in _watcher.wait(min(self.settle_time, 1.0)):
+                        self._add_event(_path, time.monotonic())
+
+                    self._reload_config()
+                    self._check_pending(time.monotonic())
+                    self._finish_jobs()
+                    self._start_jobs(executor)
+        except KeyboardInterrupt:
+            self.logger.info("Stopping, waiting for running jobs to finish")
+        finally:
+            _watcher.close()
+            self._watcher = None
+
+
+def run_job_from_json(job_json, config_text=None):
+    """
+    Entry point of the worker interpreter, makes a single panel
+    :param job_json: json from JobSpec.to_dict()
+    :param config_text: Optional text of the config the daemon had when the job started, None to read config.ini
+    :return:
+    """
+    from main import Panel
+
+    _config = None
+    if config_text is not None:
+        _config = ConfigSnapshot.from_text(config_text, Path.cwd() / "config.ini")
+    Panel(JobSpec.from_dict(json.loads(job_json)), _config).on_execute()
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("folders", nargs="*", help="Folders to watch, defaults to watch_folders in config.ini")
+    _parser.add_argument("--poll", action="store_true", help="Poll the folders instead of using inotify")
+    _parser.add_argument("--run-job", help=argparse.SUPPRESS)
+    _parser.add_argument("--config-stdin", action="store_true", help=argparse.SUPPRESS)
+    _args = _parser.parse_args()
+
+    if _args.run_job:
+        run_job_from_json(_args.run_job, sys.stdin.read() if _args.config_stdin else None)
+        return 0
+
+    _config_path = Path.cwd() / "config.ini"
+    try:
+        _options = load_config(_config_path)["Daemon"]
+    except (OSError, ConfigError) as e:
+        logzero.logger.error(str(e))
+        return 1
+
+    _folders = _args.folders or _options["watch_folders"]
+    if not _folders:
+        logzero.logger.error("No folders to watch, give them on the command line or set watch_folders in config.ini")
+        return 1
+
+    WatchDaemon(_folders,
+                max_workers=_options["max_workers"],
+                settle_time=_options["settle_time"],
+                poll_interval=_options["poll_interval"],
+                default_mousebites=_options["default_mousebites"],
+                use_inotify=not _args.poll,
+                config_path=_config_path).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())